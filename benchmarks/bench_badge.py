@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Benchmark of the badge endpoints.
+
+Measures the requests per second of ``/badge/doi/<doi>.svg`` and
+``/badge/<user_id>/<repo>.svg`` through the test client of the configured
+instance, for the first request of a badge (rendering it), for cached
+badges and for conditional requests answered with a 304.
+
+Usage::
+
+    python benchmarks/bench_badge.py \\
+        10.5281/zenodo.12345 [<user_id>/<owner>/<repo>]
+"""
+
+from __future__ import absolute_import, print_function
+
+import sys
+import time
+
+
+def requests_per_second(fun, number):
+    """Call a function repeatedly and get the calls per second."""
+    start = time.time()
+    for dummy in range(number):
+        fun()
+    return number / (time.time() - start)
+
+
+def bench(doi, repository=None, number=2000):
+    from invenio.base.factory import create_app
+    from zenodo.modules.github.badge import get_badges
+
+    app = create_app()
+    client = app.test_client()
+    base_url = app.config['CFG_SITE_SECURE_URL']
+
+    paths = [('doi', '/badge/doi/%s.svg' % doi)]
+    if repository:
+        paths.append(('repository', '/badge/%s.svg' % repository))
+
+    with app.app_context():
+        for name, path in paths:
+            resp = client.get(path, base_url=base_url)
+            assert resp.status_code == 200, (path, resp.status_code)
+            etag = resp.headers['ETag']
+
+            def uncached():
+                get_badges().clear()
+                client.get(path, base_url=base_url)
+
+            def cached():
+                client.get(path, base_url=base_url)
+
+            def conditional():
+                client.get(path, base_url=base_url,
+                           headers={'If-None-Match': etag})
+
+            print("%-10s render %8.0f/s  cached %8.0f/s  304 %8.0f/s" % (
+                name,
+                requests_per_second(uncached, number // 10),
+                requests_per_second(cached, number),
+                requests_per_second(conditional, number),
+            ))
+
+
+if __name__ == '__main__':
+    bench(*sys.argv[1:3])
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Micro-benchmark of the grants index against knowledge base lookups.
+
+The knowledge base path is simulated in memory (JSON decoding of every
+mapping and a substring scan for autocomplete, like a ``LIKE '%term%'``
+query), so the numbers are a lower bound of the cost of the database path.
+
+Usage::
+
+    python benchmarks/bench_grants_index.py [25000 250000]
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import random
+import string
+import sys
+import timeit
+
+from zenodo.modules.grants.index import GrantIndex
+
+WORDS = [
+    'open', 'access', 'research', 'europe', 'health', 'policy', 'climate',
+    'energy', 'network', 'data', 'infrastructure', 'science', 'systems',
+    'ocean', 'quantum', 'materials', 'cancer', 'brain', 'digital', 'food',
+]
+
+
+def make_kb(n):
+    """Generate a knowledge base of n grants."""
+    rnd = random.Random(n)
+    kb = {}
+    for i in xrange(n):
+        grant_id = str(100000 + i)
+        kb[grant_id] = json.dumps(dict(
+            grant_agreement_number=grant_id,
+            acronym=''.join(
+                rnd.choice(string.ascii_uppercase)
+                for dummy in range(rnd.randint(3, 8))),
+            title=' '.join(rnd.choice(WORDS) for dummy in range(6)),
+        ))
+    return kb
+
+
+def kb_get(kb, grant_id):
+    val = kb.get(grant_id)
+    return json.loads(val) if val else None
+
+
+def kb_search(kb, term, limit=50):
+    term = term.lower()
+    res = []
+    for val in kb.itervalues():
+        if term in val.lower():
+            res.append(json.loads(val))
+            if len(res) >= limit:
+                break
+    return res
+
+
+def bench(n, number=200):
+    kb = make_kb(n)
+    keys = random.Random(0).sample(list(kb.keys()), number)
+    build = timeit.timeit(
+        lambda: GrantIndex(json.loads(v) for v in kb.itervalues()), number=1)
+    idx = GrantIndex(json.loads(v) for v in kb.itervalues())
+
+    def _per_call(fun, calls):
+        return timeit.timeit(fun, number=calls) / calls * 1e6
+
+    it = iter(keys * 100)
+    print("%d grants (index build %.2fs)" % (n, build))
+    print("  get:    kb %8.1fus  index %8.1fus" % (
+        _per_call(lambda: kb_get(kb, next(it)), number),
+        _per_call(lambda: idx.get(next(it)), number),
+    ))
+    acronym = json.loads(kb[keys[0]])['acronym']
+    for term in ('quantum brain', keys[1], acronym):
+        print("  search %-14r kb %8.1fus  index %8.1fus" % (
+            term,
+            _per_call(lambda: kb_search(kb, term), 5),
+            _per_call(lambda: idx.search(term), number),
+        ))
+
+
+if __name__ == '__main__':
+    for size in map(int, sys.argv[1:]) or [25000, 250000]:
+        bench(size)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Micro-benchmark of the license registry.
+
+Compares building the license choices of a ``LicenseField`` (done on every
+form instantiation) and the license lookup of ``process_recjson`` from the
+knowledge base mappings against the license registry. The knowledge base
+mappings are loaded from the demosite fixtures and kept in memory, so the
+database round trip of the knowledge base path is not included.
+
+Usage::
+
+    python benchmarks/bench_licenses.py
+"""
+
+from __future__ import absolute_import, print_function
+
+import csv
+import json
+import timeit
+from operator import itemgetter
+from os.path import dirname, join
+
+from zenodo.modules.deposit.licenses import LicenseRegistry
+
+FIXTURE = join(dirname(__file__), '..', 'zenodo', 'demosite', 'fixtures',
+               'kb_licenses.csv')
+
+
+def load_mappings():
+    """Load licenses knowledge base mappings from the demosite fixtures."""
+    with open(FIXTURE) as f:
+        reader = csv.reader(f, delimiter=',', quotechar='"',
+                            doublequote=False, escapechar='\\')
+        return [dict(key=row[1], value=row[2]) for row in reader]
+
+
+def kb_license_choices(mappings, domain_data=True, domain_content=True,
+                       domain_software=True):
+    """Choices as computed before the registry."""
+    def _mapper(x):
+        license = json.loads(x['value'])
+        if (license['domain_data'] and domain_data) or \
+                (license['domain_content'] and domain_content) or \
+                (license['domain_software'] and domain_software):
+            return (x['key'], license['title'])
+        else:
+            return None
+    return sorted(
+        filter(lambda x: x is not None, map(_mapper, mappings)),
+        key=itemgetter(1),
+    )
+
+
+def kb_get_license(mappings, key):
+    """License lookup as done before the registry."""
+    for m in mappings:
+        if m['key'] == key:
+            return json.loads(m['value'])
+
+
+def bench(number=2000):
+    mappings = load_mappings()
+    registry = LicenseRegistry(
+        (m['key'], json.loads(m['value'])) for m in mappings
+    )
+    assert registry.get_choices() == kb_license_choices(mappings)
+
+    def _per_call(fun):
+        return timeit.timeit(fun, number=number) / number * 1e6
+
+    print("%d licenses" % len(mappings))
+    print("  choices: kb %8.1fus  registry %8.1fus" % (
+        _per_call(lambda: kb_license_choices(mappings, domain_data=False)),
+        _per_call(lambda: registry.get_choices(domain_data=False)),
+    ))
+    print("  lookup:  kb %8.1fus  registry %8.1fus" % (
+        _per_call(lambda: kb_get_license(mappings, 'cc-by')),
+        _per_call(lambda: registry.get('cc-by')),
+    ))
+
+
+if __name__ == '__main__':
+    bench()
@@ -69,6 +69,7 @@ PACKAGES = [
     'zenodo.modules.grants',
     'zenodo.modules.accessrequests',
     'zenodo.modules.quotas',
+    'zenodo.modules.mailqueue',
     'invenio.modules.access',
     'invenio.modules.accounts',
     'invenio.modules.alerts',
@@ -134,8 +135,12 @@ PACKAGES_EXCLUDE = []
 TEST_SUITES = [
     'zenodo.modules.deposit.testsuite',
     'zenodo.modules.github.testsuite',
+    'zenodo.modules.grants.testsuite',
     'zenodo.modules.preservationmeter.testsuite',
     'zenodo.modules.citationformatter.testsuite',
+    'zenodo.modules.communities.testsuite',
+    'zenodo.modules.mailqueue.testsuite',
+    'zenodo.modules.quotas.testsuite',
     # Run after records have been created by other tests
     'zenodo.base.testsuite',
     'zenodo.testsuite',
@@ -302,6 +307,11 @@ CELERYBEAT_SCHEDULE = {
         task='invenio.modules.communities.tasks.RankingTask',
         schedule=timedelta(minutes=15),
     ),
+    # Every 5 minutes
+    'communities-digests': dict(
+        task='zenodo.modules.communities.tasks.send_upload_digests',
+        schedule=crontab(minute='*/5'),
+    ),
     # Every 15 minutes
     'metrics-afs': dict(
         task='zenodo.modules.quotas.tasks.collect_metric',
@@ -331,17 +341,42 @@ CELERYBEAT_SCHEDULE = {
         schedule=crontab(minute=1, hour='*/3'),
         args=('zenodo.base.metrics.pidstore:PIDStoreMetric', ),
     ),
+    # Every 5 minutes
+    'metrics-rollup': dict(
+        task='zenodo.modules.quotas.tasks.rollup_timeseries',
+        schedule=crontab(minute='*/5'),
+    ),
     'publish-metrics': dict(
         task='zenodo.modules.quotas.tasks.publish_metrics',
         schedule=crontab(minute='*/15'),
         args=('zenodo.modules.quotas.publishers.cern:CERNPublisher', ),
     ),
-    # # Every 12 hours
-    # 'metrics-deposit': dict(
-    #     task='zenodo.modules.quotas.tasks.collect_metric',
-    #     schedule=crontab(minute=1),
-    #     args=('zenodo.modules.quotas.metrics.deposit:DepositMetric', ),
-    # ),
+    # Every 5 minutes
+    'metrics-deposit': dict(
+        task='zenodo.modules.quotas.tasks.collect_metric',
+        schedule=crontab(minute='*/5'),
+        args=('zenodo.modules.quotas.metrics.deposit:DepositMetric', ),
+    ),
+    # Every hour
+    'metrics-deposit-reconcile': dict(
+        task='zenodo.modules.quotas.tasks.reconcile_deposit_usage',
+        schedule=crontab(minute=30),
+    ),
+    # Every minute
+    'bibupload-flush': dict(
+        task='zenodo.modules.deposit.tasks.openaire_bibupload_flush',
+        schedule=timedelta(minutes=1),
+    ),
+    # Every minute (emails are otherwise sent as soon as they are queued)
+    'mailqueue-send': dict(
+        task='zenodo.modules.mailqueue.tasks.send_queued_mail',
+        schedule=crontab(minute='*'),
+    ),
+    # Every day
+    'mailqueue-purge': dict(
+        task='zenodo.modules.mailqueue.tasks.purge_sent_mail',
+        schedule=crontab(minute=15, hour=4),
+    ),
     # Every Sunday
     'harvest-grants': dict(
         task='zenodo.modules.grants.tasks.harvest_openaire_grants',
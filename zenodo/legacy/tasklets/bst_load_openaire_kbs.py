@@ -25,6 +25,8 @@ Tasklets to import/update knowledge base of journal names and
 FP7 projects.
 """
 
+from flask import current_app
+
 from invenio.legacy.bibsched.bibtask import write_message, \
     task_update_progress, task_sleep_now_if_required
 from invenio.modules.knowledge.api import kb_exists, \
@@ -198,6 +200,9 @@ def load_kbs(cfg, run_sql, in_task=False):
                 remove_kb_mapping(kb, key)
             if not in_task:
                 print "kb after remove:", len(get_kb_mappings(kb))
+            if kb == current_app.config['GRANTS_OPENAIRE_KB_JSON']:
+                from zenodo.modules.grants.index import invalidate_index
+                invalidate_index()
         except:
             register_exception(
                 alert_admin=True, prefix="Error when updating KB %s" % kb)
@@ -24,12 +24,8 @@ import os
 import uuid
 from tempfile import mkstemp
 
-from invenio.bibrecord import record_xml_output
-from invenio.bibtask import task_low_level_submission
 from invenio.config import CFG_TMPSHAREDDIR
-
-
-CFG_MAX_RECORDS = 100
+from zenodo.modules.deposit.accumulator import bibupload_records
 
 
 def open_temp_file(prefix):
@@ -54,40 +50,21 @@ def close_temp_file(file_out, filename):
 
 def bibupload_record(record=None, collection=None,
                      file_prefix="bibuploadutils", mode="-c",
-                     alias='bibuploadutils', opts=[]):
+                     alias=None, opts=None):
     """
-    General purpose function that will write a MARCXML file and call bibupload
-    on it.
-    """
-    if collection is None and record is None:
-        return
+    General purpose function that will queue records for bibupload.
 
-    (file_out, filename) = open_temp_file(file_prefix)
+    Records are submitted in batches by the bibupload accumulator of the
+    mode, alias and options (the configured ones if not given), hence
+    ``file_prefix`` is ignored.
 
-    if collection is not None:
-        file_out.write("<collection>")
-        tot = 0
-        for rec in collection:
-            file_out.write(record_xml_output(rec))
-            tot += 1
-            if tot == CFG_MAX_RECORDS:
-                file_out.write("</collection>")
-                close_temp_file(file_out, filename)
-                task_low_level_submission(
-                    'bibupload', alias, mode, filename, *opts
-                )
-
-                (file_out, filename) = open_temp_file(file_prefix)
-                file_out.write("<collection>")
-                tot = 0
-        file_out.write("</collection>")
-    elif record is not None:
-        tot = 1
-        file_out.write(record_xml_output(record))
+    :returns: Number of bibupload tasks submitted (the records may as well
+        wait for a later flush).
+    """
+    if collection is None and record is None:
+        return 0
 
-    close_temp_file(file_out, filename)
-    if tot > 0:
-        return task_low_level_submission(
-            'bibupload', alias, mode, filename, *opts
-        )
-    return None
+    return bibupload_records(
+        list(collection) if collection is not None else [record], mode=mode,
+        alias=alias, options=opts,
+    )
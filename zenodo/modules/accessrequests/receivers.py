@@ -30,8 +30,8 @@ from flask import render_template, url_for, current_app
 
 from invenio.base.globals import cfg
 from invenio.base.i18n import _
-from invenio.ext.email import send_email
 from invenio.modules.records.api import get_record
+from zenodo.modules.mailqueue.api import queue_email
 
 from .errors import RecordNotFound
 from .signals import request_created, request_confirmed, request_accepted, \
@@ -147,8 +147,8 @@ def send_reject_notification(request, message=None):
 
 
 def _send_notification(to, subject, template, **ctx):
-    """Render a template and send as email."""
-    send_email(
+    """Render a template and queue it as email."""
+    queue_email(
         cfg.get('CFG_SITE_SUPPORT_EMAIL'),
         to,
         subject,
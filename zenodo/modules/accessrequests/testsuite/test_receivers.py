@@ -53,6 +53,7 @@ class ReceiversTestCase(BaseTestCase):
         """Test sending of notifications."""
         from zenodo.modules.accessrequests.receivers import \
             _send_notification
+        from zenodo.modules.mailqueue.api import send_queued
 
         _send_notification(
             "info@invenio-software.org",
@@ -60,6 +61,8 @@ class ReceiversTestCase(BaseTestCase):
             "accessrequests/emails/accepted.tpl",
             var1="value1",
         )
+        # Notifications are queued and sent by the mail queue.
+        send_queued()
         self.assertEqual(len(mail.outbox), 1)
 
         msg = mail.outbox[0]
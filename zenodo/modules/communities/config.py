@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Configuration for communities module."""
+
+COMMUNITIES_DIGEST_DELAY = 15 * 60
+"""Seconds new uploads wait for further uploads before they are sent to
+the community owner."""
+
+COMMUNITIES_DIGEST_INTERVAL = 24 * 3600
+"""Minimum number of seconds between two digests sent to the same
+owner."""
+
+COMMUNITIES_DIGEST_MAX_RECORDS = 50
+"""Maximum number of uploads listed in one digest."""
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Digests of new uploads sent to community owners.
+
+New uploads are queued per community owner instead of being sent right
+away. A periodic task aggregates the queued uploads of each owner into one
+digest, at most once per :data:`COMMUNITIES_DIGEST_INTERVAL`, and queues
+the digests in the mail queue.
+"""
+
+from __future__ import absolute_import
+
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from flask import current_app
+
+from invenio.base.globals import cfg
+from invenio.ext.sqlalchemy import db
+from invenio.modules.accounts.models import User
+from invenio.modules.communities.models import Community
+from invenio.modules.records.api import get_record
+from zenodo.modules.mailqueue.api import queue_email
+
+from .models import UploadNotification
+
+DIGEST_TEMPLATE = "communities/emails/upload_digest.tpl"
+
+
+def queue_upload(recid):
+    """Queue a new upload for the owners of its communities.
+
+    :returns: Number of queued notifications.
+    """
+    queued = 0
+    for c in Community.from_recid(recid, provisional=True):
+        if c.id_user:
+            db.session.add(UploadNotification(
+                id_community=c.id, id_user=c.id_user, recid=recid,
+            ))
+            queued += 1
+    db.session.commit()
+    return queued
+
+
+def build_digests(notifications, last_sent, now=None):
+    """Group pending notifications into digests which are due.
+
+    A digest of an owner is due when the oldest upload has waited at least
+    :data:`COMMUNITIES_DIGEST_DELAY` and no digest was sent to the owner in
+    the last :data:`COMMUNITIES_DIGEST_INTERVAL`.
+
+    :param notifications: Pending notifications ordered by owner.
+    :param last_sent: Dictionary of the last digest sent per owner.
+    :returns: List of ``(id_user, notifications)``.
+    """
+    now = now or datetime.now()
+    delay = timedelta(seconds=cfg['COMMUNITIES_DIGEST_DELAY'])
+    interval = timedelta(seconds=cfg['COMMUNITIES_DIGEST_INTERVAL'])
+
+    digests = []
+    for id_user, items in groupby(notifications, lambda n: n.id_user):
+        items = list(items)
+        if min(n.created for n in items) > now - delay:
+            continue
+        if id_user in last_sent and last_sent[id_user] > now - interval:
+            continue
+        digests.append((id_user, items))
+    return digests
+
+
+class DigestRenderer(object):
+
+    """Render digests with a template compiled once."""
+
+    def __init__(self, template=DIGEST_TEMPLATE):
+        """Initialize renderer."""
+        self.template = current_app.jinja_env.get_template(template)
+        self.records = {}
+        self.max_records = cfg['COMMUNITIES_DIGEST_MAX_RECORDS']
+
+    def get_record(self, recid):
+        """Get a record (loaded once for all digests)."""
+        if recid not in self.records:
+            self.records[recid] = get_record(recid)
+        return self.records[recid]
+
+    def render(self, user, communities, items):
+        """Render the digest of an owner.
+
+        :returns: Tuple ``(subject, content)``.
+        """
+        uploads = []
+        for id_community, group in groupby(
+                sorted(items, key=lambda n: (n.id_community, n.created)),
+                lambda n: n.id_community):
+            recids = []
+            for n in group:
+                if n.recid not in recids:
+                    recids.append(n.recid)
+            uploads.append((communities[id_community], recids))
+
+        listed = []
+        remaining = self.max_records
+        for community, recids in uploads:
+            records = [self.get_record(r) for r in recids[:remaining]]
+            remaining -= len(records)
+            listed.append((community, records, len(recids) - len(records)))
+
+        total = sum(len(recids) for dummy, recids in uploads)
+        if len(uploads) == 1:
+            subject = "[%s] %s new upload%s to %s" % (
+                cfg['CFG_SITE_NAME'], total, "s" if total > 1 else "",
+                uploads[0][0].title,
+            )
+        else:
+            subject = "[%s] %s new uploads to your communities" % (
+                cfg['CFG_SITE_NAME'], total,
+            )
+        content = self.template.render(
+            user=user, uploads=listed, total=total,
+        )
+        return subject, content
+
+
+def send_digests(now=None):
+    """Queue all due digests.
+
+    :returns: Number of digests queued.
+    """
+    now = now or datetime.now()
+    pending = UploadNotification.get_pending()
+    if not pending:
+        return 0
+
+    digests = build_digests(
+        pending,
+        UploadNotification.get_last_sent(set(n.id_user for n in pending)),
+        now=now,
+    )
+    if not digests:
+        return 0
+
+    users = dict(
+        (u.id, u) for u in
+        User.query.filter(User.id.in_([d[0] for d in digests]))
+    )
+    communities = dict(
+        (c.id, c) for c in Community.query.filter(Community.id.in_(
+            set(n.id_community for d in digests for n in d[1])
+        ))
+    )
+
+    renderer = DigestRenderer()
+    sent = 0
+    for id_user, items in digests:
+        for n in items:
+            n.sent = now
+        user = users.get(id_user)
+        if user is None or not user.email:
+            # Owner without email, nothing to send.
+            db.session.commit()
+            continue
+        subject, content = renderer.render(user, communities, items)
+        # Commits the notifications together with the queued email.
+        queue_email(
+            cfg['CFG_SITE_SUPPORT_EMAIL'],
+            user.email,
+            subject,
+            content,
+        )
+        sent += 1
+
+    current_app.logger.info("Queued %s community digests." % sent)
+    return sent
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Database models for communities."""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.accounts.models import User
+from invenio.modules.communities.models import Community
+
+
+class UploadNotification(db.Model):
+
+    """New upload to notify to the owner of a community."""
+
+    __tablename__ = 'communitiesUPLOADNOTIFICATION'
+
+    __table_args__ = (
+        db.Index('ix_communitiesUPLOADNOTIFICATION_user_sent',
+                 'id_user', 'sent'),
+        db.Model.__table_args__
+    )
+
+    id = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                   primary_key=True, autoincrement=True)
+
+    id_community = db.Column(db.String(100), db.ForeignKey(Community.id),
+                             nullable=False)
+    """Community the record was uploaded to."""
+
+    id_user = db.Column(db.Integer(15, unsigned=True),
+                        db.ForeignKey(User.id), nullable=False)
+    """Owner of the community."""
+
+    recid = db.Column(db.Integer(15, unsigned=True), nullable=False)
+    """Uploaded record."""
+
+    created = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    """Creation timestamp."""
+
+    sent = db.Column(db.DateTime, nullable=True, index=True)
+    """Timestamp of the digest the upload was sent in."""
+
+    @classmethod
+    def get_pending(cls):
+        """Get uploads not yet sent by owner and creation."""
+        return cls.query.filter(cls.sent.is_(None)).order_by(
+            cls.id_user, cls.created).all()
+
+    @classmethod
+    def get_last_sent(cls, user_ids):
+        """Get the time of the last digest sent to owners.
+
+        :returns: Dictionary ``{id_user: datetime}``.
+        """
+        if not user_ids:
+            return {}
+        return dict(
+            db.session.query(cls.id_user, db.func.max(cls.sent)).filter(
+                cls.id_user.in_(user_ids),
+                cls.sent.isnot(None),
+            ).group_by(cls.id_user).all()
+        )
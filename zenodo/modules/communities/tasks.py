@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Communities tasks for Zenodo."""
+
+from __future__ import absolute_import
+
+from invenio.celery import celery
+
+from .digests import send_digests
+
+
+@celery.task(ignore_result=True)
+def send_upload_digests():
+    """Queue digests of new uploads to community owners.
+
+    Use by adding this task to your CELERYBEAT_SCHEDULE
+
+    .. code-block:: python
+       CELERYBEAT_SCHEDULE = {
+            # Every 5 minutes
+            'communities-digests': dict(
+                task='zenodo.modules.communities.tasks.send_upload_digests',
+                schedule=crontab(minute='*/5'),
+            ),
+            # ...
+        }
+    """
+    send_digests()
@@ -0,0 +1,35 @@
+{#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+#}
+{%- for community, records, more in uploads %}
+New uploads to {{ community.title }}:
+{% for record in records %}
+- {{ record["title"] }}
+  {{ url_for('record.metadata', recid=record['recid'], _external=True) }}
+{%- endfor %}
+{%- if more %}
+- ... and {{ more }} more
+{%- endif %}
+{% if community.id_collection_provisional %}
+To accept or reject the uploads, please open the curation page:
+{{ url_for('communities.curate', community_id=community.id, _external=True) }}
+{% endif %}
+{%- endfor %}
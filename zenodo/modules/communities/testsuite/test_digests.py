@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test digests of new community uploads."""
+
+from __future__ import absolute_import
+
+from datetime import datetime, timedelta
+
+from mock import patch
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class Notification(object):
+
+    def __init__(self, id_user, id_community, recid, created):
+        self.id_user = id_user
+        self.id_community = id_community
+        self.recid = recid
+        self.created = created
+
+
+class Community(object):
+
+    def __init__(self, id, title):
+        self.id = id
+        self.title = title
+
+
+class DigestTestCase(InvenioTestCase):
+
+    """Test aggregation and rendering of digests."""
+
+    config = dict(
+        COMMUNITIES_DIGEST_DELAY=600,
+        COMMUNITIES_DIGEST_INTERVAL=3600,
+        COMMUNITIES_DIGEST_MAX_RECORDS=3,
+    )
+
+    def setUp(self):
+        self.now = datetime(2015, 7, 29, 12, 0)
+
+    def ago(self, minutes):
+        return self.now - timedelta(minutes=minutes)
+
+    def test_build_digests(self):
+        from zenodo.modules.communities.digests import build_digests
+        notifications = [
+            # Due
+            Notification(1, 'a', 1, self.ago(20)),
+            Notification(1, 'b', 2, self.ago(1)),
+            # Waiting for more uploads
+            Notification(2, 'c', 3, self.ago(5)),
+            # Rate limited
+            Notification(3, 'd', 4, self.ago(120)),
+            # Rate limit expired
+            Notification(4, 'e', 5, self.ago(120)),
+        ]
+        digests = build_digests(
+            notifications, {3: self.ago(30), 4: self.ago(61)}, now=self.now)
+        self.assertEqual(
+            [(u, [n.recid for n in items]) for u, items in digests],
+            [(1, [1, 2]), (4, [5])]
+        )
+
+    @patch('zenodo.modules.communities.digests.get_record')
+    def test_render(self, get_record):
+        from flask import current_app
+        from zenodo.modules.communities.digests import DigestRenderer
+        get_record.side_effect = lambda recid: dict(
+            recid=recid, title='Record %s' % recid)
+
+        renderer = DigestRenderer()
+        renderer.template = current_app.jinja_env.from_string(
+            "{% for c, records, more in uploads %}"
+            "{{ c.id }}:{% for r in records %}{{ r.title }},{% endfor %}"
+            "{{ more }};{% endfor %}"
+        )
+        communities = dict(a=Community('a', u'A'), b=Community('b', u'B'))
+        subject, content = renderer.render(None, communities, [
+            Notification(1, 'a', 1, self.ago(3)),
+            Notification(1, 'b', 2, self.ago(2)),
+            Notification(1, 'a', 3, self.ago(2)),
+            Notification(1, 'a', 1, self.ago(1)),
+            Notification(1, 'b', 4, self.ago(1)),
+        ])
+        assert subject.endswith("4 new uploads to your communities")
+        self.assertEqual(content, "a:Record 1,Record 3,0;b:Record 2,1;")
+
+        # Records are loaded once for all digests.
+        renderer.render(None, communities, [
+            Notification(2, 'a', 1, self.ago(1)),
+        ])
+        self.assertEqual(get_record.call_count, 3)
+
+    @patch('zenodo.modules.communities.digests.get_record')
+    def test_render_template(self, get_record):
+        from zenodo.modules.communities.digests import DigestRenderer
+        get_record.side_effect = lambda recid: dict(
+            recid=recid, title='Record %s' % recid)
+        community = Community('a', u'A')
+        community.id_collection_provisional = None
+        with self.app.test_request_context():
+            subject, content = DigestRenderer().render(
+                None, dict(a=community), [
+                    Notification(1, 'a', 1, self.ago(1)),
+                ])
+        assert subject.endswith("1 new upload to A")
+        assert "Record 1" in content
+
+
+TEST_SUITE = make_test_suite(DigestTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
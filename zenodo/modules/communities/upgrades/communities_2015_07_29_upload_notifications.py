@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Queue notifications of new community uploads for digests."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = []
+
+
+def info():
+    """Upgrade description."""
+    return "Create table of new community uploads to notify."
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    op.create_table(
+        'communitiesUPLOADNOTIFICATION',
+        db.Column('id', db.Integer(display_width=15), nullable=False),
+        db.Column('id_community', db.String(length=100), nullable=False),
+        db.Column('id_user', db.Integer(display_width=15), nullable=False),
+        db.Column('recid', db.Integer(display_width=15), nullable=False),
+        db.Column('created', db.DateTime(), nullable=False),
+        db.Column('sent', db.DateTime(), nullable=True),
+        db.ForeignKeyConstraint(['id_community'], [u'community.id'], ),
+        db.ForeignKeyConstraint(['id_user'], [u'user.id'], ),
+        db.PrimaryKeyConstraint('id'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_index(
+        op.f('ix_communitiesUPLOADNOTIFICATION_sent'),
+        'communitiesUPLOADNOTIFICATION', ['sent'], unique=False)
+    op.create_index(
+        'ix_communitiesUPLOADNOTIFICATION_user_sent',
+        'communitiesUPLOADNOTIFICATION', ['id_user', 'sent'], unique=False)
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    return 1
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Streaming accumulator of records to bibupload.
+
+Producers (in any worker process) spool MARCXML fragments of records as
+small files in a directory per bibupload mode on the shared temporary
+directory. The fragments are merged into a single collection file and
+submitted as one bibupload task once enough records are waiting or the
+oldest waiting record exceeds the time window. Submission is deferred while
+too many bibupload tasks are already waiting in bibsched (back-pressure);
+the deferred records are submitted by a later flush.
+
+Records to bibupload with another alias or other options than the
+configured ones are spooled in a directory of their own, so that they are
+submitted in separate tasks.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import itertools
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from tempfile import mkstemp
+
+from invenio.base.globals import cfg
+from invenio.config import CFG_TMPSHAREDDIR
+from invenio.ext.cache import cache
+from invenio.legacy.bibrecord import record_xml_output
+from invenio.legacy.bibsched.bibtask import task_low_level_submission
+from invenio.legacy.dbquery import run_sql
+
+LOCK_KEY = "deposit::bibupload::lock::{0}"
+COUNTERS_KEY = "deposit::bibupload::counters"
+COUNTERS = ['records', 'tasks', 'deferred', 'max_records_per_task']
+FRAGMENT_SUFFIX = '.xml'
+TMP_SUFFIX = '.tmp'
+SETTINGS_FILE = 'accumulator.json'
+
+_sequence = itertools.count()
+
+
+def get_waiting():
+    """Get the number of bibupload tasks waiting in bibsched."""
+    res = run_sql(
+        "SELECT COUNT(*) FROM schTASK "
+        "WHERE proc LIKE 'bibupload%%' AND status='WAITING'"
+    )
+    return int(res[0][0]) if res else 0
+
+
+def get_counters():
+    """Get the counters of all accumulators.
+
+    ``records`` and ``tasks`` are the number of records and bibupload tasks
+    submitted, ``deferred`` the number of flushes deferred because of the
+    length of the bibsched queue.
+    """
+    counters = dict((c, 0) for c in COUNTERS)
+    counters.update(cache.get(COUNTERS_KEY) or {})
+    counters['records_per_task'] = float(counters['records']) / \
+        counters['tasks'] if counters['tasks'] else 0.0
+    return counters
+
+
+def update_counters(**values):
+    """Add values to the counters (call with a flush lock held)."""
+    counters = dict((c, 0) for c in COUNTERS)
+    counters.update(cache.get(COUNTERS_KEY) or {})
+    for k, v in values.items():
+        if k == 'max_records_per_task':
+            counters[k] = max(counters[k], v)
+        else:
+            counters[k] += v
+    cache.set(COUNTERS_KEY, counters)
+
+
+class BibuploadAccumulator(object):
+
+    """Accumulator of records to bibupload in a given mode."""
+
+    def __init__(self, mode='-c', alias=None, options=None, max_records=None,
+                 window=None, max_waiting=None, spool_dir=None,
+                 submit=None, waiting=None, clock=time.time):
+        """Initialize accumulator (defaults are read from configuration).
+
+        :param mode: Bibupload mode (e.g. ``-c`` or ``-r``).
+        :param alias: Name of the bibupload tasks in bibsched.
+        :param options: Further command line options of the tasks.
+        :param max_records: Maximum number of records per bibupload task.
+        :param window: Seconds a record waits at most for more records.
+        :param max_waiting: Number of waiting bibupload tasks from which
+            submissions are deferred.
+        """
+        self.mode = mode
+        self.alias = alias or cfg['DEPOSIT_BIBUPLOAD_ALIAS']
+        self.options = cfg['DEPOSIT_BIBUPLOAD_OPTIONS'] if options is None \
+            else options
+        self.max_records = max_records or cfg['DEPOSIT_BIBUPLOAD_MAX_RECORDS']
+        self.window = cfg['DEPOSIT_BIBUPLOAD_WINDOW'] if window is None \
+            else window
+        self.max_waiting = cfg['DEPOSIT_BIBUPLOAD_MAX_WAITING'] \
+            if max_waiting is None else max_waiting
+        self.name = mode.lstrip('-')
+        if (self.alias, list(self.options)) != (
+                cfg['DEPOSIT_BIBUPLOAD_ALIAS'],
+                list(cfg['DEPOSIT_BIBUPLOAD_OPTIONS'])):
+            self.name += '.' + hashlib.sha1(json.dumps(
+                [self.alias, list(self.options)])).hexdigest()[:12]
+        self.spool_dir = os.path.join(
+            spool_dir or cfg.get('DEPOSIT_BIBUPLOAD_SPOOL_DIR') or
+            os.path.join(CFG_TMPSHAREDDIR, 'bibupload-spool'),
+            self.name,
+        )
+        self.submit = submit or task_low_level_submission
+        self.waiting = waiting or get_waiting
+        self.clock = clock
+
+    @contextmanager
+    def lock(self):
+        """Acquire the flush lock of the mode without waiting.
+
+        :returns: ``True`` if the lock was acquired.
+        """
+        key = LOCK_KEY.format(self.mode)
+        acquired = cache.add(
+            key, True, timeout=cfg['DEPOSIT_BIBUPLOAD_LOCK_TIMEOUT'])
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cache.delete(key)
+
+    def add(self, records):
+        """Spool records and flush if needed.
+
+        :param records: List of MARC records or MARCXML strings.
+        :returns: Number of bibupload tasks submitted.
+        """
+        if not records:
+            return 0
+        if not os.path.isdir(self.spool_dir):
+            try:
+                os.makedirs(self.spool_dir)
+            except OSError:
+                # Created concurrently by another producer.
+                pass
+        settings = os.path.join(self.spool_dir, SETTINGS_FILE)
+        if self.name != self.mode.lstrip('-') and \
+                not os.path.exists(settings):
+            # Lets flush_all() find the options of the spooled records.
+            with open(settings + TMP_SUFFIX, 'w') as fp:
+                json.dump(dict(mode=self.mode, alias=self.alias,
+                               options=list(self.options)), fp)
+            os.rename(settings + TMP_SUFFIX, settings)
+        for rec in records:
+            xml = rec if isinstance(rec, basestring) else \
+                record_xml_output(rec)
+            if isinstance(xml, unicode):
+                xml = xml.encode('utf8')
+            # Name sorts by spool time, rename makes the fragment atomic.
+            name = "%017.6f-%010d-%s" % (
+                self.clock(), next(_sequence), uuid.uuid4().hex)
+            path = os.path.join(self.spool_dir, name)
+            with open(path + TMP_SUFFIX, 'w') as fp:
+                fp.write(xml)
+            os.rename(path + TMP_SUFFIX, path + FRAGMENT_SUFFIX)
+        return self.flush()
+
+    def pending(self):
+        """Get the spooled fragments in order of spooling."""
+        if not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(
+            f for f in os.listdir(self.spool_dir)
+            if f.endswith(FRAGMENT_SUFFIX)
+        )
+
+    def age(self, fragment):
+        """Get the number of seconds a fragment has been spooled."""
+        return self.clock() - float(fragment.split('-', 1)[0])
+
+    def is_due(self, pending):
+        """Check if the spooled fragments should be submitted."""
+        return len(pending) >= self.max_records or \
+            (pending and self.age(pending[0]) >= self.window)
+
+    def flush(self, force=False):
+        """Submit spooled records as bibupload tasks.
+
+        Only full batches and batches older than the window are submitted,
+        unless ``force`` is set. Nothing is submitted while the bibsched
+        queue is too long, or while another process flushes.
+
+        :returns: Number of bibupload tasks submitted.
+        """
+        tasks = 0
+        with self.lock() as acquired:
+            if not acquired:
+                return 0
+            while True:
+                pending = self.pending()
+                if not pending or not (force or self.is_due(pending)):
+                    break
+                if self.max_waiting and self.waiting() >= self.max_waiting:
+                    update_counters(deferred=1)
+                    break
+                self.submit_batch(pending[:self.max_records])
+                tasks += 1
+        return tasks
+
+    def submit_batch(self, fragments):
+        """Merge fragments into one collection file and submit it."""
+        fd, filename = mkstemp(
+            dir=CFG_TMPSHAREDDIR, suffix='.xml',
+            prefix='bibupload_' + time.strftime("%Y%m%d_%H%M%S_"),
+        )
+        with os.fdopen(fd, 'w') as fp:
+            fp.write("<collection>\n")
+            for f in fragments:
+                with open(os.path.join(self.spool_dir, f)) as frag:
+                    fp.write(frag.read())
+                fp.write("\n")
+            fp.write("</collection>\n")
+        os.chmod(filename, 0644)
+
+        try:
+            self.submit(
+                'bibupload', self.alias, self.mode, filename, *self.options)
+        except Exception:
+            os.remove(filename)
+            raise
+
+        for f in fragments:
+            os.remove(os.path.join(self.spool_dir, f))
+        update_counters(
+            tasks=1, records=len(fragments),
+            max_records_per_task=len(fragments),
+        )
+
+
+def get_accumulator(mode='-c', alias=None, options=None):
+    """Get the accumulator of a bibupload mode (and option set)."""
+    return BibuploadAccumulator(mode=mode, alias=alias, options=options)
+
+
+def bibupload_records(records, mode='-c', alias=None, options=None):
+    """Queue records for bibupload in a given mode.
+
+    :returns: Number of bibupload tasks submitted (the records may as well
+        wait for a later flush).
+    """
+    return get_accumulator(mode, alias=alias, options=options).add(records)
+
+
+def flush_all(force=False):
+    """Flush the accumulators of all modes with spooled records.
+
+    :returns: Number of bibupload tasks submitted.
+    """
+    spool = cfg.get('DEPOSIT_BIBUPLOAD_SPOOL_DIR') or \
+        os.path.join(CFG_TMPSHAREDDIR, 'bibupload-spool')
+    if not os.path.isdir(spool):
+        return 0
+    tasks = 0
+    for name in sorted(os.listdir(spool)):
+        path = os.path.join(spool, name)
+        if not os.path.isdir(path):
+            continue
+        settings = os.path.join(path, SETTINGS_FILE)
+        if os.path.exists(settings):
+            with open(settings) as fp:
+                kwargs = dict(
+                    (str(k), v) for k, v in json.load(fp).items())
+        elif '.' not in name:
+            kwargs = dict(mode='-' + name)
+        else:
+            continue
+        tasks += get_accumulator(**kwargs).flush(force=force)
+    return tasks
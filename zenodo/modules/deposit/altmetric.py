@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Bulk harvesting of Altmetric identifiers for records with a DOI.
+
+The harvester pre-loads the DOI and Altmetric identifiers for a whole chunk
+of records in a single query, and looks up the DOIs through a pooled HTTP
+session with a bounded number of concurrent, rate limited calls.
+"""
+
+from __future__ import absolute_import
+
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+from invenio.legacy.bibrecord import record_add_field
+from invenio.legacy.dbquery import run_sql
+
+ALTMETRIC_CACHE_KEY = "deposit::altmetric::{0}"
+
+
+class TokenBucket(object):
+
+    """Thread-safe token bucket rate limiter."""
+
+    def __init__(self, rate, capacity=None, clock=time.time,
+                 sleep=time.sleep):
+        """Initialize bucket.
+
+        :param rate: Number of tokens added per second. A rate of zero or
+            less disables rate limiting.
+        :param capacity: Maximum number of tokens (i.e. burst size).
+        """
+        self.rate = float(rate or 0)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def consume(self, tokens=1):
+        """Take tokens from the bucket, blocking until they are available.
+
+        :returns: Number of seconds spent waiting.
+        """
+        if self.rate <= 0:
+            return 0
+        waited = 0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = (tokens - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+
+def get_fieldvalues_bulk(recids, tags):
+    """Get values of MARC tags for many records with one query per table.
+
+    :returns: Dictionary ``{recid: [(field_number, tag, value), ...]}``.
+    """
+    recids = [int(x) for x in recids]
+    result = dict((recid, []) for recid in recids)
+    if not recids or not tags:
+        return result
+
+    tables = {}
+    for tag in tags:
+        tables.setdefault(tag[0:2], []).append(tag)
+
+    for digits, table_tags in tables.items():
+        query = "SELECT bb.id_bibrec, bb.field_number, b.tag, b.value " \
+                "FROM bib{0}x AS b, bibrec_bib{0}x AS bb " \
+                "WHERE bb.id_bibxxx=b.id AND bb.id_bibrec IN ({1}) " \
+                "AND b.tag IN ({2}) " \
+                "ORDER BY bb.id_bibrec, bb.field_number, b.tag".format(
+                    digits,
+                    ",".join(["%s"] * len(recids)),
+                    ",".join(["%s"] * len(table_tags)),
+                )
+        for recid, field_number, tag, value in run_sql(
+                query, tuple(recids) + tuple(table_tags)):
+            result[int(recid)].append((field_number, tag, value))
+    return result
+
+
+def extract_identifiers(fields):
+    """Extract DOI and Altmetric id from pre-loaded fields of one record."""
+    doi = None
+    sysno = {}
+    for field_number, tag, value in fields:
+        if tag == "0247_a" and doi is None:
+            doi = value
+        elif tag.startswith("035"):
+            sysno.setdefault(field_number, {})[tag[-1]] = value
+
+    altmetric_id = None
+    for subfields in sysno.values():
+        if subfields.get("9") == "Altmetric":
+            altmetric_id = subfields.get("a")
+    return doi, altmetric_id
+
+
+class AltmetricHarvester(object):
+
+    """Look up Altmetric identifiers for many records."""
+
+    def __init__(self, api_url=None, api_key=None, rate_limit=None,
+                 concurrency=None, timeout=None, recheck_interval=None,
+                 session=None):
+        """Initialize harvester (defaults are read from configuration)."""
+        self.api_url = api_url or cfg["DEPOSIT_ALTMETRIC_API_URL"]
+        self.api_key = api_key or cfg.get("DEPOSIT_ALTMETRIC_API_KEY")
+        self.concurrency = max(
+            1, concurrency or cfg["DEPOSIT_ALTMETRIC_CONCURRENCY"])
+        self.timeout = timeout or cfg["DEPOSIT_ALTMETRIC_TIMEOUT"]
+        self.recheck_interval = cfg["DEPOSIT_ALTMETRIC_RECHECK_INTERVAL"] \
+            if recheck_interval is None else recheck_interval
+        self.bucket = TokenBucket(
+            cfg["DEPOSIT_ALTMETRIC_RATE_LIMIT"] if rate_limit is None
+            else rate_limit
+        )
+        self.session = session or self.create_session(self.concurrency)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.stats = dict(
+            records=0, skipped=0, http_calls=0, found=0, errors=0,
+            elapsed=0.0, waited=0.0,
+        )
+
+    @staticmethod
+    def create_session(pool_size):
+        """Create a HTTP session with a connection pool of a given size."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def lookup(self, doi):
+        """Look up a DOI in Altmetric.
+
+        :returns: Decoded JSON response or ``None`` if Altmetric has no data
+            for the DOI.
+        """
+        self._count("waited", self.bucket.consume())
+        params = dict(key=self.api_key) if self.api_key else {}
+        r = self.session.get(
+            "{0}doi/{1}".format(self.api_url, doi),
+            params=params,
+            timeout=self.timeout,
+        )
+        self._count("http_calls")
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    def _lookup_record(self, item):
+        recid, doi = item
+        try:
+            return recid, doi, self.lookup(doi), None
+        except Exception as e:
+            return recid, doi, None, e
+
+    def harvest(self, recids):
+        """Look up all records and return MARC records to upload.
+
+        Only records for which Altmetric returned a new or changed identifier
+        are returned.
+        """
+        start = time.time()
+        recids = [int(x) for x in recids]
+        self.stats["records"] += len(recids)
+
+        # Skip records which have been checked recently.
+        checked = cache.get_many(
+            *[ALTMETRIC_CACHE_KEY.format(x) for x in recids]
+        ) if recids else []
+        todo_recids = [r for r, c in zip(recids, checked) if not c]
+        self.stats["skipped"] += len(recids) - len(todo_recids)
+
+        fields = get_fieldvalues_bulk(
+            todo_recids, ["0247_a", "035__a", "035__9"])
+
+        todo = []
+        existing = {}
+        for recid in todo_recids:
+            doi, altmetric_id = extract_identifiers(fields[recid])
+            if doi:
+                todo.append((recid, doi))
+                existing[recid] = altmetric_id
+
+        records = []
+        confirmed = {}
+        pool = ThreadPool(self.concurrency)
+        try:
+            for recid, doi, res, error in pool.imap_unordered(
+                    self._lookup_record, todo):
+                if error is not None:
+                    self.stats["errors"] += 1
+                    self.errors.append((recid, doi, error))
+                    continue
+
+                confirmed[ALTMETRIC_CACHE_KEY.format(recid)] = True
+                if not res:
+                    continue
+
+                self.stats["found"] += 1
+                altmetric_id = str(res["altmetric_id"])
+                if existing[recid] == altmetric_id:
+                    continue
+
+                rec = {}
+                record_add_field(rec, "001", controlfield_value=str(recid))
+                record_add_field(rec, "035", subfields=[
+                    ("a", altmetric_id),
+                    ("9", "Altmetric"),
+                ])
+                records.append(rec)
+        finally:
+            pool.close()
+            pool.join()
+
+        if confirmed:
+            cache.set_many(confirmed, timeout=self.recheck_interval)
+
+        self.stats["elapsed"] += time.time() - start
+        return records
+
+    def throughput(self):
+        """Compute throughput in records/s and HTTP calls/s."""
+        elapsed = self.stats["elapsed"] or 1e-9
+        return dict(
+            records_per_second=self.stats["records"] / elapsed,
+            http_calls_per_second=self.stats["http_calls"] / elapsed,
+        )
+
+    def report(self):
+        """Human readable summary of the harvest."""
+        throughput = self.throughput()
+        return "Altmetric: {records} records ({skipped} skipped, {found} " \
+            "found, {errors} errors) in {elapsed:.1f}s - {rps:.2f} " \
+            "records/s, {hps:.2f} HTTP calls/s ({waited:.1f}s rate " \
+            "limited).".format(
+                rps=throughput["records_per_second"],
+                hps=throughput["http_calls_per_second"],
+                **self.stats
+            )
@@ -46,3 +46,24 @@ def community_autocomplete(dummy_form, dummy_field, term, limit=50):
         },
         objs
     )
+
+
+def grant_mapper(grant):
+    """Map a grant to an autocomplete item."""
+    grant_id = grant.get('grant_agreement_number', '')
+    acronym = grant.get('acronym', '')
+    title = grant.get('title', '')
+    return {
+        'value': "%s - %s (%s)" % (acronym, title, grant_id),
+        'fields': {
+            'id': grant_id,
+            'acronym': acronym,
+            'title': title,
+        }
+    }
+
+
+def grants_autocomplete(dummy_form, dummy_field, term, limit=50):
+    from zenodo.modules.grants.index import search_grants
+
+    return map(grant_mapper, search_grants(term, limit=limit))
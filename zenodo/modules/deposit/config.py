@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Configuration for deposit module."""
+
+DEPOSIT_ALTMETRIC_API_URL = "http://api.altmetric.com/v1/"
+"""Altmetric API endpoint."""
+
+DEPOSIT_ALTMETRIC_API_KEY = None
+"""Altmetric API key (optional, raises the allowed request rate)."""
+
+DEPOSIT_ALTMETRIC_RATE_LIMIT = 1.0
+"""Maximum number of Altmetric API calls per second (0 disables limit)."""
+
+DEPOSIT_ALTMETRIC_CONCURRENCY = 4
+"""Number of concurrent Altmetric API calls."""
+
+DEPOSIT_ALTMETRIC_TIMEOUT = 10
+"""Timeout in seconds of a single Altmetric API call."""
+
+DEPOSIT_ALTMETRIC_CHUNK_SIZE = 500
+"""Number of records processed by one Altmetric update task."""
+
+DEPOSIT_ALTMETRIC_RECHECK_INTERVAL = 7 * 24 * 3600
+"""Seconds before a record already checked against Altmetric is checked
+again."""
+
+DEPOSIT_LICENSES_KB = "licenses"
+"""Knowledge base with the licenses."""
+
+DEPOSIT_LICENSES_TTL = 3600
+"""Seconds before the license registry of a worker is reloaded."""
+
+DEPOSIT_LICENSES_CHECK_INTERVAL = 10
+"""Seconds between checks if the license registry of a worker is
+outdated."""
+
+DEPOSIT_PIPELINE_CONCURRENCY = 4
+"""Number of post-publish pipeline steps of a record run concurrently."""
+
+DEPOSIT_BIBUPLOAD_MAX_RECORDS = 500
+"""Maximum number of records submitted in one bibupload task."""
+
+DEPOSIT_BIBUPLOAD_WINDOW = 60
+"""Seconds a record waits at most for other records before it is
+submitted."""
+
+DEPOSIT_BIBUPLOAD_MAX_WAITING = 10
+"""Number of waiting bibupload tasks in bibsched from which submissions are
+deferred (0 disables back-pressure)."""
+
+DEPOSIT_BIBUPLOAD_ALIAS = "openaire"
+"""User name of the submitted bibupload tasks."""
+
+DEPOSIT_BIBUPLOAD_OPTIONS = ["-n"]
+"""Extra options of the submitted bibupload tasks."""
+
+DEPOSIT_BIBUPLOAD_SPOOL_DIR = None
+"""Directory where records wait to be submitted (defaults to
+``bibupload-spool`` in ``CFG_TMPSHAREDDIR``)."""
+
+DEPOSIT_BIBUPLOAD_LOCK_TIMEOUT = 300
+"""Seconds after which the flush lock of a bibupload mode expires."""
+
+DEPOSIT_ICON_CACHE_DIR = None
+"""Directory of icons rendered by file checksum (defaults to ``icons`` in
+``CFG_DATADIR``)."""
+
+DEPOSIT_ICON_PROCESSES = 4
+"""Number of worker processes rendering icons."""
+
+DEPOSIT_ICON_BATCH_SIZE = 100
+"""Number of documents processed per batch (one bibreformat per batch)."""
+
+DEPOSIT_ICON_MAX_BATCHES = 50
+"""Number of batches processed by one icon check task before it is
+requeued."""
+
+DEPOSIT_ICON_MAX_ATTEMPTS = 3
+"""Number of attempts to create the icon of a document."""
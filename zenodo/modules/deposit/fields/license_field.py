@@ -22,33 +22,14 @@
 
 """License field."""
 
-import json
-from operator import itemgetter
-
 from wtforms import SelectField
 
 from invenio.modules.deposit.field_base import WebDepositField
 from invenio.modules.deposit.processor_utils import set_flag
-from invenio.modules.knowledge.api import get_kb_mappings
-
-__all__ = ['LicenseField']
 
+from ..licenses import get_license_choices
 
-def _kb_license_choices(domain_data=True, domain_content=True,
-                        domain_software=True):
-    def _mapper(x):
-        license = json.loads(x['value'])
-        if (license['domain_data'] and domain_data) or \
-                (license['domain_content'] and domain_content) or \
-                (license['domain_software'] and domain_software):
-            return (x['key'], license['title'])
-        else:
-            return None
-    return sorted(
-        filter(lambda x: x is not None,
-               map(_mapper, get_kb_mappings('licenses', '', ''))),
-        key=itemgetter(1),
-    )
+__all__ = ['LicenseField']
 
 
 class LicenseField(WebDepositField, SelectField):
@@ -65,6 +46,6 @@ class LicenseField(WebDepositField, SelectField):
                 if opt in kwargs:
                     license_filter[opt] = kwargs[opt]
                     del kwargs[opt]
-            kwargs['choices'] = _kb_license_choices(**license_filter)
+            kwargs['choices'] = get_license_choices(**license_filter)
         kwargs['processors'] = [set_flag('touched'), ]
         super(LicenseField, self).__init__(**kwargs)
@@ -22,7 +22,6 @@
 
 from __future__ import absolute_import
 
-import json
 from datetime import date
 
 from flask import request
@@ -31,7 +30,6 @@ from invenio.base.i18n import _
 from invenio.config import CFG_DATACITE_DOI_PREFIX
 from invenio.config import CFG_SITE_NAME, CFG_SITE_SUPPORT_EMAIL
 from invenio.modules.deposit import fields
-from invenio.modules.deposit.autocomplete_utils import kb_autocomplete
 from invenio.modules.deposit.field_widgets import ButtonWidget, \
     CKEditorWidget, ColumnInput, ExtendedListWidget, ItemWidget, TagInput, \
     TagListWidget, date_widget, plupload_widget
@@ -43,7 +41,6 @@ from invenio.modules.deposit.validation_utils import DOISyntaxValidator, \
     invalid_doi_prefix_validator, list_length, minted_doi_validator, \
     not_required_if, pid_validator, pre_reserved_doi_validator, required_if, \
     unchangeable
-from invenio.modules.knowledge.api import get_kb_mapping
 from invenio.utils.html import CFG_HTML_BUFFER_ALLOWED_TAG_WHITELIST
 
 from jinja2 import Markup
@@ -52,8 +49,10 @@ from wtforms import validators, widgets
 from wtforms.validators import ValidationError
 
 from . import fields as zfields
-from .autocomplete import community_autocomplete
+from .autocomplete import community_autocomplete, grant_mapper, \
+    grants_autocomplete
 from .validators import community_validator
+from ..grants.index import get_grant
 from ...legacy.utils.zenodoutils import create_doi, filter_empty_helper
 
 
@@ -116,27 +115,12 @@ def authorform_mapper(obj, prefix):
     return obj
 
 
-def json_projects_kb_mapper(val):
-    data = json.loads(val['value'])
-    grant_id = data.get('grant_agreement_number', '')
-    acronym = data.get('acronym', '')
-    title = data.get('title', '')
-    return {
-        'value': "%s - %s (%s)" % (acronym, title, grant_id),
-        'fields': {
-            'id': grant_id,
-            'acronym': acronym,
-            'title': title,
-        }
-    }
-
-
 def grants_validator(form, field):
     if field.data:
         for item in field.data:
-            val = get_kb_mapping('json_projects', str(item['id']))
-            if val:
-                data = json_projects_kb_mapper(val)
+            grant = get_grant(item['id'])
+            if grant:
+                data = grant_mapper(grant)
                 item['acronym'] = data['fields']['acronym']
                 item['title'] = data['fields']['title']
                 continue
@@ -146,9 +130,9 @@ def grants_validator(form, field):
 def grant_kb_value(key_name):
     def _getter(field):
         if field.data:
-            val = get_kb_mapping('json_projects', str(field.data))
-            if val:
-                data = json_projects_kb_mapper(val)
+            grant = get_grant(field.data)
+            if grant:
+                data = grant_mapper(grant)
                 return data['fields'][key_name]
         return ''
     return _getter
@@ -281,10 +265,7 @@ class GrantForm(WebDepositForm):
     )
     title = fields.StringField(
         placeholder="Start typing a grant number, name or abbreviation...",
-        autocomplete_fn=kb_autocomplete(
-            'json_projects',
-            mapper=json_projects_kb_mapper
-        ),
+        autocomplete_fn=grants_autocomplete,
         widget=TagInput(),
         widget_classes='form-control',
     )
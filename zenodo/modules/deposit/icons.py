@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Icon service for documents.
+
+Icons are rendered into a cache directory keyed by the checksum of the file,
+so identical files are only rendered once. Files are rendered in a pool of
+worker processes, and one bibreformat is submitted per batch of documents.
+Documents missing an icon are tracked in :class:`~.models.DocumentIcon`,
+including documents which got a new version since their icon was created.
+"""
+
+from __future__ import absolute_import
+
+import os
+import re
+import shutil
+import uuid
+from multiprocessing import Pool
+
+from celery.utils.log import get_task_logger
+
+from invenio.base.globals import cfg
+from invenio.config import CFG_DATADIR
+from invenio.ext.sqlalchemy import db
+from invenio.legacy.bibdocfile.api import BibDoc, InvenioBibDocFileError
+from invenio.legacy.bibsched.bibtask import task_low_level_submission
+from invenio.legacy.dbquery import run_sql
+from invenio.legacy.websubmit.icon_creator import create_icon, \
+    InvenioWebSubmitIconCreatorError
+
+from .models import DocumentIcon, IconScanState
+
+logger = get_task_logger(__name__)
+
+ICON_SIZE = "90"
+ICON_SUBFORMAT = 'icon-%s' % ICON_SIZE
+ICON_FILEFORMAT = "png"
+
+
+def get_cache_dir():
+    """Get the directory of rendered icons."""
+    return cfg.get('DEPOSIT_ICON_CACHE_DIR') or \
+        os.path.join(CFG_DATADIR, 'icons')
+
+
+def get_icon_path(checksum, cache_dir=None):
+    """Get the path of the rendered icon of a file checksum."""
+    return os.path.join(
+        cache_dir or get_cache_dir(), checksum[:2],
+        "%s.%s" % (checksum, ICON_FILEFORMAT)
+    )
+
+
+def render_icon(args):
+    """Render the icon of a file into the cache (unless already rendered).
+
+    :param args: Tuple ``(checksum, file_path, cache_dir)``.
+    :returns: Tuple ``(checksum, icon_path, error)``.
+    """
+    checksum, file_path, cache_dir = args
+    icon_path = get_icon_path(checksum, cache_dir)
+    if os.path.exists(icon_path):
+        return checksum, icon_path, None
+
+    icon_dir = None
+    try:
+        icon_dir, icon_name = create_icon({
+            'input-file': file_path,
+            'icon-name': "icon-%s" % checksum,
+            'multipage-icon': False,
+            'multipage-icon-delay': 0,
+            'icon-scale': ICON_SIZE,
+            'icon-file-format': ICON_FILEFORMAT,
+            'verbosity': 0,
+        })
+        if not os.path.isdir(os.path.dirname(icon_path)):
+            try:
+                os.makedirs(os.path.dirname(icon_path))
+            except OSError:
+                # Created concurrently by another worker.
+                pass
+        # Rename makes the icon appear atomically in the cache.
+        tmp_path = "%s.%s" % (icon_path, uuid.uuid4().hex)
+        shutil.move(os.path.join(icon_dir, icon_name), tmp_path)
+        os.rename(tmp_path, icon_path)
+        return checksum, icon_path, None
+    except (InvenioWebSubmitIconCreatorError, IOError, OSError) as e:
+        return checksum, None, str(e)
+    finally:
+        if icon_dir and os.path.isdir(icon_dir):
+            shutil.rmtree(icon_dir, ignore_errors=True)
+
+
+class IconService(object):
+
+    """Create icons for many documents at once."""
+
+    def __init__(self, processes=None, reformat=True, cache_dir=None,
+                 submit=None):
+        """Initialize service (defaults are read from configuration).
+
+        :param reformat: Submit one bibreformat for the records of all
+            documents which got an icon.
+        """
+        self.processes = processes or cfg['DEPOSIT_ICON_PROCESSES']
+        self.reformat = reformat
+        self.cache_dir = cache_dir or get_cache_dir()
+        self.submit = submit or task_low_level_submission
+
+    @staticmethod
+    def has_icon(doc):
+        """Check if a document has an icon."""
+        return bool(doc.get_icon(subformat_re=re.compile(ICON_SUBFORMAT)))
+
+    @staticmethod
+    def find_file(doc):
+        """Get the file of a document to create the icon from."""
+        for f in doc.list_latest_files():
+            if not f.is_icon():
+                return f
+        return None
+
+    def render(self, files):
+        """Render icons of files, each distinct checksum only once.
+
+        :param files: List of ``(checksum, file_path)``.
+        :returns: Dictionary ``{checksum: (icon_path, error)}``.
+        """
+        todo = {}
+        for checksum, file_path in files:
+            todo.setdefault(checksum, (checksum, file_path, self.cache_dir))
+        todo = todo.values()
+
+        if len(todo) <= 1 or self.processes <= 1:
+            results = map(render_icon, todo)
+        else:
+            pool = Pool(min(self.processes, len(todo)))
+            try:
+                results = pool.map(render_icon, todo)
+            finally:
+                pool.terminate()
+        return dict(
+            (checksum, (icon_path, error))
+            for checksum, icon_path, error in results
+        )
+
+    def process(self, docs):
+        """Create missing icons of documents.
+
+        :returns: Tuple ``(done, failed, recids)`` with the checksums of
+            documents with an icon by document id, the errors by document
+            id and the records which got a new icon.
+        """
+        done, failed, recids = {}, {}, set()
+
+        items = []
+        for d in docs:
+            if self.has_icon(d):
+                done[d.id] = None
+                continue
+            f = self.find_file(d)
+            if f is None:
+                failed[d.id] = "Document has no file"
+                continue
+            items.append((d, f.get_checksum(), f.get_full_path()))
+
+        rendered = self.render([(c, p) for dummy, c, p in items])
+
+        for d, checksum, dummy in items:
+            icon_path, error = rendered[checksum]
+            if error is not None:
+                failed[d.id] = error
+                continue
+            try:
+                d.add_icon(icon_path, subformat=ICON_SUBFORMAT)
+            except InvenioBibDocFileError as e:
+                failed[d.id] = str(e)
+                continue
+            done[d.id] = checksum
+            recids.update(x['recid'] for x in d.bibrec_links)
+
+        for docid, error in failed.items():
+            logger.warning(
+                "Icon for document %s could not be created: %s" % (
+                    docid, error)
+            )
+        if self.reformat and recids:
+            self.submit_reformat(recids)
+        return done, failed, recids
+
+    def submit_reformat(self, recids):
+        """Submit one bibreformat for many records."""
+        self.submit(
+            'bibreformat', 'openaire', '-i',
+            ",".join(str(r) for r in sorted(recids))
+        )
+
+
+def track_new_documents(chunk_size=10000):
+    """Track documents added since the last check.
+
+    :returns: Number of new documents.
+    """
+    total = 0
+    state = IconScanState.get()
+    while True:
+        docids = [docid for docid, in run_sql(
+            "SELECT DISTINCT id_bibdoc FROM bibdocfsinfo "
+            "WHERE id_bibdoc>%s ORDER BY id_bibdoc LIMIT %s",
+            (state.last_id_bibdoc, chunk_size)
+        )]
+        if not docids:
+            break
+        total += DocumentIcon.track(docids)
+        state.last_id_bibdoc = docids[-1]
+        db.session.commit()
+    return total
+
+
+def track_modified_documents():
+    """Re-queue documents which got a new version after their icon.
+
+    Only files of the latest versions which are not icons are compared with
+    the time the icon status was last modified.
+
+    :returns: Number of re-queued documents.
+    """
+    docids = [docid for docid, in run_sql(
+        "SELECT DISTINCT f.id_bibdoc FROM depositICON AS i "
+        "JOIN bibdocfsinfo AS f ON f.id_bibdoc=i.id_bibdoc "
+        "WHERE i.status<>%s AND f.last_version=1 "
+        "AND f.format NOT LIKE '%%;icon%%' AND f.md>i.modified",
+        (DocumentIcon.PENDING, )
+    )]
+    if docids:
+        DocumentIcon.requeue(docids)
+        db.session.commit()
+    return len(docids)
+
+
+def process_pending(service=None, batch_size=None, max_batches=None):
+    """Create icons of pending documents in batches.
+
+    :returns: Tuple ``(processed, remaining)`` where ``remaining`` tells if
+        pending documents are left after ``max_batches`` batches.
+    """
+    service = service or IconService()
+    batch_size = batch_size or cfg['DEPOSIT_ICON_BATCH_SIZE']
+    max_batches = max_batches or cfg['DEPOSIT_ICON_MAX_BATCHES']
+    max_attempts = cfg['DEPOSIT_ICON_MAX_ATTEMPTS']
+
+    processed = 0
+    for dummy in xrange(max_batches):
+        pending = DocumentIcon.get_pending(limit=batch_size)
+        if not pending:
+            return processed, False
+
+        status = dict((p.id_bibdoc, p) for p in pending)
+        docs, missing = [], {}
+        for docid in status:
+            try:
+                docs.append(BibDoc(docid))
+            except InvenioBibDocFileError as e:
+                missing[docid] = str(e)
+
+        done, failed, recids = service.process(docs)
+        for docid, checksum in done.items():
+            status[docid].done(checksum)
+        for docid in failed:
+            status[docid].failed(max_attempts)
+        for docid in missing:
+            # Deleted documents are not retried.
+            status[docid].failed(1)
+        db.session.commit()
+        processed += len(pending)
+    return processed, bool(DocumentIcon.get_pending(limit=1))
+
+
+def create_icons(docs, reformat=True):
+    """Create missing icons of documents and track their status.
+
+    :returns: Set of records which got a new icon.
+    """
+    done, failed, recids = IconService(reformat=reformat).process(docs)
+    for docid, checksum in done.items():
+        DocumentIcon.get_or_create(docid).done(checksum)
+    for docid in failed:
+        DocumentIcon.get_or_create(docid).failed(
+            cfg['DEPOSIT_ICON_MAX_ATTEMPTS'])
+    db.session.commit()
+    return recids
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""License registry.
+
+The licenses knowledge base is loaded once per worker into an immutable
+registry holding the decoded licenses and the pre-sorted choice lists for
+every combination of license domains. The registry is rebuilt when the
+knowledge base changes (any worker committing a change to a mapping of the
+licenses knowledge base bumps the registry version in the cache) or when it
+is older than ``DEPOSIT_LICENSES_TTL``.
+"""
+
+from __future__ import absolute_import
+
+import json
+import threading
+import time
+import uuid
+from itertools import product
+from operator import itemgetter
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+from invenio.modules.knowledge.api import get_kb_mappings
+from invenio.modules.knowledge.models import KnwKB, KnwKBRVAL
+
+VERSION_KEY = "deposit::licenses::version"
+
+DOMAINS = ('domain_data', 'domain_content', 'domain_software')
+
+
+class LicenseRegistry(object):
+
+    """Immutable registry of licenses."""
+
+    def __init__(self, mappings, version=None):
+        """Build registry.
+
+        :param mappings: Iterable of ``(key, license)`` pairs.
+        :param version: Version of the registry.
+        """
+        self.version = version
+        self.created = time.time()
+        self.licenses = dict(mappings)
+
+        ordered = sorted(
+            ((k, l['title']) for k, l in self.licenses.items()),
+            key=itemgetter(1),
+        )
+        self.choices = {}
+        for flags in product((True, False), repeat=len(DOMAINS)):
+            self.choices[flags] = tuple(
+                (k, title) for k, title in ordered
+                if any(self.licenses[k].get(d) and f
+                       for d, f in zip(DOMAINS, flags))
+            )
+
+    @classmethod
+    def from_kb(cls, kb_name, version=None):
+        """Build registry from a knowledge base."""
+        return cls(
+            ((m['key'], json.loads(m['value']))
+             for m in get_kb_mappings(kb_name, '', '')),
+            version=version,
+        )
+
+    def get(self, key):
+        """Get a license by its identifier."""
+        return self.licenses.get(key)
+
+    def get_choices(self, domain_data=True, domain_content=True,
+                    domain_software=True):
+        """Get choices of licenses valid in any of the given domains."""
+        return list(self.choices[
+            (bool(domain_data), bool(domain_content), bool(domain_software))
+        ])
+
+
+_registry = None
+_registry_checked = 0
+_registry_lock = threading.Lock()
+
+
+def get_version():
+    """Get current version of the license registry."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = invalidate_registry()
+    return version
+
+
+def invalidate_registry():
+    """Invalidate license registry in all workers."""
+    version = uuid.uuid4().hex
+    cache.set(VERSION_KEY, version, timeout=0)
+    return version
+
+
+def get_registry():
+    """Get the license registry of this worker (built on first use)."""
+    global _registry, _registry_checked
+
+    now = time.time()
+    if _registry is not None and \
+            now - _registry_checked < cfg['DEPOSIT_LICENSES_CHECK_INTERVAL']:
+        return _registry
+
+    with _registry_lock:
+        version = get_version()
+        if _registry is None or _registry.version != version or \
+                now - _registry.created > cfg['DEPOSIT_LICENSES_TTL']:
+            _registry = LicenseRegistry.from_kb(
+                cfg['DEPOSIT_LICENSES_KB'], version=version
+            )
+        _registry_checked = now
+    return _registry
+
+
+def get_license(key):
+    """Get a license by its identifier."""
+    return get_registry().get(key)
+
+
+def get_license_choices(**kwargs):
+    """Get license choices (see :meth:`LicenseRegistry.get_choices`)."""
+    return get_registry().get_choices(**kwargs)
+
+
+KB_ID_INFO = 'deposit_licenses_kb_id'
+CHANGED_INFO = 'deposit_licenses_changed'
+
+
+def _kb_mapping_changed(mapper, connection, target):
+    """Flag the session if a mapping of the licenses KB changed.
+
+    The id of the licenses KB is looked up once per transaction.
+    """
+    session = object_session(target)
+    if session is None:
+        return
+    if KB_ID_INFO not in session.info:
+        session.info[KB_ID_INFO] = connection.execute(
+            select([KnwKB.id]).where(KnwKB.name == cfg['DEPOSIT_LICENSES_KB'])
+        ).scalar()
+    if target.id_knwKB == session.info[KB_ID_INFO]:
+        session.info[CHANGED_INFO] = True
+
+
+def _session_committed(session):
+    """Invalidate registry once the changed mappings are committed."""
+    session.info.pop(KB_ID_INFO, None)
+    if session.info.pop(CHANGED_INFO, False):
+        invalidate_registry()
+
+
+def _session_rolled_back(session):
+    """Forget the changes of a rolled back transaction."""
+    session.info.pop(KB_ID_INFO, None)
+    session.info.pop(CHANGED_INFO, None)
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(KnwKBRVAL, _event, _kb_mapping_changed)
+event.listen(Session, 'after_commit', _session_committed)
+event.listen(Session, 'after_rollback', _session_rolled_back)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Database models for deposit."""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from invenio.ext.sqlalchemy import db
+
+
+class DocumentIcon(db.Model):
+
+    """Icon status of a document.
+
+    Documents are tracked once, so that documents missing an icon can be
+    found without scanning the formats of all documents. Documents getting
+    a new version are marked as pending again.
+    """
+
+    __tablename__ = 'depositICON'
+
+    PENDING = 'P'
+    DONE = 'D'
+    FAILED = 'F'
+
+    id_bibdoc = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                          primary_key=True, autoincrement=False)
+    """Document."""
+
+    status = db.Column(db.String(1), nullable=False, default=PENDING,
+                       index=True)
+    """Pending, done or failed."""
+
+    checksum = db.Column(db.String(32), nullable=True, index=True)
+    """Checksum of the file the icon was created from."""
+
+    attempts = db.Column(db.Integer(5, unsigned=True), nullable=False,
+                         default=0)
+    """Number of failed attempts to create the icon."""
+
+    modified = db.Column(db.DateTime, nullable=False, default=datetime.now,
+                         onupdate=datetime.now)
+    """Modification timestamp."""
+
+    @classmethod
+    def track(cls, docids):
+        """Track new documents as pending (caller commits).
+
+        :returns: Number of documents which were not tracked yet.
+        """
+        tracked = set(docid for docid, in db.session.query(
+            cls.id_bibdoc).filter(cls.id_bibdoc.in_(docids)))
+        new = [cls(id_bibdoc=docid) for docid in docids
+               if docid not in tracked]
+        db.session.add_all(new)
+        return len(new)
+
+    @classmethod
+    def requeue(cls, docids):
+        """Mark documents as missing an icon again (caller commits)."""
+        cls.query.filter(cls.id_bibdoc.in_(docids)).update(
+            dict(status=cls.PENDING, attempts=0), synchronize_session=False)
+
+    @classmethod
+    def get_or_create(cls, docid):
+        """Get the icon status of a document (caller commits)."""
+        obj = cls.query.get(docid)
+        if obj is None:
+            obj = cls(id_bibdoc=docid, status=cls.PENDING, attempts=0)
+            db.session.add(obj)
+        return obj
+
+    @classmethod
+    def get_pending(cls, limit=None):
+        """Get documents still missing an icon."""
+        q = cls.query.filter_by(status=cls.PENDING).order_by(cls.id_bibdoc)
+        return q.limit(limit).all() if limit else q.all()
+
+    def done(self, checksum=None):
+        """Mark the icon of the document as created (caller commits)."""
+        self.status = self.DONE
+        self.checksum = checksum
+
+    def failed(self, max_attempts):
+        """Count a failed attempt (caller commits)."""
+        self.attempts += 1
+        if self.attempts >= max_attempts:
+            self.status = self.FAILED
+
+
+class IconScanState(db.Model):
+
+    """Checkpoint of the scan for new documents.
+
+    Documents may be tracked out of order (e.g. by the post-publish
+    pipeline), so the highest scanned document is stored separately from
+    the tracked documents.
+    """
+
+    __tablename__ = 'depositICONSCAN'
+
+    id = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                   primary_key=True, autoincrement=True)
+
+    last_id_bibdoc = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                               default=0)
+    """Highest scanned document."""
+
+    modified = db.Column(db.DateTime, nullable=False, default=datetime.now,
+                         onupdate=datetime.now)
+    """Modification timestamp."""
+
+    @classmethod
+    def get(cls):
+        """Get the scan state (caller commits)."""
+        obj = cls.query.first()
+        if obj is None:
+            obj = cls(last_id_bibdoc=0)
+            db.session.add(obj)
+        return obj
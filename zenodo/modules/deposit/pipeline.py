@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Post-publish pipeline of a record.
+
+The record and its documents are loaded once into a :class:`PipelineContext`
+which is shared by all steps. Steps are run concurrently as soon as the
+steps they require have finished, and instead of uploading MARC on their own
+they add fields to the context, which are merged into a single bibupload at
+the end of the pipeline.
+"""
+
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from flask import current_app
+
+from invenio.base.globals import cfg
+from invenio.ext.logging.wrappers import register_exception
+from invenio.legacy.bibdocfile.api import BibRecDocs
+from invenio.legacy.bibrecord import record_add_field
+from invenio.modules.records.api import get_record
+
+_timings_lock = threading.Lock()
+_timings = defaultdict(lambda: dict(count=0, errors=0, total=0.0, max=0.0))
+
+
+def record_timing(name, elapsed, error=False):
+    """Add the run time of a step to the timings of this process."""
+    with _timings_lock:
+        timing = _timings[name]
+        timing['count'] += 1
+        timing['total'] += elapsed
+        timing['max'] = max(timing['max'], elapsed)
+        if error:
+            timing['errors'] += 1
+
+
+def get_timings():
+    """Get the step timings of this process.
+
+    :returns: Dictionary ``{step: {count, errors, total, max, mean}}`` with
+        times in seconds.
+    """
+    with _timings_lock:
+        timings = dict((k, dict(v)) for k, v in _timings.items())
+    for timing in timings.values():
+        timing['mean'] = timing['total'] / timing['count'] \
+            if timing['count'] else 0.0
+    return timings
+
+
+class PipelineContext(object):
+
+    """State of one record shared by the steps of a pipeline."""
+
+    def __init__(self, recid, record=None, docs=None):
+        """Initialize context.
+
+        :param record: Pre-loaded record (loaded on first access otherwise).
+        :param docs: Pre-loaded list of ``BibDoc`` (loaded on first access
+            otherwise).
+        """
+        self.recid = int(recid)
+        self._record = record
+        self._docs = docs
+        self.lock = threading.Lock()
+        self.fields = []
+        self.reformat = False
+        self.timings = {}
+        self.errors = {}
+
+    @property
+    def record(self):
+        """Record being processed."""
+        if self._record is None:
+            self._record = get_record(self.recid)
+        return self._record
+
+    @property
+    def docs(self):
+        """Documents of the record being processed."""
+        if self._docs is None:
+            self._docs = BibRecDocs(self.recid).list_bibdocs()
+        return self._docs
+
+    def load(self):
+        """Load the record and its documents before the steps are run."""
+        return self.record, self.docs
+
+    def add_field(self, tag, ind1=' ', ind2=' ', subfields=None,
+                  controlfield_value=''):
+        """Add a MARC field to be uploaded at the end of the pipeline."""
+        with self.lock:
+            self.fields.append(
+                (tag, ind1, ind2, subfields or [], controlfield_value)
+            )
+
+    def add_record(self, rec):
+        """Add all fields of a MARC record (except its ``001``)."""
+        for tag, fields in rec.items():
+            if tag == '001':
+                continue
+            for subfields, ind1, ind2, controlfield_value, dummy in fields:
+                self.add_field(tag, ind1, ind2, subfields, controlfield_value)
+
+    def get_record(self):
+        """Merge all added fields into one MARC record.
+
+        :returns: MARC record or ``None`` if no fields were added.
+        """
+        if not self.fields:
+            return None
+        rec = {}
+        record_add_field(rec, '001', controlfield_value=str(self.recid))
+        for tag, ind1, ind2, subfields, controlfield_value in self.fields:
+            record_add_field(
+                rec, tag, ind1=ind1, ind2=ind2, subfields=subfields,
+                controlfield_value=controlfield_value
+            )
+        return rec
+
+
+class Pipeline(object):
+
+    """Directed acyclic graph of steps run on a record.
+
+    A step is a function taking a :class:`PipelineContext`. A failing step
+    does not stop the pipeline, but all steps requiring it are skipped.
+    """
+
+    def __init__(self, concurrency=None):
+        """Initialize pipeline."""
+        self.concurrency = concurrency
+        self.steps = {}
+        self.order = []
+
+    def step(self, name, requires=None):
+        """Decorator to add a step to the pipeline."""
+        requires = tuple(requires or ())
+
+        def decorator(f):
+            for r in requires:
+                if r not in self.steps:
+                    raise ValueError(
+                        "Step %s requires unknown step %s" % (name, r))
+            if name in self.steps:
+                raise ValueError("Step %s already exists" % name)
+            self.steps[name] = (f, requires)
+            self.order.append(name)
+            return f
+        return decorator
+
+    def run(self, ctx, upload=None):
+        """Run all steps and upload the merged MARC record.
+
+        Steps are added in dependency order, hence the graph is acyclic.
+
+        :param upload: Function called with the merged MARC record (no
+            upload if ``None``).
+        :returns: The context.
+        """
+        app = current_app._get_current_object()
+        start = time.time()
+        ctx.load()
+        ctx.timings['load'] = time.time() - start
+
+        def _run(name):
+            f, dummy = self.steps[name]
+            t = time.time()
+            error = None
+            with app.app_context():
+                try:
+                    f(ctx)
+                except Exception as e:
+                    error = e
+                    register_exception(
+                        prefix='Post-publish step %s failed for record %s' % (
+                            name, ctx.recid),
+                        alert_admin=False
+                    )
+            return name, time.time() - t, error
+
+        done = set()
+        failed = set()
+        pending = list(self.order)
+        running = [0]
+        cond = threading.Condition()
+
+        def _callback(result):
+            name, elapsed, error = result
+            record_timing(name, elapsed, error=error is not None)
+            with cond:
+                ctx.timings[name] = elapsed
+                if error is not None:
+                    ctx.errors[name] = error
+                    failed.add(name)
+                done.add(name)
+                running[0] -= 1
+                cond.notify()
+
+        pool = ThreadPool(
+            max(1, self.concurrency or cfg['DEPOSIT_PIPELINE_CONCURRENCY'])
+        )
+        try:
+            with cond:
+                while pending or running[0]:
+                    for name in list(pending):
+                        requires = self.steps[name][1]
+                        if any(r in failed for r in requires):
+                            # Skip steps depending on a failed step.
+                            pending.remove(name)
+                            failed.add(name)
+                        elif all(r in done for r in requires):
+                            pending.remove(name)
+                            running[0] += 1
+                            pool.apply_async(
+                                _run, (name, ), callback=_callback)
+                    if running[0]:
+                        cond.wait()
+        finally:
+            pool.close()
+            pool.join()
+
+        rec = ctx.get_record()
+        if rec is not None and upload is not None:
+            t = time.time()
+            upload(rec)
+            ctx.timings['upload'] = time.time() - t
+            record_timing('upload', ctx.timings['upload'])
+        ctx.timings['total'] = time.time() - start
+        record_timing('total', ctx.timings['total'])
+        return ctx
@@ -22,13 +22,13 @@
 
 from flask import request, current_app
 from invenio.utils.text import nice_size
-from invenio.ext.email import send_email
 from invenio.ext.template import render_template_to_string
 from invenio.base.globals import cfg
 from invenio.modules.deposit.form import WebDepositForm
 from invenio.modules.deposit.fields.file_upload import FileUploadField
 from invenio.modules.deposit.field_widgets import PLUploadWidget
 from invenio.modules.deposit.models import DepositionDraftCacheManager
+from zenodo.modules.mailqueue.api import queue_email
 
 
 class UploadForm(WebDepositForm):
@@ -75,7 +75,7 @@ def large_file_notification(sender, deposition=None, deposition_file=None,
     """
     if deposition_file and deposition_file.size > 10485760:
         current_app.logger.info(deposition_file.__getstate__())
-        send_email(
+        queue_email(
             cfg['CFG_SITE_SUPPORT_EMAIL'],
             cfg['CFG_SITE_ADMIN_EMAIL'],
             subject="%s: %s file uploaded" % (
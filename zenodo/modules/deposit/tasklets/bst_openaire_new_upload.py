@@ -25,9 +25,7 @@ Simple tasklet that is called after a bibupload of a new record
 """
 
 from invenio.modules.pidstore.tasks import datacite_register
-from zenodo.modules.deposit.tasks import openaire_create_icon, \
-    openaire_altmetric_update, openaire_upload_notification
-from zenodo.modules.preservationmeter.tasks import calculate_preservation_score
+from zenodo.modules.deposit.tasks import openaire_postpublish
 
 
 def bst_openaire_new_upload(recid=None):
@@ -35,12 +33,10 @@ def bst_openaire_new_upload(recid=None):
     if recid is None:
         return
 
-    # Ship of tasks to Celery for background processing
+    # Ship of tasks to Celery for background processing. DOI registration
+    # runs as its own task, so that it is retried on DataCite errors.
     datacite_register.delay(recid)
-    openaire_create_icon.delay(recid=recid)
-    openaire_altmetric_update.delay([recid])
-    openaire_upload_notification.delay(recid=recid)
-    calculate_preservation_score.delay(recid=recid)
+    openaire_postpublish.delay(recid)
 
 if __name__ == '__main__':
     bst_openaire_new_upload()
@@ -25,109 +25,121 @@ from __future__ import absolute_import
 from celery import chain
 from celery.utils.log import get_task_logger
 
-import os
-import re
-from tempfile import mkstemp
-import time
-
 from invenio.base.globals import cfg
-from invenio.legacy.bibdocfile.api import BibDoc, BibRecDocs, \
-    InvenioBibDocFileError
+from invenio.legacy.bibdocfile.api import BibDoc, BibRecDocs
 from invenio.modules.formatter import format_record
-from invenio.legacy.bibrecord import record_add_field, record_xml_output
 from invenio.legacy.bibsched.bibtask import task_low_level_submission
-from invenio.modules.records.api import get_record
 from invenio.celery import celery
-from invenio.config import CFG_TMPSHAREDDIR, CFG_DATACITE_SITE_URL, \
-    CFG_SITE_SUPPORT_EMAIL, CFG_SITE_NAME
-from invenio.ext.email import send_email
-from invenio.legacy.dbquery import run_sql
+from invenio.config import CFG_DATACITE_SITE_URL
 from invenio.ext.logging.wrappers import register_exception
-from invenio.legacy.search_engine import search_pattern, get_fieldvalues
-from invenio.legacy.websubmit.icon_creator import create_icon, \
-    InvenioWebSubmitIconCreatorError
+from invenio.legacy.search_engine import search_pattern
 from invenio.modules.pidstore.models import PersistentIdentifier
-from invenio.modules.communities.models import Community
-from invenio.ext.template import render_template_to_string
-
+from zenodo.modules.communities.digests import queue_upload
+from zenodo.modules.preservationmeter.tasks import record_preservation_score
 
-try:
-    from altmetric import Altmetric, AltmetricHTTPException
-except ImportError, e:
-    register_exception(
-        prefix='Altmetric module not installed: %s' % str(e),
-        alert_admin=False
-    )
+from .accumulator import bibupload_records, flush_all
+from .altmetric import AltmetricHarvester
+from .icons import create_icons, process_pending, \
+    track_modified_documents, track_new_documents
+from .pipeline import Pipeline, PipelineContext
 
 
 # Setup logger
 logger = get_task_logger(__name__)
 
 
-ICON_SIZE = "90"
-ICON_SUBFORMAT = 'icon-%s' % ICON_SIZE
-ICON_FILEFORMAT = "png"
-MAX_RECORDS = 100
 DEPOSIT_DATACITE_OF = 'dcite3'
 
 
-def open_temp_file(prefix):
-    """
-    Create a temporary file to write MARC XML in
-    """
-    # Prepare to save results in a tmp file
-    (fd, filename) = mkstemp(
-        dir=CFG_TMPSHAREDDIR,
-        prefix='prefix_' + time.strftime("%Y%m%d_%H%M%S_", time.localtime())
-    )
-    file_out = os.fdopen(fd, "w")
-    logger.debug("Created temporary file %s" % filename)
+#
+# Post-publish pipeline
+#
+postpublish = Pipeline()
 
-    return (file_out, filename)
 
+@postpublish.step('icon')
+def postpublish_icon(ctx):
+    """Create icons for the documents of the record."""
+    if create_icons(ctx.docs, reformat=False):
+        ctx.reformat = True
+
+
+@postpublish.step('altmetric')
+def postpublish_altmetric(ctx):
+    """Retrieve Altmetric information of the record."""
+    harvester = AltmetricHarvester()
+    for rec in harvester.harvest([ctx.recid]):
+        ctx.add_record(rec)
+    for recid, doi_val, e in harvester.errors:
+        logger.warning(
+            'Altmetric error for recid %s with DOI %s: %s'
+            % (recid, doi_val, str(e))
+        )
 
-def bibupload(record=None, collection=None, file_prefix="", mode="-c"):
-    """
-    General purpose function that will write a MARCXML file and call bibupload
-    on it.
-    """
-    if collection is None and record is None:
-        return
-
-    (file_out, filename) = open_temp_file(file_prefix)
-
-    if collection is not None:
-        file_out.write("<collection>")
-        tot = 0
-        for rec in collection:
-            file_out.write(record_xml_output(rec))
-            tot += 1
-            if tot == MAX_RECORDS:
-                file_out.write("</collection>")
-                file_out.close()
-                logger.debug(
-                    "Submitting bibupload %s -n %s" % (mode, filename))
-                task_low_level_submission(
-                    'bibupload', 'openaire', mode, filename, '-n')
-
-                (file_out, filename) = open_temp_file(file_prefix)
-                file_out.write("<collection>")
-                tot = 0
-        file_out.write("</collection>")
-    elif record is not None:
-        tot = 1
-        file_out.write(record_xml_output(record))
-
-    file_out.close()
-    if tot > 0:
-        logger.debug("Submitting bibupload %s -n %s" % (mode, filename))
-        task_low_level_submission(
-            'bibupload', 'openaire', mode, filename, '-n')
+
+@postpublish.step('preservation')
+def postpublish_preservation(ctx):
+    """Calculate the preservation score of the record."""
+    ctx.add_field('347', subfields=[
+        ('p', str(record_preservation_score(ctx.record))),
+    ])
+
+
+@postpublish.step('notification')
+def postpublish_notification(ctx):
+    """Notify user collections of the new record."""
+    queue_upload(ctx.recid)
 
 
 #
 # Tasks
 #
+@celery.task(ignore_result=True)
+def openaire_bibupload_flush(force=False):
+    """
+    Submit records waiting in the bibupload accumulator.
+
+    Records are otherwise only submitted when new records are added. Use by
+    adding this task to your CELERYBEAT_SCHEDULE
+
+    .. code-block:: python
+       CELERYBEAT_SCHEDULE = {
+            'bibupload-flush': dict(
+                task='zenodo.modules.deposit.tasks.openaire_bibupload_flush',
+                schedule=timedelta(minutes=1),
+            ),
+            # ...
+        }
+    """
+    tasks = flush_all(force=force)
+    if tasks:
+        logger.info("Submitted %s bibupload tasks." % tasks)
+
+
+@celery.task(ignore_result=True)
+def openaire_postpublish(recid):
+    """
+    Run the post-publish pipeline of a new record.
+
+    All changes to the record are uploaded in a single bibupload.
+    """
+    ctx = postpublish.run(
+        PipelineContext(recid),
+        upload=lambda rec: bibupload_records([rec]),
+    )
+    if ctx.reformat and not ctx.fields:
+        # Uploading the record reformats it as well.
+        task_low_level_submission('bibreformat', 'openaire', '-i', str(recid))
+
+    logger.info("Post-publish pipeline of record %s: %s" % (
+        recid, ", ".join("%s %.2fs" % (k, v)
+                         for k, v in sorted(ctx.timings.items()))
+    ))
+    for name, e in ctx.errors.items():
+        logger.warning("Post-publish step %s failed for record %s: %s" % (
+            name, recid, str(e)))
+
+
 @celery.task(ignore_result=True)
 def openaire_create_icon(docid=None, recid=None, reformat=True):
     """
@@ -140,84 +152,26 @@ def openaire_create_icon(docid=None, recid=None, reformat=True):
         docs = [BibDoc(docid)]
 
     # Celery task will fail if BibDoc does not exists (on purpose ;-)
-    for d in docs:
-        logger.debug("Checking document %s" % d)
-        if not d.get_icon(subformat_re=re.compile(ICON_SUBFORMAT)):
-            logger.debug("Document has no icon")
-            for f in d.list_latest_files():
-                logger.debug("Checking file %s" % f)
-                if not f.is_icon():
-                    logger.debug("File not an icon")
-                    file_path = f.get_full_path()
-                    icon_path = None
-                    try:
-                        filename = os.path.splitext(
-                            os.path.basename(file_path)
-                        )[0]
-                        logger.info("Creating icon from file %s" % file_path)
-                        (icon_dir, icon_name) = create_icon(
-                            {'input-file': file_path,
-                             'icon-name': "icon-%s" % filename,
-                             'multipage-icon': False,
-                             'multipage-icon-delay': 0,
-                             'icon-scale': ICON_SIZE,
-                             'icon-file-format': ICON_FILEFORMAT,
-                             'verbosity': 0})
-                        icon_path = os.path.join(icon_dir, icon_name)
-                    except InvenioWebSubmitIconCreatorError, e:
-                        logger.warning(
-                            'Icon for file %s could not be created: %s' % (
-                                file_path, str(e))
-                            )
-                        register_exception(
-                            prefix='Icon for file %s could not be created: %s'
-                                   % (file_path, str(e)),
-                            alert_admin=False
-                        )
-
-                    try:
-                        if icon_path and os.path.exists(icon_path):
-                            logger.debug(
-                                "Adding icon %s to document" % icon_path)
-                            d.add_icon(icon_path, subformat=ICON_SUBFORMAT)
-                            recid_list = ",".join(
-                                [str(x['recid']) for x in d.bibrec_links])
-                            if reformat:
-                                task_low_level_submission(
-                                    'bibreformat', 'openaire', '-i',
-                                    recid_list
-                                )
-
-                    except InvenioBibDocFileError, e:
-                        logger.warning(
-                            'Icon %s for file %s could not be added to '
-                            'document: %s' % (icon_path, f, str(e))
-                        )
-                        register_exception(
-                            prefix='Icon %s for file %s could not be added'
-                                   ' to document: %s' % (icon_path, f, str(e)),
-                            alert_admin=False
-                        )
+    create_icons(docs, reformat=reformat)
 
 
 @celery.task(ignore_result=True)
 def openaire_check_icons():
     """
     Task to run a check of documents with out icons.
-    """
-    docs = run_sql("""
-        SELECT f.id_bibdoc
-        FROM bibdocfsinfo AS f
-        LEFT OUTER JOIN (
-            SELECT DISTINCT id_bibdoc, 1
-            FROM bibdocfsinfo
-            WHERE format LIKE '%;icon' AND last_version=1
-        ) AS i ON i.id_bibdoc=f.id_bibdoc
-        WHERE i.id_bibdoc is null
-    """)
 
-    for docid, in docs:
-        openaire_create_icon.delay(docid=docid, reformat=False)
+    New documents and documents with a new version are tracked as pending,
+    and pending documents are processed in batches with one bibreformat per
+    batch. The task is requeued until no pending documents are left.
+    """
+    new = track_new_documents()
+    modified = track_modified_documents()
+    processed, remaining = process_pending()
+    logger.info(
+        "Icons: %s new documents, %s new versions, %s documents processed."
+        % (new, modified, processed))
+    if remaining:
+        openaire_check_icons.delay()
 
 
 @celery.task(ignore_result=True)
@@ -227,15 +181,17 @@ def openaire_altmetric_check_all():
     """
     # Records with DOI
     recids = search_pattern(p="0->Z", f="0247_a")
+    chunk_size = cfg['DEPOSIT_ALTMETRIC_CHUNK_SIZE']
 
-    # Do not parallelize tasks to not overload Altmetric
+    # Do not parallelize tasks to not overload Altmetric (each task is rate
+    # limited on its own).
     subtasks = []
     logger.debug("Checking Altmetric for %s records" % len(recids))
-    for i in xrange(0, len(recids), MAX_RECORDS):
+    for i in xrange(0, len(recids), chunk_size):
         # Creating immutable subtasks - see
         # http://docs.celeryproject.org/en/latest/userguide/canvas.html
         subtasks.append(
-            openaire_altmetric_update.si(list(recids[i:i + MAX_RECORDS])))
+            openaire_altmetric_update.si(list(recids[i:i + chunk_size])))
 
     chain(*subtasks).apply_async()
 
@@ -243,53 +199,25 @@ def openaire_altmetric_check_all():
 @celery.task(ignore_result=True)
 def openaire_altmetric_update(recids, upload=True):
     """
-    Retrieve Altmetric information for a record.
+    Retrieve Altmetric information for a list of records.
     """
     logger.debug("Checking Altmetric for recids %s" % recids)
-    a = Altmetric()
-
-    records = []
-    for recid in recids:
-        logger.debug("Checking Altmetric for recid %s" % recid)
-        try:
-            # Check if we already have an Altmetric id
-            sysno_inst = get_fieldvalues(recid, "035__9")
-            if ['Altmetric'] in sysno_inst:
-                continue
-
-            doi_val = get_fieldvalues(recid, "0247_a")[0]
-            logger.debug("Found DOI %s" % doi_val)
-            json_res = a.doi(doi_val)
-            logger.debug("Altmetric response: %s" % json_res)
-
-            rec = {}
-            record_add_field(rec, "001", controlfield_value=str(recid))
-
-            if json_res:
-                record_add_field(rec, '035', subfields=[
-                    ('a', str(json_res['altmetric_id'])),
-                    ('9', 'Altmetric')
-                ])
-                records.append(rec)
-        except AltmetricHTTPException, e:
-            logger.warning(
-                'Altmetric error for recid %s with DOI %s (status code %s): %s'
-                % (recid, doi_val, e.status_code, str(e))
-            )
-            register_exception(
-                prefix='Altmetric error (status code %s): %s' % (
-                    e.status_code, str(e)),
-                alert_admin=False
-            )
-        except IndexError:
-            logger.debug("No DOI found")
-            pass
+    harvester = AltmetricHarvester()
+    records = harvester.harvest(recids)
+
+    for recid, doi_val, e in harvester.errors:
+        logger.warning(
+            'Altmetric error for recid %s with DOI %s: %s'
+            % (recid, doi_val, str(e))
+        )
+        register_exception(
+            prefix='Altmetric error for recid %s: %s' % (recid, str(e)),
+            alert_admin=False
+        )
+    logger.info(harvester.report())
 
     if upload and records:
-        if len(records) == 1:
-            bibupload(record=records[0], file_prefix="altmetric")
-        else:
-            bibupload(collection=records, file_prefix="altmetric")
+        bibupload_records(records)
 
     return records
 
@@ -297,31 +225,9 @@ def openaire_altmetric_update(recids, upload=True):
 @celery.task(ignore_result=True)
 def openaire_upload_notification(recid):
     """
-    Send a notification to all user collections.
+    Queue a notification to all user collections.
+
+    The notifications are sent in digests, see
+    :func:`zenodo.modules.communities.tasks.send_upload_digests`.
     """
-    ctx = {
-        'record': get_record(recid),
-    }
-
-    ucolls = Community.from_recid(recid, provisional=True)
-    for c in ucolls:
-        try:
-            if c.owner.email:
-                ctx.update({
-                    'community': c,
-                })
-                content = render_template_to_string(
-                    "communities/new_upload_email.html", **ctx)
-                send_email(
-                    CFG_SITE_SUPPORT_EMAIL,
-                    c.owner.email.encode('utf8'),
-                    "[%s] New upload to %s" % (
-                        CFG_SITE_NAME,
-                        c.title.encode('utf8')
-                    ),
-                    content=content.encode('utf8')
-                )
-                logger.info("Sent email for new record %s to %s." %
-                            (recid, c.owner.email.encode('utf8')))
-        except AttributeError:
-            pass
+    queue_upload(recid)
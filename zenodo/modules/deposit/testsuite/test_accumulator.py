@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test streaming bibupload accumulator."""
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class FakeClock(object):
+
+    """Clock which only advances when told so."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BibuploadAccumulatorTestCase(InvenioTestCase):
+
+    """Test batching and back-pressure of bibupload submissions."""
+
+    def setUp(self):
+        from invenio.ext.cache import cache
+        from zenodo.modules.deposit.accumulator import \
+            BibuploadAccumulator, COUNTERS_KEY, LOCK_KEY
+        cache.delete(COUNTERS_KEY)
+        cache.delete(LOCK_KEY.format('-c'))
+        self.spool = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.submitted = []
+        self.queue = [0]
+        self.acc = BibuploadAccumulator(
+            mode='-c', alias='test', options=['-n'], max_records=3,
+            window=60, max_waiting=5, spool_dir=self.spool,
+            submit=self.submit, waiting=lambda: self.queue[0],
+            clock=self.clock,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.spool)
+        for args in self.submitted:
+            os.remove(args[3])
+
+    def submit(self, *args):
+        with open(args[3]) as fp:
+            self.submitted.append(args + (fp.read(), ))
+
+    def records(self, *recids):
+        return ['<record><controlfield tag="001">%s</controlfield></record>'
+                % r for r in recids]
+
+    def test_batch(self):
+        from zenodo.modules.deposit.accumulator import get_counters
+        self.acc.add(self.records(1, 2))
+        self.assertEqual(self.submitted, [])
+        self.assertEqual(len(self.acc.pending()), 2)
+
+        self.acc.add(self.records(3, 4))
+        self.assertEqual(len(self.submitted), 1)
+        args = self.submitted[0]
+        self.assertEqual(args[:3], ('bibupload', 'test', '-c'))
+        self.assertEqual(args[4:-1], ('-n', ))
+        content = args[-1]
+        assert content.startswith('<collection>')
+        assert content.strip().endswith('</collection>')
+        self.assertEqual(content.count('<record>'), 3)
+        assert content.index('>1<') < content.index('>2<') < \
+            content.index('>3<')
+        assert '>4<' not in content
+        self.assertEqual(len(self.acc.pending()), 1)
+
+        counters = get_counters()
+        self.assertEqual(counters['tasks'], 1)
+        self.assertEqual(counters['records'], 3)
+        self.assertEqual(counters['records_per_task'], 3.0)
+
+    def test_window(self):
+        self.acc.add(self.records(1))
+        self.assertEqual(self.acc.flush(), 0)
+        self.clock.now += 61
+        self.assertEqual(self.acc.flush(), 1)
+        self.assertEqual(self.acc.pending(), [])
+
+    def test_force(self):
+        self.acc.add(self.records(1))
+        self.assertEqual(self.acc.flush(force=True), 1)
+        self.assertEqual(self.acc.flush(force=True), 0)
+
+    def test_backpressure(self):
+        from zenodo.modules.deposit.accumulator import get_counters
+        self.queue[0] = 5
+        self.acc.add(self.records(1, 2, 3, 4, 5, 6, 7))
+        self.assertEqual(self.submitted, [])
+        self.assertEqual(len(self.acc.pending()), 7)
+        self.assertEqual(get_counters()['deferred'], 1)
+
+        self.queue[0] = 0
+        self.assertEqual(self.acc.flush(), 2)
+        self.assertEqual(len(self.acc.pending()), 1)
+        self.assertEqual(get_counters()['max_records_per_task'], 3)
+
+    def test_locked(self):
+        from invenio.ext.cache import cache
+        from zenodo.modules.deposit.accumulator import LOCK_KEY
+        cache.set(LOCK_KEY.format('-c'), True)
+        try:
+            self.acc.add(self.records(1, 2, 3))
+            self.assertEqual(self.submitted, [])
+        finally:
+            cache.delete(LOCK_KEY.format('-c'))
+        self.assertEqual(self.acc.flush(), 1)
+
+    def test_submit_error(self):
+        def submit(*args):
+            raise RuntimeError()
+        self.acc.submit = submit
+        self.assertRaises(RuntimeError, self.acc.add, self.records(1, 2, 3))
+        self.assertEqual(len(self.acc.pending()), 3)
+
+    def test_option_sets(self):
+        from mock import patch
+        from zenodo.modules.deposit import accumulator
+
+        with patch.dict(self.app.config,
+                        DEPOSIT_BIBUPLOAD_SPOOL_DIR=self.spool), \
+                patch.object(accumulator, 'task_low_level_submission',
+                             self.submit), \
+                patch.object(accumulator, 'get_waiting', lambda: 0):
+            default = accumulator.get_accumulator('-c')
+            other = accumulator.get_accumulator(
+                '-c', alias='other', options=['-P', '5'])
+            self.assertNotEqual(default.spool_dir, other.spool_dir)
+
+            self.assertEqual(other.add(self.records(1)), 0)
+            self.assertEqual(default.add(self.records(2)), 0)
+            self.assertEqual(accumulator.flush_all(force=True), 2)
+
+        alias = self.app.config['DEPOSIT_BIBUPLOAD_ALIAS']
+        options = tuple(self.app.config['DEPOSIT_BIBUPLOAD_OPTIONS'])
+        self.assertEqual(
+            sorted(args[1:3] + args[4:-1] for args in self.submitted),
+            sorted([(alias, '-c') + options, ('other', '-c', '-P', '5')]))
+
+
+TEST_SUITE = make_test_suite(BibuploadAccumulatorTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test bulk Altmetric harvester."""
+
+from __future__ import absolute_import
+
+import json
+
+import httpretty
+from mock import patch
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class FakeClock(object):
+
+    """Clock which only advances when sleeping."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTestCase(InvenioTestCase):
+
+    """Test rate limiter."""
+
+    def test_consume(self):
+        from zenodo.modules.deposit.altmetric import TokenBucket
+
+        clock = FakeClock()
+        bucket = TokenBucket(2, clock=clock, sleep=clock.sleep)
+
+        # Burst of two calls is allowed, afterwards one call per 0.5s.
+        self.assertEqual(bucket.consume(), 0)
+        self.assertEqual(bucket.consume(), 0)
+        self.assertAlmostEqual(bucket.consume(), 0.5)
+        self.assertAlmostEqual(bucket.consume(), 0.5)
+        self.assertAlmostEqual(clock.now, 1.0)
+
+    def test_unlimited(self):
+        from zenodo.modules.deposit.altmetric import TokenBucket
+
+        bucket = TokenBucket(0)
+        for i in range(100):
+            self.assertEqual(bucket.consume(), 0)
+
+
+class AltmetricHarvesterTestCase(InvenioTestCase):
+
+    """Test harvester against a stub Altmetric API."""
+
+    api_url = "http://altmetric.example.org/v1/"
+
+    @property
+    def config(self):
+        """Test configuration."""
+        return dict(
+            # HTTPretty doesn't play well with Redis.
+            # See gabrielfalcao/HTTPretty#110
+            CACHE_TYPE='simple',
+            DEPOSIT_ALTMETRIC_API_URL=self.api_url,
+            DEPOSIT_ALTMETRIC_RATE_LIMIT=0,
+        )
+
+    def setUp(self):
+        """Register stub API."""
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "%sdoi/10.1234/a" % self.api_url,
+            body=json.dumps(dict(altmetric_id=1)),
+            content_type="application/json",
+        )
+        httpretty.register_uri(
+            httpretty.GET, "%sdoi/10.1234/b" % self.api_url,
+            body=json.dumps(dict(altmetric_id=2)),
+            content_type="application/json",
+        )
+        httpretty.register_uri(
+            httpretty.GET, "%sdoi/10.1234/c" % self.api_url,
+            body="Not Found", status=404,
+        )
+        httpretty.register_uri(
+            httpretty.GET, "%sdoi/10.1234/d" % self.api_url,
+            body="Error", status=500,
+        )
+
+    def tearDown(self):
+        """Clean up."""
+        from invenio.ext.cache import cache
+        cache.clear()
+        httpretty.disable()
+        httpretty.reset()
+
+    @patch('zenodo.modules.deposit.altmetric.get_fieldvalues_bulk')
+    def test_harvest(self, get_fieldvalues_bulk):
+        """Test harvesting of a chunk of records."""
+        from zenodo.modules.deposit.altmetric import AltmetricHarvester
+
+        get_fieldvalues_bulk.return_value = {
+            1: [(1, "0247_a", "10.1234/a")],
+            # Unchanged Altmetric id.
+            2: [(1, "0247_a", "10.1234/b"), (2, "035__a", "2"),
+                (2, "035__9", "Altmetric")],
+            3: [(1, "0247_a", "10.1234/c")],
+            4: [(1, "0247_a", "10.1234/d")],
+            # No DOI.
+            5: [],
+        }
+
+        h = AltmetricHarvester(concurrency=2)
+        records = h.harvest([1, 2, 3, 4, 5])
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['001'][0][3], '1')
+        self.assertEqual(h.stats['http_calls'], 4)
+        self.assertEqual(h.stats['found'], 2)
+        self.assertEqual(h.stats['errors'], 1)
+        self.assertEqual(h.errors[0][0], 4)
+        self.assertTrue(h.throughput()['records_per_second'] > 0)
+
+        # Records checked successfully are skipped on the next run.
+        get_fieldvalues_bulk.reset_mock()
+        h = AltmetricHarvester()
+        h.harvest([1, 2, 3, 4])
+        self.assertEqual(h.stats['skipped'], 3)
+        get_fieldvalues_bulk.assert_called_with(
+            [4], ["0247_a", "035__a", "035__9"])
+
+
+TEST_SUITE = make_test_suite(TokenBucketTestCase, AltmetricHarvesterTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test icon service."""
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+from mock import patch
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class FakeFile(object):
+
+    def __init__(self, checksum, path, icon=False):
+        self.checksum = checksum
+        self.path = path
+        self.icon = icon
+
+    def get_checksum(self):
+        return self.checksum
+
+    def get_full_path(self):
+        return self.path
+
+    def is_icon(self):
+        return self.icon
+
+
+class FakeDoc(object):
+
+    def __init__(self, id, recid, files, icon=False):
+        self.id = id
+        self.bibrec_links = [dict(recid=recid)]
+        self.files = files
+        self.icon = icon
+        self.icons = []
+
+    def get_icon(self, subformat_re=None):
+        return self.icon
+
+    def list_latest_files(self):
+        return self.files
+
+    def add_icon(self, path, subformat=None):
+        assert os.path.exists(path)
+        self.icons.append((path, subformat))
+
+
+def fake_create_icon(options):
+    """Write an icon named after the input file."""
+    icon_dir = tempfile.mkdtemp()
+    name = "%s.png" % options['icon-name']
+    with open(os.path.join(icon_dir, name), 'w') as fp:
+        fp.write(options['input-file'])
+    return icon_dir, name
+
+
+class IconServiceTestCase(InvenioTestCase):
+
+    """Test creating icons keyed by file checksum."""
+
+    def setUp(self):
+        from zenodo.modules.deposit.icons import IconService
+        self.cache_dir = tempfile.mkdtemp()
+        self.submitted = []
+        self.service = IconService(
+            processes=1, cache_dir=self.cache_dir,
+            submit=lambda *args: self.submitted.append(args)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def docs(self):
+        return [
+            FakeDoc(1, 10, [FakeFile('a' * 32, '/data/1.pdf')]),
+            FakeDoc(2, 11, [FakeFile('a' * 32, '/data/2.pdf')]),
+            FakeDoc(3, 11, [FakeFile('b' * 32, '/data/3.pdf')]),
+            FakeDoc(4, 12, [FakeFile('c' * 32, '/data/4.pdf')], icon=True),
+            FakeDoc(5, 12, [FakeFile('d' * 32, '/data/5.png', icon=True)]),
+        ]
+
+    @patch('zenodo.modules.deposit.icons.create_icon')
+    def test_process(self, create_icon):
+        create_icon.side_effect = fake_create_icon
+        docs = self.docs()
+        done, failed, recids = self.service.process(docs)
+
+        # Identical files are rendered once.
+        self.assertEqual(create_icon.call_count, 2)
+        self.assertEqual(done, {1: 'a' * 32, 2: 'a' * 32, 3: 'b' * 32,
+                                4: None})
+        self.assertEqual(failed.keys(), [5])
+        self.assertEqual(recids, set([10, 11]))
+        self.assertEqual(docs[0].icons, docs[1].icons)
+        self.assertEqual(docs[3].icons, [])
+
+        # One bibreformat for all records.
+        self.assertEqual(self.submitted, [
+            ('bibreformat', 'openaire', '-i', '10,11'),
+        ])
+
+    @patch('zenodo.modules.deposit.icons.create_icon')
+    def test_cached(self, create_icon):
+        from zenodo.modules.deposit.icons import get_icon_path
+        create_icon.side_effect = fake_create_icon
+        self.service.process(self.docs()[:1])
+        self.assertEqual(create_icon.call_count, 1)
+
+        doc = FakeDoc(6, 13, [FakeFile('a' * 32, '/data/6.pdf')])
+        done, failed, recids = self.service.process([doc])
+        self.assertEqual(create_icon.call_count, 1)
+        self.assertEqual(
+            doc.icons[0][0], get_icon_path('a' * 32, self.cache_dir))
+
+    @patch('zenodo.modules.deposit.icons.create_icon')
+    def test_error(self, create_icon):
+        from invenio.legacy.websubmit.icon_creator import \
+            InvenioWebSubmitIconCreatorError
+        create_icon.side_effect = InvenioWebSubmitIconCreatorError('Broken')
+        done, failed, recids = self.service.process(self.docs()[:3])
+        self.assertEqual(done, {})
+        self.assertEqual(sorted(failed.keys()), [1, 2, 3])
+        self.assertEqual(self.submitted, [])
+
+    @patch('zenodo.modules.deposit.icons.create_icon')
+    def test_pool(self, create_icon):
+        create_icon.side_effect = fake_create_icon
+        self.service.processes = 2
+        done, failed, recids = self.service.process(self.docs()[:3])
+        self.assertEqual(sorted(done.keys()), [1, 2, 3])
+        self.assertEqual(
+            len(os.listdir(self.cache_dir)), 2)
+
+
+class TrackDocumentsTestCase(InvenioTestCase):
+
+    """Test tracking documents which need an icon."""
+
+    DOCIDS = [999999991, 999999992, 999999993]
+    NEW_DOCIDS = [999999990, 999999994]
+
+    def setUp(self):
+        from invenio.ext.sqlalchemy import db
+        from zenodo.modules.deposit.models import DocumentIcon
+        self.tearDown()
+        done, failed, pending = [
+            DocumentIcon(id_bibdoc=docid, attempts=0)
+            for docid in self.DOCIDS]
+        done.done('a' * 32)
+        failed.attempts = 3
+        failed.status = DocumentIcon.FAILED
+        db.session.add_all([done, failed, pending])
+        db.session.commit()
+
+    def tearDown(self):
+        from invenio.ext.sqlalchemy import db
+        from zenodo.modules.deposit.models import DocumentIcon
+        DocumentIcon.query.filter(
+            DocumentIcon.id_bibdoc.in_(self.DOCIDS + self.NEW_DOCIDS)).delete(
+                synchronize_session=False)
+        db.session.commit()
+
+    @patch('zenodo.modules.deposit.icons.run_sql')
+    def test_track_new(self, run_sql):
+        from invenio.ext.sqlalchemy import db
+        from zenodo.modules.deposit.icons import track_new_documents
+        from zenodo.modules.deposit.models import DocumentIcon, \
+            IconScanState
+
+        def fake_run_sql(query, params):
+            last, limit = params
+            docids = sorted(self.DOCIDS + self.NEW_DOCIDS)
+            return [(d, ) for d in docids if d > last][:limit]
+
+        run_sql.side_effect = fake_run_sql
+        state = IconScanState.get()
+        last_id_bibdoc = state.last_id_bibdoc
+        state.last_id_bibdoc = self.NEW_DOCIDS[0] - 1
+        db.session.commit()
+        try:
+            # Documents tracked ahead of the scan do not hide older ones.
+            self.assertEqual(track_new_documents(chunk_size=2), 2)
+            self.assertEqual(IconScanState.get().last_id_bibdoc,
+                             self.NEW_DOCIDS[-1])
+            for docid in self.NEW_DOCIDS:
+                self.assertEqual(DocumentIcon.query.get(docid).status,
+                                 DocumentIcon.PENDING)
+            self.assertEqual(DocumentIcon.query.get(self.DOCIDS[0]).status,
+                             DocumentIcon.DONE)
+            self.assertEqual(track_new_documents(chunk_size=2), 0)
+        finally:
+            IconScanState.get().last_id_bibdoc = last_id_bibdoc
+            db.session.commit()
+
+    @patch('zenodo.modules.deposit.icons.run_sql')
+    def test_track_modified(self, run_sql):
+        from zenodo.modules.deposit.icons import track_modified_documents
+        from zenodo.modules.deposit.models import DocumentIcon
+
+        run_sql.return_value = [(docid, ) for docid in self.DOCIDS[:2]]
+        self.assertEqual(track_modified_documents(), 2)
+        for docid in self.DOCIDS:
+            icon = DocumentIcon.query.get(docid)
+            self.assertEqual((icon.status, icon.attempts),
+                             (DocumentIcon.PENDING, 0))
+
+        run_sql.return_value = []
+        self.assertEqual(track_modified_documents(), 0)
+
+
+TEST_SUITE = make_test_suite(IconServiceTestCase, TrackDocumentsTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""License registry test suite."""
+
+from __future__ import absolute_import
+
+import json
+
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+
+LICENSES = {
+    'cc-by': dict(title='Creative Commons Attribution', url='http://a.org',
+                  domain_data=False, domain_content=True,
+                  domain_software=False),
+    'mit-license': dict(title='MIT License', url='http://b.org',
+                        domain_data=False, domain_content=False,
+                        domain_software=True),
+    'odc-by': dict(title='Open Data Commons Attribution License',
+                   url='http://c.org', domain_data=True,
+                   domain_content=False, domain_software=False),
+}
+
+
+class TestLicenseRegistry(InvenioTestCase):
+    def test_choices(self):
+        from zenodo.modules.deposit.licenses import LicenseRegistry
+
+        r = LicenseRegistry(LICENSES.items())
+        self.assertEqual(
+            [k for k, dummy in r.get_choices()],
+            ['cc-by', 'mit-license', 'odc-by'],
+        )
+        self.assertEqual(
+            r.get_choices(domain_data=False, domain_software=False),
+            [('cc-by', 'Creative Commons Attribution')],
+        )
+        self.assertEqual(
+            [k for k, dummy in r.get_choices(domain_content=False)],
+            ['mit-license', 'odc-by'],
+        )
+        self.assertEqual(
+            r.get_choices(domain_data=False, domain_content=False,
+                          domain_software=False),
+            [],
+        )
+        self.assertEqual(r.get('mit-license')['url'], 'http://b.org')
+        self.assertIsNone(r.get('not-a-license'))
+
+
+class TestGetRegistry(InvenioTestCase):
+    @property
+    def config(self):
+        return dict(
+            CACHE_TYPE='simple',
+            DEPOSIT_LICENSES_KB='test_licenses',
+            DEPOSIT_LICENSES_CHECK_INTERVAL=0,
+        )
+
+    def setUp(self):
+        from invenio.modules.knowledge.api import add_kb, add_kb_mapping
+
+        add_kb('test_licenses')
+        add_kb_mapping('test_licenses', 'cc-by',
+                       json.dumps(LICENSES['cc-by']))
+
+    def tearDown(self):
+        from invenio.modules.knowledge.api import delete_kb
+        delete_kb('test_licenses')
+
+    def test_invalidate_on_kb_change(self):
+        from invenio.modules.knowledge.api import add_kb_mapping
+        from zenodo.modules.deposit.licenses import get_license, \
+            get_license_choices, get_registry
+
+        registry = get_registry()
+        self.assertIs(get_registry(), registry)
+        self.assertIsNone(get_license('mit-license'))
+
+        add_kb_mapping('test_licenses', 'mit-license',
+                       json.dumps(LICENSES['mit-license']))
+        self.assertIsNot(get_registry(), registry)
+        self.assertEqual(get_license('mit-license')['title'], 'MIT License')
+        self.assertEqual(
+            [k for k, dummy in get_license_choices(domain_content=False)],
+            ['mit-license'],
+        )
+
+    def test_invalidate_after_commit(self):
+        from invenio.ext.sqlalchemy import db
+        from invenio.modules.knowledge.models import KnwKB, KnwKBRVAL
+        from zenodo.modules.deposit.licenses import get_version
+
+        version = get_version()
+        kb = KnwKB.query.filter_by(name='test_licenses').one()
+        db.session.add(KnwKBRVAL(
+            m_key='odc-by', m_value=json.dumps(LICENSES['odc-by']),
+            id_knwKB=kb.id))
+        db.session.flush()
+        self.assertEqual(get_version(), version)
+        db.session.commit()
+        self.assertNotEqual(get_version(), version)
+
+        version = get_version()
+        db.session.delete(KnwKBRVAL.query.filter_by(
+            m_key='odc-by', id_knwKB=kb.id).one())
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(get_version(), version)
+
+
+TEST_SUITE = make_test_suite(TestLicenseRegistry, TestGetRegistry)
+
+if __name__ == '__main__':
+    run_test_suite(TEST_SUITE)
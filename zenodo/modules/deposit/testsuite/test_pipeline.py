@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test post-publish pipeline."""
+
+from __future__ import absolute_import
+
+import threading
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class PipelineTestCase(InvenioTestCase):
+
+    """Test running the steps of a record as a DAG."""
+
+    def setUp(self):
+        from zenodo.modules.deposit.pipeline import Pipeline, \
+            PipelineContext
+        self.pipeline = Pipeline(concurrency=4)
+        self.ctx = PipelineContext(1, record={'recid': 1}, docs=[])
+
+    def test_requires(self):
+        from zenodo.modules.deposit.pipeline import get_timings
+        order = []
+
+        @self.pipeline.step('a')
+        def a(ctx):
+            order.append('a')
+
+        @self.pipeline.step('b', requires=['a'])
+        def b(ctx):
+            order.append('b')
+
+        @self.pipeline.step('c', requires=['a', 'b'])
+        def c(ctx):
+            order.append('c')
+
+        ctx = self.pipeline.run(self.ctx)
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertEqual(ctx.errors, {})
+        for name in ['load', 'a', 'b', 'c', 'total']:
+            assert name in ctx.timings
+        assert get_timings()['a']['count'] >= 1
+
+    def test_unknown_step(self):
+        self.assertRaises(
+            ValueError, self.pipeline.step('a', requires=['b']), lambda c: c)
+
+    def test_concurrent(self):
+        started = threading.Event()
+
+        @self.pipeline.step('a')
+        def a(ctx):
+            # Only finishes if b runs at the same time.
+            assert started.wait(5)
+
+        @self.pipeline.step('b')
+        def b(ctx):
+            started.set()
+
+        ctx = self.pipeline.run(self.ctx)
+        self.assertEqual(ctx.errors, {})
+
+    def test_failure(self):
+        called = []
+
+        @self.pipeline.step('a')
+        def a(ctx):
+            raise RuntimeError('a failed')
+
+        @self.pipeline.step('b', requires=['a'])
+        def b(ctx):
+            called.append('b')
+
+        @self.pipeline.step('c')
+        def c(ctx):
+            called.append('c')
+
+        ctx = self.pipeline.run(self.ctx)
+        self.assertEqual(called, ['c'])
+        self.assertEqual(ctx.errors.keys(), ['a'])
+        assert 'b' not in ctx.timings
+
+    def test_single_upload(self):
+        uploads = []
+
+        @self.pipeline.step('a')
+        def a(ctx):
+            ctx.add_field('347', subfields=[('p', '100')])
+
+        @self.pipeline.step('b')
+        def b(ctx):
+            ctx.add_field('035', subfields=[('a', '1'), ('9', 'Altmetric')])
+
+        @self.pipeline.step('c')
+        def c(ctx):
+            pass
+
+        self.pipeline.run(self.ctx, upload=uploads.append)
+        self.assertEqual(len(uploads), 1)
+        rec = uploads[0]
+        self.assertEqual(rec['001'][0][3], '1')
+        self.assertEqual(rec['347'][0][0], [('p', '100')])
+        self.assertEqual(rec['035'][0][0], [('a', '1'), ('9', 'Altmetric')])
+
+    def test_no_upload(self):
+        uploads = []
+
+        @self.pipeline.step('a')
+        def a(ctx):
+            pass
+
+        ctx = self.pipeline.run(self.ctx, upload=uploads.append)
+        self.assertEqual(uploads, [])
+        assert 'upload' not in ctx.timings
+
+    def test_load_once(self):
+        from zenodo.modules.deposit.pipeline import PipelineContext
+        from mock import patch
+
+        @self.pipeline.step('a')
+        def a(ctx):
+            assert ctx.record
+
+        @self.pipeline.step('b')
+        def b(ctx):
+            assert ctx.record is not None
+            assert ctx.docs == ['doc']
+
+        with patch('zenodo.modules.deposit.pipeline.get_record') as gr:
+            with patch('zenodo.modules.deposit.pipeline.BibRecDocs') as brd:
+                gr.return_value = {'recid': 1}
+                brd.return_value.list_bibdocs.return_value = ['doc']
+                ctx = self.pipeline.run(PipelineContext(1))
+        self.assertEqual(ctx.errors, {})
+        self.assertEqual(gr.call_count, 1)
+        self.assertEqual(brd.call_count, 1)
+
+
+TEST_SUITE = make_test_suite(PipelineTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
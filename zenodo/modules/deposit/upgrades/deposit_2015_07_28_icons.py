@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Track the icon status of documents."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.legacy.dbquery import run_sql
+from invenio.modules.upgrader.api import op
+
+depends_on = ['deposit_2014_05_06_workflow_status_fix']
+
+
+def info():
+    """Upgrade description."""
+    return "Create table tracking documents missing an icon."
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    op.create_table(
+        'depositICON',
+        db.Column('id_bibdoc', db.Integer(display_width=15, unsigned=True),
+                  nullable=False),
+        db.Column('status', db.String(length=1), nullable=False),
+        db.Column('checksum', db.String(length=32), nullable=True),
+        db.Column('attempts', db.Integer(display_width=5, unsigned=True),
+                  nullable=False),
+        db.Column('modified', db.DateTime(), nullable=False),
+        db.PrimaryKeyConstraint('id_bibdoc'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_index(
+        op.f('ix_depositICON_status'), 'depositICON', ['status'],
+        unique=False)
+    op.create_index(
+        op.f('ix_depositICON_checksum'), 'depositICON', ['checksum'],
+        unique=False)
+
+    # Last scan of all formats, later checks only look at new documents.
+    run_sql("""
+        INSERT INTO depositICON (id_bibdoc, status, attempts, modified)
+        SELECT f.id_bibdoc, IF(i.id_bibdoc IS NULL, 'P', 'D'), 0, NOW()
+        FROM (SELECT DISTINCT id_bibdoc FROM bibdocfsinfo) AS f
+        LEFT OUTER JOIN (
+            SELECT DISTINCT id_bibdoc
+            FROM bibdocfsinfo
+            WHERE format LIKE '%;icon%' AND last_version=1
+        ) AS i ON i.id_bibdoc=f.id_bibdoc
+    """)
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    return 60
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Checkpoint the scan for documents missing an icon."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = ['deposit_2015_07_28_icons']
+
+
+def info():
+    """Upgrade description."""
+    return "Create table for the scan state of documents missing an icon."
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    # Without a state row, the next check scans all documents once and tracks
+    # the ones which were missed so far.
+    op.create_table(
+        'depositICONSCAN',
+        db.Column('id', db.Integer(display_width=15, unsigned=True),
+                  nullable=False),
+        db.Column('last_id_bibdoc', db.Integer(display_width=15,
+                                               unsigned=True),
+                  nullable=False),
+        db.Column('modified', db.DateTime(), nullable=False),
+        db.PrimaryKeyConstraint('id'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    return 1
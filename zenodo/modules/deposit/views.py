@@ -30,6 +30,8 @@ from __future__ import absolute_import
 from flask import Blueprint
 from invenio.modules.deposit.signals import template_context_created, \
     file_uploaded
+from zenodo.modules.quotas.metrics.deposit import file_uploaded_receiver
+
 from .receivers import index_context_listener, large_file_notification
 
 
@@ -51,4 +53,5 @@ def register_receivers():
         sender='webdeposit.index'
     )
 
+    file_uploaded.connect(file_uploaded_receiver, weak=False)
     file_uploaded.connect(large_file_notification, weak=False)
@@ -22,7 +22,6 @@
 
 from __future__ import absolute_import
 
-import json
 from datetime import date
 
 from flask import render_template, url_for, request
@@ -33,7 +32,6 @@ from workflow import patterns as p
 
 from invenio.base.globals import cfg
 from invenio.modules.formatter import format_record
-from invenio.modules.knowledge.api import get_kb_mapping
 from invenio.ext.login import UserInfo
 from invenio.modules.deposit.models import DepositionType, Deposition, \
     InvalidApiAction
@@ -55,13 +53,13 @@ from zenodo.legacy.utils.zenodoutils import create_doi, filter_empty_helper
 from invenio.ext.restful import error_codes, ISODate
 from zenodo.modules.deposit.forms import ZenodoForm, \
     ZenodoEditForm
+from zenodo.modules.deposit.licenses import get_license
 from invenio.ext.sqlalchemy import db
 from invenio.base.helpers import unicodifier
 from invenio.modules.records.api import Record
 
 __all__ = ['upload']
 
-CFG_LICENSE_KB = "licenses"
 CFG_LICENSE_SOURCE = "opendefinition.org"
 CFG_ZENODO_USER_COLLECTION_ID = "zenodo"
 CFG_ECFUNDED_USER_COLLECTION_ID = "ecfunded"
@@ -189,9 +187,8 @@ def process_recjson(deposition, recjson):
     # License
     # =================
     if recjson['access_right'] in ["open", "embargoed"]:
-        info = get_kb_mapping(CFG_LICENSE_KB, str(recjson['license']))
+        info = get_license(str(recjson['license']))
         if info:
-            info = json.loads(info['value'])
             recjson['license'] = dict(
                 identifier=recjson['license'],
                 source=CFG_LICENSE_SOURCE,
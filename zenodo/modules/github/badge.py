@@ -22,37 +22,193 @@
 
 """Utility module to create badge."""
 
-from six.moves.urllib import parse, request
+import hashlib
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
 
 from invenio.base.globals import cfg
 
+COLORS = {
+    "brightgreen": "#4c1",
+    "green": "#97ca00",
+    "yellowgreen": "#a4a61d",
+    "yellow": "#dfb317",
+    "orange": "#fe7d37",
+    "red": "#e05d44",
+    "lightgrey": "#9f9f9f",
+    "blue": "#007ec6",
+}
+"""Colors of the badge status (as used by shields.io)."""
 
-def shieldsio_encode(text):
-    """Encode text for shields.io."""
-    return parse.quote_plus(text.replace('-', '--').replace('_', '__'))
+CHAR_WIDTHS = dict(zip(
+    u' !"#$%&\'()*+,-./0123456789:;<=>?@'
+    u'ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`'
+    u'abcdefghijklmnopqrstuvwxyz{|}~',
+    (3.87, 4.33, 5.05, 9.0, 6.99, 11.84, 7.99, 2.95, 4.99, 4.99, 6.99, 9.0,
+     4.0, 4.99, 4.0, 4.99, 6.99, 6.99, 6.99, 6.99, 6.99, 6.99, 6.99, 6.99,
+     6.99, 6.99, 4.99, 4.99, 9.0, 9.0, 9.0, 6.0, 11.0,
+     7.52, 7.54, 7.68, 8.48, 6.96, 6.32, 8.53, 8.27, 4.63, 5.0, 7.62, 6.12,
+     9.27, 8.23, 8.66, 6.63, 8.66, 7.65, 7.52, 6.78, 8.05, 7.52, 10.88,
+     7.54, 6.77, 7.54, 4.99, 4.99, 4.99, 9.0, 6.99, 6.99,
+     6.61, 6.85, 5.73, 6.85, 6.55, 3.87, 6.85, 6.96, 3.02, 3.79, 6.51, 3.02,
+     10.7, 6.96, 6.68, 6.85, 6.85, 4.69, 5.73, 4.33, 6.96, 6.51, 9.0, 6.51,
+     6.51, 5.76, 6.98, 4.99, 6.98, 9.0),
+))
+"""Width in pixels of characters in 11px Verdana (the badge font)."""
 
+DEFAULT_CHAR_WIDTH = 6.99
+"""Width of characters missing in the table."""
 
-def create_badge(subject, status, color, output_path, style=None):
-    """Retrieve an SVG DOI badge from shields.io."""
-    subject = shieldsio_encode(subject)
-    status = shieldsio_encode(status)
+STYLES = {
+    "flat": dict(
+        height=20, radius=3, text_y=14,
+        gradient='<linearGradient id="b" x2="0" y2="100%">'
+                 '<stop offset="0" stop-color="#bbb" stop-opacity=".1"/>'
+                 '<stop offset="1" stop-opacity=".1"/></linearGradient>',
+    ),
+    "flat-square": dict(height=20, radius=0, text_y=14, gradient=None),
+    "plastic": dict(
+        height=18, radius=4, text_y=13,
+        gradient='<linearGradient id="b" x2="0" y2="100%">'
+                 '<stop offset="0" stop-color="#fff" stop-opacity=".7"/>'
+                 '<stop offset=".1" stop-color="#aaa" stop-opacity=".1"/>'
+                 '<stop offset=".9" stop-opacity=".3"/>'
+                 '<stop offset="1" stop-opacity=".5"/></linearGradient>',
+    ),
+}
+"""Geometry of the badge styles."""
 
-    if style not in cfg["GITHUB_BADGE_STYLES"]:
+SVG = (
+    u'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+    u'height="{height}">{gradient}<mask id="a"><rect width="{width}" '
+    u'height="{height}" rx="{radius}" fill="#fff"/></mask><g mask="url(#a)">'
+    u'<path fill="#555" d="M0 0h{left}v{height}H0z"/>'
+    u'<path fill="{color}" d="M{left} 0h{right}v{height}H{left}z"/>'
+    u'{overlay}</g><g fill="#fff" text-anchor="middle" '
+    u'font-family="DejaVu Sans,Verdana,Geneva,sans-serif" font-size="11">'
+    u'<text x="{subject_x}" y="{shadow_y}" fill="#010101" '
+    u'fill-opacity=".3">{subject}</text>'
+    u'<text x="{subject_x}" y="{text_y}">{subject}</text>'
+    u'<text x="{status_x}" y="{shadow_y}" fill="#010101" '
+    u'fill-opacity=".3">{status}</text>'
+    u'<text x="{status_x}" y="{text_y}">{status}</text></g></svg>'
+)
+
+
+def text_width(text):
+    """Estimate the rendered width of a text in pixels."""
+    return sum(CHAR_WIDTHS.get(c, DEFAULT_CHAR_WIDTH) for c in text)
+
+
+def get_style(style):
+    """Get a configured style which can be rendered (or the default one)."""
+    if style not in STYLES or style not in cfg["GITHUB_BADGE_STYLES"]:
         style = cfg["GITHUB_BADGE_DEFAULT_STYLE"]
-    if color not in cfg["GITHUB_BADGE_COLORS"]:
+    return style
+
+
+def render_badge(subject, status, color=None, style=None):
+    """Render an SVG badge (looking like the ones of shields.io).
+
+    :returns: SVG document as UTF-8 encoded bytes.
+    """
+    style = get_style(style)
+    if color not in COLORS:
         color = cfg["GITHUB_BADGE_DEFAULT_COLOR"]
+    geometry = STYLES[style]
+
+    left = int(round(text_width(subject))) + 10
+    right = int(round(text_width(status))) + 10
+
+    return SVG.format(
+        width=left + right,
+        height=geometry['height'],
+        radius=geometry['radius'],
+        gradient=geometry['gradient'] or u'',
+        overlay=u'<path fill="url(#b)" d="M0 0h{0}v{1}H0z"/>'.format(
+            left + right, geometry['height']) if geometry['gradient'] else u'',
+        left=left,
+        right=right,
+        color=COLORS[color],
+        subject=escape(subject),
+        status=escape(status),
+        subject_x=left / 2.0,
+        status_x=left + right / 2.0,
+        text_y=geometry['text_y'],
+        shadow_y=geometry['text_y'] + 1,
+    ).encode('utf-8')
+
+
+class LRUCache(object):
+
+    """Thread-safe in-memory cache of the least recently used items."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get an item (``None`` if missing)."""
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        """Add an item, evicting the least recently used one if full."""
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """Remove all items."""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+_badges = None
+_badges_lock = threading.Lock()
+
+
+def get_badges():
+    """Get the cache of rendered badges of this process."""
+    global _badges
+    with _badges_lock:
+        if _badges is None:
+            _badges = LRUCache(cfg['GITHUB_BADGE_CACHE_SIZE'])
+        return _badges
+
+
+def badge_key(doi, style=None):
+    """Get the cache key of a DOI badge."""
+    return (doi, get_style(style))
+
+
+def has_doi_badge(doi, style=None):
+    """Check if a DOI badge is cached in this process."""
+    return get_badges().get(badge_key(doi, style)) is not None
 
-    options = "?{}".format(parse.urlencode(dict(style=style)))
 
-    url = '{url}{subject}-{status}-{color}.svg{style}'.format(
-        url=cfg['GITHUB_SHIELDSIO_BASE_URL'],
-        subject=subject,
-        status=status,
-        color=color,
-        style=options,
-    )
+def doi_badge(doi, style=None):
+    """Get a rendered DOI badge and its ETag (cached per process).
 
-    response = request.urlopen(url)
+    :returns: Tuple of SVG bytes and ETag.
+    """
+    key = badge_key(doi, style)
+    style = key[1]
+    badges = get_badges()
+    value = badges.get(key)
+    if value is None:
+        svg = render_badge("DOI", doi, "blue", style=style)
+        value = (svg, hashlib.md5(svg).hexdigest())
+        badges.set(key, value)
+    return value
 
-    with open(output_path, 'wb') as f:
-        f.write(response.read())
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""HTTP client for the GitHub API.
+
+All requests share one pooled keep-alive session per process. GET responses
+are cached together with their ``ETag``/``Last-Modified`` validators, so
+that repeated requests are made conditional and unchanged resources are
+served from the cache (GitHub does not count ``304 Not Modified`` responses
+against the rate limit).
+
+The remaining rate limit of each token is tracked from the ``X-RateLimit-*``
+response headers. When it runs low, requests which are not urgent are served
+from the cache if possible, or else delayed until the limit is reset (or
+fail with :class:`RateLimitExceeded` if the reset is too far away).
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import threading
+import time
+
+import requests
+import six
+from requests.adapters import HTTPAdapter
+from werkzeug.utils import import_string
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+
+CACHE_KEY = "github::http::{0}"
+RATELIMIT_KEY = "github::ratelimit::{0}"
+
+COUNTERS = ('requests', 'hits', 'misses', 'delayed', 'limited')
+"""Names of the request counters."""
+
+DEFAULT_STORE = object()
+"""Use the store configured in ``GITHUB_HTTP_CACHE_STORE``."""
+
+_session = None
+_session_lock = threading.Lock()
+
+_counters = dict((c, 0) for c in COUNTERS)
+_counters_lock = threading.Lock()
+
+
+class RateLimitExceeded(Exception):
+
+    """The rate limit of a token is exhausted."""
+
+    def __init__(self, reset):
+        super(RateLimitExceeded, self).__init__(
+            "GitHub rate limit exceeded until %s." % reset)
+        self.reset = reset
+
+
+def get_session():
+    """Get the HTTP session of this process."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=cfg['GITHUB_HTTP_POOL_SIZE'],
+                pool_maxsize=cfg['GITHUB_HTTP_POOL_SIZE'],
+            )
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def get_store():
+    """Get the store of cached responses and rate limits."""
+    store = cfg.get('GITHUB_HTTP_CACHE_STORE')
+    if store is None:
+        return cache
+    return import_string(store) if isinstance(store, six.string_types) \
+        else store
+
+
+def count(name, value=1):
+    """Increment a request counter of this process."""
+    with _counters_lock:
+        _counters[name] += value
+
+
+def get_counters():
+    """Get the request counters of this process.
+
+    ``hits`` are requests answered from the cache (revalidated or not),
+    ``misses`` are requests which counted against the rate limit,
+    ``delayed`` and ``limited`` are requests which were delayed or refused
+    because of a low rate limit.
+    """
+    with _counters_lock:
+        counters = dict(_counters)
+    total = counters['hits'] + counters['misses']
+    counters['hit_ratio'] = float(counters['hits']) / total if total else 0.0
+    return counters
+
+
+def token_id(access_token):
+    """Get an identifier of a token (which is safe to use in cache keys)."""
+    return hashlib.sha1(access_token or '').hexdigest()
+
+
+def get_quota(access_token, store=None):
+    """Get the last known rate limit of a token.
+
+    :returns: Dictionary with ``limit``, ``remaining`` and ``reset`` (UNIX
+        time), or ``None`` if unknown.
+    """
+    store = get_store() if store is None else store
+    return store.get(RATELIMIT_KEY.format(token_id(access_token)))
+
+
+def get_token(gh):
+    """Get the access token of a github3.py API object."""
+    auth = gh._session.headers.get('Authorization', '')
+    if auth.startswith('token '):
+        return auth[len('token '):]
+    return None
+
+
+class CachedResponse(object):
+
+    """Response of a (possibly cached) GET request."""
+
+    def __init__(self, status_code, data, links, from_cache=False):
+        self.status_code = status_code
+        self.data = data
+        self.links = links
+        self.from_cache = from_cache
+
+    @property
+    def next_url(self):
+        """URL of next page of results."""
+        return self.links.get('next', {}).get('url')
+
+
+class GitHubClient(object):
+
+    """Client for the GitHub API."""
+
+    def __init__(self, access_token=None, base_url=None, session=None,
+                 cache=DEFAULT_STORE, timeout=None, cache_timeout=None):
+        """Initialize client.
+
+        :param access_token: GitHub access token (optional).
+        :param base_url: Base URL of the GitHub API.
+        :param session: HTTP session (defaults to the process session).
+        :param cache: Store of responses and rate limits (``None`` disables
+            caching and rate limit tracking).
+        :param timeout: Timeout of requests in seconds.
+        :param cache_timeout: Timeout of cached responses.
+        """
+        self.access_token = access_token
+        self.base_url = (base_url or cfg['GITHUB_BASE_URL']).rstrip('/')
+        self.session = session or get_session()
+        self.cache = get_store() if cache is DEFAULT_STORE else cache
+        self.timeout = timeout or cfg['GITHUB_HTTP_TIMEOUT']
+        self.cache_timeout = cache_timeout if cache_timeout is not None \
+            else cfg['GITHUB_HTTP_CACHE_TIMEOUT']
+
+    @classmethod
+    def from_api(cls, gh, **kwargs):
+        """Create client with the access token of a github3.py object."""
+        return cls(access_token=get_token(gh), **kwargs)
+
+    def url(self, path):
+        """Get absolute URL of an API path."""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return self.base_url + path
+
+    def headers(self):
+        """Default request headers."""
+        headers = {'Accept': 'application/vnd.github.v3+json'}
+        if self.access_token:
+            headers['Authorization'] = 'token %s' % self.access_token
+        return headers
+
+    def cache_key(self, url, params=None, public=False):
+        """Get cache key of a request."""
+        return CACHE_KEY.format(hashlib.sha1(repr((
+            url,
+            sorted((params or {}).items()),
+            None if public else self.access_token,
+        ))).hexdigest())
+
+    @property
+    def quota(self):
+        """Last known rate limit of the token."""
+        if self.cache is None:
+            return None
+        return get_quota(self.access_token, store=self.cache)
+
+    def update_quota(self, response):
+        """Record the rate limit of the token from a response."""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if self.cache is None or remaining is None or reset is None:
+            return
+        quota = dict(
+            limit=int(response.headers.get('X-RateLimit-Limit', 0)),
+            remaining=int(remaining),
+            reset=int(reset),
+        )
+        self.cache.set(
+            RATELIMIT_KEY.format(token_id(self.access_token)), quota,
+            timeout=max(quota['reset'] - int(time.time()), 1)
+        )
+
+    def quota_delay(self):
+        """Seconds a request which is not urgent must be delayed (0 if the
+        rate limit is not low)."""
+        quota = self.quota
+        if not quota or quota['remaining'] > cfg['GITHUB_RATELIMIT_RESERVE']:
+            return 0
+        return max(quota['reset'] - time.time(), 0)
+
+    def wait_for_quota(self):
+        """Delay a request which is not urgent if the rate limit is low.
+
+        :raises RateLimitExceeded: If the limit is reset too late.
+        """
+        wait = self.quota_delay()
+        if wait <= 0:
+            return
+        if wait > cfg['GITHUB_RATELIMIT_MAX_DELAY']:
+            raise RateLimitExceeded(self.quota['reset'])
+        count('delayed')
+        time.sleep(wait)
+
+    def request(self, method, url, **kwargs):
+        """Make a request and track the rate limit."""
+        count('requests')
+        r = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        self.update_quota(r)
+        if r.status_code == 403 and \
+                r.headers.get('X-RateLimit-Remaining') == '0':
+            count('limited')
+            raise RateLimitExceeded(int(r.headers['X-RateLimit-Reset']))
+        return r
+
+    def get(self, path, params=None, public=False, urgent=True):
+        """Make a conditional GET request.
+
+        :param path: API path or absolute URL.
+        :param params: Query parameters.
+        :param public: The resource is public, so a cached response can be
+            shared between access tokens.
+        :param urgent: If false, a cached response is used without
+            revalidation when the rate limit is low, and the request is
+            otherwise delayed.
+        """
+        url = self.url(path)
+        headers = self.headers()
+
+        key = None
+        cached = None
+        if self.cache is not None:
+            key = self.cache_key(url, params, public=public)
+            cached = self.cache.get(key)
+            if cached:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+
+        if not urgent:
+            # A cached response is served at once rather than waiting.
+            if cached and self.quota_delay() > 0:
+                count('hits')
+                return CachedResponse(200, cached['data'], cached['links'],
+                                      from_cache=True)
+            try:
+                self.wait_for_quota()
+            except RateLimitExceeded:
+                count('limited')
+                raise
+
+        r = self.request('GET', url, params=params, headers=headers)
+
+        if r.status_code == 304 and cached:
+            count('hits')
+            return CachedResponse(200, cached['data'], cached['links'],
+                                  from_cache=True)
+
+        count('misses')
+        data = r.json() if r.status_code == 200 else None
+        links = dict(
+            (k, dict(url=v['url'])) for k, v in r.links.items()
+        )
+        if key and r.status_code == 200 and (
+                r.headers.get('ETag') or r.headers.get('Last-Modified')):
+            self.cache.set(key, dict(
+                etag=r.headers.get('ETag'),
+                last_modified=r.headers.get('Last-Modified'),
+                data=data,
+                links=links,
+            ), timeout=self.cache_timeout)
+        return CachedResponse(r.status_code, data, links)
+
+    def iter_pages(self, path, params=None, max_pages=None, urgent=True):
+        """Iterate over the pages of a paginated resource."""
+        response = self.get(path, params=params, urgent=urgent)
+        pages = 1
+        while True:
+            yield response
+            if not response.next_url or response.status_code != 200 or \
+                    (max_pages and pages >= max_pages):
+                break
+            # The next URL already contains the query parameters.
+            response = self.get(response.next_url, urgent=urgent)
+            pages += 1
+
+    def markdown(self, text):
+        """Render GitHub flavoured markdown as HTML.
+
+        Rendered texts are cached, since they only depend on the text.
+        """
+        key = None
+        if self.cache is not None:
+            key = CACHE_KEY.format(
+                hashlib.sha1(u'markdown:{0}'.format(text).encode('utf-8'))
+                .hexdigest()
+            )
+            html = self.cache.get(key)
+            if html is not None:
+                count('hits')
+                return html
+
+        r = self.request('POST', self.url('/markdown'),
+                         data=json.dumps(dict(text=text, mode='markdown')),
+                         headers=self.headers())
+        count('misses')
+        if r.status_code != 200:
+            return None
+        if key:
+            self.cache.set(key, r.text, timeout=self.cache_timeout)
+        return r.text
@@ -47,30 +47,102 @@ set to True in a production environment, but can be useful for development and
 integration servers.
 """
 
-GITHUB_SHIELDSIO_BASE_URL = "https://img.shields.io/badge/"
-"""Base URL for shields.io."""
-
 GITHUB_BADGE_STYLES = [
     "flat",
     "flat-square",
     "plastic",
 ]
-"""List of shields.io styles."""
-
-GITHUB_BADGE_COLORS = [
-    "brightgreen",
-    "green",
-    "yellowgreen",
-    "yellow",
-    "orange",
-    "red",
-    "lightgrey",
-    "blue",
-]
-"""List of shields.io styles."""
+"""List of badge styles (as named by shields.io)."""
 
 GITHUB_BADGE_DEFAULT_STYLE = "flat"
-"""Default shields.io badge style."""
+"""Default badge style."""
 
 GITHUB_BADGE_DEFAULT_COLOR = "blue"
-"""Default shields.io badge color."""
+"""Default badge color."""
+
+GITHUB_HTTP_POOL_SIZE = 10
+"""Maximum number of kept-alive connections to the GitHub API per
+process."""
+
+GITHUB_HTTP_TIMEOUT = 10
+"""Timeout in seconds of a request to the GitHub API."""
+
+GITHUB_HTTP_CACHE_TIMEOUT = 7 * 24 * 3600
+"""Seconds a GitHub API response is cached for conditional requests."""
+
+GITHUB_CONTRIBUTORS_CONCURRENCY = 8
+"""Number of GitHub user profiles fetched concurrently."""
+
+GITHUB_CONTRIBUTORS_DEADLINE = 30
+"""Seconds after which contributors without a fetched profile are added by
+their login only."""
+
+GITHUB_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+"""Size in bytes of the chunks in which release archives are streamed from
+GitHub into the deposition storage."""
+
+GITHUB_ZENODO_RETRIES = 3
+"""Number of times a step of a release upload to the Zenodo REST API is
+retried on a connection or server error."""
+
+GITHUB_ZENODO_BACKOFF = 0.5
+"""Seconds to wait before the first retry of an upload step (doubled on each
+further retry)."""
+
+GITHUB_ZENODO_TIMEOUT = 300
+"""Timeout in seconds of a request to the Zenodo REST API."""
+
+GITHUB_SYNC_PER_PAGE = 100
+"""Number of repositories fetched per request when syncing a user's
+repositories."""
+
+GITHUB_SYNC_LOCK_TIMEOUT = 10 * 60
+"""Seconds after which a scheduled background sync of a user's repositories
+is assumed to have failed, and a new one can be scheduled."""
+
+GITHUB_BADGE_CACHE_SIZE = 10000
+"""Number of rendered badges kept in memory per process."""
+
+GITHUB_BADGE_MAX_AGE = 30 * 24 * 3600
+"""Seconds a DOI badge may be cached by browsers and proxies."""
+
+GITHUB_BADGE_REPOSITORY_MAX_AGE = 5 * 60
+"""Seconds a repository badge may be cached by browsers and proxies (the
+DOI changes with every new release)."""
+
+GITHUB_INTAKE_WINDOW = 10
+"""Seconds a webhook event waits in the queue of its repository before
+processing starts, so that superseding events of a burst are coalesced."""
+
+GITHUB_INTAKE_DEDUP_TIMEOUT = 10 * 60
+"""Seconds during which identical deliveries of a webhook event are
+dropped."""
+
+GITHUB_INTAKE_STALE_TIMEOUT = 60 * 60
+"""Seconds after which the processing of a repository queue is assumed to
+have died, and a new processor is scheduled."""
+
+GITHUB_HTTP_CACHE_STORE = None
+"""Store of cached GitHub API responses and rate limits: an object (or its
+import path) with the interface of ``invenio.ext.cache.cache``, which is
+used if ``None``."""
+
+GITHUB_RATELIMIT_RESERVE = 500
+"""Number of remaining GitHub API requests of a token reserved for urgent
+requests (e.g. handling releases). Other requests are served from the cache
+or delayed until the rate limit is reset."""
+
+GITHUB_RATELIMIT_MAX_DELAY = 60
+"""Maximum number of seconds a request which is not urgent is delayed
+waiting for the rate limit reset (otherwise it fails, and background tasks
+are rescheduled)."""
+
+GITHUB_TOKEN_VALIDITY_TTL = 10 * 60
+"""Seconds the validity of a GitHub access token is cached for."""
+
+GITHUB_HOOKS_CONCURRENCY = 8
+"""Number of repositories whose webhooks are installed, removed or verified
+concurrently by bulk operations."""
+
+GITHUB_HOOKS_PROGRESS_TIMEOUT = 60 * 60
+"""Seconds the progress of a bulk webhooks operation is kept for display."""
@@ -53,7 +53,7 @@ def payload_debug(event_state):
         ).first().access_token
         res['access_token'] = access_token
 
-        res['is_valid_sender'] = is_valid_sender(account.extra_data, e.payload)
+        res['is_valid_sender'] = is_valid_sender(e.user_id, e.payload)
 
         res['metadata'] = extract_metadata(gh, e.payload)
 
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Intake queue of GitHub webhook events.
+
+Events are queued per repository in the cache before being handled:
+
+* identical deliveries of an event are dropped,
+* an event for a release tag which is still queued replaces the queued one
+  (e.g. when a tag is deleted and pushed again),
+* events of one repository are handled one at a time in arrival order,
+  while different repositories are handled in parallel.
+
+Each repository has its own queue entry and lock, so events of different
+repositories never wait for each other. The queue only holds identifiers of
+the events, whose states are stored in entries of their own. An event stays
+queued until it has been handled, so it is not lost if its processor dies.
+
+Counters and a summary of the queues (for the metrics) are kept in a shared
+entry, which never holds events.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+
+STATS_KEY = "github::intake"
+STATS_LOCK_KEY = "github::intake::lock"
+QUEUE_KEY = "github::intake::queue::{0}"
+QUEUE_LOCK_KEY = "github::intake::queue::{0}::lock"
+EVENT_KEY = "github::intake::event::{0}"
+DELIVERY_KEY = "github::intake::delivery::{0}"
+STATE_TIMEOUT = 7 * 24 * 3600
+
+COUNTERS = ('received', 'duplicates', 'coalesced', 'processed', 'failed')
+
+
+class IntakeLockError(Exception):
+
+    """The intake queue lock could not be acquired."""
+
+
+@contextmanager
+def intake_lock(key=STATS_LOCK_KEY, timeout=10):
+    """Acquire a lock of the intake queue (the shared one by default).
+
+    A repository lock may be held while acquiring the shared lock, never
+    the other way around.
+    """
+    deadline = time.time() + timeout
+    while not cache.add(key, True, timeout=timeout):
+        if time.time() > deadline:
+            raise IntakeLockError()
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def get_stats():
+    """Get the shared counters (call with the shared lock held to modify)."""
+    stats = cache.get(STATS_KEY) or {}
+    stats.setdefault('queues', {})
+    stats.setdefault('counters', dict((c, 0) for c in COUNTERS))
+    stats.setdefault('wait', dict(total=0.0, max=0.0))
+    return stats
+
+
+def set_stats(stats):
+    """Store the shared counters."""
+    cache.set(STATS_KEY, stats, timeout=STATE_TIMEOUT)
+
+
+def get_queue(full_name):
+    """Get the queue of a repository (call with its lock held to modify)."""
+    queue = cache.get(QUEUE_KEY.format(full_name)) or {}
+    queue.setdefault('events', [])
+    queue.setdefault('running', None)
+    return queue
+
+
+def set_queue(full_name, queue, **counters):
+    """Store the queue of a repository and update the shared counters."""
+    if queue['events'] or queue['running'] is not None:
+        cache.set(QUEUE_KEY.format(full_name), queue, timeout=STATE_TIMEOUT)
+    else:
+        cache.delete(QUEUE_KEY.format(full_name))
+
+    with intake_lock():
+        stats = get_stats()
+        if queue['events']:
+            stats['queues'][full_name] = dict(
+                depth=len(queue['events']),
+                queued=queue['events'][0]['queued'],
+            )
+        else:
+            stats['queues'].pop(full_name, None)
+        for counter, value in counters.items():
+            stats['counters'][counter] += value
+        set_stats(stats)
+
+
+def delivery_id(payload):
+    """Get an identifier of the content of a delivery."""
+    return hashlib.sha1(json.dumps(payload, sort_keys=True)).hexdigest()
+
+
+def forget_delivery(payload):
+    """Allow a delivery to be queued again (e.g. after a failure)."""
+    cache.delete(DELIVERY_KEY.format(delivery_id(payload)))
+
+
+def enqueue(full_name, tag, event_state, payload):
+    """Queue an event of a repository.
+
+    :returns: ``True`` if a processor of the repository queue must be
+        scheduled.
+    """
+    event_id = delivery_id(payload)
+
+    # Identical deliveries (e.g. redelivered by GitHub) are dropped.
+    if not cache.add(DELIVERY_KEY.format(event_id), True,
+                     timeout=cfg['GITHUB_INTAKE_DEDUP_TIMEOUT']):
+        record('duplicates')
+        return False
+
+    cache.set(EVENT_KEY.format(event_id), event_state, timeout=STATE_TIMEOUT)
+
+    now = time.time()
+    with intake_lock(QUEUE_LOCK_KEY.format(full_name)):
+        queue = get_queue(full_name)
+        coalesced = 0
+        for entry in queue['events']:
+            if entry['tag'] == tag:
+                # Superseded release: keep its position in the queue.
+                if entry['id'] != event_id:
+                    cache.delete(EVENT_KEY.format(entry['id']))
+                entry['id'] = event_id
+                entry.pop('started', None)
+                coalesced = 1
+                break
+        else:
+            queue['events'].append(dict(tag=tag, id=event_id, queued=now))
+
+        started = queue['running']
+        schedule = started is None or \
+            now - started > cfg['GITHUB_INTAKE_STALE_TIMEOUT']
+        if schedule:
+            queue['running'] = now
+        set_queue(full_name, queue, received=1, coalesced=coalesced)
+    return schedule
+
+
+def next_event(full_name):
+    """Get the next event of a repository, leaving it queued.
+
+    The event must be removed with :func:`remove_event` once handled.
+
+    :returns: Tuple of the event identifier and the event state, or
+        ``None`` if the queue is empty (the processor of the queue must then
+        stop).
+    """
+    now = time.time()
+    result = None
+    wait = None
+    with intake_lock(QUEUE_LOCK_KEY.format(full_name)):
+        queue = get_queue(full_name)
+        while queue['events']:
+            entry = queue['events'][0]
+            event_state = cache.get(EVENT_KEY.format(entry['id']))
+            if event_state is not None:
+                result = (entry['id'], event_state)
+                if 'started' not in entry:
+                    entry['started'] = now
+                    wait = now - entry['queued']
+                break
+            # The event expired from the cache.
+            queue['events'].pop(0)
+
+        queue['running'] = now if result is not None else None
+        set_queue(full_name, queue)
+
+    if wait is not None:
+        with intake_lock():
+            stats = get_stats()
+            stats['wait']['total'] += wait
+            stats['wait']['max'] = max(stats['wait']['max'], wait)
+            set_stats(stats)
+    return result
+
+
+def remove_event(full_name, event_id, counter='processed'):
+    """Remove a handled event from the queue of its repository.
+
+    The event is kept if it was superseded while being handled, so that the
+    newer event is handled too.
+    """
+    with intake_lock(QUEUE_LOCK_KEY.format(full_name)):
+        queue = get_queue(full_name)
+        queue['events'] = [
+            e for e in queue['events'] if e['id'] != event_id]
+        cache.delete(EVENT_KEY.format(event_id))
+        set_queue(full_name, queue, **{counter: 1})
+
+
+def record(counter):
+    """Increment a counter of the intake queue."""
+    with intake_lock():
+        stats = get_stats()
+        stats['counters'][counter] += 1
+        set_stats(stats)
+
+
+def get_metrics():
+    """Get the metrics of the intake queue.
+
+    :returns: Dictionary with the backlog depth (queued events), the number
+        of repositories with queued events, the wait time of the oldest
+        queued event per repository, the event counters and the total and
+        maximum wait time of handled events.
+    """
+    now = time.time()
+    stats = get_stats()
+    queues = stats['queues']
+    return dict(
+        backlog=sum(q['depth'] for q in queues.values()),
+        repositories=len(queues),
+        waiting=dict(
+            (name, now - q['queued']) for name, q in queues.items()
+        ),
+        counters=stats['counters'],
+        wait_total=stats['wait']['total'],
+        wait_max=stats['wait']['max'],
+    )
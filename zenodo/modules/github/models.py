@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Database models for GitHub repositories and releases."""
+
+from __future__ import absolute_import
+
+import json
+from datetime import datetime
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.accounts.models import User
+
+
+class Repository(db.Model):
+
+    """GitHub repository of a user."""
+
+    __tablename__ = 'githubREPOSITORY'
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'name'),
+        db.Model.__table_args__
+    )
+
+    id = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                   primary_key=True, autoincrement=True)
+
+    user_id = db.Column(
+        db.Integer(15, unsigned=True), db.ForeignKey(User.id),
+        nullable=False, index=True
+    )
+    """Owner of the GitHub account."""
+
+    name = db.Column(db.String(255), nullable=False)
+    """Full name of the repository (e.g. ``owner/repo``)."""
+
+    description = db.Column(db.Text, nullable=False, default='')
+    """Description of the repository."""
+
+    hook = db.Column(db.Integer(15, unsigned=True), nullable=True)
+    """Identifier of the installed GitHub webhook."""
+
+    created = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    """Creation timestamp."""
+
+    @classmethod
+    def get(cls, user_id, name):
+        """Get a repository of a user."""
+        return cls.query.filter_by(user_id=user_id, name=name).first()
+
+    @classmethod
+    def get_or_create(cls, user_id, name, description=''):
+        """Get a repository of a user, adding it if needed (caller commits).
+        """
+        obj = cls.get(user_id, name)
+        if obj is None:
+            obj = cls(user_id=user_id, name=name, description=description)
+            db.session.add(obj)
+        return obj
+
+    @classmethod
+    def get_repos(cls, user_id):
+        """Get repositories of a user with their latest release.
+
+        :returns: Dictionary of repositories by name (as
+            :meth:`Repository.to_dict`).
+        """
+        latest = db.session.query(
+            db.func.max(Release.id).label('id')
+        ).select_from(Release).join(Repository).filter(
+            Repository.user_id == user_id,
+            Release.record_id.isnot(None),
+        ).group_by(Release.repository_id).subquery()
+
+        releases = dict(
+            (r.repository_id, r) for r in
+            Release.query.join(latest, Release.id == latest.c.id)
+        )
+        return dict(
+            (r.name, r.to_dict(releases.get(r.id)))
+            for r in cls.query.filter_by(user_id=user_id)
+        )
+
+    @property
+    def latest_release(self):
+        """Latest published release."""
+        return Release.query.filter(
+            Release.repository_id == self.id,
+            Release.record_id.isnot(None),
+        ).order_by(Release.id.desc()).first()
+
+    def to_dict(self, latest_release=None):
+        """Get the repository as stored in the account previously."""
+        return dict(
+            hook=self.hook,
+            description=self.description,
+            depositions=[latest_release.to_dict()] if latest_release else [],
+            errors=None,
+        )
+
+
+class Release(db.Model):
+
+    """Release of a GitHub repository deposited in Zenodo.
+
+    A release without a record identifier is an upload which has not been
+    completed.
+    """
+
+    __tablename__ = 'githubRELEASE'
+
+    __table_args__ = (
+        db.Index('ix_githubRELEASE_repository_id_tag', 'repository_id',
+                 'tag'),
+        db.Model.__table_args__
+    )
+
+    id = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                   primary_key=True, autoincrement=True)
+
+    repository_id = db.Column(
+        db.Integer(15, unsigned=True), db.ForeignKey(Repository.id),
+        nullable=False
+    )
+    """Repository of the release."""
+
+    repository = db.relationship(
+        Repository, backref=db.backref('releases', lazy='dynamic',
+                                       cascade='all, delete-orphan'))
+
+    tag = db.Column(db.String(255), nullable=False)
+    """Release tag name."""
+
+    deposition_id = db.Column(db.Integer(15, unsigned=True), nullable=True)
+    """Deposition of the release."""
+
+    record_id = db.Column(db.Integer(15, unsigned=True), nullable=True)
+    """Record of the published deposition."""
+
+    doi = db.Column(db.String(255), nullable=True)
+    """DOI of the record."""
+
+    submitted = db.Column(db.String(40), nullable=True)
+    """Modification timestamp of the deposition when published."""
+
+    _errors = db.Column('errors', db.Text, nullable=True)
+
+    created = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    """Creation timestamp."""
+
+    @property
+    def errors(self):
+        """Errors of the release."""
+        return json.loads(self._errors) if self._errors else None
+
+    @errors.setter
+    def errors(self, value):
+        self._errors = json.dumps(value) if value is not None else None
+
+    @classmethod
+    def get_pending(cls, repository, tag):
+        """Get the incomplete upload of a release."""
+        return cls.query.filter_by(
+            repository_id=repository.id, tag=tag, record_id=None,
+        ).order_by(cls.id.desc()).first()
+
+    def to_dict(self):
+        """Get the release as stored in the account previously."""
+        return dict(
+            deposition_id=self.deposition_id,
+            record_id=self.record_id,
+            doi=self.doi,
+            submitted=self.submitted,
+            errors=self.errors,
+            github_ref=self.tag,
+        )
@@ -29,12 +29,14 @@ from __future__ import absolute_import
 
 
 from celery.utils.log import get_task_logger
-import requests
 import six
 import sys
+import time
 from flask import current_app
 
+from invenio.base.globals import cfg
 from invenio.celery import celery
+from invenio.ext.cache import cache
 from invenio.ext.sqlalchemy import db
 from invenio.modules.webhooks.models import Event
 from invenio.modules.oauth2server.models import Token as ProviderToken
@@ -45,35 +47,223 @@ from invenio.modules.oauthclient.client import oauth
 #from invenio.modules.accounts.models import User
 
 
+from . import intake
+from .client import GitHubClient, RateLimitExceeded
 from .helpers import get_account, get_api
-from .upload import upload
-from .utils import submitted_deposition, get_zenodo_json, is_valid_sender, \
-    get_contributors, init_api, revoke_token, remove_hook, get_owner
+from .models import Release, Repository
+from .upload import stream_url, upload
+from .utils import submitted_deposition, get_zenodo_json, \
+    get_contributors, init_api, revoke_token, get_owner, fetch_repos, \
+    apply_repos, iso_utcnow, hook_config, install_hook, uninstall_hook, \
+    find_hook, iter_concurrently
 
 
 logger = get_task_logger(__name__)
 
+SYNC_LOCK_KEY = "github::sync::{0}"
+HOOKS_PROGRESS_KEY = "github::hooks::{0}"
+
+HOOKS_ACTIONS = ('enable', 'disable', 'reconcile')
+
+
+def schedule_sync(user_id):
+    """Sync repositories of a user in the background.
+
+    :returns: ``False`` if a sync is already scheduled.
+    """
+    key = SYNC_LOCK_KEY.format(user_id)
+    if not cache.add(key, True, timeout=cfg['GITHUB_SYNC_LOCK_TIMEOUT']):
+        return False
+    sync_account.delay(user_id)
+    return True
+
+
+def is_syncing(user_id):
+    """Check if a background sync of a user's repositories is scheduled."""
+    return bool(cache.get(SYNC_LOCK_KEY.format(user_id)))
+
+
+@celery.task(ignore_result=True)
+def sync_account(user_id):
+    """Sync the list of repositories of a user."""
+    key = SYNC_LOCK_KEY.format(user_id)
+    try:
+        # Fetch before loading the account, so that the account is locked
+        # only for applying the changes.
+        repos = fetch_repos(get_api(user_id=user_id))
+    except RateLimitExceeded as e:
+        # Try again once the rate limit is reset (keeping the lock).
+        countdown = int(max(e.reset - time.time(), 0))
+        cache.set(key, True,
+                  timeout=cfg['GITHUB_SYNC_LOCK_TIMEOUT'] + countdown)
+        sync_account.apply_async((user_id, ), countdown=countdown)
+        return
+    except Exception:
+        cache.delete(key)
+        raise
+
+    try:
+        if repos is None:
+            return
+
+        changes = apply_repos(user_id, repos)
+        account = get_account(user_id=user_id)
+        account.extra_data['last_sync'] = iso_utcnow()
+        account.extra_data.changed()
+        db.session.commit()
+        logger.info("Synced repositories of user %s (%s changed)",
+                    user_id, changes)
+    finally:
+        cache.delete(key)
+
+
+def get_hooks_progress(user_id):
+    """Get the progress of the last bulk hooks operation of a user."""
+    return cache.get(HOOKS_PROGRESS_KEY.format(user_id))
+
+
+def set_hooks_progress(user_id, progress):
+    """Store the progress of a bulk hooks operation of a user."""
+    cache.set(HOOKS_PROGRESS_KEY.format(user_id), progress,
+              timeout=cfg['GITHUB_HOOKS_PROGRESS_TIMEOUT'])
+
+
+def schedule_bulk_hooks(user_id, names, action):
+    """Install, remove or verify the hooks of repositories in background.
+
+    :param names: Full names of the repositories (all repositories of the
+        user if ``None``, in which case the total is only known once the
+        operation starts).
+    """
+    assert action in HOOKS_ACTIONS
+    set_hooks_progress(user_id, dict(
+        action=action, total=len(names) if names is not None else None,
+        done=0, failed=[], finished=False,
+    ))
+    bulk_hooks.delay(user_id, names, action)
+
 
 @celery.task(ignore_result=True)
-def disconnect_github(remote_app, access_token, extra_data):
+def bulk_hooks(user_id, names, action):
+    """Install, remove or verify the hooks of repositories of a user.
+
+    GitHub is called for the repositories concurrently, while the outcomes
+    are stored in one commit at the end. The progress is available from
+    :func:`get_hooks_progress`.
+
+    :param names: Full names of the repositories (all repositories of the
+        user are verified if ``None``).
+    :param action: ``enable``, ``disable`` or ``reconcile`` (find the
+        installed hooks).
+    """
+    gh = get_api(user_id=user_id)
+    query = Repository.query.filter_by(user_id=user_id)
+    if names is not None:
+        query = query.filter(Repository.name.in_(names))
+    repos = dict((r.name, r) for r in query)
+
+    if action == 'disable':
+        items = [(n, r.hook) for n, r in repos.items() if r.hook]
+        fun = lambda item: uninstall_hook(gh, item[0], item[1])
+    else:
+        config = hook_config(get_account(user_id=user_id).extra_data)
+        items = [(n, r.hook) for n, r in repos.items()]
+        if action == 'enable':
+            fun = lambda item: install_hook(gh, item[0], config)
+        else:
+            fun = lambda item: find_hook(gh, item[0], item[1], config)
+
+    progress = dict(
+        action=action, total=len(items), done=0, failed=[], finished=False,
+    )
+    set_hooks_progress(user_id, progress)
+
+    outcomes = {}
+    for (name, hook), result, error in iter_concurrently(fun, items):
+        progress['done'] += 1
+        if error is not None or (action != 'reconcile' and not result):
+            progress['failed'].append(name)
+        else:
+            outcomes[name] = result
+        set_hooks_progress(user_id, progress)
+
+    for name, result in outcomes.items():
+        if action == 'disable':
+            repos[name].hook = None
+        else:
+            repos[name].hook = result
+    db.session.commit()
+
+    progress['finished'] = True
+    set_hooks_progress(user_id, progress)
+    logger.info("Bulk %s of hooks of user %s: %s done, %s failed",
+                action, user_id, progress['done'], len(progress['failed']))
+
+
+@celery.task(ignore_result=True)
+def disconnect_github(remote_app, access_token, hooks):
     """ Uninstall webhooks. """
     # Note at this point the remote account and all associated data have
     # already been deleted. The celery task is passed the access_token and
-    # extra_data to make some last cleanup and afterwards delete itself
-    # remotely.
+    # the installed hooks as (repository name, hook id) pairs to make some
+    # last cleanup and afterwards delete itself remotely.
     remote = oauth.remote_apps[remote_app]
 
     try:
         gh = init_api(access_token)
 
-        # Remove all installed hooks.
-        for full_name, repo in six.iteritems(extra_data["repos"]):
-            if repo.get('hook', None):
-                remove_hook(gh, extra_data, full_name)
+        # Remove all installed hooks (repositories are not stored anymore).
+        for (full_name, hook), removed, error in iter_concurrently(
+                lambda h: uninstall_hook(gh, h[0], h[1]), hooks):
+            if error is not None or not removed:
+                logger.warning("Could not remove hook of %s", full_name)
     finally:
         revoke_token(remote, access_token)
 
 
+@celery.task(ignore_result=True)
+def enqueue_github_payload(event_state):
+    """Queue an incoming notification from GitHub."""
+    e = Event()
+    e.__setstate__(event_state)
+
+    # Ping event
+    if 'hook_id' in e.payload and 'zen' in e.payload:
+        return
+
+    full_name = e.payload['repository']['full_name']
+    tag_name = e.payload['release']['tag_name']
+    if intake.enqueue(full_name, tag_name, event_state, e.payload):
+        # Wait for a burst of events to be coalesced.
+        process_github_queue.apply_async(
+            (full_name, ), countdown=cfg['GITHUB_INTAKE_WINDOW'])
+
+
+@celery.task(ignore_result=True)
+def process_github_queue(full_name):
+    """Handle the queued notifications of a repository in order.
+
+    An event is removed from the queue only once handled, so that the
+    events of a dying processor are handled by the next one.
+    """
+    while True:
+        event = intake.next_event(full_name)
+        if event is None:
+            return
+        event_id, event_state = event
+        try:
+            handle_github_payload(event_state)
+        except Exception:
+            logger.exception("Failed handling GitHub event for %s", full_name)
+            # Allow GitHub to redeliver the event (resuming the upload).
+            e = Event()
+            e.__setstate__(event_state)
+            intake.forget_delivery(e.payload)
+            intake.remove_event(full_name, event_id, counter='failed')
+        else:
+            intake.remove_event(full_name, event_id)
+
+
 @celery.task(ignore_result=True)
 def handle_github_payload(event_state, verify_sender=True):
     """ Handle incoming notification from GitHub on a new release. """
@@ -92,12 +282,20 @@ def handle_github_payload(event_state, verify_sender=True):
         id=account.extra_data["tokens"]["internal"]
     ).first().access_token
 
+    full_name = e.payload['repository']['full_name']
+    tag_name = e.payload['release']['tag_name']
+
     # Validate payload sender
-    if verify_sender and \
-       not is_valid_sender(account.extra_data, e.payload):
-        raise Exception("Invalid sender for payload %s for user %s" % (
-            e.payload, e.user_id
-        ))
+    repo = Repository.get(e.user_id, full_name)
+    if repo is None:
+        if verify_sender:
+            raise Exception("Invalid sender for payload %s for user %s" % (
+                e.payload, e.user_id
+            ))
+        repo = Repository.get_or_create(e.user_id, full_name)
+        db.session.commit()
+
+    pending = Release.get_pending(repo, tag_name)
 
     try:
         # Extra metadata from .zenodo.json and github repository
@@ -106,21 +304,27 @@ def handle_github_payload(event_state, verify_sender=True):
         # Extract zip snapshot from github
         files = extract_files(e.payload)
 
-        # Upload into Zenodo
-        deposition = upload(access_token, metadata, files, publish=True)
+        # Upload into Zenodo (resuming a previously failed upload)
+        deposition = upload(
+            access_token, metadata, files, publish=True, direct=True,
+            deposition_id=pending.deposition_id if pending else None,
+        )
 
         # TODO: Add step to update metadata of all previous records
-        submitted_deposition(
-            account.extra_data, e.payload['repository']['full_name'],
-            deposition, e.payload['release']['tag_name']
-        )
-        account.extra_data.changed()
+        submitted_deposition(repo, deposition, tag_name)
         db.session.commit()
         # Send email to user that release was included.
-    except Exception as e:
+    except Exception as error:
         # Handle errors and possibly send user an email
         # Send email to user
         current_app.logger.exception("Failed handling GitHub payload")
+        deposition_id = getattr(error, 'deposition_id', None)
+        if deposition_id is not None:
+            # Keep the deposition so that a redelivery resumes the upload
+            if pending is None:
+                pending = Release(repository=repo, tag=tag_name)
+                db.session.add(pending)
+            pending.deposition_id = deposition_id
         db.session.commit()
         six.reraise(*sys.exc_info())
 
@@ -133,8 +337,9 @@ def extract_title(release, repository):
 
 
 def extract_description(gh, release, repository):
-    return gh.markdown(release['body']) or repository['description'] or \
-        'No description provided.'
+    html = GitHubClient.from_api(gh).markdown(release['body']) \
+        if release['body'] else None
+    return html or repository['description'] or 'No description provided.'
 
 
 def extract_metadata(gh, payload):
@@ -202,10 +407,4 @@ def extract_files(payload):
         "repo_name": repo_name, "tag_name": tag_name
     }
 
-    r = requests.get(zipball_url, stream=True)
-    if r.status_code != 200:
-        raise Exception(
-            "Could not retrieve archive from GitHub: %s" % zipball_url
-        )
-
-    return [(r.raw, filename)]
+    return [(stream_url(zipball_url), filename)]
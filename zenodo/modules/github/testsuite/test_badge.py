@@ -24,72 +24,82 @@
 
 from __future__ import absolute_import
 
-import os
-import shutil
-import tempfile
-
-import httpretty
-
 from invenio.testsuite import InvenioTestCase, make_test_suite, run_test_suite
 
-from zenodo.modules.github.badge import create_badge, shieldsio_encode
-
 
 class BadgeTestCase(InvenioTestCase):
 
     """Badge test case."""
 
-    @property
-    def config(self):
-        """Fix up configuration."""
-        return dict(
-            # HTTPretty doesn't play well with Redis.
-            # See gabrielfalcao/HTTPretty#110
-            CACHE_TYPE='simple',
-            GITHUB_SHIELDSIO_create_badgeBASE_URL='http://example.org/badge/',
-        )
+    def test_render_badge(self):
+        """Test local rendering of badges."""
+        from xml.dom import minidom
+        from zenodo.modules.github.badge import render_badge, text_width
 
-    def setUp(self):
-        """Setup method test case."""
-        self.SVG = """<svg xmlns="http://www.w3.org/2000/svg" width="135" height="20"><linearGradient id="b" x2="0" y2="100%"><stop offset="0" stop-color="#bbb" stop-opacity=".1"/><stop offset="1" stop-opacity=".1"/></linearGradient><mask id="a"><rect width="135" height="20" rx="3" fill="#fff"/></mask><g mask="url(#a)"><path fill="#555" d="M0 0h33v20H0z"/><path fill="#007ec6" d="M33 0h102v20H33z"/><path fill="url(#b)" d="M0 0h135v20H0z"/></g><g fill="#fff" text-anchor="middle" font-family="DejaVu Sans,Verdana,Geneva,sans-serif" font-size="11"><text x="17.5" y="15" fill="#010101" fill-opacity=".3">DOI</text><text x="17.5" y="14">DOI</text><text x="83" y="15" fill="#010101" fill-opacity=".3">10.1234/foo.bar</text><text x="83" y="14">10.1234/foo.bar</text></g></svg>"""
-        self.TMP_DIR = tempfile.mkdtemp()
+        svg = render_badge("DOI", "10.1234/foo<bar>", "blue", style="flat")
+        doc = minidom.parseString(svg)
+        texts = [t.firstChild.data for t in doc.getElementsByTagName('text')]
+        self.assertEqual(texts, ["DOI", "DOI", "10.1234/foo<bar>",
+                                 "10.1234/foo<bar>"])
 
-    def tearDown(self):
-        """Tear down test case."""
-        shutil.rmtree(self.TMP_DIR)
+        width = int(doc.documentElement.getAttribute('width'))
+        self.assertEqual(width, int(round(text_width("DOI"))) +
+                         int(round(text_width("10.1234/foo<bar>"))) + 20)
 
-    def test_shieldsio_encode(self):
-        """Test encoding of text for shields.io."""
+        plastic = minidom.parseString(
+            render_badge("DOI", "10.1234/foo", style="plastic"))
+        self.assertEqual(plastic.documentElement.getAttribute('height'), "18")
         self.assertEqual(
-            shieldsio_encode("10.1234/foo-bar_"),
-            "10.1234%2Ffoo--bar__"
-        )
-
-    def test_create_badge(self):
-        """Test create_badge method."""
-        badge_url = "%sDOI-10.1234%%2Ffoo.bar-blue.svg?style=flat" % \
-            self.app.config["GITHUB_SHIELDSIO_BASE_URL"]
-
-        httpretty.enable()
-        httpretty.register_uri(
-            httpretty.GET,
-            badge_url,
-            body=self.SVG,
-            content_type="image/svg+xml",
-        )
-
-        output = os.path.join(self.TMP_DIR, "test.svg")
-
-        create_badge(
-            "DOI",
-            "10.1234/foo.bar",
-            "blue",
-            output,
-            style="flat",
+            render_badge("DOI", "10.1234/foo", "unknown", style="unknown"),
+            render_badge("DOI", "10.1234/foo", "blue", style="flat"),
         )
 
-        self.assertTrue(os.path.exists(output))
-        httpretty.disable()
+    def test_configured_styles(self):
+        """Test that only configured styles are rendered."""
+        from mock import patch
+        from zenodo.modules.github.badge import badge_key
+
+        self.assertEqual(badge_key("10.1234/foo", "plastic"),
+                         ("10.1234/foo", "plastic"))
+        with patch.dict(self.app.config, GITHUB_BADGE_STYLES=["flat"]):
+            self.assertEqual(badge_key("10.1234/foo", "plastic"),
+                             ("10.1234/foo", "flat"))
+
+    def test_lru_cache(self):
+        """Test eviction of least recently used badges."""
+        from zenodo.modules.github.badge import LRUCache
+
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_conditional_response(self):
+        """Test ETag and cache headers of the badge view."""
+        from flask import url_for
+        from zenodo.modules.github.badge import doi_badge
+
+        # A cached badge is served without looking up the DOI.
+        svg, etag = doi_badge("10.1234/foo.bar", style="flat")
+        with self.app.test_request_context():
+            url = url_for('zenodo_github_badge.doi_badge',
+                          doi="10.1234/foo.bar", style="flat")
+        base_url = self.app.config['CFG_SITE_SECURE_URL']
+
+        resp = self.client.get(url, base_url=base_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, svg)
+        self.assertEqual(resp.headers['ETag'], '"%s"' % etag)
+        self.assertIn('max-age=', resp.headers['Cache-Control'])
+
+        resp = self.client.get(url, base_url=base_url,
+                               headers={'If-None-Match': '"%s"' % etag})
+        self.assertEqual(resp.status_code, 304)
 
 TEST_SUITE = make_test_suite(BadgeTestCase)
 
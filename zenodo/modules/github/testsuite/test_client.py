@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test cases for GitHub API client and contributors extraction."""
+
+from __future__ import absolute_import
+
+import json
+import time
+
+import httpretty
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, run_test_suite
+
+from . import fixtures
+
+
+CONTRIBUTORS_URL = "https://api.github.com/repos/auser/repo-1/contributors"
+
+
+def contributor(login, contributions):
+    return dict(
+        login=login,
+        contributions=contributions,
+        url='https://api.github.com/users/%s' % login,
+        type='User',
+    )
+
+
+class GitHubClientTestCase(InvenioTestCase):
+
+    """Contributors extraction test case."""
+
+    @property
+    def config(self):
+        """Fix up configuration."""
+        return dict(
+            # HTTPretty doesn't play well with Redis.
+            # See gabrielfalcao/HTTPretty#110
+            CACHE_TYPE='simple',
+        )
+
+    def setUp(self):
+        """Mock up GitHub API with two pages of contributors."""
+        import github3
+        from invenio.ext.cache import cache
+
+        cache.clear()
+        self.gh = github3.login(token='test')
+        self.profile_requests = []
+
+        def contributors_callback(request, uri, headers):
+            if request.querystring.get('page') == ['2']:
+                body = [contributor('cuser', 1),
+                        dict(contributor('bot', 100), type='Bot')]
+            else:
+                headers['Link'] = '<%s?per_page=100&page=2>; rel="next"' % \
+                    CONTRIBUTORS_URL
+                body = [contributor('buser', 4), contributor('auser', 10)]
+            return (200, headers, json.dumps(body))
+
+        def profile_callback(request, uri, headers):
+            login = uri.split('/')[-1]
+            self.profile_requests.append(login)
+            etag = '"%s"' % login
+            headers['ETag'] = etag
+            if request.headers.get('If-None-Match') == etag:
+                return (304, headers, '')
+            return (200, headers, json.dumps(
+                fixtures.USER(login, bio=login != 'buser')
+            ))
+
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, CONTRIBUTORS_URL, body=contributors_callback
+        )
+        for login in ['auser', 'buser', 'cuser']:
+            httpretty.register_uri(
+                httpretty.GET, "https://api.github.com/users/%s" % login,
+                body=profile_callback,
+            )
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_get_contributors(self):
+        """Test pagination and order of contributors."""
+        from zenodo.modules.github.utils import get_contributors
+
+        self.assertEqual(
+            get_contributors(self.gh, 'auser', 'repo-1'),
+            [
+                dict(name='Lars Holm Nielsen', affiliation='CERN'),
+                dict(name='buser', affiliation=''),
+                dict(name='Lars Holm Nielsen', affiliation='CERN'),
+            ]
+        )
+        self.assertEqual(
+            sorted(self.profile_requests), ['auser', 'buser', 'cuser']
+        )
+
+    def test_conditional_requests(self):
+        """Test profiles are revalidated with their ETag."""
+        from zenodo.modules.github.client import GitHubClient
+
+        client = GitHubClient(access_token='test')
+        r = client.get('/users/auser', public=True)
+        self.assertFalse(r.from_cache)
+        self.assertEqual(r.data['login'], 'auser')
+
+        r = client.get('/users/auser', public=True)
+        self.assertTrue(r.from_cache)
+        self.assertEqual(r.data['login'], 'auser')
+        self.assertEqual(
+            httpretty.last_request().headers.get('If-None-Match'), '"auser"'
+        )
+
+    def test_deadline(self):
+        """Test fallback to logins when deadline is exceeded."""
+        from zenodo.modules.github.utils import get_contributors
+
+        self.assertEqual(
+            get_contributors(self.gh, 'auser', 'repo-1', deadline=0),
+            [dict(name='auser', affiliation=''),
+             dict(name='buser', affiliation='')],
+        )
+
+
+class RateLimitTestCase(InvenioTestCase):
+
+    """Rate limit tracking test case (against a fake GitHub API)."""
+
+    @property
+    def config(self):
+        """Fix up configuration."""
+        return dict(
+            CACHE_TYPE='simple',
+            GITHUB_RATELIMIT_RESERVE=5,
+            GITHUB_RATELIMIT_MAX_DELAY=0,
+        )
+
+    def setUp(self):
+        """Mock up GitHub API with a rate limit."""
+        from invenio.ext.cache import cache
+
+        cache.clear()
+        self.remaining = 10
+        self.requests = []
+
+        def callback(request, uri, headers):
+            self.requests.append(uri)
+            self.remaining -= 1
+            headers.update({
+                'X-RateLimit-Limit': '5000',
+                'X-RateLimit-Remaining': str(self.remaining),
+                'X-RateLimit-Reset': str(int(time.time()) + 3600),
+                'ETag': '"etag"',
+            })
+            if request.headers.get('If-None-Match') == '"etag"':
+                return (304, headers, '')
+            if uri.endswith('/markdown'):
+                return (200, headers, '<p>%s</p>' % json.loads(
+                    request.body)['text'])
+            return (200, headers, json.dumps(dict(uri=uri)))
+
+        httpretty.enable()
+        for path in ['/users/auser', '/users/buser']:
+            httpretty.register_uri(
+                httpretty.GET, "https://api.github.com%s" % path,
+                body=callback,
+            )
+        httpretty.register_uri(
+            httpretty.POST, "https://api.github.com/markdown", body=callback,
+        )
+        httpretty.register_uri(
+            httpretty.GET, "https://api.github.com/applications/"
+            "client/tokens/test", body=callback,
+        )
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_quota(self):
+        """Test requests which are not urgent when the limit is low."""
+        from zenodo.modules.github.client import GitHubClient, \
+            RateLimitExceeded, get_counters, get_quota
+
+        client = GitHubClient(access_token='test')
+        counters = get_counters()
+
+        client.get('/users/auser')
+        self.assertEqual(get_quota('test')['remaining'], 9)
+        self.remaining = 5
+        client.get('/users/auser')
+        self.assertEqual(get_quota('test')['remaining'], 4)
+        self.assertEqual(len(self.requests), 2)
+
+        # Cached responses are used as they are, others are refused.
+        r = client.get('/users/auser', urgent=False)
+        self.assertTrue(r.from_cache)
+        self.assertEqual(len(self.requests), 2)
+        self.assertRaises(RateLimitExceeded, client.get, '/users/buser',
+                          urgent=False)
+
+        # Urgent requests are made anyway.
+        self.assertEqual(client.get('/users/buser').status_code, 200)
+        self.assertEqual(len(self.requests), 3)
+
+        after = get_counters()
+        self.assertEqual(after['hits'] - counters['hits'], 2)
+        self.assertEqual(after['misses'] - counters['misses'], 2)
+        self.assertEqual(after['limited'] - counters['limited'], 1)
+
+    def test_quota_cached_first(self):
+        """Test cached responses are not delayed when the limit is low."""
+        from mock import patch
+        from zenodo.modules.github.client import GitHubClient
+
+        client = GitHubClient(access_token='test')
+        self.remaining = 5
+        client.get('/users/auser')
+
+        with patch.dict(self.app.config, GITHUB_RATELIMIT_MAX_DELAY=7200), \
+                patch('zenodo.modules.github.client.time.sleep') as sleep:
+            r = client.get('/users/auser', urgent=False)
+            self.assertTrue(r.from_cache)
+            self.assertFalse(sleep.called)
+
+            # Without a cached response, the request waits for the reset.
+            client.get('/users/buser', urgent=False)
+            self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_markdown(self):
+        """Test rendered markdown is cached."""
+        from zenodo.modules.github.client import GitHubClient
+
+        client = GitHubClient(access_token='test')
+        self.assertEqual(client.markdown('Test'), '<p>Test</p>')
+        self.assertEqual(client.markdown('Test'), '<p>Test</p>')
+        self.assertEqual(len(self.requests), 1)
+
+    def test_token_validity(self):
+        """Test the validity of tokens is memoised."""
+        from zenodo.modules.github.utils import is_valid_token
+
+        class Remote(object):
+            consumer_key = 'client'
+            consumer_secret = 'secret'
+
+        self.assertTrue(is_valid_token(Remote(), 'test'))
+        self.assertTrue(is_valid_token(Remote(), 'test'))
+        self.assertEqual(len(self.requests), 1)
+
+
+TEST_SUITE = make_test_suite(GitHubClientTestCase, RateLimitTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test cases for bulk webhook operations."""
+
+from __future__ import absolute_import
+
+import threading
+import time
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+CONFIG = dict(url='https://zenodo.org/api/hooks/receivers/github/events/')
+
+
+class FakeHook(object):
+    def __init__(self, repo, id, url):
+        self.repo = repo
+        self.id = id
+        self.config = dict(url=url)
+
+    def delete(self):
+        self.repo.hooks.pop(self.id)
+        return True
+
+
+class FakeRepository(object):
+    def __init__(self):
+        self.hooks = {}
+
+    def create_hook(self, name, config, events=None):
+        hook = FakeHook(self, len(self.hooks) + 1, config['url'])
+        self.hooks[hook.id] = hook
+        return hook
+
+    def hook(self, hook_id):
+        return self.hooks.get(hook_id)
+
+    def iter_hooks(self):
+        return iter(self.hooks.values())
+
+
+class FakeGitHub(object):
+    def __init__(self, names):
+        self.repos = dict((n, FakeRepository()) for n in names)
+        self.threads = set()
+
+    def repository(self, owner, name):
+        self.threads.add(threading.current_thread().ident)
+        time.sleep(0.01)
+        return self.repos.get('%s/%s' % (owner, name))
+
+
+class BulkHooksTestCase(InvenioTestCase):
+
+    """Bulk webhook operations test case."""
+
+    def test_install_find_uninstall(self):
+        """Test hook operations on single repositories."""
+        from zenodo.modules.github.utils import find_hook, install_hook, \
+            uninstall_hook
+
+        gh = FakeGitHub(['auser/repo-1'])
+        hook_id = install_hook(gh, 'auser/repo-1', CONFIG)
+        self.assertEqual(hook_id, 1)
+        self.assertEqual(find_hook(gh, 'auser/repo-1', None, CONFIG), 1)
+        self.assertEqual(find_hook(gh, 'auser/repo-1', 1, CONFIG), 1)
+        self.assertEqual(
+            find_hook(gh, 'auser/repo-1', 1, dict(url='http://other')),
+            None)
+        self.assertTrue(uninstall_hook(gh, 'auser/repo-1', hook_id))
+        self.assertEqual(find_hook(gh, 'auser/repo-1', 1, CONFIG), None)
+        self.assertEqual(install_hook(gh, 'auser/missing', CONFIG), None)
+
+    def test_iter_concurrently(self):
+        """Test outcomes and errors of concurrent operations."""
+        from zenodo.modules.github.utils import install_hook, \
+            iter_concurrently
+
+        names = ['auser/repo-%s' % i for i in range(20)]
+        gh = FakeGitHub(names)
+
+        def install(name):
+            if name == 'auser/repo-3':
+                raise ValueError(name)
+            return install_hook(gh, name, CONFIG)
+
+        results = dict(
+            (name, (result, error)) for name, result, error in
+            iter_concurrently(install, names, concurrency=4)
+        )
+        self.assertEqual(sorted(results.keys()), sorted(names))
+        self.assertTrue(isinstance(results['auser/repo-3'][1], ValueError))
+        self.assertEqual(results['auser/repo-1'], (1, None))
+        self.assertTrue(1 < len(gh.threads) <= 4)
+        self.assertEqual(list(iter_concurrently(install, [])), [])
+
+    def test_schedule_all(self):
+        """Test scheduling an operation on all repositories of a user."""
+        from mock import patch
+        from zenodo.modules.github.tasks import get_hooks_progress, \
+            schedule_bulk_hooks
+
+        with patch('zenodo.modules.github.tasks.bulk_hooks') as bulk_hooks:
+            schedule_bulk_hooks(1, None, 'reconcile')
+            self.assertEqual(get_hooks_progress(1)['total'], None)
+            bulk_hooks.delay.assert_called_once_with(1, None, 'reconcile')
+
+            schedule_bulk_hooks(1, ['auser/repo-1'], 'enable')
+            self.assertEqual(get_hooks_progress(1)['total'], 1)
+
+
+TEST_SUITE = make_test_suite(BulkHooksTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test cases for the webhook event intake queue."""
+
+from __future__ import absolute_import
+
+from invenio.ext.cache import cache
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+def payload(repo, tag, body=''):
+    return dict(
+        repository=dict(full_name=repo),
+        release=dict(tag_name=tag, body=body),
+    )
+
+
+class IntakeTestCase(InvenioTestCase):
+
+    """Intake queue test case."""
+
+    @property
+    def config(self):
+        """Use an isolated cache."""
+        return dict(CACHE_TYPE='simple')
+
+    def setUp(self):
+        from zenodo.modules.github.intake import QUEUE_KEY, STATS_KEY
+        cache.delete(STATS_KEY)
+        for name in ('a/1', 'a/2', 'b/1', 'c/1', 'd/1'):
+            cache.delete(QUEUE_KEY.format(name))
+
+    def enqueue(self, repo, tag, body=''):
+        from zenodo.modules.github.intake import enqueue
+        p = payload(repo, tag, body)
+        return enqueue(repo, tag, dict(payload=p, tag=tag, body=body), p)
+
+    def dequeue(self, repo):
+        """Take the next event and mark it handled."""
+        from zenodo.modules.github.intake import next_event, remove_event
+        event = next_event(repo)
+        if event is None:
+            return None
+        remove_event(repo, event[0])
+        return event[1]
+
+    def test_order(self):
+        """Test events are processed per repository in arrival order."""
+        dequeue = self.dequeue
+
+        self.assertTrue(self.enqueue('a/1', 'v1'))
+        self.assertFalse(self.enqueue('a/1', 'v2'))
+        self.assertTrue(self.enqueue('a/2', 'v1'))
+
+        self.assertEqual(dequeue('a/1')['tag'], 'v1')
+        self.assertEqual(dequeue('a/1')['tag'], 'v2')
+        self.assertEqual(dequeue('a/1'), None)
+        self.assertEqual(dequeue('a/2')['tag'], 'v1')
+        self.assertEqual(dequeue('a/2'), None)
+
+        # The processor stopped, so a new one is needed.
+        self.assertTrue(self.enqueue('a/1', 'v3'))
+
+    def test_duplicates(self):
+        """Test identical deliveries are dropped."""
+        from zenodo.modules.github.intake import forget_delivery, get_metrics
+        dequeue = self.dequeue
+
+        self.assertTrue(self.enqueue('b/1', 'v1'))
+        self.assertFalse(self.enqueue('b/1', 'v1'))
+        self.assertEqual(dequeue('b/1')['tag'], 'v1')
+        self.assertEqual(dequeue('b/1'), None)
+
+        forget_delivery(payload('b/1', 'v1'))
+        self.assertTrue(self.enqueue('b/1', 'v1'))
+        self.assertEqual(get_metrics()['counters']['duplicates'], 1)
+
+    def test_coalesce(self):
+        """Test a queued release is replaced by a newer event."""
+        from zenodo.modules.github.intake import get_metrics
+        dequeue = self.dequeue
+
+        self.enqueue('c/1', 'v1', body='old')
+        self.enqueue('c/1', 'v2')
+        self.enqueue('c/1', 'v1', body='new')
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['backlog'], 2)
+        self.assertEqual(metrics['repositories'], 1)
+        self.assertIn('c/1', metrics['waiting'])
+        self.assertEqual(metrics['counters']['coalesced'], 1)
+
+        first = dequeue('c/1')
+        self.assertEqual((first['tag'], first['body']), ('v1', 'new'))
+        self.assertEqual(dequeue('c/1')['tag'], 'v2')
+        self.assertEqual(get_metrics()['backlog'], 0)
+
+    def test_remove_after_handling(self):
+        """Test events stay queued until handled."""
+        from zenodo.modules.github.intake import QUEUE_KEY, get_metrics, \
+            next_event, remove_event
+
+        self.enqueue('d/1', 'v1', body='old')
+        self.enqueue('d/1', 'v2')
+
+        # A processor dies while handling the first event.
+        event_id, event_state = next_event('d/1')
+        self.assertEqual(event_state['tag'], 'v1')
+        self.assertEqual(get_metrics()['backlog'], 2)
+        self.assertEqual(next_event('d/1')[0], event_id)
+
+        # The event is superseded while being handled.
+        self.enqueue('d/1', 'v1', body='new')
+        remove_event('d/1', event_id)
+        event_id, event_state = next_event('d/1')
+        self.assertEqual((event_state['tag'], event_state['body']),
+                         ('v1', 'new'))
+        remove_event('d/1', event_id, counter='failed')
+
+        event_id, event_state = next_event('d/1')
+        self.assertEqual(event_state['tag'], 'v2')
+        remove_event('d/1', event_id)
+        self.assertEqual(next_event('d/1'), None)
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['backlog'], 0)
+        self.assertEqual(metrics['counters']['processed'], 2)
+        self.assertEqual(metrics['counters']['failed'], 1)
+        self.assertEqual(cache.get(QUEUE_KEY.format('d/1')), None)
+
+    def test_payloads_not_shared(self):
+        """Test event states are not stored in the shared entry."""
+        from zenodo.modules.github.intake import STATS_KEY
+
+        self.enqueue('a/1', 'v1', body='x' * 1000)
+        self.assertNotIn('x' * 1000, repr(cache.get(STATS_KEY)))
+
+
+TEST_SUITE = make_test_suite(IntakeTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
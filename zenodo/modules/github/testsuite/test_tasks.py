@@ -100,8 +100,11 @@ class GitHubTestCase(CeleryTestCase):
         if self.remote_token:
             self.remote_token.remote_account.delete()
 
-        # Remove User and provider tokens
+        # Remove repositories, User and provider tokens
         if self.user:
+            from zenodo.modules.github.models import Repository
+            for r in Repository.query.filter_by(user_id=self.user.id):
+                db.session.delete(r)
             ProviderToken.query.filter_by(user_id=self.user.id).delete()
             db.session.delete(self.user)
 
@@ -127,13 +130,15 @@ class HandlePayloadTestCase(GitHubTestCase):
         from zenodo.modules.github.tasks import handle_github_payload
         from invenio.modules.webhooks.models import Event
 
+        from zenodo.modules.github.models import Repository
+
         httpretty.enable()
-        extra_data = self.remote_token.remote_account.extra_data
-        assert 'auser/repo-1' in extra_data['repos']
-        assert 'auser/repo-2' in extra_data['repos']
+        repos = Repository.get_repos(self.user.id)
+        assert 'auser/repo-1' in repos
+        assert 'auser/repo-2' in repos
 
-        assert len(extra_data['repos']['auser/repo-1']['depositions']) == 0
-        assert len(extra_data['repos']['auser/repo-2']['depositions']) == 0
+        assert len(repos['auser/repo-1']['depositions']) == 0
+        assert len(repos['auser/repo-2']['depositions']) == 0
 
         e = Event(
             user_id=self.user.id,
@@ -142,12 +147,11 @@ class HandlePayloadTestCase(GitHubTestCase):
 
         handle_github_payload(e.__getstate__())
 
-        db.session.expire(self.remote_token.remote_account)
-        extra_data = self.remote_token.remote_account.extra_data
-        assert len(extra_data['repos']['auser/repo-1']['depositions']) == 1
-        assert len(extra_data['repos']['auser/repo-2']['depositions']) == 0
+        repos = Repository.get_repos(self.user.id)
+        assert len(repos['auser/repo-1']['depositions']) == 1
+        assert len(repos['auser/repo-2']['depositions']) == 0
 
-        dep = extra_data['repos']['auser/repo-1']['depositions'][0]
+        dep = repos['auser/repo-1']['depositions'][0]
 
         assert dep['doi'].endswith(six.text_type(dep['record_id']))
         assert dep['errors'] is None
@@ -202,7 +206,54 @@ class PayloadExtractionTestCase(GitHubTestCase):
         assert metadata['upload_type'] == 'dataset'
 
 
-TEST_SUITE = make_test_suite(HandlePayloadTestCase, PayloadExtractionTestCase)
+class SyncTestCase(GitHubTestCase):
+    def test_sync_account(self):
+        from ..models import Repository
+        from ..tasks import sync_account
+
+        repo = fixtures.REPO('auser', 'repo-1')
+        repo['description'] = 'New description'
+
+        httpretty.enable()
+        fixtures.register_endpoint(
+            "/user/repos",
+            [repo, fixtures.REPO('auser', 'repo-3')]
+        )
+        sync_account(self.user.id)
+
+        repos = Repository.get_repos(self.user.id)
+        self.assertEqual(sorted(repos.keys()),
+                         ['auser/repo-1', 'auser/repo-3'])
+        self.assertEqual(repos['auser/repo-1']['description'],
+                         'New description')
+        self.assertEqual(repos['auser/repo-3']['depositions'], [])
+
+    def test_apply_repos(self):
+        from ..models import Repository
+        from ..utils import apply_repos
+
+        Repository.get(self.user.id, 'auser/repo-1').hook = 1
+        Repository.get(self.user.id, 'auser/repo-1').description = 'a'
+        db.session.commit()
+
+        changes = apply_repos(self.user.id, {
+            'auser/repo-1': 'a',
+            'auser/repo-3': 'c',
+        })
+        db.session.commit()
+        repos = Repository.get_repos(self.user.id)
+        self.assertEqual(changes, 2)
+        self.assertEqual(repos['auser/repo-1']['hook'], 1)
+        self.assertEqual(repos['auser/repo-3']['description'], 'c')
+        self.assertNotIn('auser/repo-2', repos)
+        self.assertEqual(apply_repos(self.user.id, {
+            'auser/repo-1': 'a',
+            'auser/repo-3': 'c',
+        }), 0)
+
+
+TEST_SUITE = make_test_suite(HandlePayloadTestCase, PayloadExtractionTestCase,
+                             SyncTestCase)
 
 
 if __name__ == "__main__":
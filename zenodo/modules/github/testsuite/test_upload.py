@@ -25,7 +25,8 @@ from __future__ import absolute_import
 from functools import partial
 from invenio.ext.sqlalchemy import db
 from invenio.ext.restful.utils import APITestCase
-from invenio.testsuite import make_pdf_fixture, make_test_suite, run_test_suite
+from invenio.testsuite import InvenioTestCase, make_pdf_fixture, \
+    make_test_suite, run_test_suite
 
 from .helpers import tclient_request_factory
 
@@ -77,8 +78,212 @@ class ZenodoUploadTestCase(APITestCase):
         assert 'record_id' in metadata
         assert 'doi' in metadata
 
+    def test_upload_direct(self):
+        from invenio.modules.deposit.models import Deposition
+        from ..upload import StreamingFile, upload
 
-TEST_SUITE = make_test_suite(ZenodoUploadTestCase)
+        factory = partial(tclient_request_factory, self.client)
+        data = b'x' * 2500
+        fileobj = StreamingFile(data[i:i + 1000] for i in range(0, 2500, 1000))
+
+        metadata = upload(
+            self.accesstoken[self.user.id],
+            dict(upload_type="software", title="Test title"),
+            [(fileobj, 'test.zip')],
+            publish=False,
+            request_factory=factory,
+            direct=True,
+        )
+
+        files = Deposition.get(metadata['id']).files
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0].name, 'test.zip')
+        self.assertEqual(files[0].size, 2500)
+        self.assertEqual(fileobj.size, 2500)
+
+    def test_upload_resume(self):
+        from invenio.modules.deposit.models import Deposition
+        from ..upload import upload
+
+        factory = partial(tclient_request_factory, self.client)
+        metadata = dict(upload_type="software", title="Test title")
+
+        first = upload(
+            self.accesstoken[self.user.id], metadata,
+            [make_pdf_fixture('test.pdf', "upload test")],
+            request_factory=factory,
+        )
+        second = upload(
+            self.accesstoken[self.user.id], metadata,
+            [make_pdf_fixture('test.pdf', "upload test"),
+             make_pdf_fixture('test2.pdf', "upload test")],
+            request_factory=factory,
+            deposition_id=first['id'],
+        )
+
+        self.assertEqual(first['id'], second['id'])
+        files = Deposition.get(first['id']).files
+        self.assertEqual(sorted(f.name for f in files),
+                         ['test.pdf', 'test2.pdf'])
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class ZenodoClientTestCase(InvenioTestCase):
+    def make_client(self, *responses):
+        from ..upload import ZenodoClient
+
+        calls = []
+        responses = list(responses)
+
+        def factory(method, endpoint, *args):
+            calls.append((method, endpoint))
+            r = responses.pop(0)
+            if isinstance(r, Exception):
+                raise r
+            if isinstance(r, tuple):
+                return FakeResponse(*r)
+            return FakeResponse(r)
+
+        client = ZenodoClient('token', request_factory=factory, retries=2,
+                              backoff=0)
+        return client, calls
+
+    def test_retry_idempotent(self):
+        import requests
+
+        client, calls = self.make_client(
+            requests.ConnectionError(), 503, 200)
+        r = client.step('metadata', 'put', 'depositionresource')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual([t[0] for t in client.timings], ['metadata'])
+
+    def test_retry_exhausted(self):
+        client, calls = self.make_client(500, 502, 503, 200)
+        r = client.step('get', 'get', 'depositionresource')
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(len(calls), 3)
+
+    def test_no_retry_post(self):
+        import requests
+
+        client, calls = self.make_client(500)
+        r = client.step('create', 'post', 'depositionlistresource')
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(len(calls), 1)
+
+        client, calls = self.make_client(requests.ConnectionError())
+        self.assertRaises(requests.ConnectionError, client.step,
+                          'create', 'post', 'depositionlistresource')
+
+    def test_recover(self):
+        from ..upload import Recovered
+
+        client, calls = self.make_client(500, 500)
+        recovered = []
+
+        def recover():
+            recovered.append(1)
+            if len(recovered) == 2:
+                return Recovered(202, {'id': 1})
+
+        r = client.step('publish', 'post', 'depositionactionresource',
+                        recover=recover)
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(r.json(), {'id': 1})
+        self.assertEqual(len(calls), 2)
+
+    def test_error_deposition_id(self):
+        import requests
+        from ..upload import upload
+
+        client, calls = self.make_client(
+            (201, {'id': 5}), requests.ConnectionError(),
+            requests.ConnectionError(), requests.ConnectionError())
+        try:
+            upload('token', {}, [], client=client)
+        except requests.ConnectionError as error:
+            self.assertEqual(error.deposition_id, 5)
+        else:
+            self.fail("Error not raised")
+        self.assertEqual(len(calls), 4)
+
+
+class StreamingFileTestCase(InvenioTestCase):
+    def test_read(self):
+        import hashlib
+        from ..upload import StreamingFile
+
+        f = StreamingFile(iter([b'abc', b'', b'defg', b'h']))
+        self.assertEqual(f.read(2), b'ab')
+        self.assertEqual(f.read(3), b'cde')
+        self.assertEqual(f.read(), b'fgh')
+        self.assertEqual(f.read(1), b'')
+        self.assertEqual(f.size, 8)
+        self.assertEqual(f.checksum, hashlib.md5(b'abcdefgh').hexdigest())
+
+    def test_read_small(self):
+        from ..upload import StreamingFile
+
+        data = b''.join(chr(i % 256) for i in range(10000))
+        f = StreamingFile([data[:7000], data[7000:]])
+        parts = []
+        while True:
+            part = f.read(3)
+            if not part:
+                break
+            parts.append(part)
+        self.assertEqual(b''.join(parts), data)
+        self.assertEqual(f.read(0), b'')
+
+    def test_check_checksum(self):
+        import hashlib
+        from ..upload import StreamingFile, ZenodoApiWarning, check_checksum
+
+        f = StreamingFile([b'abc'])
+        f.read()
+        check_checksum(f, hashlib.md5(b'abc').hexdigest(), 1)
+        check_checksum(f, None, 1)
+        check_checksum(object(), 'x', 1)
+        try:
+            check_checksum(f, hashlib.md5(b'abd').hexdigest(), 1)
+        except ZenodoApiWarning as e:
+            self.assertEqual(e.deposition_id, 1)
+        else:
+            self.fail("Checksum mismatch not detected")
+
+    def test_save(self):
+        from six import BytesIO
+        from ..upload import StreamingFile
+
+        closed = []
+        f = StreamingFile([b'abc', b'def'], close=lambda: closed.append(1))
+        f.read(1)
+        out = BytesIO()
+        f.save(out)
+        f.close()
+        f.close()
+        self.assertEqual(out.getvalue(), b'bcdef')
+        self.assertEqual(closed, [1])
+
+    def test_max_size(self):
+        from ..upload import FileTooLargeError, StreamingFile
+
+        f = StreamingFile([b'abc', b'def'], max_size=5)
+        self.assertEqual(f.read(3), b'abc')
+        self.assertRaises(FileTooLargeError, f.read, 3)
+
+
+TEST_SUITE = make_test_suite(ZenodoUploadTestCase, ZenodoClientTestCase,
+                             StreamingFileTestCase)
 
 
 if __name__ == "__main__":
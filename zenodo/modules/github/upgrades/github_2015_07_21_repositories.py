@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Move GitHub repositories and releases out of the account extra data."""
+
+import warnings
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = []
+
+
+def info():
+    """Upgrade description."""
+    return "Create GitHub repository and release tables."
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    op.create_table(
+        'githubREPOSITORY',
+        db.Column('id', db.Integer(display_width=15), nullable=False),
+        db.Column('user_id', db.Integer(display_width=15), nullable=False),
+        db.Column('name', db.String(length=255), nullable=False),
+        db.Column('description', db.Text(), nullable=False),
+        db.Column('hook', db.Integer(display_width=15), nullable=True),
+        db.Column('created', db.DateTime(), nullable=False),
+        db.ForeignKeyConstraint(['user_id'], [u'user.id'], ),
+        db.PrimaryKeyConstraint('id'),
+        db.UniqueConstraint('user_id', 'name'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_index(
+        op.f('ix_githubREPOSITORY_user_id'), 'githubREPOSITORY', ['user_id'],
+        unique=False)
+
+    op.create_table(
+        'githubRELEASE',
+        db.Column('id', db.Integer(display_width=15), nullable=False),
+        db.Column('repository_id', db.Integer(display_width=15),
+                  nullable=False),
+        db.Column('tag', db.String(length=255), nullable=False),
+        db.Column('deposition_id', db.Integer(display_width=15),
+                  nullable=True),
+        db.Column('record_id', db.Integer(display_width=15), nullable=True),
+        db.Column('doi', db.String(length=255), nullable=True),
+        db.Column('submitted', db.String(length=40), nullable=True),
+        db.Column('errors', db.Text(), nullable=True),
+        db.Column('created', db.DateTime(), nullable=False),
+        db.ForeignKeyConstraint(['repository_id'],
+                                [u'githubREPOSITORY.id'], ),
+        db.PrimaryKeyConstraint('id'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_index(
+        'ix_githubRELEASE_repository_id_tag', 'githubRELEASE',
+        ['repository_id', 'tag'], unique=False)
+
+    migrate_accounts()
+
+
+def migrate_accounts():
+    """Move repositories and releases of all GitHub accounts to the tables.
+
+    Accounts are loaded one at a time, and each one is committed separately,
+    so an interrupted migration can be run again.
+    """
+    from invenio.modules.oauthclient.models import RemoteAccount
+    from zenodo.modules.github.models import Release, Repository
+
+    ids = [
+        i for (i, ) in db.session.query(RemoteAccount.id).order_by(
+            RemoteAccount.id)
+    ]
+    for account_id in ids:
+        account = RemoteAccount.query.get(account_id)
+        extra_data = account.extra_data
+        if 'repos' not in extra_data or 'tokens' not in extra_data:
+            db.session.expunge(account)
+            continue
+
+        for name, data in extra_data['repos'].items():
+            repo = Repository.get_or_create(
+                account.user_id, name, data.get('description') or '')
+            repo.hook = data.get('hook')
+
+            for dep in data.get('depositions', []):
+                release = Release(
+                    repository=repo,
+                    tag=dep.get('github_ref') or '',
+                    deposition_id=dep.get('deposition_id'),
+                    record_id=dep.get('record_id'),
+                    doi=dep.get('doi'),
+                    submitted=dep.get('submitted'),
+                )
+                release.errors = dep.get('errors')
+                db.session.add(release)
+
+            for tag, deposition_id in data.get('pending', {}).items():
+                db.session.add(Release(
+                    repository=repo, tag=tag, deposition_id=deposition_id,
+                ))
+
+        del extra_data['repos']
+        extra_data.changed()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            warnings.warn("Could not migrate GitHub account %s" % account_id)
+        db.session.expunge_all()
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    from invenio.modules.oauthclient.models import RemoteAccount
+    return 1 + RemoteAccount.query.count() / 100
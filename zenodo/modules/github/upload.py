@@ -20,13 +20,36 @@
 # granted to it by virtue of its status as an Intergovernmental Organization
 # or submit itself to any jurisdiction.
 
+import hashlib
 import json
+import time
+from functools import partial
+
 import requests
 from flask import url_for, current_app
 
+from invenio.base.globals import cfg
+
+from .client import get_session
+
+IDEMPOTENT_METHODS = ('get', 'head', 'put', 'delete')
+"""HTTP methods which can be retried safely."""
+
 
 class ZenodoApiException(Exception):
-    pass
+
+    """Zenodo API exception.
+
+    Keyword arguments (e.g. ``response``) are set as attributes. The second
+    positional argument is the identifier of the deposition the error
+    occurred for (``deposition_id``).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ZenodoApiException, self).__init__(*args)
+        self.deposition_id = args[1] if len(args) > 1 else None
+        for k, v in kwargs.items():
+            setattr(self, k, v)
 
 
 class ZenodoApiWarning(ZenodoApiException):
@@ -37,10 +60,176 @@ class ZenodoApiError(ZenodoApiException):
     pass
 
 
+class FileTooLargeError(ZenodoApiError):
+    pass
+
+
+class StreamingFile(object):
+
+    """File-like object reading a stream of chunks.
+
+    Checksum and size are computed while the stream is consumed, so the
+    file never has to be held in memory. Once the stream is consumed, the
+    checksum is compared with the one of the stored file (see
+    :func:`check_checksum`).
+    """
+
+    def __init__(self, chunks, max_size=None, close=None):
+        """Initialize streaming file.
+
+        :param chunks: Iterable of byte strings.
+        :param max_size: Maximum size in bytes (``FileTooLargeError`` is
+            raised as soon as more bytes are read).
+        :param close: Function called when the file is closed.
+        """
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._offset = 0
+        self._close = close
+        self.max_size = max_size
+        self.size = 0
+        self.md5 = hashlib.md5()
+
+    @property
+    def checksum(self):
+        """MD5 checksum of the bytes read so far."""
+        return self.md5.hexdigest()
+
+    def _next_chunk(self):
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            self.size += len(chunk)
+            if self.max_size is not None and self.size > self.max_size:
+                raise FileTooLargeError(
+                    "File exceeds maximum size of %s bytes." % self.max_size)
+            self.md5.update(chunk)
+            return chunk
+        return b''
+
+    def read(self, size=-1):
+        """Read at most size bytes (all remaining bytes if negative)."""
+        if size is None:
+            size = -1
+        parts = []
+        while size != 0:
+            # Only the unread part of the current chunk is ever copied.
+            if self._offset >= len(self._buffer):
+                self._buffer = self._next_chunk()
+                self._offset = 0
+                if not self._buffer:
+                    break
+            end = len(self._buffer) if size < 0 else self._offset + size
+            part = self._buffer[self._offset:end]
+            self._offset += len(part)
+            parts.append(part)
+            if size > 0:
+                size -= len(part)
+        return b''.join(parts)
+
+    def save(self, dst, buffer_size=16384):
+        """Write the stream to a file object (like werkzeug's FileStorage).
+        """
+        if self._offset < len(self._buffer):
+            dst.write(self._buffer[self._offset:])
+        self._buffer = b''
+        self._offset = 0
+        while True:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            dst.write(chunk)
+
+    def close(self):
+        """Close the underlying stream."""
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
+def stream_url(url, chunk_size=None, max_size=None):
+    """Open URL as a streaming file."""
+    chunk_size = chunk_size or cfg['GITHUB_DOWNLOAD_CHUNK_SIZE']
+    if max_size is None:
+        max_size = cfg['DEPOSIT_MAX_UPLOAD_SIZE']
+
+    r = requests.get(url, stream=True)
+    if r.status_code != 200:
+        r.close()
+        raise ZenodoApiError("Could not retrieve file: %s" % url)
+
+    length = r.headers.get('Content-Length')
+    if max_size and length and length.isdigit() and int(length) > max_size:
+        r.close()
+        raise FileTooLargeError(
+            "File exceeds maximum size of %s bytes." % max_size)
+
+    return StreamingFile(
+        r.iter_content(chunk_size=chunk_size), max_size=max_size,
+        close=r.close,
+    )
+
+
+def check_checksum(fileobj, checksum, deposition_id=None):
+    """Check that a stored file matches the streamed file.
+
+    Nothing is checked if either checksum is unknown (e.g. the file object
+    is not a :class:`StreamingFile`).
+    """
+    expected = getattr(fileobj, 'checksum', None)
+    if expected and checksum and expected != checksum:
+        raise ZenodoApiWarning(
+            "Stored file checksum %s differs from received %s." % (
+                checksum, expected), deposition_id)
+
+
+def ingest_file(deposition_id, fileobj, filename):
+    """Store a file in a deposition (without going through the REST API).
+
+    :returns: The deposition file.
+    """
+    from invenio.modules.deposit.models import Deposition, DepositionFile, \
+        DepositionStorage
+
+    d = Deposition.get(deposition_id)
+    df = DepositionFile(backend=DepositionStorage(d.id))
+    try:
+        df.save(fileobj, filename=filename)
+    finally:
+        if hasattr(fileobj, 'close'):
+            fileobj.close()
+
+    size = getattr(fileobj, 'size', None)
+    if size is not None and df.size != size:
+        raise ZenodoApiWarning(
+            "Stored file size %s differs from received %s bytes." % (
+                df.size, size), deposition_id)
+    check_checksum(fileobj, getattr(df, 'checksum', None), deposition_id)
+
+    d.add_file(df)
+    d.save()
+    return df
+
+
+class Recovered(object):
+
+    """Response standing in for a request which had already succeeded."""
+
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
 def requests_request_factory(method, endpoint, urlargs, data, is_json, headers,
-                             files, verify_ssl):
-    """Make requests with request package."""
-    client_func = getattr(requests, method.lower())
+                             files, verify_ssl, session=None, timeout=None):
+    """Make requests with request package.
+
+    If a session is given, its kept-alive connections are reused.
+    """
+    client_func = getattr(session or requests, method.lower())
 
     if headers is None:
         headers = [('Content-Type', 'application/json')] if is_json else []
@@ -64,20 +253,41 @@ def requests_request_factory(method, endpoint, urlargs, data, is_json, headers,
             **urlargs
         ),
         verify=verify_ssl,
+        timeout=timeout,
         **request_args
     )
 
 
 class ZenodoClient(object):
-    def __init__(self, access_token, ssl_verify=True, request_factory=None):
+
+    """Client for the Zenodo REST API.
+
+    Requests are made over the pooled session of the process. Steps failing
+    with a connection error or a server error are retried with exponential
+    backoff, and the latency of each step is recorded in ``timings``.
+    """
+
+    def __init__(self, access_token, ssl_verify=True, request_factory=None,
+                 session=None, retries=None, backoff=None):
         self.access_token = access_token
         self.ssl_verify = ssl_verify
         self.request_factory = request_factory or current_app.extensions.get(
-            'zenodo_github.request_factory', requests_request_factory)
+            'zenodo_github.request_factory', None)
+        if self.request_factory is None:
+            self.request_factory = partial(
+                requests_request_factory,
+                session=session or get_session(),
+                timeout=cfg['GITHUB_ZENODO_TIMEOUT'],
+            )
+        self.retries = cfg['GITHUB_ZENODO_RETRIES'] \
+            if retries is None else retries
+        self.backoff = cfg['GITHUB_ZENODO_BACKOFF'] \
+            if backoff is None else backoff
+        self.timings = []
 
-    def make_request(self, method, endpoint, urlargs={}, data=None,
+    def make_request(self, method, endpoint, urlargs=None, data=None,
                      is_json=True, headers=None, files=None):
-
+        urlargs = dict(urlargs or {})
         urlargs['access_token'] = self.access_token
 
         return self.request_factory(
@@ -97,26 +307,86 @@ class ZenodoClient(object):
     def delete(self, *args, **kwargs):
         return self.make_request("delete", *args, **kwargs)
 
+    def step(self, name, method, endpoint, recover=None, **kwargs):
+        """Make a request, retrying it on transient failures.
+
+        Only idempotent requests are retried blindly. Other requests are
+        retried only if ``recover`` is given: it is called before each retry
+        and may return a response showing the previous attempt succeeded
+        after all (in which case no new request is made).
+
+        :returns: The last response.
+        """
+        can_retry = method in IDEMPOTENT_METHODS or recover is not None
+        start = time.time()
+        attempt = 0
+        try:
+            while True:
+                if attempt and recover is not None:
+                    r = recover()
+                    if r is not None:
+                        return r
+                try:
+                    r = self.make_request(method, endpoint, **kwargs)
+                except requests.RequestException:
+                    if not can_retry or attempt >= self.retries:
+                        raise
+                else:
+                    if r.status_code < 500 or not can_retry or \
+                            attempt >= self.retries:
+                        return r
+                current_app.logger.warning(
+                    "Retrying Zenodo API step %s (attempt %s)",
+                    name, attempt + 1)
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+        finally:
+            self.timings.append((name, time.time() - start))
+
+    def get_files(self, deposition_id):
+        """Get the names of the files of a deposition."""
+        r = self.step(
+            'get_files', 'get', 'depositionfilelistresource',
+            urlargs=dict(resource_id=deposition_id),
+        )
+        if r.status_code != 200:
+            raise ZenodoApiWarning("Could not get files", deposition_id,
+                                   response=r)
+        return set(f['filename'] for f in r.json())
 
-def upload(access_token, metadata, files, publish=False, request_factory=None):
-    """Zenodo Upload."""
-    client = ZenodoClient(
-        access_token,
-        ssl_verify=False,
-        request_factory=request_factory,
-    )
 
-    # Create deposition
-    r = client.post('depositionlistresource', data={})
-    if r.status_code != 201:
-        raise ZenodoApiError("Could not create deposition.", response=r)
+def _fill_deposition(client, deposition_id, metadata, files, publish, direct,
+                     resume):
+    """Add files and metadata to a deposition (and possibly publish it).
 
-    deposition_id = r.json()['id']
+    :returns: The deposition.
+    """
+    existing = client.get_files(deposition_id) if resume else set()
 
     # Upload a file
     for fileobj, filename in files:
-        r = client.post(
-            'depositionfilelistresource',
+        if filename in existing:
+            if hasattr(fileobj, 'close'):
+                fileobj.close()
+            continue
+        if direct:
+            start = time.time()
+            try:
+                ingest_file(deposition_id, fileobj, filename)
+            finally:
+                client.timings.append(('add_file', time.time() - start))
+            continue
+
+        def recover_file():
+            if filename in client.get_files(deposition_id):
+                return Recovered(201)
+            if hasattr(fileobj, 'seek'):
+                fileobj.seek(0)
+
+        # A stream which cannot be rewound is posted only once.
+        r = client.step(
+            'add_file', 'post', 'depositionfilelistresource',
+            recover=recover_file if hasattr(fileobj, 'seek') else None,
             urlargs=dict(resource_id=deposition_id),
             is_json=False,
             data={'filename': filename},
@@ -125,10 +395,12 @@ def upload(access_token, metadata, files, publish=False, request_factory=None):
         if r.status_code != 201:
             raise ZenodoApiWarning("Could not add file", deposition_id,
                                    response=r)
+        check_checksum(fileobj, (r.json() or {}).get('checksum'),
+                       deposition_id)
 
     # Set metadata (being set here to ensure file is fetched)
-    r = client.put(
-        'depositionresource',
+    r = client.step(
+        'metadata', 'put', 'depositionresource',
         urlargs=dict(resource_id=deposition_id),
         data={"metadata": metadata}
     )
@@ -140,21 +412,74 @@ def upload(access_token, metadata, files, publish=False, request_factory=None):
                                response=r, metadata=metadata)
 
     if publish:
-        r = client.post(
-            'depositionactionresource',
+        def recover_publish():
+            r = client.step(
+                'get', 'get', 'depositionresource',
+                urlargs=dict(resource_id=deposition_id),
+            )
+            if r.status_code == 200 and r.json().get('submitted'):
+                return Recovered(202, r.json())
+
+        r = client.step(
+            'publish', 'post', 'depositionactionresource',
+            recover=recover_publish,
             urlargs=dict(resource_id=deposition_id, action_id='publish'),
         )
         if r.status_code != 202:
             raise ZenodoApiWarning("Could not publish deposition",
                                    deposition_id, response=r)
 
-        return r.json()
+        result = r.json()
     else:
-        r = client.get(
-            'depositionresource',
+        r = client.step(
+            'get', 'get', 'depositionresource',
             urlargs=dict(resource_id=deposition_id),
         )
         if r.status_code != 200:
             raise ZenodoApiWarning("Could not get deposition", deposition_id,
                                    response=r)
-        return r.json()
+        result = r.json()
+
+    return result
+
+
+def upload(access_token, metadata, files, publish=False, request_factory=None,
+           direct=False, deposition_id=None, client=None):
+    """Zenodo Upload.
+
+    If ``direct`` is true, files are stored in the deposition in-process
+    instead of being posted to the REST API.
+
+    If ``deposition_id`` is given, a previous partial upload is resumed:
+    the existing deposition is reused and files already attached to it are
+    not uploaded again.
+    """
+    client = client or ZenodoClient(
+        access_token,
+        ssl_verify=False,
+        request_factory=request_factory,
+    )
+
+    resume = deposition_id is not None
+    if not resume:
+        # Create deposition (no retry since it would create a new one)
+        r = client.step('create', 'post', 'depositionlistresource', data={})
+        if r.status_code != 201:
+            raise ZenodoApiError("Could not create deposition.", response=r)
+
+        deposition_id = r.json()['id']
+
+    try:
+        result = _fill_deposition(client, deposition_id, metadata, files,
+                                  publish, direct, resume)
+    except Exception as error:
+        # Any failure past this point leaves a deposition behind, which a
+        # new attempt can resume.
+        if getattr(error, 'deposition_id', None) is None:
+            error.deposition_id = deposition_id
+        raise
+
+    current_app.logger.info(
+        "Uploaded deposition %s (%s)", deposition_id,
+        ", ".join("%s: %.3fs" % t for t in client.timings))
+    return result
@@ -17,11 +17,14 @@
 ## along with Invenio; if not, write to the Free Software Foundation, Inc.,
 ## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 
-import copy
+import base64
 import github3
 import json
 import pytz
 import requests
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 from operator import itemgetter
 from flask import current_app
 
@@ -30,9 +33,14 @@ import dateutil.parser
 
 from invenio.ext.sqlalchemy import db
 from invenio.base.globals import cfg
+from invenio.ext.cache import cache
 from invenio.modules.webhooks.models import CeleryReceiver
 from invenio.modules.oauth2server.models import Token as ProviderToken
 
+from .client import GitHubClient, get_session, token_id
+from .models import Release, Repository
+
+TOKEN_KEY = "github::token::{0}"
 
 utcnow = lambda: datetime.now(tz=pytz.utc)
 """
@@ -104,86 +112,96 @@ def init_account(remote_token):
             webhook=hook_token.id,
             internal=internal_token.id,
         ),
-        repos=dict(),
         last_sync=iso_utcnow(),
     )
 
     # Fetch list of repositories
-    sync(gh, extra_data)
+    sync(gh, remote_token.remote_account.user_id, extra_data)
 
     # Store extra data
     remote_token.remote_account.extra_data = extra_data
     db.session.commit()
 
 
-def sync(gh, extra_data, sync_hooks=True):
+def fetch_repos(gh):
+    """Fetch the repositories a user is an administrator of.
+
+    The list is fetched with conditional requests, so unchanged pages are
+    served from the cache without counting against the rate limit.
+
+    :returns: Dictionary of repository descriptions by full name, or
+        ``None`` if the list could not be fetched completely.
     """
-    Helper method to sync list of repositories
+    client = GitHubClient.from_api(gh)
+    repos = {}
+    for page in client.iter_pages('/user/repos', urgent=False, params=dict(
+            type='all', sort='full_name',
+            per_page=cfg['GITHUB_SYNC_PER_PAGE'])):
+        if page.status_code != 200:
+            current_app.logger.warning(
+                "Could not fetch repositories (%s)", page.status_code)
+            return None
+        for r in page.data:
+            if r.get('permissions', {}).get('admin'):
+                repos[r['full_name']] = r['description'] or ""
+    return repos
+
+
+def apply_repos(user_id, repos):
+    """Update the stored repositories with the fetched ones (caller commits).
+
+    Only repositories which were added, removed or changed are touched.
+
+    :returns: Number of changed repositories.
     """
-    repo_data = dict(
-        hook=None,
-        description="",
-        depositions=[],
-        errors=None,
+    changes = 0
+    existing = dict(
+        (r.name, r) for r in Repository.query.filter_by(user_id=user_id)
     )
 
-    existing_set = set(extra_data['repos'].keys())
-    new_set = set()
-
-    repos = gh.iter_repos(type='all', sort='full_name')
-    repos.headers['Accept'] = 'application/vnd.github.moondragon+json'
-
-    for r in repos:
-        # Next line to be replaced with "r.permissions['admin']" once
-        # fix has been integrated in github3.py
-        if r.to_json()['permissions']['admin']:
-            # Add if not in list
-            if r.full_name not in extra_data["repos"]:
-                extra_data["repos"][r.full_name] = copy.copy(repo_data)
-            # Update description
-            extra_data["repos"][r.full_name]["description"] = r.description
-            new_set.add(r.full_name)
-
-        # # TODO:
-        # if sync_hooks:
-        #     for h in r.iter_hooks():
-        #         if h.name == 'web' and 'url' in h.config:
-        #             h.config['url'] ==
+    for full_name, description in repos.items():
+        repo = existing.get(full_name)
+        if repo is None:
+            db.session.add(Repository(
+                user_id=user_id, name=full_name, description=description
+            ))
+        elif repo.description != description:
+            repo.description = description
+        else:
+            continue
+        changes += 1
 
     # Remove repositories no longer available in github
-    for full_name in (existing_set-new_set):
-        del extra_data["repos"][full_name]
+    for full_name in set(existing.keys()) - set(repos.keys()):
+        db.session.delete(existing[full_name])
+        changes += 1
 
-    # Update last sync
-    extra_data['last_sync'] = iso_utcnow()
+    return changes
 
 
-def remove_hook(gh, extra_data, full_name):
+def sync(gh, user_id, extra_data, sync_hooks=True):
     """
-    Remove an existing webhook
+    Helper method to sync list of repositories
+
+    :returns: Number of changed repositories.
     """
-    owner, repo = full_name.split("/")
-    hook_id = extra_data["repos"][full_name]["hook"]
+    repos = fetch_repos(gh)
+    if repos is None:
+        return 0
 
-    if hook_id:
-        ghrepo = gh.repository(owner, repo)
-        if ghrepo:
-            hook = ghrepo.hook(hook_id)
-            if not hook or (hook and hook.delete()):
-                extra_data["repos"][full_name]["hook"] = None
-                return True
-    return False
+    changes = apply_repos(user_id, repos)
 
+    # Update last sync
+    extra_data['last_sync'] = iso_utcnow()
+    return changes
 
-def create_hook(gh, extra_data, full_name):
-    """
-    Create a new webhook
-    """
-    owner, repo = full_name.split("/")
+
+def hook_config(extra_data):
+    """Get the configuration of the webhook of an account."""
     webhook_token = ProviderToken.query.filter_by(
         id=extra_data['tokens']['webhook']
     ).first()
-    config = dict(
+    return dict(
         url=CeleryReceiver.get_hook_url(
             cfg['GITHUB_WEBHOOK_RECEIVER_ID'],
             webhook_token.access_token
@@ -193,7 +211,15 @@ def create_hook(gh, extra_data, full_name):
         insecure_ssl="1" if cfg['GITHUB_INSECURE_SSL'] else "0",
     )
 
-    ghrepo = gh.repository(owner, repo)
+
+def install_hook(gh, full_name, config):
+    """
+    Install a webhook in a repository
+
+    :returns: Identifier of the hook, or ``None`` if it was not installed.
+    """
+    owner, name = full_name.split("/")
+    ghrepo = gh.repository(owner, name)
     if ghrepo:
         try:
             hook = ghrepo.create_hook(
@@ -202,19 +228,100 @@ def create_hook(gh, extra_data, full_name):
                 events=["release"],
             )
             if hook:
-                extra_data["repos"][full_name]["hook"] = hook.id
-                return True
+                return hook.id
         except github3.GitHubError as e:
             # Check if hook is already installed
             for m in e.errors:
                 if m["code"] == "custom" and m["resource"] == "Hook":
                     for h in ghrepo.iter_hooks():
                         if h.config.get('url', '') == config['url']:
-                            extra_data["repos"][full_name]["hook"] = h.id
                             h.edit(
                                 config=config, events=["release"], active=True
                             )
-                            return True
+                            return h.id
+    return None
+
+
+def uninstall_hook(gh, full_name, hook_id):
+    """
+    Remove a webhook from a repository
+
+    :returns: ``True`` if the hook does not exist anymore.
+    """
+    owner, name = full_name.split("/")
+    ghrepo = gh.repository(owner, name)
+    if ghrepo:
+        hook = ghrepo.hook(hook_id)
+        if not hook or (hook and hook.delete()):
+            return True
+    return False
+
+
+def find_hook(gh, full_name, hook_id, config):
+    """
+    Find the installed webhook of a repository
+
+    :returns: Identifier of the hook, or ``None`` if it is not installed.
+    """
+    owner, name = full_name.split("/")
+    ghrepo = gh.repository(owner, name)
+    if not ghrepo:
+        return None
+    if hook_id:
+        hook = ghrepo.hook(hook_id)
+        if hook and hook.config.get('url', '') == config['url']:
+            return hook.id
+    for h in ghrepo.iter_hooks():
+        if h.config.get('url', '') == config['url']:
+            return h.id
+    return None
+
+
+def iter_concurrently(fun, items, concurrency=None):
+    """
+    Apply a function to items in a bounded number of threads
+
+    :returns: Iterator of ``(item, result, error)`` tuples in order of
+        completion (``error`` is the raised exception, if any).
+    """
+    items = list(items)
+    if not items:
+        return
+
+    def _apply(item):
+        try:
+            return item, fun(item), None
+        except Exception as e:
+            return item, None, e
+
+    pool = ThreadPool(min(
+        concurrency or cfg['GITHUB_HOOKS_CONCURRENCY'], len(items)
+    ))
+    try:
+        for result in pool.imap_unordered(_apply, items):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def remove_hook(gh, repo):
+    """
+    Remove an existing webhook
+    """
+    if repo.hook and uninstall_hook(gh, repo.name, repo.hook):
+        repo.hook = None
+        return True
+    return False
+
+
+def create_hook(gh, extra_data, repo):
+    """
+    Create a new webhook
+    """
+    hook_id = install_hook(gh, repo.name, hook_config(extra_data))
+    if hook_id:
+        repo.hook = hook_id
+        return True
     return False
 
 
@@ -223,13 +330,14 @@ def get_zenodo_json(gh, owner, repo_name, ref):
     Get the .zenodo.json file
     """
     try:
-        content = gh.repository(owner, repo_name).contents(
-            '.zenodo.json', ref=ref
+        r = GitHubClient.from_api(gh).get(
+            '/repos/%s/%s/contents/.zenodo.json' % (owner, repo_name),
+            params=dict(ref=ref),
         )
-        if not content:
+        if r.status_code != 200:
             # File does not exists in the given ref
             return None
-        return json.loads(content.decoded)
+        return json.loads(base64.b64decode(r.data['content']))
     except Exception:
         current_app.logger.exception("Failed to decode .zenodo.json.")
         # Problems decoding the file
@@ -239,47 +347,90 @@ def get_zenodo_json(gh, owner, repo_name, ref):
 def get_owner(gh, owner):
     """ Get owner of repository as a creator. """
     try:
-        u = gh.user(owner)
-        name = u.name or u.login
-        company = u.company or ''
+        u = GitHubClient.from_api(gh).get('/users/%s' % owner, public=True)
+        name = u.data.get('name') or u.data['login']
+        company = u.data.get('company') or ''
         return [dict(name=name, affliation=company)]
     except Exception:
         current_app.logger.exception("Failed to get GitHub owner")
         return None
 
 
-def get_contributors(gh, owner, repo_name):
+def get_contributors(gh, owner, repo_name, deadline=None):
     """
     Get list of contributors to a repository
+
+    User profiles are fetched concurrently. Contributors whose profile could
+    not be fetched before the deadline are added by their login only.
     """
-    try:
-        contrib_url = gh.repository(owner, repo_name).contributors_url
-
-        r = requests.get(contrib_url)
-        if r.status_code == 200:
-            contributors = r.json()
-
-            def get_author(contributor):
-                r = requests.get(contributor['url'])
-                if r.status_code == 200:
-                    data = r.json()
-                    return dict(
-                        name=(data['name'] if 'name' in data and data['name']
-                              else data['login']),
-                        affiliation=(data['company'] if 'company' in data
-                                     else ''),
-                    )
+    if deadline is None:
+        deadline = cfg['GITHUB_CONTRIBUTORS_DEADLINE']
+    end = time.time() + deadline
 
-            # Sort according to number of contributions
-            contributors.sort(key=itemgetter('contributions'))
-            contributors.reverse()
-            contributors = map(
-                get_author,
-                filter(lambda x: x['type'] == 'User', contributors)
-            )
-            contributors = filter(lambda x: x is not None, contributors)
+    try:
+        client = GitHubClient.from_api(gh)
+
+        contributors = []
+        for page in client.iter_pages(
+                '/repos/%s/%s/contributors' % (owner, repo_name),
+                params=dict(per_page=100)):
+            if page.status_code != 200:
+                if not contributors:
+                    return None
+                break
+            contributors.extend(page.data)
+            if time.time() >= end:
+                break
+
+        # Sort according to number of contributions
+        contributors = sorted(
+            filter(lambda x: x['type'] == 'User', contributors),
+            key=itemgetter('contributions'),
+            reverse=True,
+        )
 
-            return contributors
+        def get_login(contributor):
+            return contributor.get('login') or \
+                contributor['url'].rstrip('/').split('/')[-1]
+
+        app = current_app._get_current_object()
+
+        def get_author(contributor):
+            try:
+                with app.app_context():
+                    r = client.get(contributor['url'], public=True)
+            except requests.RequestException:
+                return None
+            if r.status_code == 200:
+                data = r.data
+                return dict(
+                    name=data.get('name') or data['login'],
+                    affiliation=data.get('company') or '',
+                )
+
+        authors = [None] * len(contributors)
+        if contributors and time.time() < end:
+            pool = ThreadPool(min(
+                cfg['GITHUB_CONTRIBUTORS_CONCURRENCY'], len(contributors)
+            ))
+            try:
+                results = pool.imap(get_author, contributors)
+                for i in range(len(contributors)):
+                    authors[i] = results.next(
+                        timeout=max(end - time.time(), 0)
+                    )
+            except TimeoutError:
+                current_app.logger.warning(
+                    "Deadline exceeded while fetching contributors of %s/%s."
+                    % (owner, repo_name)
+                )
+            finally:
+                pool.terminate()
+
+        return [
+            author or dict(name=get_login(contributor), affiliation='')
+            for contributor, author in zip(contributors, authors)
+        ]
     except Exception:
         current_app.logger.exception("Failed to get GitHub contributors.")
         return None
@@ -292,23 +443,34 @@ def is_valid_token(remote, access_token):
     GitHub requires the use of Basic Auth to query token validity.
     200 - valid token
     404 - invalid token
+
+    The result is cached for ``GITHUB_TOKEN_VALIDITY_TTL`` seconds.
     """
-    r = requests.get(
+    key = TOKEN_KEY.format(token_id(access_token))
+    valid = cache.get(key)
+    if valid is not None:
+        return valid
+
+    r = get_session().get(
         "%(base)s/applications/%(client_id)s/tokens/%(access_token)s" % {
             "client_id": remote.consumer_key,
             "access_token": access_token,
             "base": cfg['GITHUB_BASE_URL']
         },
-        auth=(remote.consumer_key, remote.consumer_secret)
+        auth=(remote.consumer_key, remote.consumer_secret),
+        timeout=cfg['GITHUB_HTTP_TIMEOUT'],
     )
 
-    return r.status_code == 200
+    valid = r.status_code == 200
+    cache.set(key, valid, timeout=cfg['GITHUB_TOKEN_VALIDITY_TTL'])
+    return valid
 
 
 def revoke_token(remote, access_token):
     """
     Revokes an access token
     """
+    cache.delete(TOKEN_KEY.format(token_id(access_token)))
     r = requests.delete(
         "%(base)s/applications/%(client_id)s/tokens/%(access_token)s" % {
             "client_id": remote.consumer_key,
@@ -321,18 +483,21 @@ def revoke_token(remote, access_token):
     return r.status_code == 200
 
 
-def is_valid_sender(extra_data, payload):
-    return payload['repository']['full_name'] in extra_data['repos']
-
-
-def submitted_deposition(extra_data, full_name, deposition, github_ref,
-                         errors=None):
-    deposition = dict(
-        deposition_id=deposition.get('id', None),
-        record_id=deposition.get('record_id', None),
-        doi=deposition.get('doi', None),
-        submitted=deposition.get('modified', None),
-        errors=errors,
-        github_ref=github_ref,  # TODO
-    )
-    extra_data["repos"][full_name]['depositions'].append(deposition)
+def is_valid_sender(user_id, payload):
+    return Repository.get(
+        user_id, payload['repository']['full_name']
+    ) is not None
+
+
+def submitted_deposition(repo, deposition, github_ref, errors=None):
+    """Record a published release of a repository (caller commits)."""
+    release = Release.get_pending(repo, github_ref)
+    if release is None:
+        release = Release(repository=repo, tag=github_ref)
+        db.session.add(release)
+    release.deposition_id = deposition.get('id', None)
+    release.record_id = deposition.get('record_id', None)
+    release.doi = deposition.get('doi', None)
+    release.submitted = deposition.get('modified', None)
+    release.errors = errors
+    return release
@@ -25,18 +25,14 @@
 
 from __future__ import absolute_import
 
-import os
-import urllib
-
 from flask import Blueprint, abort, current_app, make_response, redirect, \
     request, url_for
 
-from invenio.base.globals import cfg
 from invenio.ext.sslify import ssl_required
 from invenio.modules.pidstore.models import PersistentIdentifier
 
-from ..badge import create_badge
-from ..helpers import get_account
+from ..badge import doi_badge as get_doi_badge, has_doi_badge
+from ..models import Repository
 
 blueprint = Blueprint(
     'zenodo_github_badge',
@@ -47,39 +43,21 @@ blueprint = Blueprint(
 )
 
 
-def badge(doi, style=None):
-    """Helper method to generate DOI badge."""
-    doi_encoded = urllib.quote(doi, '')
-
-    if style not in current_app.config['GITHUB_BADGE_STYLES']:
-        style = current_app.config['GITHUB_BADGE_DEFAULT_STYLE']
+def badge(doi, style=None, max_age=None):
+    """Helper method to generate DOI badge.
 
-    # Check if badge already exists
-    badge_path = os.path.join(
-        current_app.config['COLLECT_STATIC_ROOT'],
-        "badges",
-        "%s-%s.svg" % (doi_encoded, style)
-    )
+    Badges are rendered locally and cached in memory. Responses carry a
+    strong ETag, so that conditional requests are answered with a 304.
+    """
+    svg, etag = get_doi_badge(doi, style=style)
 
-    if not os.path.exists(os.path.dirname(badge_path)):
-        os.makedirs(os.path.dirname(badge_path))
-
-    if not os.path.isfile(badge_path):
-        try:
-            create_badge("DOI", doi, "blue", badge_path, style=style)
-        except Exception:
-            current_app.logger.warning(
-                "%s is down." % cfg['GITHUB_SHIELDSIO_BASE_URL'],
-                exc_info=True
-            )
-            return make_response(
-                "%s is down." % cfg['GITHUB_SHIELDSIO_BASE_URL'],
-                503
-            )
-
-    resp = make_response(open(badge_path, 'r').read())
+    resp = make_response(svg)
     resp.content_type = "image/svg+xml"
-    return resp
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = current_app.config['GITHUB_BADGE_MAX_AGE'] \
+        if max_age is None else max_age
+    return resp.make_conditional(request)
 
 
 #
@@ -89,38 +67,39 @@ def badge(doi, style=None):
 @ssl_required
 def index(user_id, repository):
     """Generate a badge for a specific GitHub repository."""
-    account = get_account(user_id=user_id)
+    repo = Repository.get(user_id, repository)
 
-    if repository not in account.extra_data["repos"]:
+    if repo is None:
         return abort(404)
 
-    # Get the latest deposition
-    try:
-        dep = account.extra_data["repos"][repository]['depositions'][-1]
-    except IndexError:
+    # Get the latest release
+    release = repo.latest_release
+    if release is None or not release.doi:
         return abort(404)
 
-    # Extract DOI
-    if "doi" not in dep:
-        return abort(404)
-
-    doi = dep["doi"]
+    doi = release.doi
 
     style = request.args.get('style', None)
 
-    return badge(doi, style)
+    return badge(
+        doi, style,
+        max_age=current_app.config['GITHUB_BADGE_REPOSITORY_MAX_AGE']
+    )
 
 
 @blueprint.route("/doi/<path:doi>.svg", methods=["GET"])
 @ssl_required
 def doi_badge(doi):
     """Generate a badge for a specific DOI."""
-    pid = PersistentIdentifier.get("doi", doi)
-
-    if pid is None:
-        return abort(404)
     style = request.args.get('style', None)
 
+    # A DOI with a rendered badge was already checked.
+    if not has_doi_badge(doi, style):
+        pid = PersistentIdentifier.get("doi", doi)
+
+        if pid is None:
+            return abort(404)
+
     return badge(doi, style)
 
 
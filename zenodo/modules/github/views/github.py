@@ -54,7 +54,8 @@ import humanize
 from dateutil.parser import parse
 from datetime import datetime, timedelta
 
-from flask import Blueprint, render_template, request, current_app, abort
+from flask import Blueprint, render_template, request, current_app, abort, \
+    jsonify
 from flask.ext.login import login_required
 from flask.ext.menu import register_menu
 from flask.ext.breadcrumbs import register_breadcrumb
@@ -64,10 +65,12 @@ from invenio.ext.sqlalchemy import db
 from invenio.ext.sslify import ssl_required
 from invenio.modules.webhooks.models import Receiver, CeleryReceiver
 
-from ..tasks import handle_github_payload
-from ..utils import sync, utcnow, parse_timestamp, remove_hook, create_hook, \
+from ..tasks import enqueue_github_payload, schedule_sync, is_syncing, \
+    schedule_bulk_hooks, get_hooks_progress, HOOKS_ACTIONS
+from ..utils import utcnow, parse_timestamp, remove_hook, create_hook, \
     init_account
 from ..helpers import get_api, get_token, get_account, check_token
+from ..models import Repository
 
 
 blueprint = Blueprint(
@@ -87,7 +90,7 @@ def register_webhook():
     """ Setup webhook endpoint for github notifications. """
     Receiver.register(
         current_app.config.get('GITHUB_WEBHOOK_RECEIVER_ID'),
-        CeleryReceiver(handle_github_payload)
+        CeleryReceiver(enqueue_github_payload)
     )
 
 
@@ -128,24 +131,22 @@ def index():
             init_account(token)
             extra_data = token.remote_account.extra_data
 
-        # Check if sync is needed - should probably not be done here
+        # Sync in the background if needed, and show the last snapshot
         now = utcnow()
         yesterday = now - timedelta(days=1)
         last_sync = parse_timestamp(extra_data["last_sync"])
+        user_id = token.remote_account.user_id
 
         if last_sync < yesterday:
-            sync(get_api(), extra_data)
-            token.remote_account.extra_data.changed()
-            db.session.commit()
-            last_sync = utcnow()
-            extra_data = token.remote_account.extra_data
+            schedule_sync(user_id)
 
         ctx.update({
             "connected": True,
-            "repos": extra_data['repos'],
+            "repos": Repository.get_repos(user_id),
             "name": extra_data['login'],
-            "user_id": token.remote_account.user_id,
+            "user_id": user_id,
             "last_sync": humanize.naturaltime(now - last_sync),
+            "syncing": is_syncing(user_id),
         })
 
     return render_template("github/index.html", **ctx)
@@ -174,23 +175,20 @@ def hook():
     """
     Install or remove GitHub webhook
     """
-    repo = request.json["repo"]
     account = get_account()
-    extra_data = account.extra_data
+    repo = Repository.get(account.user_id, request.json["repo"])
 
-    if repo not in extra_data["repos"]:
+    if repo is None:
             abort(404)
 
     if request.method == 'DELETE':
-        if remove_hook(get_api(), extra_data, repo):
-            account.extra_data.changed()
+        if remove_hook(get_api(), repo):
             db.session.commit()
             return "", 204
         else:
             abort(400)
     elif request.method == 'POST':
-        if create_hook(get_api(), extra_data, repo):
-            account.extra_data.changed()
+        if create_hook(get_api(), account.extra_data, repo):
             db.session.commit()
             return "", 201
         else:
@@ -199,23 +197,50 @@ def hook():
         abort(400)
 
 
+@blueprint.route('/hooks/', methods=["GET", "POST"])
+@ssl_required
+@login_required
+def hooks():
+    """
+    Install, remove or verify GitHub webhooks of many repositories
+
+    POST starts the operation (``{"action": ..., "repos": [...]}``) and
+    GET returns its progress.
+    """
+    account = get_account()
+
+    if request.method == 'POST':
+        action = request.json.get("action")
+        names = request.json.get("repos")
+        if action not in HOOKS_ACTIONS or \
+                (names is None and action != 'reconcile'):
+            abort(400)
+        schedule_bulk_hooks(account.user_id, names, action)
+        return jsonify(get_hooks_progress(account.user_id)), 202
+
+    progress = get_hooks_progress(account.user_id)
+    if progress is None:
+        abort(404)
+    return jsonify(progress)
+
+
 @blueprint.route('/sync/', methods=["POST"])
 @ssl_required
 @login_required
 def sync_repositories():
+    """Sync repositories in the background and show the last snapshot."""
     account = get_account()
-    sync(get_api(), account.extra_data)
-    account.extra_data.changed()
-    db.session.commit()
+    schedule_sync(account.user_id)
 
     ctx = dict(
         connected=True,
-        repos=account.extra_data['repos'],
+        repos=Repository.get_repos(account.user_id),
         name=account.extra_data['login'],
         user_id=account.user_id,
         last_sync=humanize.naturaltime(
             utcnow() - parse_timestamp(account.extra_data['last_sync'])
         ),
+        syncing=is_syncing(account.user_id),
     )
 
     return render_template("github/index.html", **ctx)
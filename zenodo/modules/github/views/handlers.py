@@ -25,11 +25,13 @@ from __future__ import absolute_import
 
 from flask import url_for, redirect, current_app
 from flask.ext.login import current_user
+from invenio.ext.sqlalchemy import db
 from invenio.modules.oauthclient.models import RemoteToken
 from invenio.modules.oauthclient.handlers import authorized_signup_handler, \
     oauth_error_handler
 from invenio.modules.oauthclient.errors import OAuthResponseError
 
+from ..models import Repository
 from ..utils import init_account, init_api
 from ..tasks import disconnect_github
 
@@ -76,10 +78,15 @@ def disconnect(remote):
     token = RemoteToken.get(current_user.get_id(), remote.consumer_key)
 
     if token:
-        disconnect_github.delay(
-            remote.name, token.access_token, token.remote_account.extra_data
-        )
+        repos = Repository.query.filter_by(
+            user_id=token.remote_account.user_id
+        ).all()
+        hooks = [(r.name, r.hook) for r in repos if r.hook]
+        disconnect_github.delay(remote.name, token.access_token, hooks)
+        for r in repos:
+            db.session.delete(r)
         token.remote_account.delete()
+        db.session.commit()
 
     return redirect(url_for('oauthclient_settings.index'))
 
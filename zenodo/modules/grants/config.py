@@ -25,8 +25,17 @@
 GRANTS_OPENAIRE_OAIPMH_ENDPOINT = "http://api.openaire.eu/oai_pmh"
 """OpenAIRE OAI-PMH API endpoint."""
 
+GRANTS_OPENAIRE_OAIPMH_SET = "FP7Projects"
+"""OpenAIRE OAI-PMH set to harvest."""
+
 GRANTS_OPENAIRE_KB_JSON = "json_projects"
 """Knowledge base name for grants (json structure)."""
 
 GRANTS_OPENAIRE_KB_TITLE = "projects"
 """Knowledge base name for grants (no structure)."""
+
+GRANTS_KB_BATCH_SIZE = 500
+"""Number of knowledge base mappings written per statement."""
+
+GRANTS_INDEX_CHECK_INTERVAL = 60
+"""Seconds between checks if the in-memory grants index is outdated."""
@@ -23,10 +23,34 @@
 """OAI-PMH Client for Harvesting OpenAIRE grants."""
 
 from urllib import unquote
+
+from lxml import etree
 from oaipmh.client import Client
 from oaipmh.metadata import MetadataRegistry, MetadataReader
 
 
+NAMESPACES = {
+    'oai': 'http://www.openarchives.org/OAI/2.0/',
+    'oaf': 'http://namespace.openaire.eu/oaf',
+}
+
+
+class OAIPMHError(Exception):
+
+    """OAI-PMH error response."""
+
+    def __init__(self, code, message=""):
+        """Initialize exception."""
+        super(OAIPMHError, self).__init__(code, message)
+        self.code = code
+        self.message = message
+
+
+class BadResumptionTokenError(OAIPMHError):
+
+    """Resumption token is invalid or has expired."""
+
+
 class OpenAireClient(Client):
 
     """Client for OpenAIRE OAI-PMH.
@@ -58,10 +82,7 @@ class OpenAireClient(Client):
                 'textList',
                 'oaf:entity/oaf:project/websiteurl/text()'),
         },
-        namespaces={
-            'oai': 'http://www.openarchives.org/OAI/2.0/',
-            'oaf': 'http://namespace.openaire.eu/oaf',
-        }
+        namespaces=NAMESPACES,
     )
 
     def __init__(self, url):
@@ -86,6 +107,77 @@ class OpenAireClient(Client):
         for h, m, dummy in self.listRecords(metadataPrefix='oaf', set=set):
             yield clean_metadata(m.__dict__['_map'])
 
+    def list_grant_pages(self, set='FP7Projects', from_=None,
+                         resumption_token=None):
+        """Iterate over pages of grants changed since a given date.
+
+        Contrary to ``list_grants`` the resumption token of each page is
+        exposed, so that an interrupted harvest can be resumed from the last
+        processed page.
+
+        :param set: OAI-PMH set to harvest.
+        :param from_: Only harvest records changed on or after this date
+            (``YYYY-MM-DD``).
+        :param resumption_token: Resume a previous harvest from this token
+            (``set`` and ``from_`` are ignored).
+        :returns: Iterator of tuples ``(grants, resumption_token,
+            datestamp)``, where ``grants`` is the list of grants in the page,
+            ``resumption_token`` is the token to fetch the next page (``None``
+            for the last page), and ``datestamp`` is the most recent
+            datestamp in the page.
+        """
+        while True:
+            if resumption_token:
+                kw = dict(resumptionToken=resumption_token)
+            else:
+                kw = dict(metadataPrefix='oaf', set=set)
+                if from_:
+                    kw['from'] = from_
+
+            grants, resumption_token, datestamp = self._parse_page(
+                self.makeRequest(verb='ListRecords', **kw)
+            )
+            yield grants, resumption_token, datestamp
+
+            if not resumption_token:
+                break
+
+    def _parse_page(self, xml):
+        """Parse a ListRecords response."""
+        if isinstance(xml, unicode):
+            xml = xml.encode('utf-8')
+        tree = etree.XML(xml)
+        ns = NAMESPACES
+
+        for e in tree.xpath('//oai:error', namespaces=ns):
+            code = e.get('code')
+            if code == 'noRecordsMatch':
+                return [], None, None
+            elif code == 'badResumptionToken':
+                raise BadResumptionTokenError(code, e.text or '')
+            raise OAIPMHError(code, e.text or '')
+
+        grants = []
+        datestamp = None
+        for record in tree.xpath('//oai:ListRecords/oai:record',
+                                 namespaces=ns):
+            header = record.xpath('oai:header', namespaces=ns)[0]
+            record_datestamp = header.findtext(
+                '{%s}datestamp' % ns['oai'])
+            if record_datestamp and \
+                    (datestamp is None or record_datestamp > datestamp):
+                datestamp = record_datestamp
+            if header.get('status') == 'deleted':
+                continue
+            metadata = record.xpath('oai:metadata', namespaces=ns)
+            if metadata:
+                m = self.oaf_reader(metadata[0])
+                grants.append(clean_metadata(m.__dict__['_map']))
+
+        token = tree.xpath('//oai:resumptionToken/text()', namespaces=ns)
+        token = token[0].strip() if token else None
+        return grants, token or None, datestamp
+
 
 def clean_metadata(metadata_record):
     """Clean a metadata record."""
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""In-memory index of grants.
+
+The index is built once per worker from the grants knowledge base and serves
+lookups by grant agreement number and prefix searches over acronym, title
+and grant agreement number without touching the database. Each index carries
+a version which is stored in the cache; bumping the version (e.g. after a
+harvest has updated the knowledge base) makes all workers rebuild their
+index on next use.
+"""
+
+from __future__ import absolute_import
+
+import json
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from heapq import nsmallest
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+from invenio.modules.knowledge.api import get_kb_mappings
+
+VERSION_KEY = "grants::index::version"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lower case tokens."""
+    return TOKEN_RE.findall((text or u"").lower())
+
+
+class GrantIndex(object):
+
+    """Immutable index of grants."""
+
+    def __init__(self, grants, version=None):
+        """Build index.
+
+        :param grants: Iterable of grant dictionaries (as stored in the
+            grants knowledge base).
+        :param version: Version of the index.
+        """
+        self.version = version
+        self.grants = {}
+        postings = {}
+
+        for grant in grants:
+            grant_id = grant.get("grant_agreement_number", "")
+            if not grant_id:
+                continue
+            grant_id = str(grant_id)
+            self.grants[grant_id] = grant
+            for field in ("grant_agreement_number", "acronym", "title"):
+                for token in tokenize(grant.get(field)):
+                    postings.setdefault(token, set()).add(grant_id)
+
+        self.tokens = sorted(postings.keys())
+        self.postings = dict(
+            (token, frozenset(ids)) for token, ids in postings.items()
+        )
+
+        # Results are ordered by acronym, so precompute the position of each
+        # grant in that order and an acronym lookup for exact matches.
+        self.acronyms = {}
+        order = []
+        for grant_id, grant in self.grants.items():
+            acronym = (grant.get("acronym") or u"").lower()
+            self.acronyms.setdefault(acronym, set()).add(grant_id)
+            order.append((acronym, grant_id))
+        self.order = dict(
+            (grant_id, i) for i, (dummy, grant_id) in enumerate(sorted(order))
+        )
+
+    @classmethod
+    def from_kb(cls, kb_name, version=None):
+        """Build index from a knowledge base."""
+        return cls(
+            (json.loads(m["value"]) for m in get_kb_mappings(kb_name)),
+            version=version,
+        )
+
+    def __len__(self):
+        """Number of grants in index."""
+        return len(self.grants)
+
+    def get(self, grant_id):
+        """Get a grant by grant agreement number."""
+        return self.grants.get(str(grant_id))
+
+    def _prefix_match(self, prefix):
+        """Get ids of grants having a token starting with prefix."""
+        lo = bisect_left(self.tokens, prefix)
+        hi = bisect_left(self.tokens, prefix + u"\uffff", lo)
+        if hi - lo == 1:
+            return self.postings[self.tokens[lo]]
+        return frozenset().union(
+            *[self.postings[t] for t in self.tokens[lo:hi]]
+        )
+
+    def search(self, term, limit=50):
+        """Search grants where every word in term prefixes a token.
+
+        Grants whose acronym or grant agreement number equals the term come
+        first, the rest are ordered by acronym.
+        """
+        terms = tokenize(term)
+        if not terms:
+            return []
+
+        # Intersect starting from the most selective term.
+        matches = sorted((self._prefix_match(t) for t in terms), key=len)
+        ids = matches[0]
+        for m in matches[1:]:
+            if not ids:
+                break
+            ids = ids & m
+
+        query = u" ".join(terms)
+        exact = ids & (self.acronyms.get(query, set()) | set([query]))
+        result = sorted(exact, key=self.order.__getitem__)
+        if len(result) < limit:
+            result.extend(nsmallest(
+                limit - len(result), ids - exact, key=self.order.__getitem__
+            ))
+        return [self.grants[i] for i in result[:limit]]
+
+_index = None
+_index_checked = 0
+_index_lock = threading.Lock()
+
+
+def get_version():
+    """Get current version of the grants index."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = invalidate_index()
+    return version
+
+
+def invalidate_index():
+    """Invalidate grants index in all workers."""
+    version = uuid.uuid4().hex
+    cache.set(VERSION_KEY, version, timeout=0)
+    return version
+
+
+def get_index():
+    """Get the grants index of this worker (built on first use).
+
+    The version of the index is checked against the cache at most every
+    ``GRANTS_INDEX_CHECK_INTERVAL`` seconds.
+    """
+    global _index, _index_checked
+
+    now = time.time()
+    if _index is not None and \
+            now - _index_checked < cfg["GRANTS_INDEX_CHECK_INTERVAL"]:
+        return _index
+
+    with _index_lock:
+        version = get_version()
+        if _index is None or _index.version != version:
+            _index = GrantIndex.from_kb(
+                cfg["GRANTS_OPENAIRE_KB_JSON"], version=version
+            )
+        _index_checked = now
+    return _index
+
+
+def get_grant(grant_id):
+    """Get a grant by grant agreement number."""
+    return get_index().get(grant_id)
+
+
+def search_grants(term, limit=50):
+    """Search grants by acronym, title or grant agreement number."""
+    return get_index().search(term, limit=limit)
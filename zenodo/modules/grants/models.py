@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Database models for grants harvesting."""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from invenio.ext.sqlalchemy import db
+
+
+class HarvestState(db.Model):
+
+    """Checkpoint of an incremental OAI-PMH harvest.
+
+    Stores the datestamp of the last complete harvest as well as the
+    resumption token of the last processed page of a running harvest, so that
+    an interrupted harvest can be resumed.
+    """
+
+    __tablename__ = 'grantsHARVESTSTATE'
+
+    __table_args__ = (
+        db.UniqueConstraint('endpoint', 'set_spec'),
+        db.Model.__table_args__
+    )
+
+    id = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                   primary_key=True, autoincrement=True)
+
+    endpoint = db.Column(db.String(200), nullable=False)
+    """OAI-PMH endpoint."""
+
+    set_spec = db.Column(db.String(100), nullable=False, default='')
+    """OAI-PMH set."""
+
+    last_datestamp = db.Column(db.String(30), nullable=True)
+    """Most recent datestamp harvested by the last complete harvest."""
+
+    from_date = db.Column(db.String(30), nullable=True)
+    """From date used by the running harvest."""
+
+    current_datestamp = db.Column(db.String(30), nullable=True)
+    """Most recent datestamp seen by the running harvest."""
+
+    resumption_token = db.Column(db.Text, nullable=True)
+    """Resumption token of the next page of the running harvest."""
+
+    modified = db.Column(db.DateTime, nullable=False, default=datetime.now,
+                         onupdate=datetime.now)
+    """Modification timestamp."""
+
+    @classmethod
+    def get_or_create(cls, endpoint, set_spec):
+        """Get harvest state of an endpoint and set."""
+        obj = cls.query.filter_by(endpoint=endpoint, set_spec=set_spec).first()
+        if obj is None:
+            obj = cls(endpoint=endpoint, set_spec=set_spec)
+            db.session.add(obj)
+            db.session.commit()
+        return obj
+
+    @property
+    def is_running(self):
+        """Determine if a harvest was interrupted and can be resumed."""
+        return bool(self.resumption_token)
+
+    def start(self, incremental=True):
+        """Start a new harvest."""
+        self.from_date = self.last_datestamp[:10] \
+            if incremental and self.last_datestamp else None
+        self.current_datestamp = None
+        self.resumption_token = None
+
+    def checkpoint(self, resumption_token, datestamp):
+        """Record a processed page (caller commits)."""
+        self.resumption_token = resumption_token
+        if datestamp and (self.current_datestamp is None or
+                          datestamp > self.current_datestamp):
+            self.current_datestamp = datestamp
+
+    def finish(self):
+        """Mark the running harvest as complete (caller commits)."""
+        if self.current_datestamp and (
+                self.last_datestamp is None or
+                self.current_datestamp > self.last_datestamp):
+            self.last_datestamp = self.current_datestamp
+        self.from_date = None
+        self.current_datestamp = None
+        self.resumption_token = None
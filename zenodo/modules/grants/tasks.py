@@ -24,42 +24,143 @@
 
 import json
 
+from celery.utils.log import get_task_logger
 from flask import current_app
+from sqlalchemy import and_, bindparam
 
 from invenio.celery import celery
-from invenio.modules.knowledge.api import update_kb_mapping, add_kb_mapping, \
-    get_kb_mappings
-from .contrib.openaire import OpenAireClient
+from invenio.ext.sqlalchemy import db
+from invenio.modules.knowledge.api import get_kb_by_name
+from invenio.modules.knowledge.models import KnwKBRVAL
 
+from .contrib.openaire import BadResumptionTokenError, OpenAireClient
+from .index import invalidate_index
+from .models import HarvestState
 
-def update_kb(kb_name, data, key_fun, value_fun=lambda x: x, update=False):
-    """Update a knowledge base from data."""
-    # Memory greedy, but faster than many individual SQL queries.
-    mappings = dict([
-        (d['key'], d['value']) for d in get_kb_mappings(kb_name)
-    ])
+logger = get_task_logger(__name__)
 
-    for item in data:
-        k = key_fun(item)
-        v = json.dumps(value_fun(item))
-        if k not in mappings:
-            add_kb_mapping(kb_name, k, v)
-        elif update and mappings[k] != v:
-            update_kb_mapping(kb_name, k, k, v)
 
+def _chunks(iterable, size):
+    """Split an iterable into lists of a given size."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
-@celery.task(ignore_result=True)
-def harvest_openaire_grants():
-    """Harvest grants from OpenAIRE and store in knowledge base."""
-    # OAI-PMH harvester client
-    client = OpenAireClient(
-        current_app.config['GRANTS_OPENAIRE_OAIPMH_ENDPOINT']
+
+def update_kb(kb_name, data, key_fun, value_fun=lambda x: x, update=False,
+              batch_size=None):
+    """Update a knowledge base from data.
+
+    Existing mappings are loaded, and new or changed mappings are written,
+    with one multi-row statement per batch. Changes are not committed, so
+    that the caller can commit them together with other changes.
+
+    :returns: Tuple of number of added and updated mappings.
+    """
+    batch_size = batch_size or current_app.config['GRANTS_KB_BATCH_SIZE']
+    kb_id = get_kb_by_name(kb_name).id
+    table = KnwKBRVAL.__table__
+
+    insert_stmt = table.insert()
+    update_stmt = table.update().where(and_(
+        table.c.id_knwKB == kb_id,
+        table.c.m_key == bindparam('b_key'),
+    )).values(m_value=bindparam('b_value'))
+
+    added, updated = 0, 0
+    for batch in _chunks(data, batch_size):
+        items = dict(
+            (key_fun(item), json.dumps(value_fun(item))) for item in batch
+        )
+        existing = dict(db.session.query(
+            KnwKBRVAL.m_key, KnwKBRVAL.m_value
+        ).filter(
+            KnwKBRVAL.id_knwKB == kb_id,
+            KnwKBRVAL.m_key.in_(items.keys()),
+        ).all())
+
+        inserts = [
+            dict(id_knwKB=kb_id, m_key=k, m_value=v)
+            for k, v in items.items() if k not in existing
+        ]
+        updates = [
+            dict(b_key=k, b_value=v)
+            for k, v in items.items()
+            if update and k in existing and existing[k] != v
+        ]
+
+        if inserts:
+            db.session.execute(insert_stmt, inserts)
+        if updates:
+            db.session.execute(update_stmt, updates)
+        added += len(inserts)
+        updated += len(updates)
+
+    return added, updated
+
+
+def harvest_kb(client, state, kb_name, key_fun):
+    """Harvest pages of grants into a knowledge base.
+
+    Resumes from the resumption token stored in the harvest state. KB changes
+    and the new checkpoint of each page are committed together.
+    """
+    added, updated = 0, 0
+    pages = client.list_grant_pages(
+        set=state.set_spec,
+        from_=state.from_date,
+        resumption_token=state.resumption_token,
     )
+    for grants, resumption_token, datestamp in pages:
+        a, u = update_kb(kb_name, grants, key_fun=key_fun, update=True)
+        added += a
+        updated += u
+        state.checkpoint(resumption_token, datestamp)
+        db.session.commit()
+
+    state.finish()
+    db.session.commit()
+    return added, updated
+
+
+@celery.task(ignore_result=True)
+def harvest_openaire_grants(incremental=True):
+    """Harvest grants from OpenAIRE and store in knowledge base.
+
+    In incremental mode, only grants changed since the last complete harvest
+    are requested. An interrupted harvest is resumed from the last processed
+    page.
+    """
+    endpoint = current_app.config['GRANTS_OPENAIRE_OAIPMH_ENDPOINT']
     kb_json = current_app.config['GRANTS_OPENAIRE_KB_JSON']
+    key_fun = lambda x: x['grant_agreement_number']
 
-    # Update knowledge base.
-    update_kb(
-        kb_json,
-        client.list_grants(),
-        key_fun=lambda x: x['grant_agreement_number'],
+    # OAI-PMH harvester client
+    client = OpenAireClient(endpoint)
+    state = HarvestState.get_or_create(
+        endpoint, current_app.config['GRANTS_OPENAIRE_OAIPMH_SET']
     )
+
+    if state.is_running:
+        logger.info("Resuming grants harvest from %s." % state.from_date)
+    else:
+        state.start(incremental=incremental)
+        db.session.commit()
+
+    try:
+        added, updated = harvest_kb(client, state, kb_json, key_fun)
+    except BadResumptionTokenError:
+        # Resumption token expired - restart the harvest.
+        logger.warning("Resumption token expired, restarting grants harvest.")
+        state.start(incremental=incremental)
+        db.session.commit()
+        added, updated = harvest_kb(client, state, kb_json, key_fun)
+
+    logger.info("Harvested grants: %s added, %s updated." % (added, updated))
+    if added or updated:
+        invalidate_index()
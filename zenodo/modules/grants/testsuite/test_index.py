@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Grants index test suite."""
+
+from __future__ import absolute_import
+
+import json
+
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+
+GRANTS = [
+    dict(grant_agreement_number='283595', acronym='OPENAIREPLUS',
+         title='2nd-Generation Open Access Infrastructure for Research in '
+               'Europe'),
+    dict(grant_agreement_number='246686', acronym='OPENAIRE',
+         title='Open Access Infrastructure for Research in Europe'),
+    dict(grant_agreement_number='502084', acronym='POLYMOD',
+         title='Improving Public Health Policy in Europe'),
+]
+
+
+class TestGrantIndex(InvenioTestCase):
+    def test_get(self):
+        from zenodo.modules.grants.index import GrantIndex
+
+        idx = GrantIndex(GRANTS, version='1')
+        self.assertEqual(len(idx), 3)
+        self.assertEqual(idx.get('246686')['acronym'], 'OPENAIRE')
+        self.assertEqual(idx.get(246686)['acronym'], 'OPENAIRE')
+        self.assertIsNone(idx.get('000000'))
+
+    def test_search(self):
+        from zenodo.modules.grants.index import GrantIndex
+
+        idx = GrantIndex(GRANTS)
+        ids = lambda res: [g['grant_agreement_number'] for g in res]
+
+        # Exact acronym match is ranked first.
+        self.assertEqual(ids(idx.search('openaire')), ['246686', '283595'])
+        self.assertEqual(ids(idx.search('Open Europe')),
+                         ['246686', '283595'])
+        self.assertEqual(ids(idx.search('europe health')), ['502084'])
+        self.assertEqual(ids(idx.search('5020')), ['502084'])
+        self.assertEqual(ids(idx.search('europe', limit=1)), ['246686'])
+        self.assertEqual(idx.search('nonexisting'), [])
+        self.assertEqual(idx.search(''), [])
+
+
+class TestGetIndex(InvenioTestCase):
+    @property
+    def config(self):
+        return dict(
+            CACHE_TYPE='simple',
+            GRANTS_OPENAIRE_KB_JSON='test_json_projects',
+            GRANTS_INDEX_CHECK_INTERVAL=0,
+        )
+
+    def setUp(self):
+        from invenio.modules.knowledge.api import add_kb, add_kb_mapping
+
+        add_kb('test_json_projects')
+        add_kb_mapping('test_json_projects', '246686',
+                       json.dumps(GRANTS[1]))
+
+    def tearDown(self):
+        from invenio.modules.knowledge.api import delete_kb
+        delete_kb('test_json_projects')
+
+    def test_invalidate(self):
+        from invenio.modules.knowledge.api import add_kb_mapping
+        from zenodo.modules.grants.index import get_grant, get_index, \
+            invalidate_index
+
+        invalidate_index()
+        idx = get_index()
+        self.assertEqual(get_grant('246686')['acronym'], 'OPENAIRE')
+        self.assertIsNone(get_grant('502084'))
+
+        # Index is reused until invalidated.
+        add_kb_mapping('test_json_projects', '502084', json.dumps(GRANTS[2]))
+        self.assertIs(get_index(), idx)
+        self.assertIsNone(get_grant('502084'))
+
+        invalidate_index()
+        self.assertIsNot(get_index(), idx)
+        self.assertEqual(get_grant('502084')['acronym'], 'POLYMOD')
+
+
+TEST_SUITE = make_test_suite(TestGrantIndex, TestGetIndex)
+
+if __name__ == '__main__':
+    run_test_suite(TEST_SUITE)
@@ -28,8 +28,17 @@ from mock import patch
 
 from invenio.testsuite import make_test_suite, run_test_suite
 from invenio.celery.testsuite.helpers import CeleryTestCase
+from invenio.ext.sqlalchemy import db
 
-from .fixtures import FixtureMixin
+from .fixtures import FixtureMixin, OPENAIRE_SECOND_RESPONSE
+
+
+NO_RECORDS_MATCH = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <responseDate>2014-12-09T15:25:12Z</responseDate>
+  <request verb="ListRecords">http://api.openaire.eu/oai_pmh</request>
+  <error code="noRecordsMatch">No records match.</error>
+</OAI-PMH>"""
 
 
 class TasksTest(CeleryTestCase, FixtureMixin):
@@ -40,28 +49,101 @@ class TasksTest(CeleryTestCase, FixtureMixin):
             # See gabrielfalcao/HTTPretty#110
             CACHE_TYPE='simple',
             GRANTS_OPENAIRE_OAIPMH_ENDPOINT='http://example.org/oai_pmh',
+            GRANTS_OPENAIRE_KB_JSON='test_json_projects',
         )
 
+    def setUp(self):
+        from invenio.modules.knowledge.api import add_kb
+        from zenodo.modules.grants.models import HarvestState
+
+        HarvestState.query.delete()
+        db.session.commit()
+        add_kb('test_json_projects')
+
+    def tearDown(self):
+        from invenio.modules.knowledge.api import delete_kb
+        from zenodo.modules.grants.models import HarvestState
+
+        delete_kb('test_json_projects')
+        HarvestState.query.delete()
+        db.session.commit()
+
+    def get_state(self):
+        from zenodo.modules.grants.models import HarvestState
+        db.session.expire_all()
+        return HarvestState.query.filter_by(
+            endpoint=self.endpoint, set_spec='FP7Projects').one()
+
     @httpretty.activate
-    @patch('zenodo.modules.grants.tasks.add_kb_mapping')
-    @patch('zenodo.modules.grants.tasks.get_kb_mappings')
-    def test_harvest_openaire_grants(self, get_kb_mappings, add_kb_mapping):
-        # Mock OAI-OMH response and knowledge base.
+    def test_harvest_openaire_grants(self):
+        from invenio.modules.knowledge.api import get_kb_mappings
+        from zenodo.modules.grants.tasks import harvest_openaire_grants
+
+        # Mock OAI-OMH response
         self.get_client()
-        # Empty knowledge base
-        get_kb_mappings.return_value = []
 
-        # Test harvesting task
-        from zenodo.modules.grants.tasks import \
-            harvest_openaire_grants
+        harvest_openaire_grants()
+        self.assertEqual(len(get_kb_mappings('test_json_projects')), 200)
+
+        state = self.get_state()
+        self.assertEqual(state.last_datestamp, '2014-11-29T00:28:28Z')
+        self.assertFalse(state.is_running)
 
+        # Incremental harvest requests only changed records.
+        httpretty.register_uri(
+            httpretty.POST, self.endpoint, body=NO_RECORDS_MATCH,
+            content_type='text/xml',
+        )
         harvest_openaire_grants()
-        assert add_kb_mapping.call_count == 200
+        self.assertEqual(
+            httpretty.last_request().parsed_body['from'], ['2014-11-29'])
+        self.assertEqual(len(get_kb_mappings('test_json_projects')), 200)
+
+        # Full harvest ignores last datestamp
+        self.get_client()
+        harvest_openaire_grants(incremental=False)
+        self.assertTrue(
+            'from' not in httpretty.latest_requests[-2].parsed_body)
+
+    @httpretty.activate
+    def test_harvest_resume(self):
+        from invenio.modules.knowledge.api import get_kb_mappings
+        from zenodo.modules.grants import tasks
+
+        self.get_client()
+
+        # Crash after first page has been processed.
+        update_kb = tasks.update_kb
+
+        def crash_on_second_page(*args, **kwargs):
+            if crash_on_second_page.calls:
+                raise RuntimeError("Crash")
+            crash_on_second_page.calls += 1
+            return update_kb(*args, **kwargs)
+        crash_on_second_page.calls = 0
+
+        with patch('zenodo.modules.grants.tasks.update_kb',
+                   crash_on_second_page):
+            self.assertRaises(RuntimeError, tasks.harvest_openaire_grants)
+
+        state = self.get_state()
+        self.assertTrue(state.is_running)
+        self.assertEqual(len(get_kb_mappings('test_json_projects')), 100)
 
-    @patch('zenodo.modules.grants.tasks.add_kb_mapping')
-    @patch('zenodo.modules.grants.tasks.update_kb_mapping')
-    @patch('zenodo.modules.grants.tasks.get_kb_mappings')
-    def test_task(self, get_kb_mappings, update_kb_mapping, add_kb_mapping):
+        # Resume from the second page.
+        httpretty.register_uri(
+            httpretty.POST, self.endpoint,
+            body=OPENAIRE_SECOND_RESPONSE, content_type='text/xml',
+        )
+        tasks.harvest_openaire_grants()
+        self.assertTrue(
+            'resumptionToken' in httpretty.last_request().parsed_body)
+        self.assertEqual(len(get_kb_mappings('test_json_projects')), 200)
+        self.assertFalse(self.get_state().is_running)
+
+    def test_update_kb(self):
+        from invenio.modules.knowledge.api import add_kb_mapping, \
+            get_kb_mappings
         from zenodo.modules.grants.tasks import update_kb
 
         # Test data
@@ -71,32 +153,33 @@ class TasksTest(CeleryTestCase, FixtureMixin):
             dict(k='c', v='v3'),
         ]
 
-        existing_mapping = [
-            dict(key='a', value=json.dumps(data[0])),
-            dict(key='b', value=json.dumps(dict(k='b', v='v4'))),
-        ]
-
-        # Mock functions
-        def add_check_value(kb_name, k, v):
-            assert k == 'c'
-            assert v == json.dumps(data[2])
-
-        def update_check_value(kb_name, k_old, k, v):
-            assert k_old == 'b'
-            assert k == 'b'
-            assert v == json.dumps(data[1])
+        add_kb_mapping('test_json_projects', 'a', json.dumps(data[0]))
+        add_kb_mapping('test_json_projects', 'b',
+                       json.dumps(dict(k='b', v='v4')))
 
-        add_kb_mapping.side_effect = add_check_value
-        update_kb_mapping.side_effect = update_check_value
-        get_kb_mappings.return_value = existing_mapping
+        def kb_values():
+            return dict([
+                (m['key'], json.loads(m['value']))
+                for m in get_kb_mappings('test_json_projects')
+            ])
 
         # Run update function
-        update_kb('test', data, key_fun=lambda x: x['k'])
-        assert add_kb_mapping.called
-        assert not update_kb_mapping.called
-
-        update_kb('test', data, key_fun=lambda x: x['k'], update=True)
-        assert update_kb_mapping.called
+        self.assertEqual(
+            update_kb('test_json_projects', data, key_fun=lambda x: x['k'],
+                      batch_size=2),
+            (1, 0)
+        )
+        db.session.commit()
+        self.assertEqual(kb_values()['b'], dict(k='b', v='v4'))
+        self.assertEqual(kb_values()['c'], data[2])
+
+        self.assertEqual(
+            update_kb('test_json_projects', data, key_fun=lambda x: x['k'],
+                      update=True),
+            (0, 1)
+        )
+        db.session.commit()
+        self.assertEqual(kb_values()['b'], data[1])
 
 
 TEST_SUITE = make_test_suite(TasksTest)
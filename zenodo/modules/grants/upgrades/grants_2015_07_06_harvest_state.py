@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Create grants harvest state table."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = []
+
+
+def info():
+    """Upgrade description."""
+    return "Create table for incremental grants harvesting checkpoints."
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    op.create_table(
+        'grantsHARVESTSTATE',
+        db.Column('id', db.Integer(display_width=15), nullable=False),
+        db.Column('endpoint', db.String(length=200), nullable=False),
+        db.Column('set_spec', db.String(length=100), nullable=False),
+        db.Column('last_datestamp', db.String(length=30), nullable=True),
+        db.Column('from_date', db.String(length=30), nullable=True),
+        db.Column('current_datestamp', db.String(length=30), nullable=True),
+        db.Column('resumption_token', db.Text(), nullable=True),
+        db.Column('modified', db.DateTime(), nullable=False),
+        db.PrimaryKeyConstraint('id'),
+        db.UniqueConstraint('endpoint', 'set_spec'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    return 1
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Durable queue of outgoing emails.
+
+Emails are stored in :class:`~.models.MailMessage` instead of being sent
+while the request is handled. A Celery task sends the queued emails in
+batches over a single mail server connection. Failed emails are retried
+with exponential backoff and moved to the dead letters after
+:data:`MAILQUEUE_MAX_ATTEMPTS` attempts.
+"""
+
+from __future__ import absolute_import
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_email import get_connection
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+from invenio.ext.email import forge_email
+from invenio.ext.sqlalchemy import db
+
+from .models import MailMessage
+
+LOCK_KEY = "mailqueue::lock"
+KICK_KEY = "mailqueue::kick"
+METRICS_KEY = "mailqueue::metrics"
+COUNTERS = ['queued', 'sent', 'failed', 'dead']
+
+
+def _text(value):
+    """Store text as unicode."""
+    if isinstance(value, str):
+        return value.decode('utf8')
+    return value or u''
+
+
+def queue_email(fromaddr, toaddr, subject='', content='', html_content='',
+                kick=True):
+    """Queue an email (same arguments as ``send_email``).
+
+    :param kick: Schedule the queue to be sent after the batch delay.
+    :returns: The queued message.
+    """
+    if isinstance(toaddr, (list, tuple)):
+        toaddr = ",".join(toaddr)
+    msg = MailMessage(
+        fromaddr=_text(fromaddr),
+        toaddr=_text(toaddr),
+        subject=_text(subject),
+        content=_text(content),
+        html_content=_text(html_content),
+    )
+    db.session.add(msg)
+    db.session.commit()
+    update_metrics(queued=1)
+
+    if kick:
+        delay = cfg['MAILQUEUE_BATCH_DELAY']
+        # One scheduled send for all emails queued during the delay.
+        if cache.add(KICK_KEY, True, timeout=max(1, delay)):
+            from .tasks import send_queued_mail
+            send_queued_mail.apply_async(countdown=delay)
+    return msg
+
+
+def update_metrics(latency=None, **counters):
+    """Update the mail queue metrics."""
+    metrics = cache.get(METRICS_KEY) or {}
+    for k, v in counters.items():
+        metrics[k] = metrics.get(k, 0) + v
+    if latency is not None:
+        metrics['latency_total'] = metrics.get('latency_total', 0.0) + latency
+        metrics['latency_max'] = max(metrics.get('latency_max', 0.0), latency)
+    cache.set(METRICS_KEY, metrics)
+
+
+def get_metrics():
+    """Get the mail queue metrics.
+
+    :returns: Dictionary with the queue depth, the number of dead letters,
+        the counters and the mean and maximum send latency (seconds from
+        queueing to sending) of sent emails.
+    """
+    metrics = dict((c, 0) for c in COUNTERS)
+    metrics.update(latency_total=0.0, latency_max=0.0)
+    metrics.update(cache.get(METRICS_KEY) or {})
+    metrics['latency_mean'] = metrics['latency_total'] / metrics['sent'] \
+        if metrics['sent'] else 0.0
+    metrics['depth'] = MailMessage.count(MailMessage.QUEUED)
+    metrics['dead_letters'] = MailMessage.count(MailMessage.DEAD)
+    return metrics
+
+
+def forge(msg):
+    """Create the email of a queued message."""
+    return forge_email(
+        msg.fromaddr.encode('utf8'),
+        [r.encode('utf8') for r in msg.recipients],
+        msg.subject.encode('utf8'),
+        msg.content.encode('utf8'),
+        html_content=msg.html_content.encode('utf8'),
+    )
+
+
+def send_batch(messages, connection, now):
+    """Send messages over an open connection.
+
+    :returns: Number of messages sent.
+    """
+    sent = 0
+    for msg in messages:
+        try:
+            connection.send_messages([forge(msg)])
+        except Exception as e:
+            msg.attempts += 1
+            msg.last_error = str(e)
+            if msg.attempts >= cfg['MAILQUEUE_MAX_ATTEMPTS']:
+                msg.status = MailMessage.DEAD
+                update_metrics(failed=1, dead=1)
+                current_app.logger.error(
+                    "Email %s moved to dead letters: %s" % (msg.id, e))
+            else:
+                msg.next_attempt = now + timedelta(
+                    seconds=cfg['MAILQUEUE_RETRY_BACKOFF'] *
+                    2 ** (msg.attempts - 1)
+                )
+                update_metrics(failed=1)
+            continue
+        msg.status = MailMessage.SENT
+        msg.sent = datetime.now()
+        update_metrics(
+            sent=1, latency=(msg.sent - msg.created).total_seconds())
+        sent += 1
+    db.session.commit()
+    return sent
+
+
+def send_queued(connection=None, now=None):
+    """Send all due emails in batches.
+
+    Only one process sends the queue at a time.
+
+    :returns: Number of emails sent.
+    """
+    if not cache.add(LOCK_KEY, True, timeout=cfg['MAILQUEUE_LOCK_TIMEOUT']):
+        return 0
+    try:
+        now = now or datetime.now()
+        batch_size = cfg['MAILQUEUE_BATCH_SIZE']
+        messages = MailMessage.get_due(now, batch_size)
+        if not messages:
+            return 0
+
+        connection = connection or get_connection(
+            backend=cfg['MAILQUEUE_BACKEND'] or None)
+        sent = 0
+        connection.open()
+        try:
+            while messages:
+                sent += send_batch(messages, connection, now)
+                if len(messages) < batch_size:
+                    break
+                messages = MailMessage.get_due(now, batch_size)
+        finally:
+            connection.close()
+        return sent
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def purge_sent(now=None):
+    """Delete sent emails older than :data:`MAILQUEUE_KEEP_SENT`."""
+    now = now or datetime.now()
+    deleted = MailMessage.query.filter(
+        MailMessage.status == MailMessage.SENT,
+        MailMessage.sent < now - timedelta(
+            seconds=cfg['MAILQUEUE_KEEP_SENT']),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def requeue_dead():
+    """Queue all dead letters again.
+
+    :returns: Number of queued emails.
+    """
+    count = 0
+    for msg in MailMessage.query.filter_by(status=MailMessage.DEAD):
+        msg.status = MailMessage.QUEUED
+        msg.attempts = 0
+        msg.next_attempt = datetime.now()
+        count += 1
+    db.session.commit()
+    return count
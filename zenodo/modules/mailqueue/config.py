@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Configuration for mail queue module."""
+
+MAILQUEUE_BACKEND = None
+"""Mail backend used to send queued emails (defaults to ``EMAIL_BACKEND``),
+e.g. ``flask_email.backends.console.Mail`` or
+``flask_email.backends.filebased.Mail`` for testing."""
+
+MAILQUEUE_BATCH_SIZE = 100
+"""Number of emails sent over one mail server connection."""
+
+MAILQUEUE_BATCH_DELAY = 10
+"""Seconds a queued email waits for other emails before the queue is
+sent."""
+
+MAILQUEUE_MAX_ATTEMPTS = 5
+"""Number of attempts to send an email before it is moved to the dead
+letters."""
+
+MAILQUEUE_RETRY_BACKOFF = 60
+"""Seconds before the first retry of an email (doubled on each attempt)."""
+
+MAILQUEUE_KEEP_SENT = 7 * 24 * 3600
+"""Seconds sent emails are kept before they are purged."""
+
+MAILQUEUE_LOCK_TIMEOUT = 600
+"""Seconds after which the lock of the queue sender expires."""
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Database models for mail queue."""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from invenio.ext.sqlalchemy import db
+
+
+class MailMessage(db.Model):
+
+    """Email waiting to be sent (or kept after it was sent)."""
+
+    __tablename__ = 'mailqueueMESSAGE'
+
+    __table_args__ = (
+        db.Index('ix_mailqueueMESSAGE_status_next_attempt',
+                 'status', 'next_attempt'),
+        db.Model.__table_args__
+    )
+
+    QUEUED = 'Q'
+    SENT = 'S'
+    DEAD = 'D'
+
+    id = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                   primary_key=True, autoincrement=True)
+
+    status = db.Column(db.String(1), nullable=False, default=QUEUED)
+    """Queued, sent or dead (failed too many times)."""
+
+    fromaddr = db.Column(db.String(255), nullable=False)
+    """Sender."""
+
+    toaddr = db.Column(db.Text, nullable=False)
+    """Comma separated recipients."""
+
+    subject = db.Column(db.Text, nullable=False, default=u'')
+    """Subject."""
+
+    content = db.Column(db.Text, nullable=False, default=u'')
+    """Text body."""
+
+    html_content = db.Column(db.Text, nullable=False, default=u'')
+    """HTML body (optional)."""
+
+    attempts = db.Column(db.Integer(5, unsigned=True), nullable=False,
+                         default=0)
+    """Number of failed attempts to send the email."""
+
+    last_error = db.Column(db.Text, nullable=True)
+    """Error of the last failed attempt."""
+
+    created = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    """Creation timestamp."""
+
+    next_attempt = db.Column(db.DateTime, nullable=False,
+                             default=datetime.now)
+    """Time from which the email is sent."""
+
+    sent = db.Column(db.DateTime, nullable=True)
+    """Time the email was sent."""
+
+    @classmethod
+    def get_due(cls, now, limit):
+        """Get queued emails which are due."""
+        return cls.query.filter(
+            cls.status == cls.QUEUED,
+            cls.next_attempt <= now,
+        ).order_by(cls.next_attempt, cls.id).limit(limit).all()
+
+    @classmethod
+    def count(cls, status):
+        """Count the emails of a status."""
+        return cls.query.filter_by(status=status).count()
+
+    @property
+    def recipients(self):
+        """List of recipients."""
+        return [r.strip() for r in self.toaddr.split(',') if r.strip()]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Mail queue tasks."""
+
+from __future__ import absolute_import
+
+from invenio.celery import celery
+from invenio.ext.cache import cache
+
+from .api import KICK_KEY, purge_sent, send_queued
+
+
+@celery.task(ignore_result=True)
+def send_queued_mail():
+    """Send queued emails.
+
+    The task is scheduled when emails are queued. Use as well by adding this
+    task to your CELERYBEAT_SCHEDULE to send retried emails
+
+    .. code-block:: python
+       CELERYBEAT_SCHEDULE = {
+            'mailqueue-send': dict(
+                task='zenodo.modules.mailqueue.tasks.send_queued_mail',
+                schedule=crontab(minute='*'),
+            ),
+            # ...
+        }
+    """
+    # Emails queued from now on schedule another run.
+    cache.delete(KICK_KEY)
+    send_queued()
+
+
+@celery.task(ignore_result=True)
+def purge_sent_mail():
+    """Delete sent emails which have been kept long enough."""
+    purge_sent()
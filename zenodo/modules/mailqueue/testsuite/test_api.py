@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test mail queue."""
+
+from __future__ import absolute_import
+
+from datetime import datetime, timedelta
+
+from flask_email.backends import locmem as mail
+
+from invenio.ext.sqlalchemy import db
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class FailingConnection(object):
+
+    """Connection which fails to send some recipients."""
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.opened = 0
+        self.outbox = []
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for m in messages:
+            if set(m.to) & set(self.fail):
+                raise IOError("Relay refused %s" % m.to)
+            self.outbox.append(m)
+        return len(messages)
+
+
+class MailQueueTestCase(InvenioTestCase):
+
+    """Test queueing and sending of emails."""
+
+    config = dict(
+        EMAIL_BACKEND="flask.ext.email.backends.locmem.Mail",
+        MAILQUEUE_BATCH_SIZE=2,
+        MAILQUEUE_MAX_ATTEMPTS=2,
+        MAILQUEUE_RETRY_BACKOFF=60,
+    )
+
+    def setUp(self):
+        from invenio.ext.cache import cache
+        from zenodo.modules.mailqueue.api import LOCK_KEY, METRICS_KEY
+        from zenodo.modules.mailqueue.models import MailMessage
+        MailMessage.query.delete()
+        db.session.commit()
+        cache.delete(LOCK_KEY)
+        cache.delete(METRICS_KEY)
+        mail.outbox = []
+
+    def tearDown(self):
+        from zenodo.modules.mailqueue.models import MailMessage
+        MailMessage.query.delete()
+        db.session.commit()
+        mail.outbox = []
+
+    def queue(self, *recipients):
+        from zenodo.modules.mailqueue.api import queue_email
+        return [
+            queue_email("info@zenodo.org", r, "Subject %s" % r,
+                        u"Content é", kick=False)
+            for r in recipients
+        ]
+
+    def test_queue(self):
+        from zenodo.modules.mailqueue.api import get_metrics, send_queued
+        from zenodo.modules.mailqueue.models import MailMessage
+        self.queue("a@zenodo.org", "b@zenodo.org", "c@zenodo.org")
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(get_metrics()['depth'], 3)
+
+        self.assertEqual(send_queued(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ["a@zenodo.org"])
+        self.assertEqual(MailMessage.count(MailMessage.SENT), 3)
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['depth'], 0)
+        self.assertEqual(metrics['queued'], 3)
+        self.assertEqual(metrics['sent'], 3)
+        assert metrics['latency_max'] >= metrics['latency_mean'] >= 0
+
+    def test_connection_reuse(self):
+        from zenodo.modules.mailqueue.api import send_queued
+        self.queue("a@zenodo.org", "b@zenodo.org", "c@zenodo.org")
+        connection = FailingConnection()
+        self.assertEqual(send_queued(connection=connection), 3)
+        self.assertEqual(connection.opened, 1)
+        self.assertEqual(len(connection.outbox), 3)
+
+    def test_retry(self):
+        from zenodo.modules.mailqueue.api import get_metrics, \
+            requeue_dead, send_queued
+        from zenodo.modules.mailqueue.models import MailMessage
+        self.queue("a@zenodo.org", "b@zenodo.org")
+        connection = FailingConnection(fail=["a@zenodo.org"])
+        now = datetime.now()
+
+        self.assertEqual(send_queued(connection=connection, now=now), 1)
+        msg = MailMessage.query.filter_by(status=MailMessage.QUEUED).one()
+        self.assertEqual(msg.attempts, 1)
+        assert "Relay refused" in msg.last_error
+        self.assertEqual(msg.next_attempt, now + timedelta(seconds=60))
+
+        # Not due yet.
+        self.assertEqual(send_queued(connection=connection, now=now), 0)
+        self.assertEqual(msg.attempts, 1)
+
+        # Second failure moves the email to the dead letters.
+        later = now + timedelta(seconds=61)
+        self.assertEqual(send_queued(connection=connection, now=later), 0)
+        self.assertEqual(msg.status, MailMessage.DEAD)
+        metrics = get_metrics()
+        self.assertEqual(metrics['dead_letters'], 1)
+        self.assertEqual(metrics['failed'], 2)
+
+        self.assertEqual(requeue_dead(), 1)
+        self.assertEqual(send_queued(connection=FailingConnection()), 1)
+
+    def test_locked(self):
+        from invenio.ext.cache import cache
+        from zenodo.modules.mailqueue.api import LOCK_KEY, send_queued
+        self.queue("a@zenodo.org")
+        cache.set(LOCK_KEY, True)
+        self.assertEqual(send_queued(), 0)
+        cache.delete(LOCK_KEY)
+        self.assertEqual(send_queued(), 1)
+
+    def test_purge(self):
+        from zenodo.modules.mailqueue.api import purge_sent, send_queued
+        from zenodo.modules.mailqueue.models import MailMessage
+        self.queue("a@zenodo.org", "b@zenodo.org")
+        send_queued()
+        self.assertEqual(purge_sent(), 0)
+        self.assertEqual(
+            purge_sent(now=datetime.now() + timedelta(days=8)), 2)
+        self.assertEqual(MailMessage.query.count(), 0)
+
+
+TEST_SUITE = make_test_suite(MailQueueTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Create the mail queue."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = []
+
+
+def info():
+    """Upgrade description."""
+    return "Create table of queued emails."
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    op.create_table(
+        'mailqueueMESSAGE',
+        db.Column('id', db.Integer(display_width=15), nullable=False),
+        db.Column('status', db.String(length=1), nullable=False),
+        db.Column('fromaddr', db.String(length=255), nullable=False),
+        db.Column('toaddr', db.Text(), nullable=False),
+        db.Column('subject', db.Text(), nullable=False),
+        db.Column('content', db.Text(), nullable=False),
+        db.Column('html_content', db.Text(), nullable=False),
+        db.Column('attempts', db.Integer(display_width=5), nullable=False),
+        db.Column('last_error', db.Text(), nullable=True),
+        db.Column('created', db.DateTime(), nullable=False),
+        db.Column('next_attempt', db.DateTime(), nullable=False),
+        db.Column('sent', db.DateTime(), nullable=True),
+        db.PrimaryKeyConstraint('id'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_index(
+        'ix_mailqueueMESSAGE_status_next_attempt', 'mailqueueMESSAGE',
+        ['status', 'next_attempt'], unique=False)
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    return 1
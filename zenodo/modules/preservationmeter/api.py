@@ -20,14 +20,38 @@
 ## granted to it by virtue of its status as an Intergovernmental Organization
 ## or submit itself to any jurisdiction.
 
+"""Preservation score calculation.
+
+Archives are inspected without extracting them: for ZIP files only the
+central directory is read entry by entry, and TAR files are read header by
+header without keeping the list of members in memory. Archives nested in
+archives are inspected up to ``PRESERVATIONMETER_ARCHIVE_MAX_DEPTH`` levels.
+
+The result of scanning a file is an aggregate (sum of scores, number of
+files, size weighted sum of scores and total size) which is memoised in the
+cache by the checksum of the file, when known.
+"""
+
 from __future__ import print_function
+
+import hashlib
+import os
+import struct
+import tarfile
+import tempfile
+import zipfile
+from multiprocessing import Pool
 from os.path import splitext, basename
+
 from invenio.base.globals import cfg
-import zipfile
-import tarfile
+from invenio.ext.cache import cache
 
 IGNORE_FILES = ['.']
 
+ARCHIVE_EXTENSIONS = ['.zip', '.tar']
+
+CACHE_KEY = "preservationmeter::{0}::{1}"
+
 
 def get_file_extension(file_path):
     '''
@@ -47,38 +71,42 @@ def get_file_name(file_path):
 
 def calculate_score(file_path_list):
     """Receives a list of file paths and calculates their preservation score.
+
+    Each item of the list is a tuple ``(file_name, file_path)`` optionally
+    followed by the checksum of the file, used to memoise the result.
     """
-    ## Iterate the list and get the file extension and quality associated.
-    files_quality = []
-    for file_n, file_p in file_path_list:
-        if is_file_compressed(file_n):
-            ## Try to extract it
-            try:
-                for extracted_file in extractor(file_p):
-                    ## Extract one level of files and append them
-                    files_quality.append(calculate_file_score(*extracted_file))
-            except IOError:
-                files_quality.append(0)
-        else:
-            files_quality.append(calculate_file_score(file_n, file_p))
+    return ScoreEngine.from_config().score(file_path_list)
 
-    ## Average quality of this submission
-    return sum(files_quality) / len(files_quality)
+
+def score_records(records, processes=None):
+    """Calculate the preservation scores of many records in parallel.
+
+    :param records: Iterable of ``(recid, file_path_list)``.
+    :param processes: Number of worker processes.
+    :returns: Iterator of ``(recid, score)`` in order of completion.
+    """
+    return ScoreEngine.from_config().score_records(
+        records,
+        processes=processes or cfg['PRESERVATIONMETER_PROCESSES'],
+    )
 
 
 def extractor(file_path):
     """Generator to iterate through files inside an archive.
     """
     if zipfile.is_zipfile(file_path):
-        z = zipfile.ZipFile(file_path, "r")
-        for file_p in z.namelist():
-            if file_p not in IGNORE_FILES:
-                yield basename(file_p), None
+        with open(file_path, 'rb') as fp:
+            for file_p, dummy_size in iter_zip(fp):
+                if file_p not in IGNORE_FILES:
+                    yield basename(file_p), None
     elif tarfile.is_tarfile(file_path):
         t = tarfile.open(file_path, "r:*")
-        for file_p in t.getnames():
-            if file_p not in IGNORE_FILES:
-                yield basename(file_p), None
+        try:
+            for member in iter_tar(t):
+                if member.name not in IGNORE_FILES:
+                    yield basename(member.name), None
+        finally:
+            t.close()
     else:
         raise IOError("Not a compressed file.")
 
@@ -95,5 +123,328 @@ def calculate_file_score(file_name, file_path):
 def is_file_compressed(file_name):
     """Returns if a file is in a known compressed format.
     """
-    list_of_compressed_formats = ['.zip', '.tar']
-    return get_file_extension(file_name) in list_of_compressed_formats
+    return get_file_extension(file_name) in ARCHIVE_EXTENSIONS
+
+
+#
+# Archive readers
+#
+def iter_zip(fp):
+    """Iterate over ``(name, size)`` of the entries of a ZIP file.
+
+    Reads the central directory one entry at a time (like
+    :class:`zipfile.ZipFile`, but without building the list of entries).
+    """
+    endrec = zipfile._EndRecData(fp)
+    if endrec is None:
+        raise zipfile.BadZipfile("File is not a zip file")
+
+    size_cd = endrec[zipfile._ECD_SIZE]
+    offset_cd = endrec[zipfile._ECD_OFFSET]
+    concat = endrec[zipfile._ECD_LOCATION] - size_cd - offset_cd
+    if endrec[zipfile._ECD_SIGNATURE] == zipfile.stringEndArchive64:
+        concat -= zipfile.sizeEndCentDir64 + zipfile.sizeEndCentDir64Locator
+
+    position = offset_cd + concat
+    read = 0
+    while read < size_cd:
+        # The file may be read by the consumer between two entries.
+        fp.seek(position, 0)
+        centdir = fp.read(zipfile.sizeCentralDir)
+        if len(centdir) != zipfile.sizeCentralDir or \
+                centdir[0:4] != zipfile.stringCentralDir:
+            raise zipfile.BadZipfile("Bad magic number for central directory")
+        centdir = struct.unpack(zipfile.structCentralDir, centdir)
+        name = fp.read(centdir[zipfile._CD_FILENAME_LENGTH])
+        extra = fp.read(centdir[zipfile._CD_EXTRA_FIELD_LENGTH])
+        length = zipfile.sizeCentralDir + len(name) + len(extra) + \
+            centdir[zipfile._CD_COMMENT_LENGTH]
+        read += length
+        position += length
+
+        size = centdir[zipfile._CD_UNCOMPRESSED_SIZE]
+        if size == 0xffffffff:
+            size = _zip64_size(extra, size)
+        yield name, size
+
+
+def _zip64_size(extra, default):
+    """Get uncompressed size from the ZIP64 extra field."""
+    i = 0
+    while i + 4 <= len(extra):
+        tp, ln = struct.unpack('<HH', extra[i:i + 4])
+        if tp == 1 and ln >= 8:
+            return struct.unpack('<Q', extra[i + 4:i + 12])[0]
+        i += 4 + ln
+    return default
+
+
+def iter_tar(t):
+    """Iterate over the members of a TAR file, one header at a time.
+
+    Members already read are not kept in memory.
+    """
+    while True:
+        member = t.next()
+        if member is None:
+            break
+        t.members = []
+        yield member
+
+
+#
+# Scoring
+#
+def merge(a, b):
+    """Merge two aggregates ``(total, count, weighted_total, weight)``."""
+    return tuple(x + y for x, y in zip(a, b))
+
+
+EMPTY = (0, 0, 0, 0)
+
+
+class ScoreEngine(object):
+
+    """Preservation score calculator."""
+
+    def __init__(self, quality, max_depth=1, nested_max_size=None,
+                 size_weighted=False, cache=None, cache_timeout=0):
+        """Initialize engine.
+
+        :param quality: Mapping of file extensions to quality.
+        :param max_depth: Number of levels of nested archives to inspect
+            (0 scores archives by their extension only).
+        :param nested_max_size: Maximum size of a nested archive which needs
+            to be copied to a temporary file to be inspected.
+        :param size_weighted: Weight the score of each file by its size.
+        :param cache: Cache used to memoise scans of files by checksum.
+        :param cache_timeout: Timeout of memoised scans.
+        """
+        self.quality = quality
+        self.max_depth = max_depth
+        self.nested_max_size = nested_max_size
+        self.size_weighted = size_weighted
+        self.cache = cache
+        self.cache_timeout = cache_timeout
+        self.fingerprint = hashlib.md5(repr(
+            (sorted(quality.items()), max_depth, nested_max_size)
+        )).hexdigest()[:12]
+
+    @classmethod
+    def from_config(cls):
+        """Create engine from configuration."""
+        return cls(
+            cfg['PRESERVATIONMETER_FILES_QUALITY'],
+            max_depth=cfg['PRESERVATIONMETER_ARCHIVE_MAX_DEPTH'],
+            nested_max_size=cfg['PRESERVATIONMETER_NESTED_MAX_SIZE'],
+            size_weighted=cfg['PRESERVATIONMETER_SIZE_WEIGHTED'],
+            cache=cache,
+            cache_timeout=cfg['PRESERVATIONMETER_CACHE_TIMEOUT'],
+        )
+
+    def __getstate__(self):
+        """Do not send the cache to worker processes."""
+        state = self.__dict__.copy()
+        state['cache'] = None
+        return state
+
+    def file_score(self, file_name):
+        """Get score of a file by its extension."""
+        return self.quality.get(get_file_extension(file_name)) or 0
+
+    #
+    # Aggregation
+    #
+    def result(self, aggregate):
+        """Get score from an aggregate."""
+        total, count, weighted_total, weight = aggregate
+        if self.size_weighted and weight:
+            return int(weighted_total / weight)
+        if count:
+            return total // count
+        return 0
+
+    def score(self, file_path_list):
+        """Calculate the preservation score of a list of files."""
+        file_path_list = list(file_path_list)
+        aggregates = self.get_cached(file_path_list)
+        for i, f in enumerate(file_path_list):
+            if aggregates[i] is None:
+                aggregates[i] = self.scan_file(*f[:2])
+        self.set_cached(file_path_list, aggregates)
+        return self.result(reduce(merge, aggregates, EMPTY))
+
+    def score_records(self, records, processes=None):
+        """Calculate the preservation scores of many records in a pool.
+
+        Files already scanned are taken from the cache, the remaining are
+        scanned in worker processes.
+        """
+        # Look up the cache here, as the pool hands out the tasks from
+        # another thread, which has no application context.
+        pending = {}
+        tasks = []
+        for recid, files in records:
+            files = list(files)
+            aggregates = self.get_cached(files)
+            pending[recid] = (files, aggregates)
+            tasks.append((self, recid, [
+                f[:2] for f, a in zip(files, aggregates) if a is None
+            ]))
+
+        pool = Pool(processes)
+        try:
+            for recid, scanned in pool.imap_unordered(_scan_files, tasks):
+                files, aggregates = pending.pop(recid)
+                scanned = iter(scanned)
+                aggregates = [
+                    next(scanned) if a is None else a for a in aggregates
+                ]
+                self.set_cached(files, aggregates)
+                yield recid, self.result(reduce(merge, aggregates, EMPTY))
+        finally:
+            pool.terminate()
+
+    #
+    # Memoisation
+    #
+    def _cache_keys(self, file_path_list):
+        # Only archives are worth memoising.
+        return [
+            CACHE_KEY.format(self.fingerprint, f[2])
+            if len(f) > 2 and f[2] and self.max_depth and
+            is_file_compressed(f[0]) else None
+            for f in file_path_list
+        ]
+
+    def get_cached(self, file_path_list):
+        """Get memoised aggregates (``None`` if not memoised)."""
+        keys = self._cache_keys(file_path_list)
+        if self.cache is None or not any(keys):
+            return [None] * len(keys)
+        values = dict(zip(
+            filter(None, keys), self.cache.get_many(*filter(None, keys))
+        ))
+        return [values.get(k) if k else None for k in keys]
+
+    def set_cached(self, file_path_list, aggregates):
+        """Memoise aggregates of files with a checksum."""
+        if self.cache is None:
+            return
+        mapping = dict(
+            (k, tuple(a)) for k, a in
+            zip(self._cache_keys(file_path_list), aggregates) if k
+        )
+        if mapping:
+            self.cache.set_many(mapping, timeout=self.cache_timeout)
+
+    #
+    # Scanning
+    #
+    def scan_file(self, file_name, file_path):
+        """Scan a file and return its aggregate."""
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = 0
+
+        if not self.max_depth or not is_file_compressed(file_name):
+            return self._entry(file_name, size)
+
+        try:
+            with open(file_path, 'rb') as fp:
+                return self.scan_archive(fp, file_name, depth=1)
+        except (IOError, zipfile.BadZipfile, tarfile.TarError):
+            # Unreadable archives have no value.
+            return (0, 1, 0, size)
+
+    def _entry(self, file_name, size):
+        score = self.file_score(file_name)
+        return (score, 1, score * size, size)
+
+    def scan_archive(self, fp, file_name, depth):
+        """Scan an open archive and return its aggregate."""
+        # Detect the format by extension, as a TAR file ending with a ZIP
+        # member looks like a ZIP file.
+        if get_file_extension(file_name) == '.zip':
+            return self._scan_zip(fp, depth)
+        t = tarfile.open(fileobj=fp, mode='r:*')
+        try:
+            return self._scan_tar(t, depth)
+        finally:
+            t.close()
+
+    def _scan_zip(self, fp, depth):
+        aggregate = EMPTY
+        z = None
+        for name, size in iter_zip(fp):
+            if name in IGNORE_FILES:
+                continue
+            # Directories are scored 0 like files without extension.
+            if depth < self.max_depth and is_file_compressed(name):
+                if z is None:
+                    z = zipfile.ZipFile(fp)
+                nested = z.open(name)
+                try:
+                    aggregate = merge(
+                        aggregate, self._scan_nested(nested, name, size, depth)
+                    )
+                finally:
+                    nested.close()
+            else:
+                aggregate = merge(aggregate, self._entry(name, size))
+        return aggregate
+
+    def _scan_tar(self, t, depth):
+        aggregate = EMPTY
+        for member in iter_tar(t):
+            if member.name in IGNORE_FILES:
+                continue
+            if depth < self.max_depth and member.isfile() and \
+                    is_file_compressed(member.name):
+                nested = t.extractfile(member)
+                aggregate = merge(aggregate, self._scan_nested(
+                    nested, member.name, member.size, depth
+                ))
+            else:
+                aggregate = merge(
+                    aggregate, self._entry(member.name, member.size)
+                )
+        return aggregate
+
+    def _scan_nested(self, fp, name, size, depth):
+        """Scan archive member which itself is an archive."""
+        if not _seekable(fp):
+            # Members of ZIP files can only be read sequentially.
+            if self.nested_max_size is not None and \
+                    size > self.nested_max_size:
+                return self._entry(name, size)
+            spool = tempfile.SpooledTemporaryFile(max_size=2 ** 20)
+            try:
+                while True:
+                    chunk = fp.read(2 ** 16)
+                    if not chunk:
+                        break
+                    spool.write(chunk)
+                spool.seek(0)
+                return self._scan_nested(spool, name, size, depth)
+            finally:
+                spool.close()
+
+        try:
+            return self.scan_archive(fp, name, depth + 1)
+        except (IOError, zipfile.BadZipfile, tarfile.TarError):
+            return (0, 1, 0, size)
+
+
+def _seekable(fp):
+    """Check if a file object supports random access."""
+    if hasattr(fp, 'seekable'):
+        return fp.seekable()
+    return hasattr(fp, 'seek')
+
+
+def _scan_files(args):
+    """Scan files of a record in a worker process."""
+    engine, recid, files = args
+    return recid, [engine.scan_file(*f) for f in files]
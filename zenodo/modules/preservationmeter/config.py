@@ -83,3 +83,26 @@ PRESERVATIONMETER_FILES_QUALITY = {
     '.7z': 100,
     '.rar': 70
 }
+
+PRESERVATIONMETER_ARCHIVE_MAX_DEPTH = 1
+"""Levels of nested archives inspected (0 scores archives by extension)."""
+
+PRESERVATIONMETER_NESTED_MAX_SIZE = 512 * 1024 * 1024
+"""Maximum size in bytes of a nested archive copied to a temporary file to
+be inspected (larger archives are scored by extension)."""
+
+PRESERVATIONMETER_SIZE_WEIGHTED = False
+"""Weight the score of each file by its size."""
+
+PRESERVATIONMETER_CACHE_TIMEOUT = 30 * 24 * 3600
+"""Seconds a scan of a file is memoised (by checksum)."""
+
+PRESERVATIONMETER_PROCESSES = 4
+"""Number of processes used to score many records."""
+
+PRESERVATIONMETER_BACKFILL_CHUNK = 500
+"""Number of records per chunk of the preservation score backfill."""
+
+PRESERVATIONMETER_BACKFILL_CHECKPOINT = None
+"""File storing the progress of the preservation score backfill (defaults to
+``preservationmeter_backfill.json`` in ``CFG_TMPSHAREDDIR``)."""
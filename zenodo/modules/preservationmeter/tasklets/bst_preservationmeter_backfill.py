@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Tasklet to (re)calculate the preservation score of all records.
+
+Records are processed in chunks of increasing record identifier. Files are
+scored in a pool of worker processes and the scores are queued in the shared
+bibupload accumulator. After each chunk a checkpoint is saved, so the
+tasklet can be stopped (e.g. at the end of a maintenance window) and
+resumed later where it stopped.
+
+Example::
+
+    bibtasklet -T bst_preservationmeter_backfill -a chunk_size=1000
+"""
+
+from __future__ import absolute_import
+
+import json
+import os
+import time
+from datetime import timedelta
+
+from flask import current_app
+
+from invenio.legacy.bibrecord import record_add_field
+from invenio.legacy.bibsched.bibtask import task_sleep_now_if_required, \
+    task_update_progress, write_message
+from invenio.legacy.dbquery import run_sql
+from invenio.modules.records.api import get_record
+
+from zenodo.modules.deposit.accumulator import bibupload_records
+from zenodo.modules.preservationmeter.api import score_records
+
+
+HISTOGRAM_BINS = 10
+
+
+class Checkpoint(object):
+
+    """Progress of a backfill, persisted in a JSON file."""
+
+    def __init__(self, path):
+        """Load checkpoint from path (if it exists)."""
+        self.path = path
+        self.last_recid = 0
+        self.processed = 0
+        self.skipped = 0
+        self.histograms = {'upload_type': {}, 'community': {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.__dict__.update(json.load(f))
+
+    def save(self):
+        """Save checkpoint atomically."""
+        data = dict(
+            last_recid=self.last_recid,
+            processed=self.processed,
+            skipped=self.skipped,
+            histograms=self.histograms,
+        )
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, self.path)
+
+    def delete(self):
+        """Remove checkpoint file."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def add(self, score, upload_type, communities):
+        """Add a score to the histograms."""
+        i = min(int(score) * HISTOGRAM_BINS // 100, HISTOGRAM_BINS - 1)
+        keys = [('upload_type', upload_type or 'unknown')] + \
+            [('community', c) for c in communities]
+        for histogram, key in keys:
+            counts = self.histograms[histogram].setdefault(
+                key, [0] * HISTOGRAM_BINS
+            )
+            counts[i] += 1
+
+
+def get_chunk(last_recid, size):
+    """Get next chunk of record identifiers."""
+    return [r[0] for r in run_sql(
+        "SELECT id FROM bibrec WHERE id>%s ORDER BY id LIMIT %s",
+        (last_recid, size)
+    )]
+
+
+def count_remaining(last_recid):
+    """Count records after a given record identifier."""
+    return run_sql("SELECT COUNT(id) FROM bibrec WHERE id>%s",
+                   (last_recid, ))[0][0]
+
+
+def load_records(recids, files_field):
+    """Load files, upload type and communities of records."""
+    records = {}
+    for recid in recids:
+        r = get_record(recid)
+        files = (r or {}).get(files_field) or []
+        if not files:
+            continue
+        records[recid] = (
+            [(f['full_name'], f['path'], f.get('checksum')) for f in files],
+            (r.get('upload_type') or {}).get('type'),
+            r.get('communities') or [],
+        )
+    return records
+
+
+def make_record(recid, score):
+    """Create record structure with the preservation score."""
+    rec = {}
+    record_add_field(rec, '001', controlfield_value=str(recid))
+    record_add_field(rec, '347', subfields=[('p', str(score))])
+    return rec
+
+
+def format_histograms(histograms):
+    """Format histograms as lines of text."""
+    width = 100 // HISTOGRAM_BINS
+    lines = ["%-30s %s" % ("", " ".join(
+        "%6s" % ("%d-" % (i * width)) for i in range(HISTOGRAM_BINS)
+    ))]
+    for name in sorted(histograms):
+        for key, counts in sorted(histograms[name].items()):
+            lines.append("%-30s %s" % (
+                ("%s:%s" % (name, key))[:30],
+                " ".join("%6d" % c for c in counts),
+            ))
+    return lines
+
+
+def bst_preservationmeter_backfill(chunk_size=None, processes=None,
+                                   restart='no'):
+    """Calculate the preservation score of all records.
+
+    :param chunk_size: Number of records per chunk (and bibupload).
+    :param processes: Number of processes used to score files.
+    :param restart: If ``yes``, ignore the checkpoint of a previous run.
+    """
+    config = current_app.config
+    chunk_size = int(chunk_size or config['PRESERVATIONMETER_BACKFILL_CHUNK'])
+    processes = int(processes or config['PRESERVATIONMETER_PROCESSES'])
+
+    checkpoint = Checkpoint(
+        config['PRESERVATIONMETER_BACKFILL_CHECKPOINT'] or os.path.join(
+            config['CFG_TMPSHAREDDIR'], 'preservationmeter_backfill.json')
+    )
+    if restart == 'yes':
+        checkpoint.delete()
+        checkpoint = Checkpoint(checkpoint.path)
+    elif checkpoint.last_recid:
+        write_message("Resuming after record %s (%s records done)." % (
+            checkpoint.last_recid, checkpoint.processed))
+
+    total = count_remaining(checkpoint.last_recid)
+    done = 0
+    start = time.time()
+    write_message("Calculating preservation score of %s records." % total)
+
+    while True:
+        task_sleep_now_if_required(can_stop_too=True)
+        recids = get_chunk(checkpoint.last_recid, chunk_size)
+        if not recids:
+            break
+
+        records = load_records(recids, config['PRESERVATIONMETER_FILES_FIELD'])
+        collection = []
+        for recid, score in score_records(
+                ((recid, r[0]) for recid, r in records.items()),
+                processes=processes):
+            collection.append(make_record(recid, score))
+            checkpoint.add(score, *records[recid][1:])
+
+        if collection:
+            bibupload_records(collection, mode='-c')
+
+        checkpoint.last_recid = recids[-1]
+        checkpoint.processed += len(collection)
+        checkpoint.skipped += len(recids) - len(collection)
+        checkpoint.save()
+
+        done += len(recids)
+        rate = done / max(time.time() - start, 1e-6)
+        eta = timedelta(seconds=int((total - done) / rate)) if rate else '-'
+        task_update_progress(
+            "%s/%s records (%.1f records/s, ETA %s)" % (
+                done, total, rate, eta)
+        )
+
+    write_message("Done: %s records scored, %s records without files." % (
+        checkpoint.processed, checkpoint.skipped))
+    for line in format_histograms(checkpoint.histograms):
+        write_message(line)
+    checkpoint.delete()
+    return checkpoint
+
+
+if __name__ == '__main__':
+    bst_preservationmeter_backfill()
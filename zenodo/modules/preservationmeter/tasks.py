@@ -27,27 +27,27 @@ from __future__ import absolute_import
 
 from flask import current_app
 from invenio.modules.records.api import get_record
-from invenio.legacy.bibupload.utils import bibupload_record
+from invenio.legacy.bibrecord import record_add_field
 from invenio.celery import celery
+from zenodo.modules.deposit.accumulator import bibupload_records
 
 from .api import calculate_score
 
 
+def record_preservation_score(record):
+    """Calculate the preservation score of a loaded record."""
+    files = record[current_app.config['PRESERVATIONMETER_FILES_FIELD']]
+    return calculate_score(
+        [(f['full_name'], f['path'], f.get('checksum')) for f in files]
+    )
+
+
 @celery.task(ignore_result=True)
 def calculate_preservation_score(recid):
     """Calculate the preservation score of a given record."""
-    r = get_record(recid)
-    files = r[current_app.config['PRESERVATIONMETER_FILES_FIELD']]
-    score = calculate_score(
-        [(f['full_name'], f['path']) for f in files]
-    )
-
-    marcxml = """<record>
-    <controlfield tag="001">{0}</controlfield>
-    <datafield tag="347" ind1="" ind2="">
-        <subfield code="p">{1}</subfield>
-    </datafield>
-    </record>
-    """.format(recid, score)
+    score = record_preservation_score(get_record(recid))
 
-    bibupload_record(marcxml)
+    rec = {}
+    record_add_field(rec, '001', controlfield_value=str(recid))
+    record_add_field(rec, '347', subfields=[('p', str(score))])
+    bibupload_records([rec])
@@ -255,7 +255,120 @@ class CalculateScoreTest(InvenioTestCase):
         self.assertEqual(osp.exists(csv_file.name), False)
 
 
-TEST_SUITE = make_test_suite(CalculateScoreTest)
+class ScoreEngineTest(InvenioTestCase):
+
+    """Tests of nested archives, size weighting and memoisation."""
+
+    def setUp(self):
+        import tarfile
+        import zipfile
+
+        self.tmp_dir = tempfile.mkdtemp()
+        # inner.tar: file.csv (100, 30 bytes), file.doc (40, 10 bytes)
+        self.inner = osp.join(self.tmp_dir, 'inner.tar')
+        with open(osp.join(self.tmp_dir, 'file.csv'), 'w') as f:
+            f.write('a' * 30)
+        with open(osp.join(self.tmp_dir, 'file.doc'), 'w') as f:
+            f.write('b' * 10)
+        t = tarfile.open(self.inner, 'w')
+        t.add(osp.join(self.tmp_dir, 'file.csv'), 'file.csv')
+        t.add(osp.join(self.tmp_dir, 'file.doc'), 'file.doc')
+        t.close()
+        # outer.zip: inner.tar, readme.rtf (90)
+        self.outer = osp.join(self.tmp_dir, 'outer.zip')
+        z = zipfile.ZipFile(self.outer, 'w')
+        z.write(self.inner, 'data/inner.tar')
+        z.writestr('data/', '')
+        z.writestr('readme.rtf', 'c' * 20)
+        z.close()
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def get_engine(self, **kwargs):
+        return api.ScoreEngine(
+            self.app.config['PRESERVATIONMETER_FILES_QUALITY'], **kwargs
+        )
+
+    def test_max_depth(self):
+        files = [('outer.zip', self.outer)]
+        # Archive scored by its extension.
+        self.assertEqual(self.get_engine(max_depth=0).score(files), 100)
+        # (90 + 0 + 90) / 3, the directory entry scores 0
+        self.assertEqual(self.get_engine(max_depth=1).score(files), 60)
+        # (100 + 40 + 0 + 90) / 4
+        self.assertEqual(self.get_engine(max_depth=2).score(files), 57)
+
+    def test_directories(self):
+        """Directory entries are scored 0, as before streaming."""
+        import tarfile
+
+        path = osp.join(self.tmp_dir, 'dirs.tar')
+        t = tarfile.open(path, 'w')
+        t.add(self.tmp_dir + '/file.csv', 'data/file.csv')
+        info = tarfile.TarInfo('data')
+        info.type = tarfile.DIRTYPE
+        t.addfile(info)
+        t.close()
+        # (100 + 0) / 2
+        self.assertEqual(self.get_engine().score([('dirs.tar', path)]), 50)
+        self.assertEqual(api.calculate_score([('dirs.tar', path)]), 50)
+
+    def test_size_weighted(self):
+        engine = self.get_engine(max_depth=2, size_weighted=True)
+        # (100 * 30 + 40 * 10 + 90 * 20) / 60
+        self.assertEqual(engine.score([('outer.zip', self.outer)]), 86)
+
+    def test_streaming_readers(self):
+        import tarfile
+
+        with open(self.outer, 'rb') as fp:
+            self.assertEqual(
+                sorted(api.iter_zip(fp)),
+                [('data/', 0), ('data/inner.tar', osp.getsize(self.inner)),
+                 ('readme.rtf', 20)],
+            )
+        t = tarfile.open(self.inner)
+        self.assertEqual(
+            [m.name for m in api.iter_tar(t)], ['file.csv', 'file.doc']
+        )
+        self.assertEqual(t.members, [])
+        t.close()
+
+    def test_memoisation(self):
+        from invenio.ext.cache import cache
+
+        engine = self.get_engine(max_depth=2, cache=cache)
+        files = [('outer.zip', self.outer, 'md5:1234')]
+        self.assertEqual(engine.score(files), 57)
+        # Memoised by checksum, the file is not read anymore.
+        with patch.object(engine, 'scan_file') as scan_file:
+            self.assertEqual(engine.score(files), 57)
+            self.assertFalse(scan_file.called)
+
+    def test_score_records(self):
+        """Records are scored in worker processes."""
+        from invenio.ext.cache import cache
+
+        records = [
+            (1, [('outer.zip', self.outer, 'md5:5678')]),
+            (2, [('file.csv', osp.join(self.tmp_dir, 'file.csv'))]),
+            (3, []),
+        ]
+        cache.delete(api.CACHE_KEY.format(
+            api.ScoreEngine.from_config().fingerprint, 'md5:5678'))
+        self.assertEqual(
+            dict(api.score_records(records, processes=2)),
+            {1: 60, 2: 100, 3: 0},
+        )
+        # Second run takes the archive from the cache.
+        self.assertEqual(
+            dict(api.score_records(records, processes=2)),
+            {1: 60, 2: 100, 3: 0},
+        )
+
+
+TEST_SUITE = make_test_suite(CalculateScoreTest, ScoreEngineTest)
 
 if __name__ == '__main__':
     run_test_suite(TEST_SUITE)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Preservation score backfill test suite."""
+
+from __future__ import absolute_import
+
+import os
+import tempfile
+from shutil import rmtree
+
+from mock import patch
+
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+
+TASKLET = 'zenodo.modules.preservationmeter.tasklets.' \
+    'bst_preservationmeter_backfill'
+
+RECORDS = {
+    1: {'upload_type': {'type': 'dataset'}, 'communities': ['ecfunded'],
+        '_files': [dict(full_name='a.csv', path='a.csv')]},
+    2: {'upload_type': {'type': 'publication'}, 'communities': [],
+        '_files': [dict(full_name='a.doc', path='a.doc')]},
+    3: {'upload_type': {'type': 'publication'}, '_files': []},
+    4: {'upload_type': {'type': 'publication'}, 'communities': ['ecfunded'],
+        '_files': [dict(full_name='a.pdf', path='a.pdf', checksum='x')]},
+}
+
+
+def fake_run_sql(query, params):
+    last_recid = params[0]
+    recids = [r for r in sorted(RECORDS) if r > last_recid]
+    if query.startswith('SELECT COUNT'):
+        return ((len(recids), ), )
+    return tuple((r, ) for r in recids[:params[1]])
+
+
+def fake_score_records(records, processes=None):
+    from zenodo.modules.preservationmeter.api import calculate_score
+    for recid, files in records:
+        yield recid, calculate_score(files)
+
+
+class Stop(Exception):
+    pass
+
+
+@patch(TASKLET + '.score_records', fake_score_records)
+@patch(TASKLET + '.run_sql', fake_run_sql)
+@patch(TASKLET + '.get_record', RECORDS.get)
+@patch(TASKLET + '.task_update_progress', lambda msg: None)
+@patch(TASKLET + '.write_message', lambda msg: None)
+class BackfillTest(InvenioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmp_dir, 'checkpoint.json')
+        self.app.config['PRESERVATIONMETER_BACKFILL_CHECKPOINT'] = \
+            self.checkpoint
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    @patch(TASKLET + '.bibupload_records')
+    def test_backfill_resume(self, bibupload_records):
+        from zenodo.modules.preservationmeter.tasklets.\
+            bst_preservationmeter_backfill import \
+            bst_preservationmeter_backfill
+
+        # Stop after the first chunk.
+        with patch(TASKLET + '.task_sleep_now_if_required',
+                   side_effect=[None, Stop]):
+            self.assertRaises(Stop, bst_preservationmeter_backfill,
+                              chunk_size='2')
+        self.assertTrue(os.path.exists(self.checkpoint))
+        self.assertEqual(bibupload_records.call_count, 1)
+        collection = bibupload_records.call_args[0][0]
+        self.assertEqual(
+            [(r['001'][0][3], r['347'][0][0]) for r in collection],
+            [('1', [('p', '100')]), ('2', [('p', '40')])],
+        )
+
+        # Resume with the remaining records.
+        with patch(TASKLET + '.task_sleep_now_if_required'):
+            checkpoint = bst_preservationmeter_backfill(chunk_size='2')
+        self.assertEqual(bibupload_records.call_count, 2)
+        collection = bibupload_records.call_args[0][0]
+        self.assertEqual([r['001'][0][3] for r in collection], ['4'])
+
+        self.assertEqual(checkpoint.processed, 3)
+        self.assertEqual(checkpoint.skipped, 1)
+        self.assertEqual(
+            checkpoint.histograms['community']['ecfunded'],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0, 2],
+        )
+        self.assertEqual(
+            checkpoint.histograms['upload_type']['publication'],
+            [0, 0, 0, 0, 1, 0, 0, 0, 0, 1],
+        )
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+TEST_SUITE = make_test_suite(BackfillTest)
+
+if __name__ == '__main__':
+    run_test_suite(TEST_SUITE)
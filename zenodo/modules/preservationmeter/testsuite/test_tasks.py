@@ -32,8 +32,8 @@ from ..config import PRESERVATIONMETER_FILES_FIELD
 class CalculateScoreTaskTest(CeleryTestCase):
 
     @patch('zenodo.modules.preservationmeter.tasks.get_record')
-    @patch('zenodo.modules.preservationmeter.tasks.bibupload_record')
-    def test_task(self, bibupload_record, get_record):
+    @patch('zenodo.modules.preservationmeter.tasks.bibupload_records')
+    def test_task(self, bibupload_records, get_record):
         get_record.return_value = {
             'recid': 1,
             PRESERVATIONMETER_FILES_FIELD: [
@@ -41,17 +41,14 @@ class CalculateScoreTaskTest(CeleryTestCase):
             ]
         }
 
-        bibupload_record.return_value = True
-
         from zenodo.modules.preservationmeter.tasks import \
             calculate_preservation_score
 
         calculate_preservation_score(recid=1)
         assert get_record.called
-        self.assertEqual(
-            '<record>\n    <controlfield tag="001">1</controlfield>\n    <datafield tag="347" ind1="" ind2="">\n        <subfield code="p">100</subfield>\n    </datafield>\n    </record>\n    ',
-            bibupload_record.call_args[0][0],
-        )
+        rec = bibupload_records.call_args[0][0][0]
+        self.assertEqual(rec['001'][0][3], '1')
+        self.assertEqual(rec['347'][0][0], [('p', '100')])
 
 
 TEST_SUITE = make_test_suite(CalculateScoreTaskTest)
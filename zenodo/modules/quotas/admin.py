@@ -23,12 +23,18 @@
 
 """Admin interface to shared links."""
 
+import time
+from array import array
+
+from flask import jsonify, request
+from flask.ext.admin import expose
 
 from invenio.base.i18n import _
-from invenio.ext.admin.views import ModelView
+from invenio.ext.admin.views import BaseView, ModelView
 from invenio.ext.sqlalchemy import db
 
 from .models import ResourceUsage
+from .timeseries import get_series
 
 
 class ResourceUsageAdmin(ModelView):
@@ -51,6 +57,42 @@ class ResourceUsageAdmin(ModelView):
     column_default_sort = ('modified', True)
 
 
+class ResourceUsageSeriesView(BaseView):
+
+    """Charts of the time series of resource usage metrics."""
+
+    acc_view_action = 'cfgquotas'
+
+    @expose('/')
+    def index(self):
+        """List metrics with a chart of the selected one."""
+        usages = ResourceUsage.query.order_by(
+            ResourceUsage.object_type, ResourceUsage.object_id,
+            ResourceUsage.metric
+        ).all()
+        return self.render('quotas/admin/series.html', usages=usages)
+
+    @expose('/<int:id_usage>.json')
+    def series(self, id_usage):
+        """Values of a metric in a time range as JSON.
+
+        Takes the optional arguments ``start``, ``end`` (seconds since the
+        epoch, defaults to the last day) and ``resolution``.
+        """
+        ResourceUsage.query.get_or_404(id_usage)
+        now = int(time.time())
+        series = get_series(
+            id_usage,
+            request.args.get('start', now - 24 * 3600, type=int),
+            end=request.args.get('end', now, type=int),
+            resolution=request.args.get('resolution', None, type=int),
+        )
+        return jsonify(dict(
+            (k, v.tolist() if isinstance(v, array) else v)
+            for k, v in series.items()
+        ))
+
+
 def register_admin(app, admin):
     """Called on app initialization to register administration interface."""
     category = _('Quotas')
@@ -58,3 +100,6 @@ def register_admin(app, admin):
     admin.add_view(ResourceUsageAdmin(
         ResourceUsage, db.session,
         name=_('Resource Usage'), category=category))
+    admin.add_view(ResourceUsageSeriesView(
+        name=_('Resource Usage History'), endpoint='quotas_series',
+        category=category))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Collection of metric values."""
+
+from __future__ import absolute_import
+
+import time
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+
+from . import timeseries
+from .models import ResourceUsage
+
+TIMINGS_KEY = "quotas::collect::{0}"
+COLLECTED_KEY = "quotas::collect"
+
+
+def collect(metric_class, batch_signal=None):
+    """Collect all values of a metric class and store the changed ones.
+
+    :param metric_class: Subclass of :class:`~.models.Metric`.
+    :param batch_signal: Send one signal for all changed values. Defaults to
+        :data:`QUOTAS_BATCH_SIGNALS`.
+    :returns: Timings and counts of the run (see
+        :func:`get_collect_timings`).
+    """
+    if batch_signal is None:
+        batch_signal = cfg['QUOTAS_BATCH_SIGNALS']
+
+    start = time.time()
+    values = {}
+    for obj_id, data in metric_class.all():
+        for name, val in data.items():
+            values[(unicode(obj_id), metric_class.get_id(name))] = int(val)
+    computed = time.time()
+
+    run, ids = ResourceUsage.bulk_update(
+        metric_class.object_type, metric_class.metric_class, values,
+        batch_signal=batch_signal,
+    )
+    stored = time.time()
+
+    if cfg['QUOTAS_TIMESERIES']:
+        timeseries.append(
+            metric_class.object_type, metric_class.metric_class, values,
+            timestamp=start, ids=ids,
+        )
+    end = time.time()
+
+    run.update(
+        values=len(values),
+        compute=computed - start,
+        store=stored - computed,
+        append=end - stored,
+        total=end - start,
+        timestamp=end,
+    )
+    cache.set(TIMINGS_KEY.format(metric_class.metric_class), run)
+    collected = cache.get(COLLECTED_KEY) or []
+    if metric_class.metric_class not in collected:
+        cache.set(COLLECTED_KEY, collected + [metric_class.metric_class])
+    return run
+
+
+def get_collect_timings(metric_class):
+    """Get timings and counts of the last collection of a metric class.
+
+    :returns: Dictionary with the number of ``values``, ``inserted``,
+        ``updated`` and ``unchanged`` values, the ``compute``, ``store``,
+        ``append`` (time series) and ``total`` durations in seconds and the
+        ``timestamp`` of the run, or ``None`` if the metric class has not
+        been collected yet.
+    """
+    return cache.get(TIMINGS_KEY.format(metric_class.metric_class))
+
+
+def get_all_collect_timings():
+    """Get timings and counts of the last collection of all metric classes.
+
+    :returns: Dictionary ``{metric_class: timings}`` (see
+        :func:`get_collect_timings`).
+    """
+    names = cache.get(COLLECTED_KEY) or []
+    timings = cache.get_many(*[TIMINGS_KEY.format(n) for n in names]) \
+        if names else []
+    return dict((n, t) for n, t in zip(names, timings) if t is not None)
@@ -31,12 +31,106 @@ QUOTAS_METRICS = [
 QUOTAS_PUBLISH_METRICS = []
 """Determine which metrics to publish."""
 
+QUOTAS_BATCH_SIGNALS = False
+"""Send one ``resource_usage_bulk_updated`` signal per metric collection.
+
+By default one ``resource_usage_updated`` signal is sent per changed value.
+"""
+
+QUOTAS_EXPOSITION_CACHE_TIMEOUT = 5
+"""Seconds to cache resource usage values served by ``/metrics``."""
+
+QUOTAS_EXPOSITION_ALLOWED_IPS = ['127.0.0.1', '::1']
+"""Client addresses allowed to scrape ``/metrics`` (None allows all).
+
+Behind a reverse proxy, the address of the connection is the one of the
+proxy: set :data:`QUOTAS_EXPOSITION_PROXIES`, or use
+:data:`QUOTAS_EXPOSITION_TOKEN` instead. Requests with an
+``X-Forwarded-For`` header are refused if no proxy is configured.
+"""
+
+QUOTAS_EXPOSITION_PROXIES = 0
+"""Number of trusted reverse proxies in front of the application, which
+append the client address to the ``X-Forwarded-For`` header."""
+
+QUOTAS_EXPOSITION_TOKEN = None
+"""Token allowing to scrape ``/metrics`` from any address, sent as
+``Authorization: Bearer <token>`` (e.g. ``bearer_token`` in Prometheus)."""
+
+QUOTAS_EXPOSITION_COLLECTORS = [
+    dict(name='zenodo_github_client',
+         collector='zenodo.modules.github.client:get_counters',
+         per_process=True),
+    dict(name='zenodo_github_intake',
+         collector='zenodo.modules.github.intake:get_metrics',
+         labels={'waiting': 'repository'}),
+    dict(name='zenodo_deposit_bibupload',
+         collector='zenodo.modules.deposit.accumulator:get_counters'),
+    dict(name='zenodo_deposit_pipeline',
+         collector='zenodo.modules.deposit.pipeline:get_timings',
+         labels={'': 'step'}, per_process=True),
+    dict(name='zenodo_mailqueue',
+         collector='zenodo.modules.mailqueue.api:get_metrics'),
+    dict(name='zenodo_quotas_collect',
+         collector='zenodo.modules.quotas.api:get_all_collect_timings',
+         labels={'': 'metric_class'}),
+]
+"""Functions (import paths) returning dictionaries of numbers which are
+served by ``/metrics`` as gauges.
+
+Keys of nested dictionaries are appended to the ``name`` of the gauge,
+except at the levels given in ``labels`` (by key path, ``''`` being the top
+level), whose keys become the values of the named label. Values of
+``per_process`` collectors are only known to the serving process, so they
+get a ``pid`` label.
+"""
+
+QUOTAS_FILE_PUBLISHER_PATH = None
+"""File written by ``FilePublisher``."""
+
+QUOTAS_TIMESERIES = True
+"""Append a sample of every collected value to the time series."""
+
+QUOTAS_TIMESERIES_RESOLUTIONS = [
+    (0, 2 * 24 * 3600),
+    (5 * 60, 14 * 24 * 3600),
+    (3600, 180 * 24 * 3600),
+    (24 * 3600, None),
+]
+"""Resolutions and retentions in seconds of the time series.
+
+Each resolution is rolled up from the previous one, so the retention of a
+resolution must be longer than the next resolution. Raw samples (resolution
+0) are kept for 2 days, and daily roll-ups forever.
+"""
+
+QUOTAS_TIMESERIES_MAX_POINTS = 1000
+"""Maximum number of points returned by a range query without resolution."""
+
+QUOTAS_DEPOSIT_USER_QUOTA = None
+"""Maximum file storage in bytes of the depositions of a user (or None)."""
+
+QUOTAS_DEPOSIT_USER_QUOTAS = {}
+"""Per-user overrides of :data:`QUOTAS_DEPOSIT_USER_QUOTA` by user id."""
+
 QUOTAS_AFSMETRIC_DIRECTORIES = [
     "var/data/deposit/",
     "var/data/files/",
 ]
 """AFS directories for AFS metric."""
 
+QUOTAS_AFSMETRIC_COMMAND = "fs"
+"""AFS command used to probe the quota of a directory."""
+
+QUOTAS_AFSMETRIC_PROCESSES = 8
+"""Maximum number of concurrent AFS quota probes."""
+
+QUOTAS_AFSMETRIC_TIMEOUT = 30
+"""Seconds after which an AFS quota probe is killed."""
+
+QUOTAS_AFSMETRIC_CACHE_TIMEOUT = 24 * 3600
+"""Seconds to remember the volume of a directory."""
+
 #
 # XSLS related variables.
 #
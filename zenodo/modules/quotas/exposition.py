@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Metrics in the Prometheus text exposition format.
+
+Serves all :class:`~.models.ResourceUsage` values as the
+``zenodo_resource_usage`` gauge, the values returned by the functions in
+:data:`QUOTAS_EXPOSITION_COLLECTORS`, and counters and histograms kept in
+the memory of the serving process (labelled with its ``pid``):
+
+.. code-block:: python
+
+   from zenodo.modules.quotas.exposition import counter
+
+   uploads = counter('zenodo_uploads_total', 'Number of uploads.')
+   uploads.inc(type='software')
+
+The resource usage values are cached for
+:data:`QUOTAS_EXPOSITION_CACHE_TIMEOUT` seconds, so that frequent scrapes
+do not hit the database.
+"""
+
+from __future__ import absolute_import
+
+import os
+import re
+import threading
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+from invenio.ext.sqlalchemy import db
+
+from .models import ResourceUsage
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+USAGE_KEY = "quotas::exposition::usage"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+_lock = threading.Lock()
+_registry = {}
+
+
+def _escape(value):
+    """Escape a label value."""
+    return unicode(value).replace('\\', r'\\').replace(
+        '\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    """Format a sample value."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_metric(name, doc, type_, samples):
+    """Format a metric family.
+
+    :param samples: Iterable of ``(name, labels, value)``.
+    :returns: List of lines.
+    """
+    lines = [
+        u'# HELP {0} {1}'.format(name, doc.replace('\\', r'\\').replace(
+            '\n', r'\n')),
+        u'# TYPE {0} {1}'.format(name, type_),
+    ]
+    for sample_name, labels, value in samples:
+        if labels:
+            labels = u'{{{0}}}'.format(u','.join(
+                u'{0}="{1}"'.format(k, _escape(v))
+                for k, v in sorted(labels.items())))
+        else:
+            labels = u''
+        lines.append(u'{0}{1} {2}'.format(
+            sample_name, labels, _format_value(value)))
+    return lines
+
+
+class Counter(object):
+
+    """Counter kept in memory."""
+
+    type = 'counter'
+
+    def __init__(self, name, doc):
+        self.name = name
+        self.doc = doc
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        """Increment the counter."""
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        """Get the samples of the counter."""
+        with _lock:
+            values = sorted(self.values.items())
+        return [(self.name, dict(key), value) for key, value in values]
+
+
+class Histogram(object):
+
+    """Histogram kept in memory."""
+
+    type = 'histogram'
+
+    def __init__(self, name, doc, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(sorted(buckets)) + (float('inf'), )
+        self.values = {}
+
+    def observe(self, value, **labels):
+        """Observe a value."""
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    def samples(self):
+        """Get the samples of the histogram."""
+        with _lock:
+            values = sorted(
+                (key, (list(c[0]), c[1], c[2]))
+                for key, c in self.values.items())
+        samples = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                labels = dict(key, le=_format_value(bound))
+                samples.append((self.name + '_bucket', labels, cumulative))
+            samples.append((self.name + '_sum', dict(key), total))
+            samples.append((self.name + '_count', dict(key), count))
+        return samples
+
+
+def _get_or_create(cls, name, doc, **kwargs):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, doc, **kwargs)
+    if not isinstance(metric, cls):
+        raise ValueError(
+            "Metric {0} is already registered as {1}.".format(
+                name, metric.type))
+    return metric
+
+
+def counter(name, doc):
+    """Get or create an in-process counter."""
+    return _get_or_create(Counter, name, doc)
+
+
+def histogram(name, doc, buckets=DEFAULT_BUCKETS):
+    """Get or create an in-process histogram."""
+    return _get_or_create(Histogram, name, doc, buckets=buckets)
+
+
+def render_registry():
+    """Format the in-process metrics."""
+    pid = os.getpid()
+    lines = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        lines.extend(format_metric(
+            name, metric.doc, metric.type,
+            [(n, dict(labels, pid=pid), value)
+             for n, labels, value in metric.samples()]))
+    return lines
+
+
+def _sanitize(name):
+    """Turn a key into a valid part of a metric name."""
+    return re.sub(r'[^a-zA-Z0-9_]', '_', unicode(name))
+
+
+def flatten(data, name, labels=None, path='', sample_labels=None):
+    """Get the samples of a (nested) dictionary of numbers.
+
+    :param labels: Label names by key path (see
+        :data:`QUOTAS_EXPOSITION_COLLECTORS`).
+    :returns: Dictionary ``{name: [(name, labels, value)]}``.
+    """
+    labels = labels or {}
+    sample_labels = sample_labels or {}
+    families = {}
+    for key, value in sorted(data.items()):
+        label = labels.get(path)
+        if label:
+            key_name = name
+            key_path = path + '.*' if path else '*'
+            key_labels = dict(sample_labels, **{label: key})
+        else:
+            key_name = '{0}_{1}'.format(name, _sanitize(key))
+            key_path = '{0}.{1}'.format(path, key) if path else key
+            key_labels = sample_labels
+        if isinstance(value, dict):
+            for n, samples in flatten(value, key_name, labels, key_path,
+                                      key_labels).items():
+                families.setdefault(n, []).extend(samples)
+        elif isinstance(value, (int, long, float)) and \
+                not isinstance(value, bool):
+            families.setdefault(key_name, []).append(
+                (key_name, key_labels, value))
+    return families
+
+
+def render_collectors():
+    """Format the values of the configured collectors.
+
+    A failing collector is logged and skipped.
+    """
+    pid = os.getpid()
+    lines = []
+    for spec in cfg['QUOTAS_EXPOSITION_COLLECTORS']:
+        try:
+            data = import_string(spec['collector'])() or {}
+        except Exception:
+            current_app.logger.exception(
+                "Metrics collector %s failed.", spec['collector'])
+            continue
+        families = flatten(
+            data, spec['name'], labels=spec.get('labels'),
+            sample_labels=dict(pid=pid) if spec.get('per_process') else None,
+        )
+        for name in sorted(families):
+            lines.extend(format_metric(
+                name, 'Value of {0}.'.format(spec['collector']), 'gauge',
+                families[name]))
+    return lines
+
+
+def render_usage(usages):
+    """Format resource usage values.
+
+    :param usages: Iterable of ``(object_type, object_id, metric, value)``.
+    """
+    return format_metric(
+        'zenodo_resource_usage', 'Latest value of resource usage metrics.',
+        'gauge', [
+            ('zenodo_resource_usage',
+             dict(object_type=object_type, object_id=object_id,
+                  metric=metric),
+             value)
+            for object_type, object_id, metric, value in usages
+        ])
+
+
+def get_usage_lines():
+    """Get the formatted resource usage values (cached)."""
+    lines = cache.get(USAGE_KEY)
+    if lines is None:
+        lines = render_usage(db.session.query(
+            ResourceUsage.object_type, ResourceUsage.object_id,
+            ResourceUsage.metric, ResourceUsage.value,
+        ).order_by(ResourceUsage.object_type, ResourceUsage.object_id,
+                   ResourceUsage.metric))
+        cache.set(USAGE_KEY, lines,
+                  timeout=cfg['QUOTAS_EXPOSITION_CACHE_TIMEOUT'])
+    return lines
+
+
+def render():
+    """Format all metrics."""
+    return u'\n'.join(
+        get_usage_lines() + render_collectors() + render_registry()) + u'\n'
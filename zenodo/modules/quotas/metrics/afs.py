@@ -17,29 +17,87 @@
 # along with Invenio; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 
-"""AFS volume usage metrics."""
+"""AFS volume usage metrics.
+
+The quota of every subdirectory of :data:`QUOTAS_AFSMETRIC_DIRECTORIES` is
+probed with ``fs listquota`` in a pool of threads, each probe being killed
+after :data:`QUOTAS_AFSMETRIC_TIMEOUT` seconds. Directories are listed and
+checked in the pool as well, and calls hanging on an unresponsive server are
+given up. The volume of each directory is cached, so that a volume shared by
+several directories is only probed once. Failed probes only report their
+latency.
+"""
 
 from __future__ import absolute_import
 
 import os
 import os.path
 import re
+import signal
+import subprocess
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from flask import current_app
 
 from invenio.base.globals import cfg
-from invenio.utils.shell import run_shell_command
+from invenio.ext.cache import cache
 
 from ..models import Metric
 
+VOLUME_KEY = "quotas::afs::volume::{0}"
+
+
+def run_command(args, timeout=None):
+    """Run a command and kill it after ``timeout`` seconds.
+
+    The command runs in its own process group, so that its children are
+    killed as well.
+
+    :returns: Tuple ``(return code, stdout, stderr)``. The return code is
+        negative if the command was killed.
+    """
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, preexec_fn=os.setsid)
+
+    def kill():
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        output, err = proc.communicate()
+    finally:
+        if timer:
+            timer.cancel()
+    return proc.returncode, output, err
+
 
 class AFSVolumeMetric(Metric):
 
-    """Compute AFS volume usage metrics."""
+    """Compute AFS volume usage metrics.
+
+    Reports the used percentage of each volume (``usage``) and the time in
+    milliseconds it took to probe it (``latency``). Failed probes only
+    report their latency, under the volume last seen for the directory (or
+    the directory itself).
+    """
 
     PATTERN = re.compile("([a-z0-9\.]+)\s+(\d+)\s+(\d+)\s+(\d+)%\s+(\d+)%")
 
     metric_class = "afs"
     object_type = "AFS Volume"
 
+    runner = staticmethod(run_command)
+    """Callable running a command, with the signature of
+    :func:`run_command`."""
+
     @classmethod
     def _parse_output(cls, output):
         s = cls.PATTERN.match(output.splitlines()[-1])
@@ -53,27 +111,146 @@ class AFSVolumeMetric(Metric):
         return None
 
     @classmethod
-    def _list_quota(cls, directory):
-        if not os.path.isdir(directory):
+    def _list_quota(cls, directory, command='fs', timeout=None):
+        try:
+            (ret, output, err) = cls.runner(
+                [command, "listquota", directory], timeout=timeout)
+        except OSError:
             return None
 
-        (ret, output, err) = run_shell_command(
-            "fs listquota {}".format(directory))
-
-        if ret == 0:
+        if ret == 0 and output.strip():
             return cls._parse_output(output)
         return None
 
+    @classmethod
+    def _probe_directory(cls, directory, command='fs', timeout=None):
+        """Probe a directory (``False`` if it is not a directory)."""
+        path = os.path.realpath(directory)
+        if not os.path.isdir(path):
+            return False
+        return cls._list_quota(path, command=command, timeout=timeout)
+
+    @staticmethod
+    def _list_subdirectories(directory):
+        """List the entries of a directory (``False`` if it is missing)."""
+        if not os.path.isdir(directory):
+            return False
+        return [os.path.join(directory, name)
+                for name in sorted(os.listdir(directory))]
+
+    @classmethod
+    def _map(cls, fun, items):
+        """Call a function on items in a pool of threads.
+
+        Each call is given up :data:`QUOTAS_AFSMETRIC_TIMEOUT` seconds after
+        it started (once all threads are busy, waiting calls are given up
+        after the calls ahead of them), and its thread is left behind.
+
+        :returns: Dictionary ``{item: (result, seconds)}`` where the result
+            is ``None`` if the call failed or was given up, and the seconds
+            are ``None`` if the call did not start.
+        """
+        if not items:
+            return {}
+        timeout = cfg['QUOTAS_AFSMETRIC_TIMEOUT']
+        processes = min(cfg['QUOTAS_AFSMETRIC_PROCESSES'], len(items))
+        started = {}
+
+        def _call(item):
+            started[item] = time.time()
+            try:
+                return fun(item), time.time() - started[item]
+            except (IOError, OSError):
+                return None, time.time() - started[item]
+
+        pool = ThreadPool(processes)
+        results, hung = {}, False
+        try:
+            pending = [(item, pool.apply_async(_call, (item, )))
+                       for item in items]
+            # Calls ahead in the queue take at most the timeout each.
+            deadline = time.time() + timeout * (
+                (len(items) + processes - 1) // processes)
+            for item, res in pending:
+                try:
+                    results[item] = res.get(max(deadline - time.time(), 0))
+                except TimeoutError:
+                    hung = True
+                    start = started.get(item)
+                    results[item] = (
+                        None, time.time() - start if start else None)
+        finally:
+            pool.close()
+            if not hung:
+                pool.join()
+        return results
+
+    @classmethod
+    def get_directories(cls):
+        """Get the directories to probe (not checked to be directories)."""
+        roots = [os.path.join(cfg['CFG_PREFIX'], d)
+                 for d in cfg.get("QUOTAS_AFSMETRIC_DIRECTORIES", [])]
+        listings = cls._map(cls._list_subdirectories, roots)
+        directories = []
+        for root in roots:
+            subdirs = listings[root][0]
+            if subdirs is None:
+                current_app.logger.warning(
+                    "AFS directory listing failed for %s", root)
+            for path in subdirs or []:
+                if path not in directories:
+                    directories.append(path)
+        return directories
+
+    @classmethod
+    def probe(cls, directories):
+        """Probe the quota of directories concurrently.
+
+        :returns: Dictionary ``{directory: (quota, seconds)}``, where the
+            quota is ``None`` if the probe failed or timed out, and ``False``
+            if the path is not a directory.
+        """
+        command = cfg['QUOTAS_AFSMETRIC_COMMAND']
+        timeout = cfg['QUOTAS_AFSMETRIC_TIMEOUT']
+        return cls._map(
+            lambda d: cls._probe_directory(d, command=command,
+                                           timeout=timeout),
+            directories
+        )
+
     @classmethod
     def all(cls):
-        """Compute used space per user."""
-        data = dict()
+        """Compute used space per volume."""
+        directories = cls.get_directories()
+        keys = [VOLUME_KEY.format(d) for d in directories]
+        volumes = dict(zip(directories, cache.get_many(*keys))) \
+            if keys else {}
+
+        # Probe one directory per known volume, and all unknown ones.
+        targets, seen = [], set()
+        for d in directories:
+            if volumes[d] is None or volumes[d] not in seen:
+                targets.append(d)
+                seen.add(volumes[d])
 
-        for d in cfg.get("QUOTAS_AFSMETRIC_DIRECTORIES", []):
-            for subdir in os.listdir(os.path.join(cfg['CFG_PREFIX'], d)):
-                quota = cls._list_quota(os.path.join(
-                    cfg['CFG_PREFIX'], d, subdir))
-                if quota:
-                    data[quota['volume']] = dict(usage=quota['used_percent'])
+        data = dict()
+        for d, (quota, latency) in cls.probe(targets).items():
+            if quota is False:
+                continue
+            if quota is None:
+                current_app.logger.warning(
+                    "AFS quota probe failed for %s", d)
+                # Probe the other directories of the volume next time.
+                cache.delete(VOLUME_KEY.format(d))
+                if latency is not None:
+                    data.setdefault(volumes[d] or d, {})['latency'] = \
+                        int(latency * 1000)
+                continue
+            cache.set(VOLUME_KEY.format(d), quota['volume'],
+                      timeout=cfg['QUOTAS_AFSMETRIC_CACHE_TIMEOUT'])
+            data[quota['volume']] = dict(
+                usage=quota['used_percent'],
+                latency=int(latency * 1000),
+            )
 
         return data.items()
@@ -17,13 +17,31 @@
 # along with Invenio; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 
-"""Deposit disk usage metrics per user."""
+"""Deposit metric maintained from file uploads.
+
+The file storage of each user is kept in
+:class:`~zenodo.modules.quotas.models.DepositUsage`. Uploads increment the
+counters right away (:func:`file_uploaded_receiver`), while removed files
+and deleted depositions are taken into account by :func:`reconcile`, which
+only loads the depositions modified since its previous run and recomputes
+the counters with an aggregate query. The number of depositions is counted
+with an aggregate query as well.
+"""
 
 from __future__ import absolute_import
 
-from invenio.modules.deposit.models import Deposition
+from datetime import datetime
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from invenio.base.globals import cfg
+from invenio.ext.cache import cache
+from invenio.ext.sqlalchemy import db
+from invenio.utils.text import nice_size
 
-from ..models import Metric
+from ..models import DepositFileUsage, DepositUsage, Metric
+
+RECONCILED_KEY = "quotas::deposit::reconciled"
 
 
 class DepositMetric(Metric):
@@ -35,18 +53,192 @@ class DepositMetric(Metric):
 
     @classmethod
     def all(cls):
-        """Compute deposit metrics per user."""
-        data = dict()
+        """Get deposit metrics per user."""
+        data = dict(
+            (id_user, dict(num=num, size=0))
+            for id_user, num in count_depositions()
+        )
+        for id_user, size in db.session.query(
+                DepositUsage.id_user, DepositUsage.size):
+            data.setdefault(id_user, dict(num=0))['size'] = size
+        return [(str(id_user), d) for id_user, d in data.items()]
+
+
+def get_quota(id_user):
+    """Get the file storage quota of a user in bytes (or None)."""
+    return cfg['QUOTAS_DEPOSIT_USER_QUOTAS'].get(
+        id_user, cfg['QUOTAS_DEPOSIT_USER_QUOTA'])
+
+
+def get_usage(id_user):
+    """Get the deposit usage of a user (or None)."""
+    return DepositUsage.query.get(id_user)
+
+
+def _increment(id_user, files, size):
+    """Increment the counters of a user with one statement."""
+    t = DepositUsage.__table__
+    res = db.session.execute(t.update().where(t.c.id_user == id_user).values(
+        files=t.c.files + files,
+        size=t.c.size + size,
+        modified=datetime.now(),
+    ))
+    if res.rowcount == 0:
+        db.session.execute(t.insert().values(
+            id_user=id_user, files=files, size=size, modified=datetime.now(),
+        ))
+
+
+def track_upload(id_user, id_deposition, uuid, size):
+    """Count an uploaded file.
+
+    :returns: ``False`` if the file was already counted.
+    """
+    if DepositFileUsage.query.get((id_deposition, uuid)) is not None:
+        return False
+    db.session.add(DepositFileUsage(
+        id_deposition=id_deposition, uuid=uuid, id_user=id_user, size=size))
+    _increment(id_user, 1, size)
+    db.session.commit()
+    return True
+
+
+def untrack_upload(id_deposition, uuid):
+    """Stop counting an uploaded file."""
+    f = DepositFileUsage.query.get((id_deposition, uuid))
+    if f is None:
+        return
+    db.session.delete(f)
+    _increment(f.id_user, -1, -f.size)
+    db.session.commit()
+
+
+def file_uploaded_receiver(sender, deposition=None, deposition_file=None,
+                           **kwargs):
+    """Count an uploaded file and enforce the user storage quota.
 
-        for d in Deposition.get_depositions():
-            if str(d.user_id) not in data:
-                data[str(d.user_id)] = dict(num=0, size=0)
+    Files exceeding the quota are removed again from the deposition.
+    """
+    if deposition is None or deposition_file is None or \
+            deposition.get_file(deposition_file.uuid) is None:
+        # Upload of a chunk.
+        return
 
-            # Count number of deposits
-            data[str(d.user_id)]['num'] += 1
+    id_user = deposition.user_id
+    if not track_upload(id_user, deposition.id, deposition_file.uuid,
+                        deposition_file.size):
+        return
 
-            # Collected file sizes
+    quota = get_quota(id_user)
+    usage = get_usage(id_user)
+    if quota is not None and usage is not None and usage.size > quota:
+        untrack_upload(deposition.id, deposition_file.uuid)
+        deposition.remove_file(deposition_file.uuid)
+        deposition.save()
+        raise RequestEntityTooLarge(
+            "Your depositions exceed your storage quota of %s."
+            % nice_size(quota))
+
+
+def store_counters(counters, modified=None):
+    """Overwrite the counters of users without removing any row first.
+
+    Counters are upserted, so that concurrent uploads always find the row of
+    their user. Users missing from ``counters`` are reset to zero.
+
+    :param counters: Dictionary ``{id_user: (files, size)}``.
+    """
+    # Whole seconds, as stored in the table.
+    modified = modified or datetime.now().replace(microsecond=0)
+    t = DepositUsage.__table__
+    if counters:
+        db.session.execute(
+            db.text(
+                "INSERT INTO quotaDEPOSITUSAGE "
+                "(id_user, files, size, modified) "
+                "VALUES (:id_user, :files, :size, :modified) "
+                "ON DUPLICATE KEY UPDATE files=VALUES(files), "
+                "size=VALUES(size), modified=VALUES(modified)"
+            ).bindparams(db.bindparam('modified', type_=t.c.modified.type)),
+            [dict(id_user=id_user, files=files, size=size, modified=modified)
+             for id_user, (files, size) in counters.items()]
+        )
+    # Rows which were neither upserted nor incremented meanwhile.
+    db.session.execute(t.update().where(t.c.modified < modified).values(
+        files=0, size=0, modified=modified))
+    db.session.commit()
+
+
+def _deposition_objects():
+    """Query the workflow objects of depositions."""
+    from invenio.modules.workflows.models import BibWorkflowObject, Workflow
+    return BibWorkflowObject.query.join("workflow").filter(
+        Workflow.module_name == 'webdeposit',
+        BibWorkflowObject.id_user != 0,
+    )
+
+
+def count_depositions():
+    """Count the depositions of each user with one query.
+
+    :returns: Iterable of ``(id_user, number of depositions)``.
+    """
+    from invenio.modules.workflows.models import BibWorkflowObject
+    return _deposition_objects().with_entities(
+        BibWorkflowObject.id_user, db.func.count(BibWorkflowObject.id)
+    ).group_by(BibWorkflowObject.id_user)
+
+
+def reconcile(full=False):
+    """Recompute the counters of all users.
+
+    Only the files of depositions modified since the previous run (or all
+    with ``full``) are reloaded.
+
+    :returns: Number of reloaded depositions.
+    """
+    from invenio.modules.deposit.models import Deposition, \
+        InvalidDepositionType
+    from invenio.modules.workflows.models import BibWorkflowObject
+
+    started = datetime.now()
+    since = None if full else cache.get(RECONCILED_KEY)
+
+    # Reload files of modified depositions, 100 at a time.
+    query = _deposition_objects().with_entities(BibWorkflowObject.id)
+    if since is not None:
+        query = query.filter(BibWorkflowObject.modified >= since)
+    ids = [id_ for (id_, ) in query]
+    for i in range(0, len(ids), 100):
+        chunk = ids[i:i + 100]
+        DepositFileUsage.query.filter(
+            DepositFileUsage.id_deposition.in_(chunk)
+        ).delete(synchronize_session=False)
+        for o in BibWorkflowObject.query.filter(
+                BibWorkflowObject.id.in_(chunk)):
+            try:
+                d = Deposition(o)
+            except InvalidDepositionType:
+                continue
             for f in d.files:
-                data[str(d.user_id)]['size'] += f.size
+                db.session.add(DepositFileUsage(
+                    id_deposition=o.id, uuid=f.uuid, id_user=o.id_user,
+                    size=f.size or 0))
+        db.session.commit()
+
+    # Forget files of deleted depositions.
+    DepositFileUsage.query.filter(~DepositFileUsage.id_deposition.in_(
+        _deposition_objects().with_entities(BibWorkflowObject.id)
+    )).delete(synchronize_session=False)
+
+    # Recompute counters.
+    store_counters(dict(
+        (id_user, (files, int(size or 0)))
+        for id_user, files, size in db.session.query(
+            DepositFileUsage.id_user, db.func.count(DepositFileUsage.uuid),
+            db.func.sum(DepositFileUsage.size),
+        ).group_by(DepositFileUsage.id_user)
+    ))
 
-        return data.items()
+    cache.set(RECONCILED_KEY, started, timeout=0)
+    return len(ids)
@@ -29,7 +29,7 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from invenio.ext.sqlalchemy import db
 
-from .signals import resource_usage_updated
+from .signals import resource_usage_bulk_updated, resource_usage_updated
 
 
 class Metric(object):
@@ -64,7 +64,8 @@ class ResourceUsage(db.Model):
 
     """Usage of a specific.
 
-    Note: Model is not suitable to store metrics with high granularity.
+    Note: Model is not suitable to store metrics with high granularity. The
+    history of values is stored in :class:`ResourceUsageSample`.
     """
 
     __tablename__ = 'quotaUSAGE'
@@ -132,6 +133,96 @@ class ResourceUsage(db.Model):
             )
         return m
 
+    @classmethod
+    def get_values(cls, object_type, metric_class):
+        """Get all values of a metric class with one query.
+
+        :returns: Dictionary ``{(object_id, metric): (id, value)}``.
+        """
+        return dict(
+            ((object_id, metric), (id_, value))
+            for id_, object_id, metric, value in db.session.query(
+                cls.id, cls.object_id, cls.metric, cls.value
+            ).filter(
+                cls.object_type == object_type,
+                cls.metric.like(metric_class + '.%'),
+            )
+        )
+
+    @classmethod
+    def bulk_update(cls, object_type, metric_class, values,
+                    batch_signal=False):
+        """Update or create many values of a metric class at once.
+
+        Existing values are loaded with one query, and only new and changed
+        values are written, with one statement for all inserts and one for
+        all updates in a single transaction. Signals are only sent for
+        changed values, either one per value or, with ``batch_signal``, one
+        for all values.
+
+        :param values: Dictionary ``{(object_id, metric): value}``.
+        :returns: Tuple of a dictionary with the number of ``inserted``,
+            ``updated`` and ``unchanged`` values, and the identifiers of the
+            stored values ``{(object_id, metric): id}`` (new ones included).
+        """
+        existing = cls.get_values(object_type, metric_class)
+        now = datetime.now()
+        inserts, updates, changes = [], [], []
+
+        for (object_id, metric), value in values.items():
+            old = existing.get((object_id, metric))
+            if old is None:
+                inserts.append(dict(
+                    object_type=object_type, object_id=object_id,
+                    metric=metric, value=value, modified=now,
+                ))
+                changes.append((object_id, metric, value, None))
+            elif old[1] != value:
+                updates.append(dict(_id=old[0], _value=value, _modified=now))
+                changes.append((object_id, metric, value, old[1]))
+
+        ids = dict((key, old[0]) for key, old in existing.items())
+        table = cls.__table__
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+            # Identifiers of new values (only read when there are some).
+            new = set((i['object_id'], i['metric']) for i in inserts)
+            ids.update(
+                (key, old[0]) for key, old in
+                cls.get_values(object_type, metric_class).items()
+                if key in new)
+        if updates:
+            db.session.execute(
+                table.update().where(
+                    table.c.id == db.bindparam('_id')
+                ).values(
+                    value=db.bindparam('_value'),
+                    modified=db.bindparam('_modified'),
+                ),
+                updates
+            )
+        db.session.commit()
+
+        if batch_signal:
+            if changes:
+                resource_usage_bulk_updated.send(
+                    metric_class, object_type=object_type, changes=changes)
+        else:
+            for object_id, metric, value, old_value in changes:
+                resource_usage_updated.send(
+                    metric,
+                    object_type=object_type,
+                    object_id=object_id,
+                    value=value,
+                    old_value=old_value
+                )
+
+        return dict(
+            inserted=len(inserts),
+            updated=len(updates),
+            unchanged=len(values) - len(inserts) - len(updates),
+        ), ids
+
     @classmethod
     def get(cls, object_type, object_id, metric):
         """Get specific metric."""
@@ -143,3 +234,93 @@ class ResourceUsage(db.Model):
             ).one()
         except NoResultFound:
             return None
+
+
+class ResourceUsageSample(db.Model):
+
+    """Sample or roll-up of the values of a resource usage metric.
+
+    Raw samples have resolution 0 and a count of 1. Roll-ups aggregate the
+    samples of a bucket of ``resolution`` seconds starting at ``timestamp``.
+    """
+
+    __tablename__ = 'quotaSAMPLE'
+
+    __table_args__ = (
+        db.Index('ix_quotaSAMPLE_resolution_timestamp', 'resolution',
+                 'timestamp'),
+        db.Model.__table_args__
+    )
+
+    id_usage = db.Column(db.Integer(15, unsigned=True),
+                         db.ForeignKey(ResourceUsage.id), nullable=False,
+                         primary_key=True, autoincrement=False)
+    """Resource usage metric of the sample."""
+
+    resolution = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                           primary_key=True, autoincrement=False)
+    """Bucket size in seconds (0 for raw samples)."""
+
+    timestamp = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                          primary_key=True, autoincrement=False)
+    """Start of the bucket in seconds since the epoch."""
+
+    count = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                      default=1)
+    """Number of raw samples in the bucket."""
+
+    total = db.Column(db.BigInteger(), nullable=False)
+    """Sum of the raw samples in the bucket."""
+
+    minimum = db.Column(db.BigInteger(), nullable=False)
+    """Minimum of the raw samples in the bucket."""
+
+    maximum = db.Column(db.BigInteger(), nullable=False)
+    """Maximum of the raw samples in the bucket."""
+
+
+class DepositUsage(db.Model):
+
+    """File storage of the depositions of a user.
+
+    Incremented on file uploads and reconciled periodically (see
+    :mod:`.metrics.deposit`).
+    """
+
+    __tablename__ = 'quotaDEPOSITUSAGE'
+
+    id_user = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                        primary_key=True, autoincrement=False)
+    """User."""
+
+    files = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                      default=0)
+    """Number of files."""
+
+    size = db.Column(db.BigInteger(), nullable=False, default=0)
+    """Total size of files in bytes."""
+
+    modified = db.Column(db.DateTime, nullable=False, default=datetime.now,
+                         onupdate=datetime.now)
+    """Modification timestamp."""
+
+
+class DepositFileUsage(db.Model):
+
+    """Size of a file of a deposition."""
+
+    __tablename__ = 'quotaDEPOSITFILE'
+
+    id_deposition = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                              primary_key=True, autoincrement=False)
+    """Deposition (workflow object)."""
+
+    uuid = db.Column(db.String(36), nullable=False, primary_key=True)
+    """Deposition file."""
+
+    id_user = db.Column(db.Integer(15, unsigned=True), nullable=False,
+                        index=True)
+    """Owner of the deposition."""
+
+    size = db.Column(db.BigInteger(), nullable=False, default=0)
+    """Size of the file in bytes."""
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Publisher writing metrics to a local file."""
+
+from __future__ import absolute_import
+
+import os
+
+from flask import current_app
+
+from ..exposition import render_usage
+from ..models import Publisher
+
+
+class FilePublisher(Publisher):
+
+    """Metrics publisher writing to a local file, e.g. for offline testing.
+
+    The file is written in the Prometheus text format to
+    ``QUOTAS_FILE_PUBLISHER_PATH``.
+    """
+
+    @classmethod
+    def publish(cls, metrics):
+        """Write metrics to a file."""
+        path = current_app.config.get('QUOTAS_FILE_PUBLISHER_PATH')
+        if path is None:
+            raise RuntimeError("QUOTAS_FILE_PUBLISHER_PATH must be set.")
+
+        lines = render_usage(
+            (obj.object_type, obj.object_id, obj.metric, obj.value)
+            for obj in metrics
+        )
+        # Write atomically, so readers never see a partial file.
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write((u'\n'.join(lines) + u'\n').encode('utf8'))
+        os.rename(tmp_path, path)
@@ -28,3 +28,10 @@ _signals = Namespace()
 
 resource_usage_updated = _signals.signal('resource-usage-updated')
 """Signal sent when a resource usage metric has been updated."""
+
+resource_usage_bulk_updated = _signals.signal('resource-usage-bulk-updated')
+"""Signal sent once for all changed values of a metric class collection.
+
+Sent with the metric class name as sender, and ``object_type`` and
+``changes``, a list of ``(object_id, metric, value, old_value)``.
+"""
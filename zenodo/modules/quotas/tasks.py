@@ -27,6 +27,8 @@ from werkzeug.utils import import_string
 
 from invenio.celery import celery
 
+from . import timeseries
+from .api import collect
 from .models import Metric, Publisher, ResourceUsage
 
 
@@ -54,14 +56,7 @@ def collect_metric(metric_import_path):
     if not issubclass(metric_class, Metric):
         raise Exception("Invalid metric class: {0}".format(metric_import_path))
 
-    for obj_id, data in metric_class.all():
-        for name, val in data.items():
-            ResourceUsage.update_or_create(
-                metric_class.object_type,
-                obj_id,
-                metric_class.get_id(name),
-                val,
-            )
+    collect(metric_class)
 
 
 @celery.task(ignore_result=True)
@@ -107,3 +102,47 @@ def publish_metrics(publisher_import_path):
     publisher_class.publish(iter_metrics(
         current_app.config.get('QUOTAS_PUBLISH_METRICS', [])
     ))
+
+
+@celery.task(ignore_result=True)
+def rollup_timeseries():
+    """Roll up and purge the time series of the metrics.
+
+    Use by adding this task to your CELERYBEAT_SCHEDULE
+
+    .. code-block:: python
+       CELERYBEAT_SCHEDULE = {
+            # Every 5 minutes
+            'metrics-rollup': dict(
+                task='zenodo.modules.quotas.tasks.rollup_timeseries',
+                schedule=crontab(minute='*/5'),
+            ),
+            # ...
+        }
+
+
+    """
+    timeseries.rollup()
+    timeseries.purge()
+
+
+@celery.task(ignore_result=True)
+def reconcile_deposit_usage(full=False):
+    """Reconcile the file storage counters of the deposit metric.
+
+    Use by adding this task to your CELERYBEAT_SCHEDULE
+
+    .. code-block:: python
+       CELERYBEAT_SCHEDULE = {
+            # Every hour
+            'metrics-deposit-reconcile': dict(
+                task='zenodo.modules.quotas.tasks.reconcile_deposit_usage',
+                schedule=crontab(minute=30),
+            ),
+            # ...
+        }
+
+
+    """
+    from .metrics.deposit import reconcile
+    reconcile(full=full)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test AFS volume metric."""
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+FAKE_FS = """#!/bin/sh
+echo "$2" >> "{log}"
+name=$(basename "$2")
+case "$name" in
+    slow) sleep 10 ;;
+    broken) echo "fs: You don't have the required access rights" >&2
+            exit 1 ;;
+    shared*) name=shared ;;
+esac
+echo "Volume Name                    Quota       Used %Used   Partition"
+echo "$name.vol                     1000000     250000   25%         40%"
+"""
+
+
+class AFSVolumeMetricTestCase(InvenioTestCase):
+
+    """Test probing AFS volumes with a fake fs command."""
+
+    def setUp(self):
+        from invenio.ext.cache import cache
+        from zenodo.modules.quotas.metrics.afs import VOLUME_KEY
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, 'calls.log')
+        command = os.path.join(self.tmp_dir, 'fs')
+        with open(command, 'w') as f:
+            f.write(FAKE_FS.format(log=self.log))
+        os.chmod(command, stat.S_IRWXU)
+
+        deposit = os.path.join(self.tmp_dir, 'deposit')
+        files = os.path.join(self.tmp_dir, 'files')
+        for d in ['a', 'shared1', 'slow', 'broken']:
+            os.makedirs(os.path.join(deposit, d))
+        for d in ['b', 'shared2']:
+            os.makedirs(os.path.join(files, d))
+        open(os.path.join(files, 'notadir'), 'w').close()
+
+        self.app.config.update(
+            QUOTAS_AFSMETRIC_DIRECTORIES=[deposit, files],
+            QUOTAS_AFSMETRIC_COMMAND=command,
+            QUOTAS_AFSMETRIC_PROCESSES=4,
+            QUOTAS_AFSMETRIC_TIMEOUT=1,
+        )
+        for d in ['a', 'shared1', 'slow', 'broken']:
+            cache.delete(VOLUME_KEY.format(os.path.join(deposit, d)))
+        for d in ['b', 'shared2']:
+            cache.delete(VOLUME_KEY.format(os.path.join(files, d)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _calls(self):
+        with open(self.log) as f:
+            calls = [os.path.basename(l.strip()) for l in f]
+        os.remove(self.log)
+        return sorted(calls)
+
+    def test_all(self):
+        """Failed and slow probes only report their latency."""
+        from zenodo.modules.quotas.metrics.afs import AFSVolumeMetric
+
+        start = time.time()
+        data = dict(AFSVolumeMetric.all())
+        self.assertTrue(time.time() - start < 5)
+
+        self.assertEqual(sorted(k for k, v in data.items() if 'usage' in v),
+                         ['a.vol', 'b.vol', 'shared.vol'])
+        self.assertEqual(data['a.vol']['usage'], '25')
+        self.assertTrue(data['a.vol']['latency'] >= 0)
+        # Failed and slow probes report their latency only.
+        slow = [v for k, v in data.items() if k.endswith('slow')]
+        self.assertEqual(len(slow), 1)
+        self.assertTrue(slow[0]['latency'] >= 900)
+        self.assertEqual(len(data), 5)
+        self.assertEqual(self._calls(), [
+            'a', 'b', 'broken', 'shared1', 'shared2', 'slow'])
+
+        # Shared volume is only probed once.
+        data = dict(AFSVolumeMetric.all())
+        self.assertEqual(sorted(k for k, v in data.items() if 'usage' in v),
+                         ['a.vol', 'b.vol', 'shared.vol'])
+        self.assertEqual(self._calls(), [
+            'a', 'b', 'broken', 'shared1', 'slow'])
+
+    def test_runner(self):
+        """The command runner can be replaced."""
+        from zenodo.modules.quotas.metrics.afs import AFSVolumeMetric
+
+        def runner(args, timeout=None):
+            if args[-1].endswith('a'):
+                return 0, "Volume Name  Quota  Used %Used Partition\n" \
+                    "x.vol  10  5  50%  1%", ""
+            return 1, "", "error"
+
+        orig = AFSVolumeMetric.runner
+        AFSVolumeMetric.runner = staticmethod(runner)
+        try:
+            data = dict(AFSVolumeMetric.all())
+        finally:
+            AFSVolumeMetric.runner = orig
+        self.assertEqual([k for k, v in data.items() if 'usage' in v],
+                         ['x.vol'])
+        self.assertEqual(data['x.vol']['usage'], '50')
+
+    def test_hung_directory(self):
+        """Directory checks hanging on the file system are given up."""
+        from mock import patch
+        from zenodo.modules.quotas.metrics.afs import AFSVolumeMetric
+
+        isdir = os.path.isdir
+        release = threading.Event()
+
+        def hanging_isdir(path):
+            if os.path.basename(path) == 'a':
+                release.wait(10)
+            return isdir(path)
+
+        start = time.time()
+        with patch('os.path.isdir', hanging_isdir):
+            try:
+                data = dict(AFSVolumeMetric.all())
+            finally:
+                release.set()
+        self.assertTrue(time.time() - start < 5)
+        self.assertFalse('a.vol' in data)
+        hung = [v for k, v in data.items() if k.endswith('/a')]
+        self.assertEqual(len(hung), 1)
+        self.assertTrue(hung[0]['latency'] >= 900)
+        self.assertEqual(data['b.vol']['usage'], '25')
+
+
+TEST_SUITE = make_test_suite(AFSVolumeMetricTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test bulk collection of metrics."""
+
+from __future__ import absolute_import
+
+from invenio.ext.sqlalchemy import db
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class CollectTestCase(InvenioTestCase):
+
+    """Test collection of metric values."""
+
+    def setUp(self):
+        from zenodo.modules.quotas.models import Metric
+        self.tearDown()
+
+        class TestMetric(Metric):
+            metric_class = "testmetric"
+            object_type = "Test"
+            data = {}
+
+            @classmethod
+            def all(cls):
+                return cls.data.items()
+
+        self.metric = TestMetric
+        self.signals = []
+        self.batches = []
+
+    def tearDown(self):
+        from zenodo.modules.quotas.models import ResourceUsage, \
+            ResourceUsageSample
+        ResourceUsageSample.query.delete()
+        ResourceUsage.query.delete()
+        db.session.commit()
+
+    def _collect(self, data, batch_signal=False):
+        from zenodo.modules.quotas.api import collect
+        from zenodo.modules.quotas.signals import \
+            resource_usage_bulk_updated, resource_usage_updated
+
+        def on_update(sender, **kwargs):
+            self.signals.append((sender, kwargs['object_id'],
+                                 kwargs['value'], kwargs['old_value']))
+
+        def on_bulk_update(sender, **kwargs):
+            self.batches.append((sender, kwargs['changes']))
+
+        self.metric.data = data
+        with resource_usage_updated.connected_to(on_update):
+            with resource_usage_bulk_updated.connected_to(on_bulk_update):
+                return collect(self.metric, batch_signal=batch_signal)
+
+    def _values(self):
+        from zenodo.modules.quotas.models import ResourceUsage
+        return dict(
+            (k, v[1]) for k, v in ResourceUsage.get_values(
+                "Test", "testmetric").items()
+        )
+
+    def test_insert_update_unchanged(self):
+        """Only new and changed values are written and signalled."""
+        run = self._collect({'a': dict(num=1, size='10'), 'b': dict(num=2)})
+        self.assertEqual(run['inserted'], 3)
+        self.assertEqual(run['updated'], 0)
+        self.assertEqual(len(self.signals), 3)
+        self.assertEqual(self._values(), {
+            ('a', 'testmetric.num'): 1,
+            ('a', 'testmetric.size'): 10,
+            ('b', 'testmetric.num'): 2,
+        })
+
+        self.signals = []
+        run = self._collect({
+            'a': dict(num=1, size=20), 'b': dict(num=2), 'c': dict(num=3)
+        })
+        self.assertEqual(run['inserted'], 1)
+        self.assertEqual(run['updated'], 1)
+        self.assertEqual(run['unchanged'], 2)
+        self.assertEqual(sorted(self.signals), [
+            ('testmetric.num', 'c', 3, None),
+            ('testmetric.size', 'a', 20, 10),
+        ])
+        self.assertEqual(self._values()[('a', 'testmetric.size')], 20)
+
+        self.signals = []
+        run = self._collect({
+            'a': dict(num=1, size=20), 'b': dict(num=2), 'c': dict(num=3)
+        })
+        self.assertEqual(run['unchanged'], 4)
+        self.assertEqual(self.signals, [])
+
+    def test_batch_signal(self):
+        """One signal is sent for all changed values."""
+        self._collect({'a': dict(num=1), 'b': dict(num=2)}, batch_signal=True)
+        self._collect({'a': dict(num=1), 'b': dict(num=2)}, batch_signal=True)
+        self.assertEqual(self.signals, [])
+        self.assertEqual(len(self.batches), 1)
+        sender, changes = self.batches[0]
+        self.assertEqual(sender, "testmetric")
+        self.assertEqual(sorted(changes), [
+            ('a', 'testmetric.num', 1, None),
+            ('b', 'testmetric.num', 2, None),
+        ])
+
+    def test_timings(self):
+        """Timings of the last run are recorded per metric class."""
+        from zenodo.modules.quotas.api import get_collect_timings
+        self._collect({'a': dict(num=1)})
+        timings = get_collect_timings(self.metric)
+        self.assertEqual(timings['values'], 1)
+        self.assertEqual(timings['inserted'], 1)
+        for k in ['compute', 'store', 'total']:
+            self.assertTrue(timings[k] >= 0)
+
+
+TEST_SUITE = make_test_suite(CollectTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
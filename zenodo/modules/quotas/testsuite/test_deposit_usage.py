@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test deposit metric counters."""
+
+from __future__ import absolute_import
+
+from mock import patch
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from invenio.ext.sqlalchemy import db
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+class FakeFile(object):
+
+    """Deposition file."""
+
+    def __init__(self, uuid, size):
+        self.uuid = uuid
+        self.size = size
+
+
+class FakeDeposition(object):
+
+    """Deposition with files."""
+
+    def __init__(self, id, user_id):
+        self.id = id
+        self.user_id = user_id
+        self.files = []
+        self.saved = 0
+
+    def get_file(self, uuid):
+        for f in self.files:
+            if f.uuid == uuid:
+                return f
+        return None
+
+    def remove_file(self, uuid):
+        self.files = [f for f in self.files if f.uuid != uuid]
+
+    def save(self):
+        self.saved += 1
+
+
+class DepositUsageTestBase(InvenioTestCase):
+
+    """Helpers to upload files."""
+
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        from zenodo.modules.quotas.models import DepositFileUsage, \
+            DepositUsage
+        DepositFileUsage.query.delete()
+        DepositUsage.query.delete()
+        db.session.commit()
+
+    def _upload(self, d, uuid, size, chunk=False):
+        from zenodo.modules.quotas.metrics.deposit import \
+            file_uploaded_receiver
+        f = FakeFile(uuid, size)
+        if not chunk:
+            d.files.append(f)
+        file_uploaded_receiver('upload', deposition=d, deposition_file=f)
+
+    def _usage(self, id_user):
+        from zenodo.modules.quotas.metrics.deposit import get_usage
+        u = get_usage(id_user)
+        return (u.files, u.size) if u else None
+
+
+class DepositUsageTestCase(DepositUsageTestBase):
+
+    """Test incremental deposit usage counters."""
+
+    config = dict(
+        QUOTAS_DEPOSIT_USER_QUOTA=None,
+        QUOTAS_DEPOSIT_USER_QUOTAS={},
+    )
+
+    def test_track(self):
+        """Uploads are counted once and can be untracked."""
+        from zenodo.modules.quotas.metrics.deposit import track_upload, \
+            untrack_upload
+        self.assertTrue(track_upload(1, 10, 'a', 100))
+        self.assertFalse(track_upload(1, 10, 'a', 100))
+        self.assertTrue(track_upload(1, 11, 'b', 50))
+        self.assertTrue(track_upload(2, 12, 'c', 10))
+        self.assertEqual(self._usage(1), (2, 150))
+        self.assertEqual(self._usage(2), (1, 10))
+
+        untrack_upload(10, 'a')
+        untrack_upload(10, 'a')
+        self.assertEqual(self._usage(1), (1, 50))
+
+    def test_receiver(self):
+        """Only completed uploads are counted."""
+        d = FakeDeposition(10, 1)
+        self._upload(d, 'a', 5, chunk=True)
+        self.assertEqual(self._usage(1), None)
+        self._upload(d, 'a', 100)
+        self._upload(d, 'b', 20)
+        self.assertEqual(self._usage(1), (2, 120))
+
+    def test_metric(self):
+        """The metric combines deposition counts and file storage."""
+        from zenodo.modules.quotas.metrics.deposit import DepositMetric, \
+            track_upload
+        track_upload(1, 10, 'a', 100)
+        track_upload(3, 12, 'b', 10)
+        with patch('zenodo.modules.quotas.metrics.deposit.count_depositions',
+                   return_value=[(1, 2), (2, 1)]):
+            self.assertEqual(sorted(DepositMetric.all()), [
+                ('1', dict(num=2, size=100)),
+                ('2', dict(num=1, size=0)),
+                ('3', dict(num=0, size=10)),
+            ])
+
+    def test_store_counters(self):
+        """Counters are overwritten in place and missing users reset."""
+        from datetime import datetime, timedelta
+        from zenodo.modules.quotas.metrics.deposit import store_counters, \
+            track_upload
+        track_upload(1, 10, 'a', 100)
+        track_upload(2, 11, 'b', 10)
+        store_counters({1: (3, 300), 3: (1, 5)},
+                       modified=datetime.now().replace(microsecond=0) +
+                       timedelta(seconds=1))
+        self.assertEqual(self._usage(1), (3, 300))
+        self.assertEqual(self._usage(2), (0, 0))
+        self.assertEqual(self._usage(3), (1, 5))
+
+
+class DepositQuotaTestCase(DepositUsageTestBase):
+
+    """Test user storage quota."""
+
+    config = dict(
+        QUOTAS_DEPOSIT_USER_QUOTA=150,
+        QUOTAS_DEPOSIT_USER_QUOTAS={2: 1000},
+    )
+
+    def test_quota(self):
+        """Uploads exceeding the user quota are removed again."""
+        d = FakeDeposition(10, 1)
+        self._upload(d, 'a', 100)
+        self.assertRaises(RequestEntityTooLarge, self._upload, d, 'b', 100)
+        self.assertEqual([f.uuid for f in d.files], ['a'])
+        self.assertEqual(d.saved, 1)
+        self.assertEqual(self._usage(1), (1, 100))
+        self._upload(d, 'c', 50)
+        self.assertEqual(self._usage(1), (2, 150))
+
+        d = FakeDeposition(11, 2)
+        self._upload(d, 'a', 500)
+        self.assertEqual(self._usage(2), (1, 500))
+
+    def test_missing_usage(self):
+        """Uploads do not fail if the counters are being reconciled."""
+        d = FakeDeposition(12, 3)
+        with patch('zenodo.modules.quotas.metrics.deposit.get_usage',
+                   return_value=None):
+            self._upload(d, 'a', 500)
+        self.assertEqual([f.uuid for f in d.files], ['a'])
+
+
+TEST_SUITE = make_test_suite(DepositUsageTestCase, DepositQuotaTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
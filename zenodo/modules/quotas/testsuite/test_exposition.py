@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test metrics exposition."""
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+from flask import url_for
+
+from invenio.ext.sqlalchemy import db
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+
+def collector():
+    """Test metrics collector."""
+    return {'hits': 2, 'ok': True, 'name': 'x',
+            'steps': {'a-b': {'count': 1, 'max': 0.5}, 'c': {'count': 3}}}
+
+
+class ExpositionTestCase(InvenioTestCase):
+
+    """Test formatting and serving of metrics."""
+
+    config = dict(
+        QUOTAS_EXPOSITION_CACHE_TIMEOUT=60,
+        QUOTAS_EXPOSITION_ALLOWED_IPS=None,
+        QUOTAS_EXPOSITION_COLLECTORS=[dict(
+            name='test',
+            collector='zenodo.modules.quotas.testsuite.test_exposition:'
+                      'collector',
+            labels={'steps': 'step'}, per_process=True,
+        ), dict(name='broken', collector='zenodo.modules.quotas:missing')],
+    )
+
+    def setUp(self):
+        from invenio.ext.cache import cache
+        from zenodo.modules.quotas.exposition import USAGE_KEY
+        from zenodo.modules.quotas.models import ResourceUsage
+        self.tearDown()
+        cache.delete(USAGE_KEY)
+        ResourceUsage.bulk_update("Test", "expo", {
+            ('a"b', 'expo.num'): 3, ('c', 'expo.size'): 10,
+        })
+
+    def tearDown(self):
+        from zenodo.modules.quotas.models import ResourceUsage, \
+            ResourceUsageSample
+        ResourceUsageSample.query.delete()
+        ResourceUsage.query.delete()
+        db.session.commit()
+
+    def test_counter(self):
+        """Counters are summed per label set."""
+        from zenodo.modules.quotas.exposition import Counter, format_metric
+        c = Counter('test_total', 'Test counter.')
+        c.inc(kind='x')
+        c.inc(2, kind='x')
+        c.inc(kind='y')
+        self.assertEqual(format_metric(c.name, c.doc, c.type, c.samples()), [
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total{kind="x"} 3',
+            'test_total{kind="y"} 1',
+        ])
+
+    def test_histogram(self):
+        """Histogram buckets are cumulative."""
+        from zenodo.modules.quotas.exposition import Histogram, \
+            format_metric
+        h = Histogram('test_seconds', 'Test histogram.', buckets=(0.1, 1))
+        for v in [0.05, 0.5, 0.7, 3]:
+            h.observe(v)
+        self.assertEqual(format_metric(h.name, h.doc, h.type, h.samples()), [
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            'test_seconds_sum 4.25',
+            'test_seconds_count 4',
+        ])
+
+    def test_registry(self):
+        """Metrics are registered once per name."""
+        from zenodo.modules.quotas.exposition import counter, histogram
+        self.assertTrue(counter('test_registry_total', '') is
+                        counter('test_registry_total', ''))
+        self.assertRaises(ValueError, histogram, 'test_registry_total', '')
+
+    def test_usage(self):
+        """Resource usage values are escaped and cached."""
+        from zenodo.modules.quotas.exposition import get_usage_lines
+        from zenodo.modules.quotas.models import ResourceUsage
+        lines = get_usage_lines()
+        self.assertEqual(lines[2:], [
+            'zenodo_resource_usage{metric="expo.num",object_id="a\\"b",'
+            'object_type="Test"} 3',
+            'zenodo_resource_usage{metric="expo.size",object_id="c",'
+            'object_type="Test"} 10',
+        ])
+        ResourceUsage.bulk_update("Test", "expo", {('c', 'expo.size'): 20})
+        self.assertEqual(get_usage_lines(), lines)
+
+    def test_endpoint(self):
+        """Endpoint serves resource usage and request metrics."""
+        self.client.get(url_for('quotas.metrics'))
+        res = self.client.get(url_for('quotas.metrics'))
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        self.assertIn('object_id="c"', res.data)
+        self.assertIn('zenodo_http_requests_total{{method="GET",pid="{0}",'
+                      'status="200"}}'.format(os.getpid()), res.data)
+
+    def test_collectors(self):
+        """Collected dictionaries are flattened into labelled gauges."""
+        from zenodo.modules.quotas.exposition import render_collectors
+        pid = os.getpid()
+        self.assertEqual(render_collectors(), [
+            '# HELP test_hits Value of zenodo.modules.quotas.testsuite.'
+            'test_exposition:collector.',
+            '# TYPE test_hits gauge',
+            'test_hits{{pid="{0}"}} 2'.format(pid),
+            '# HELP test_steps_count Value of zenodo.modules.quotas.'
+            'testsuite.test_exposition:collector.',
+            '# TYPE test_steps_count gauge',
+            'test_steps_count{{pid="{0}",step="a-b"}} 1'.format(pid),
+            'test_steps_count{{pid="{0}",step="c"}} 3'.format(pid),
+            '# HELP test_steps_max Value of zenodo.modules.quotas.'
+            'testsuite.test_exposition:collector.',
+            '# TYPE test_steps_max gauge',
+            'test_steps_max{{pid="{0}",step="a-b"}} 0.5'.format(pid),
+        ])
+
+    def test_access(self):
+        """Endpoint needs an allowed client address or the token."""
+        self.app.config['QUOTAS_EXPOSITION_ALLOWED_IPS'] = ['10.0.0.1']
+        self.app.config['QUOTAS_EXPOSITION_TOKEN'] = 'secret'
+        url = url_for('quotas.metrics')
+        env = dict(REMOTE_ADDR='10.0.0.1')
+        forwarded = {'X-Forwarded-For': '10.0.0.1, 10.0.0.2'}
+        self.assertEqual(
+            self.client.get(url, environ_base=env).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(
+            url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(
+            url, headers={'Authorization': 'Bearer secret'}).status_code, 200)
+        # Requests forwarded by an unknown proxy are refused.
+        self.assertEqual(self.client.get(
+            url, environ_base=env, headers=forwarded).status_code, 403)
+        self.app.config['QUOTAS_EXPOSITION_PROXIES'] = 1
+        self.assertEqual(self.client.get(
+            url, headers=forwarded).status_code, 403)
+        self.app.config['QUOTAS_EXPOSITION_PROXIES'] = 2
+        self.assertEqual(self.client.get(
+            url, headers=forwarded).status_code, 200)
+
+    def test_file_publisher(self):
+        """Publisher writes metrics to a file."""
+        from zenodo.modules.quotas.models import ResourceUsage
+        from zenodo.modules.quotas.publishers.file import FilePublisher
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'metrics.prom')
+            self.app.config['QUOTAS_FILE_PUBLISHER_PATH'] = path
+            FilePublisher.publish([
+                ResourceUsage.get("Test", "c", "expo.size")])
+            with open(path) as f:
+                self.assertEqual(f.read().splitlines()[2:], [
+                    'zenodo_resource_usage{metric="expo.size",object_id="c",'
+                    'object_type="Test"} 10',
+                ])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+TEST_SUITE = make_test_suite(ExpositionTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Test time series of metrics."""
+
+from __future__ import absolute_import
+
+from invenio.ext.sqlalchemy import db
+from invenio.testsuite import InvenioTestCase, make_test_suite, \
+    run_test_suite
+
+DAY = 24 * 3600
+T0 = 1438300800  # 2015-07-31 00:00:00 UTC
+
+
+class TimeSeriesTestCase(InvenioTestCase):
+
+    """Test appending, rolling up and querying samples."""
+
+    config = dict(
+        QUOTAS_TIMESERIES_RESOLUTIONS=[
+            (0, 2 * DAY), (300, 14 * DAY), (3600, None),
+        ],
+        QUOTAS_TIMESERIES_MAX_POINTS=100,
+    )
+
+    def setUp(self):
+        from zenodo.modules.quotas.models import ResourceUsage
+        self.tearDown()
+        dummy, self.ids = ResourceUsage.bulk_update("Test", "ts", {
+            ('a', 'ts.num'): 0, ('b', 'ts.num'): 0,
+        })
+        self.id_a = ResourceUsage.get("Test", "a", "ts.num").id
+
+    def tearDown(self):
+        from zenodo.modules.quotas.models import ResourceUsage, \
+            ResourceUsageSample
+        ResourceUsageSample.query.delete()
+        ResourceUsage.query.delete()
+        db.session.commit()
+
+    def _append(self, timestamp, a, b=0):
+        from zenodo.modules.quotas.timeseries import append
+        return append("Test", "ts", {
+            ('a', 'ts.num'): a, ('b', 'ts.num'): b, ('c', 'ts.num'): 1,
+        }, timestamp=timestamp)
+
+    def test_bulk_update_ids(self):
+        """Identifiers of new and existing values are returned."""
+        from zenodo.modules.quotas.models import ResourceUsage
+        from zenodo.modules.quotas.timeseries import append
+        self.assertEqual(self.ids[('a', 'ts.num')], self.id_a)
+
+        run, ids = ResourceUsage.bulk_update("Test", "ts", {
+            ('a', 'ts.num'): 1, ('c', 'ts.num'): 1,
+        })
+        self.assertEqual((run['inserted'], run['updated']), (1, 1))
+        self.assertEqual(ids[('a', 'ts.num')], self.id_a)
+        self.assertEqual(ids[('c', 'ts.num')],
+                         ResourceUsage.get("Test", "c", "ts.num").id)
+        self.assertEqual(append("Test", "ts", {('c', 'ts.num'): 1},
+                                timestamp=T0, ids=ids), 1)
+
+    def test_append(self):
+        """Samples are only appended for stored metrics."""
+        from zenodo.modules.quotas.timeseries import get_series
+        self.assertEqual(self._append(T0, 5), 2)
+        self.assertEqual(self._append(T0 + 60, 6), 2)
+        # Same second again replaces the sample.
+        self.assertEqual(self._append(T0 + 60, 7), 2)
+        series = get_series(self.id_a, T0, T0 + 120, resolution=0)
+        self.assertEqual(list(series['timestamp']), [T0, T0 + 60])
+        self.assertEqual(list(series['mean']), [5.0, 7.0])
+        self.assertEqual(series['mean'].typecode, 'd')
+
+    def test_rollup(self):
+        """Closed buckets are rolled up once into each resolution."""
+        from zenodo.modules.quotas.timeseries import get_series, rollup
+        for i, v in enumerate([1, 2, 3, 10, 20]):
+            self._append(T0 + i * 120, v)
+
+        # Only the first 5-minute bucket is closed.
+        self.assertEqual(rollup(now=T0 + 400), {300: 2})
+        series = get_series(self.id_a, T0, T0 + 3600, resolution=300)
+        self.assertEqual(list(series['timestamp']), [T0])
+        self.assertEqual(list(series['count']), [3])
+        self.assertEqual(list(series['mean']), [2.0])
+
+        self.assertEqual(rollup(now=T0 + 3600), {300: 2, 3600: 2})
+        self.assertEqual(rollup(now=T0 + 3600), {})
+        series = get_series(self.id_a, T0, T0 + 3600, resolution=300)
+        self.assertEqual(list(series['timestamp']), [T0, T0 + 300])
+        self.assertEqual(list(series['minimum']), [1.0, 10.0])
+        self.assertEqual(list(series['maximum']), [3.0, 20.0])
+
+        series = get_series(self.id_a, T0, T0 + 3600, resolution=3600)
+        self.assertEqual(list(series['count']), [5])
+        self.assertEqual(list(series['mean']), [7.2])
+        self.assertEqual(list(series['minimum']), [1.0])
+        self.assertEqual(list(series['maximum']), [20.0])
+
+    def test_purge(self):
+        """Buckets older than their retention are deleted."""
+        from zenodo.modules.quotas.timeseries import get_series, purge, \
+            rollup
+        self._append(T0, 1)
+        self._append(T0 + DAY, 2)
+        rollup(now=T0 + 3 * DAY)
+        self.assertEqual(purge(now=T0 + 3 * DAY), 2)
+        series = get_series(self.id_a, T0, T0 + 3 * DAY, resolution=0)
+        self.assertEqual(list(series['timestamp']), [T0 + DAY])
+        series = get_series(self.id_a, T0, T0 + 3 * DAY, resolution=3600)
+        self.assertEqual(len(series['timestamp']), 2)
+
+    def test_resolution(self):
+        """The finest resolution covering the range is used."""
+        from zenodo.modules.quotas.timeseries import get_resolution
+        now = T0 + 30 * DAY
+        self.assertEqual(get_resolution(now - 3600, now, now=now), 0)
+        self.assertEqual(get_resolution(now - 3 * DAY, now, now=now), 3600)
+        start = now - 3 * DAY
+        self.assertEqual(
+            get_resolution(start, start + 6 * 3600, now=now), 300)
+        self.assertEqual(get_resolution(now - 20 * DAY, now, now=now), 3600)
+
+
+TEST_SUITE = make_test_suite(TimeSeriesTestCase)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Time series of resource usage metrics.
+
+Every collection appends one raw sample per value to
+:class:`~.models.ResourceUsageSample` with a single insert statement.
+:func:`rollup` aggregates closed buckets of each resolution into the next
+coarser one (e.g. raw samples into 5-minute buckets, 5-minute buckets into
+hourly buckets) with one ``GROUP BY`` query per resolution, and
+:func:`purge` deletes buckets older than their retention (see
+:data:`QUOTAS_TIMESERIES_RESOLUTIONS`).
+
+Range queries return ``array.array`` columns, which can be wrapped by
+NumPy without copying, e.g. ``numpy.frombuffer(series['mean'])``.
+"""
+
+from __future__ import absolute_import
+
+import time
+from array import array
+
+from sqlalchemy.exc import IntegrityError
+
+from invenio.base.globals import cfg
+from invenio.ext.sqlalchemy import db
+
+from .models import ResourceUsage, ResourceUsageSample
+
+
+def get_resolutions():
+    """Get the configured ``(resolution, retention)`` pairs."""
+    return sorted(cfg['QUOTAS_TIMESERIES_RESOLUTIONS'])
+
+
+def append(object_type, metric_class, values, timestamp=None, ids=None):
+    """Append a raw sample of collected values.
+
+    :param values: Dictionary ``{(object_id, metric): value}``.
+    :param timestamp: Time of the sample in seconds since the epoch.
+    :param ids: Identifiers of the resource usage values
+        ``{(object_id, metric): id}`` as returned by
+        :meth:`~.models.ResourceUsage.bulk_update` (queried if not given).
+    :returns: Number of appended samples.
+    """
+    timestamp = int(timestamp or time.time())
+    if ids is None:
+        ids = dict(
+            (key, usage[0]) for key, usage in
+            ResourceUsage.get_values(object_type, metric_class).items())
+    samples = [
+        dict(id_usage=ids[key], resolution=0, timestamp=timestamp,
+             count=1, total=value, minimum=value, maximum=value)
+        for key, value in values.items() if key in ids
+    ]
+    if not samples:
+        return 0
+
+    table = ResourceUsageSample.__table__
+    try:
+        db.session.execute(table.insert(), samples)
+        db.session.commit()
+    except IntegrityError:
+        # Collected twice in the same second: keep the last values.
+        db.session.rollback()
+        ResourceUsageSample.query.filter(
+            ResourceUsageSample.resolution == 0,
+            ResourceUsageSample.timestamp == timestamp,
+            ResourceUsageSample.id_usage.in_(
+                [s['id_usage'] for s in samples]),
+        ).delete(synchronize_session=False)
+        db.session.execute(table.insert(), samples)
+        db.session.commit()
+    return len(samples)
+
+
+def rollup(now=None):
+    """Roll up all closed buckets which have not been rolled up yet.
+
+    :returns: Dictionary with the number of created buckets per resolution.
+    """
+    now = int(now or time.time())
+    S = ResourceUsageSample
+    created = {}
+
+    resolutions = [r for r, dummy_retention in get_resolutions()]
+    for source, resolution in zip(resolutions, resolutions[1:]):
+        last = db.session.query(db.func.max(S.timestamp)).filter(
+            S.resolution == resolution).scalar()
+        since = 0 if last is None else last + resolution
+        until = now - now % resolution
+        if since >= until:
+            continue
+
+        bucket = S.timestamp - S.timestamp % resolution
+        buckets = [
+            dict(id_usage=id_usage, resolution=resolution,
+                 timestamp=int(timestamp), count=int(count), total=int(total),
+                 minimum=int(minimum), maximum=int(maximum))
+            for id_usage, timestamp, count, total, minimum, maximum in
+            db.session.query(
+                S.id_usage, bucket, db.func.sum(S.count),
+                db.func.sum(S.total), db.func.min(S.minimum),
+                db.func.max(S.maximum),
+            ).filter(
+                S.resolution == source,
+                S.timestamp >= since,
+                S.timestamp < until,
+            ).group_by(S.id_usage, bucket)
+        ]
+        if buckets:
+            db.session.execute(S.__table__.insert(), buckets)
+            created[resolution] = len(buckets)
+
+    db.session.commit()
+    return created
+
+
+def purge(now=None):
+    """Delete buckets older than the retention of their resolution.
+
+    :returns: Number of deleted buckets.
+    """
+    now = int(now or time.time())
+    S = ResourceUsageSample
+    deleted = 0
+    for resolution, retention in get_resolutions():
+        if retention is None:
+            continue
+        deleted += S.query.filter(
+            S.resolution == resolution,
+            S.timestamp < now - retention,
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def get_resolution(start, end, now=None):
+    """Get the finest resolution which covers a time range.
+
+    The resolution must still retain ``start`` and give at most
+    :data:`QUOTAS_TIMESERIES_MAX_POINTS` buckets. Raw samples are counted
+    as if they had the next resolution.
+    """
+    now = int(now or time.time())
+    resolutions = get_resolutions()
+    max_points = cfg['QUOTAS_TIMESERIES_MAX_POINTS']
+    for resolution, retention in resolutions:
+        step = resolution or (resolutions[1][0] if len(resolutions) > 1
+                              else 1)
+        if retention is not None and start < now - retention:
+            continue
+        if (end - start) / step <= max_points:
+            return resolution
+    return resolutions[-1][0]
+
+
+def get_series(id_usage, start, end=None, resolution=None):
+    """Get the values of a metric in a time range.
+
+    :param id_usage: Id of the :class:`~.models.ResourceUsage`.
+    :param start: Start of the range in seconds since the epoch.
+    :param end: End of the range (excluded). Defaults to now.
+    :param resolution: Resolution of the values. Defaults to
+        :func:`get_resolution`.
+    :returns: Dictionary with the ``resolution`` and the columns
+        ``timestamp`` and ``count`` (``array('l')``) and ``mean``,
+        ``minimum`` and ``maximum`` (``array('d')``).
+    """
+    end = int(end or time.time())
+    if resolution is None:
+        resolution = get_resolution(start, end)
+    S = ResourceUsageSample
+
+    series = dict(
+        resolution=resolution,
+        timestamp=array('l'),
+        count=array('l'),
+        mean=array('d'),
+        minimum=array('d'),
+        maximum=array('d'),
+    )
+    for timestamp, count, total, minimum, maximum in db.session.query(
+        S.timestamp, S.count, S.total, S.minimum, S.maximum
+    ).filter(
+        S.id_usage == id_usage,
+        S.resolution == resolution,
+        S.timestamp >= start,
+        S.timestamp < end,
+    ).order_by(S.timestamp):
+        series['timestamp'].append(timestamp)
+        series['count'].append(count)
+        series['mean'].append(float(total) / count)
+        series['minimum'].append(minimum)
+        series['maximum'].append(maximum)
+    return series
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Create the time series of resource usage metrics."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = ['quotas_2015_04_24_initial']
+
+
+def info():
+    """Upgrade description."""
+    return "Create table of resource usage samples."
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    op.create_table(
+        'quotaSAMPLE',
+        db.Column('id_usage', db.Integer(display_width=15), nullable=False),
+        db.Column('resolution', db.Integer(display_width=15),
+                  nullable=False),
+        db.Column('timestamp', db.Integer(display_width=15), nullable=False),
+        db.Column('count', db.Integer(display_width=15), nullable=False),
+        db.Column('total', db.BigInteger(), nullable=False),
+        db.Column('minimum', db.BigInteger(), nullable=False),
+        db.Column('maximum', db.BigInteger(), nullable=False),
+        db.ForeignKeyConstraint(['id_usage'], ['quotaUSAGE.id'], ),
+        db.PrimaryKeyConstraint('id_usage', 'resolution', 'timestamp'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_index(
+        'ix_quotaSAMPLE_resolution_timestamp', 'quotaSAMPLE',
+        ['resolution', 'timestamp'], unique=False)
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    return 1
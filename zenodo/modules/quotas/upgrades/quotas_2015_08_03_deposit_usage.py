@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Create the counters of the deposit metric."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = ['quotas_2015_07_31_timeseries']
+
+
+def info():
+    """Upgrade description."""
+    return "Create tables of deposit file storage per user."
+
+
+def do_upgrade():
+    """Implement your upgrades here.
+
+    The tables are filled by the first run of the
+    ``reconcile_deposit_usage`` task.
+    """
+    op.create_table(
+        'quotaDEPOSITUSAGE',
+        db.Column('id_user', db.Integer(display_width=15), nullable=False),
+        db.Column('files', db.Integer(display_width=15), nullable=False),
+        db.Column('size', db.BigInteger(), nullable=False),
+        db.Column('modified', db.DateTime(), nullable=False),
+        db.PrimaryKeyConstraint('id_user'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_table(
+        'quotaDEPOSITFILE',
+        db.Column('id_deposition', db.Integer(display_width=15),
+                  nullable=False),
+        db.Column('uuid', db.String(length=36), nullable=False),
+        db.Column('id_user', db.Integer(display_width=15), nullable=False),
+        db.Column('size', db.BigInteger(), nullable=False),
+        db.PrimaryKeyConstraint('id_deposition', 'uuid'),
+        mysql_charset='utf8',
+        mysql_engine='MyISAM'
+    )
+    op.create_index(
+        op.f('ix_quotaDEPOSITFILE_id_user'), 'quotaDEPOSITFILE',
+        ['id_user'], unique=False)
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    return 1
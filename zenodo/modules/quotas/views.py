@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Zenodo.
+# Copyright (C) 2015 CERN.
+#
+# Zenodo is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Zenodo is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Zenodo. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Metrics exposition endpoint."""
+
+from __future__ import absolute_import
+
+import time
+
+from flask import Blueprint, Response, abort, g, request
+from werkzeug.security import safe_str_cmp
+
+from invenio.base.globals import cfg
+
+from .exposition import CONTENT_TYPE, counter, histogram, render
+
+blueprint = Blueprint(
+    'quotas',
+    __name__,
+    url_prefix='',
+    template_folder='templates',
+)
+
+requests_total = counter(
+    'zenodo_http_requests_total', 'Number of handled HTTP requests.')
+request_duration = histogram(
+    'zenodo_http_request_duration_seconds', 'Duration of HTTP requests.')
+
+
+def get_client_addr():
+    """Get the client address, as seen by the outermost trusted proxy.
+
+    :returns: The address, or ``None`` if it cannot be trusted (a request
+        forwarded by an unknown proxy).
+    """
+    proxies = cfg['QUOTAS_EXPOSITION_PROXIES']
+    forwarded = request.headers.get('X-Forwarded-For')
+    if not proxies:
+        return None if forwarded else request.remote_addr
+    route = [a.strip() for a in forwarded.split(',')] if forwarded else []
+    return route[-proxies] if len(route) >= proxies else None
+
+
+def is_allowed():
+    """Check if the client may scrape the metrics.
+
+    Clients need the configured token, or an allowed address (see
+    :data:`QUOTAS_EXPOSITION_ALLOWED_IPS`).
+    """
+    token = cfg['QUOTAS_EXPOSITION_TOKEN']
+    if token and safe_str_cmp(
+            request.headers.get('Authorization', ''), 'Bearer ' + token):
+        return True
+    allowed = cfg['QUOTAS_EXPOSITION_ALLOWED_IPS']
+    return allowed is None or get_client_addr() in allowed
+
+
+@blueprint.route('/metrics', methods=['GET', ])
+def metrics():
+    """Serve metrics in the Prometheus text format."""
+    if not is_allowed():
+        abort(403)
+    return Response(render(), content_type=CONTENT_TYPE)
+
+
+@blueprint.before_app_request
+def start_request_timer():
+    """Remember when the request started."""
+    g.quotas_request_start = time.time()
+
+
+@blueprint.after_app_request
+def record_request(response):
+    """Count the request and record its duration."""
+    start = getattr(g, 'quotas_request_start', None)
+    if start is not None:
+        labels = dict(method=request.method, status=response.status_code)
+        requests_total.inc(**labels)
+        request_duration.observe(time.time() - start, **labels)
+    return response